@@ -0,0 +1,61 @@
+"""Benchmark render throughput with the render pool at increasing sizes.
+
+Renders the sample handwriting page from several threads at once, the way
+process_pages does, first in-process (threads share the GIL) and then with
+1..N worker processes. Throughput should scale with the number of vCPUs.
+
+    python benchmarks/bench_render_pool.py [--pages 40] [--max-processes 6]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from render_pool import RenderPool
+from rm_renderer import render_rm_to_png
+
+
+def throughput(render, rm_bytes: bytes, pages: int, threads: int) -> float:
+    """Pages rendered per second by `threads` concurrent callers."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: render(rm_bytes), range(pages)))
+    return pages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--rm", default=str(ROOT / "tests" / "fixtures" / "sample.rm"))
+    args = parser.parse_args()
+
+    # rmscene warns about unread trailing data on every parse of the fixture
+    logging.getLogger("rmscene").setLevel(logging.ERROR)
+    rm_bytes = Path(args.rm).read_bytes()
+    threads = max(5, args.max_processes)
+    print(f"vCPUs: {os.cpu_count()}, pages: {args.pages}, caller threads: {threads}")
+    print(f"{'mode':>12} {'pages/s':>9}")
+    print(f"{'threads':>12} {throughput(render_rm_to_png, rm_bytes, args.pages, threads):9.1f}")
+
+    processes = 1
+    while processes <= args.max_processes:
+        pool = RenderPool(processes)
+        try:
+            pool.run("render", rm_bytes)  # first task per worker is not timed
+            rate = throughput(lambda b: pool.run("render", b), rm_bytes, args.pages, threads)
+        finally:
+            pool.close()
+        print(f"{f'{processes} procs':>12} {rate:9.1f}")
+        processes *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark .rm parsing: the rm_scan scanner against rmscene.
+
+Times how long each takes to get a page's strokes out of the sample
+handwriting page and out of synthetic pages with increasing numbers of
+long strokes (a dense page of notes has a few thousand).
+
+    python benchmarks/bench_rm_scan.py [--max-strokes 4000] [--repeat 5]
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from rmscene import read_blocks, scene_items as si, write_blocks
+from rmscene.crdt_sequence import CrdtSequenceItem
+from rmscene.scene_stream import SceneLineItemBlock
+from rmscene.tagged_block_common import CrdtId
+
+from rm_scan import scan
+
+
+def synthetic_page(strokes: int, points: int = 120, seed: int = 0, height: float = 1800) -> bytes:
+    """A page of `strokes` pen lines of `points` samples each, `height` tall."""
+    rng = random.Random(seed)
+    blocks = []
+    for i in range(strokes):
+        x, y = rng.uniform(-700, 700), rng.uniform(0, height)
+        samples = []
+        for _ in range(points):
+            x += rng.uniform(-3, 3)
+            y += rng.uniform(-3, 3)
+            samples.append(si.Point(x, y, 10, 20, 30, 40))
+        line = si.Line(si.PenColor.BLACK, si.Pen.BALLPOINT_2, samples, 2.0, 0.0)
+        blocks.append(SceneLineItemBlock(
+            parent_id=CrdtId(0, 11),
+            item=CrdtSequenceItem(CrdtId(1, 100 + i), CrdtId(0, 0), CrdtId(0, 0), 0, line),
+        ))
+    buf = BytesIO()
+    write_blocks(buf, blocks)
+    return buf.getvalue()
+
+
+def rmscene_strokes(rm_bytes: bytes) -> list:
+    return [
+        block.item.value for block in read_blocks(BytesIO(rm_bytes))
+        if isinstance(block, SceneLineItemBlock) and block.item.value is not None
+    ]
+
+
+def best_of(parse, rm_bytes: bytes, repeat: int) -> float:
+    """Fastest of `repeat` parses, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(rm_bytes)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-strokes", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rm", default=str(ROOT / "tests" / "fixtures" / "sample.rm"))
+    args = parser.parse_args()
+
+    # rmscene warns about unread trailing data on every parse of the fixture
+    logging.getLogger("rmscene").setLevel(logging.ERROR)
+    pages = [("sample", Path(args.rm).read_bytes())]
+    strokes = 250
+    while strokes <= args.max_strokes:
+        pages.append((f"{strokes} strokes", synthetic_page(strokes)))
+        strokes *= 2
+
+    print(f"{'page':>14} {'KiB':>7} {'rmscene ms':>11} {'scan ms':>8} {'speedup':>8}")
+    for name, rm_bytes in pages:
+        slow = best_of(rmscene_strokes, rm_bytes, args.repeat)
+        fast = best_of(scan, rm_bytes, args.repeat)
+        print(f"{name:>14} {len(rm_bytes) / 1024:7.0f} {slow:11.1f} {fast:8.1f} {slow / fast:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
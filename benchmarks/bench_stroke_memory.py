@@ -0,0 +1,102 @@
+"""Measure peak memory of a maximum-size page's strokes, by representation.
+
+Builds a dense infinite-scroll page (strokes down to MAX_CANVAS_HEIGHT)
+and, each in a fresh process, reads its strokes as rmscene objects, as
+per-stroke lists of (x, y) tuples, and as a StrokeSet, then renders it.
+Reports the peak RSS each step adds over the process's baseline.
+
+    python benchmarks/bench_stroke_memory.py [--strokes 5000] [--points 100]
+"""
+
+import argparse
+import logging
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+MODES = ["rmscene", "tuples", "arrays", "render"]
+
+
+def reset_peak_rss():
+    """Restart the peak RSS count; a child inherits its parent's through exec."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mib() -> float:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(mode: str, path: str):
+    """Run one mode in this process; print its peak RSS over baseline."""
+    from io import BytesIO
+
+    from rmscene import read_blocks
+
+    import rm_renderer
+
+    logging.getLogger("rmscene").setLevel(logging.ERROR)
+    rm_bytes = Path(path).read_bytes()
+    reset_peak_rss()
+    baseline = peak_rss_mib()
+    if mode == "rmscene":
+        held = list(read_blocks(BytesIO(rm_bytes)))
+    elif mode == "tuples":
+        held = [line.points for line in rm_renderer.read_strokes(rm_bytes)]
+    elif mode == "arrays":
+        held = rm_renderer.read_strokes(rm_bytes)
+    else:
+        held = rm_renderer.render_rm_to_png(rm_bytes)
+    print(f"{peak_rss_mib() - baseline:.1f}")
+    del held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--strokes", type=int, default=5000)
+    parser.add_argument("--points", type=int, default=100)
+    parser.add_argument("--measure", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--rm", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.measure, args.rm)
+        return
+
+    from bench_rm_scan import synthetic_page
+
+    from rm_renderer import MAX_CANVAS_HEIGHT, read_strokes
+
+    rm_bytes = synthetic_page(args.strokes, args.points, height=MAX_CANVAS_HEIGHT - 100)
+    strokes = read_strokes(rm_bytes)
+    print(f"page: {len(rm_bytes) / 2**20:.1f} MiB, {len(strokes)} strokes, "
+          f"{len(strokes.points) // 2} points; StrokeSet arrays {strokes.nbytes / 2**20:.1f} MiB")
+    with tempfile.NamedTemporaryFile(suffix=".rm") as f:
+        f.write(rm_bytes)
+        f.flush()
+        print(f"{'strokes held as':>16} {'peak RSS +MiB':>14}")
+        for mode in MODES:
+            result = subprocess.run(
+                [sys.executable, __file__, "--measure", mode, "--rm", f.name],
+                capture_output=True, text=True, check=True,
+            )
+            label = "render (arrays)" if mode == "render" else mode
+            print(f"{label:>16} {float(result.stdout):14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark typed-text reconstruction on large synthetic typed pages.
+
+Compares typed_text.text_to_markdown with rmscene's TextDocument on
+documents of increasing paragraph count, typed as the device writes them
+(one run per burst of typing, with a fraction of edits inserted mid-run).
+
+    python benchmarks/bench_typed_text.py [--max-paragraphs 4000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from rmscene import scene_items as si
+from rmscene.crdt_sequence import CrdtSequence, CrdtSequenceItem
+from rmscene.tagged_block_common import CrdtId, LwwValue
+from rmscene.text import TextDocument
+
+from typed_text import text_to_markdown
+
+WORDS = "the quick brown fox jumps over lazy dog meeting notes roadmap".split()
+
+
+def synthetic_text(paragraphs: int, edit_ratio: float = 0.1, seed: int = 0) -> si.Text:
+    """A typed page with `paragraphs` styled paragraphs of ~60 characters."""
+    rng = random.Random(seed)
+    items = []
+    styles = {CrdtId(0, 0): LwwValue(CrdtId(1, 1), si.ParagraphStyle.HEADING)}
+    next_id = 10
+    prev_last = CrdtId(0, 0)
+    runs = []  # (first_id, length) of appended runs, for mid-run edits
+    for _ in range(paragraphs):
+        line = " ".join(rng.choice(WORDS) for _ in range(10)) + "\n"
+        item_id = CrdtId(1, next_id)
+        items.append([item_id, prev_last, CrdtId(0, 0), line])
+        if items[-2:-1]:
+            items[-2][2] = item_id
+        runs.append((next_id, len(line)))
+        newline_id = CrdtId(1, next_id + len(line) - 1)
+        styles[newline_id] = LwwValue(
+            CrdtId(1, 1), rng.choice([si.ParagraphStyle.PLAIN, si.ParagraphStyle.BULLET,
+                                      si.ParagraphStyle.CHECKBOX])
+        )
+        next_id += len(line)
+        prev_last = newline_id
+
+    # Corrections typed into the middle of earlier runs.
+    for _ in range(int(paragraphs * edit_ratio)):
+        start, length = rng.choice(runs)
+        k = rng.randrange(1, length - 1)
+        items.append([CrdtId(1, next_id), CrdtId(1, start + k - 1), CrdtId(1, start + k), "x"])
+        next_id += 1
+
+    seq = [CrdtSequenceItem(i, l, r, 0, v) for i, l, r, v in items]
+    return si.Text(items=CrdtSequence(seq), styles=styles, pos_x=0.0, pos_y=0.0, width=900.0)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-paragraphs", type=int, default=4000)
+    parser.add_argument("--rmscene-limit", type=int, default=2000,
+                        help="skip rmscene above this size (it is quadratic)")
+    args = parser.parse_args()
+
+    print(f"{'paragraphs':>10} {'chars':>8} {'typed_text':>12} {'rmscene':>12}")
+    n = 250
+    while n <= args.max_paragraphs:
+        text = synthetic_text(n)
+        chars = sum(len(item.value) for item in text.items.sequence_items())
+        ours = timed(text_to_markdown, text)
+        theirs = (f"{timed(TextDocument.from_scene_item, text) * 1000:10.1f}ms"
+                  if n <= args.rmscene_limit else f"{'skipped':>12}")
+        print(f"{n:>10} {chars:>8} {ours * 1000:10.1f}ms {theirs}")
+        n *= 2
+
+
+if __name__ == "__main__":
+    main()
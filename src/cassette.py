@@ -0,0 +1,272 @@
+"""Record and replay Claude calls for offline pipeline regression tests.
+
+A cassette is a JSON file of the messages.create calls made while
+processing a fixture page: each request's fingerprint and normalized form,
+the response, and the call's latency. CassetteClient stands in for
+anthropic.Anthropic. Given a real client it forwards and records every
+call; without one it answers from the cassette and never touches the
+network.
+
+A request's fingerprint hashes everything sent to Claude (model,
+max_tokens, prompt text, and each image's decoded pixels, so Pillow's PNG
+encoder settings don't matter). A rendering or prompt change that alters
+what is sent makes replay fail with CassetteMismatch, naming the fields
+that changed against the closest recorded request and estimating the
+image token change. Re-record the cassette with a live key to accept it.
+
+report() compares the calls played in this run with the cassette as it
+was loaded: calls, tokens and recorded latency, with deltas. Calls the
+pipeline no longer makes (a skipped escalation, say) or repeats show up
+there even when every fingerprint matches.
+"""
+
+import base64
+import difflib
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+import anthropic
+from PIL import Image
+
+from rm_renderer import image_tokens
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMismatch(Exception):
+    """Replay got a request the cassette has no recording for."""
+
+
+def normalize_request(request: dict) -> dict:
+    """The request as recorded: base64 images replaced by their pixel hash
+    and size."""
+    if isinstance(request, dict):
+        source = request.get("source")
+        if request.get("type") == "image" and isinstance(source, dict) and "data" in source:
+            return {"type": "image", **_image_summary(source["data"])}
+        return {key: normalize_request(value) for key, value in request.items()}
+    if isinstance(request, list):
+        return [normalize_request(item) for item in request]
+    return request
+
+
+def _image_summary(data: str) -> dict:
+    raw = base64.b64decode(data)
+    try:
+        with Image.open(BytesIO(raw)) as img:
+            pixels = img.tobytes()
+            return {
+                "width": img.width,
+                "height": img.height,
+                "sha256": hashlib.sha256(f"{img.mode}:".encode() + pixels).hexdigest(),
+            }
+    except Exception:
+        return {"width": None, "height": None, "sha256": hashlib.sha256(raw).hexdigest()}
+
+
+def fingerprint(normalized: dict) -> str:
+    canonical = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+@dataclass
+class CallTotals:
+    """Calls, tokens and latency over a set of recorded interactions."""
+
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_ms: int = 0
+
+    @classmethod
+    def of(cls, interactions: list[dict]) -> "CallTotals":
+        totals = cls()
+        for interaction in interactions:
+            usage = interaction["response"].get("usage") or {}
+            totals.calls += 1
+            totals.input_tokens += usage.get("input_tokens") or 0
+            totals.output_tokens += usage.get("output_tokens") or 0
+            totals.latency_ms += interaction.get("latencyMs", 0)
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "inputTokens": self.input_tokens,
+            "outputTokens": self.output_tokens,
+            "latencyMs": self.latency_ms,
+        }
+
+
+class Cassette:
+    """The recorded calls for one fixture, and the calls played this run."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.baseline: list[dict] = []
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"{self.path}: unsupported cassette version {data.get('version')}")
+            self.baseline = data["interactions"]
+        self.played: list[dict] = []
+        self._lock = threading.Lock()
+        self._used: set[int] = set()
+
+    @property
+    def exists(self) -> bool:
+        return bool(self.baseline)
+
+    def lookup(self, normalized: dict) -> dict:
+        """The next unplayed recording of this request (the last one again
+        if it was sent more often than recorded)."""
+        digest = fingerprint(normalized)
+        with self._lock:
+            matches = [i for i, item in enumerate(self.baseline) if item["fingerprint"] == digest]
+            if not matches:
+                raise CassetteMismatch(self._describe_mismatch(normalized, digest))
+            index = next((i for i in matches if i not in self._used), matches[-1])
+            self._used.add(index)
+            self.played.append(self.baseline[index])
+            return self.baseline[index]
+
+    def record(self, normalized: dict, response: dict, latency_ms: int):
+        with self._lock:
+            self.played.append({
+                "fingerprint": fingerprint(normalized),
+                "request": normalized,
+                "response": response,
+                "latencyMs": latency_ms,
+            })
+
+    def save(self):
+        """Write the calls recorded this run as the cassette."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": CASSETTE_VERSION, "interactions": self.played}
+        self.path.write_text(json.dumps(data, indent=1, sort_keys=True) + "\n")
+
+    def report(self) -> dict:
+        """Recorded vs played totals and their deltas."""
+        recorded = CallTotals.of(self.baseline).to_dict()
+        played = CallTotals.of(self.played).to_dict()
+        return {
+            "recorded": recorded,
+            "played": played,
+            "delta": {key: played[key] - recorded[key] for key in recorded},
+        }
+
+    def format_report(self) -> str:
+        report = self.report()
+        parts = [
+            f"{key} {report['recorded'][key]} -> {report['played'][key]} "
+            f"({report['delta'][key]:+d})"
+            for key in report["recorded"]
+        ]
+        return f"{self.path.stem}: " + ", ".join(parts)
+
+    def _describe_mismatch(self, normalized: dict, digest: str) -> str:
+        lines = [f"{self.path.name}: no recording of request {digest}."]
+        candidates = [item["request"] for item in self.baseline]
+        if not candidates:
+            return lines[0] + " The cassette is empty."
+        closest = min(candidates, key=lambda old: len(_differences(old, normalized)))
+        lines.append("The request sent to Claude changed against the closest recording:")
+        for path, old, new in _differences(closest, normalized):
+            lines.append(f"  {path}: {_describe_change(old, new)}")
+        lines.append("Re-record the cassette if the change is intended.")
+        return "\n".join(lines)
+
+
+def _flatten(value, path: str = "") -> dict:
+    if isinstance(value, dict) and value.get("type") == "image" and "sha256" in value:
+        return {path: value}
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(_flatten(item, f"{path}.{key}" if path else key))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for index, item in enumerate(value):
+            items.update(_flatten(item, f"{path}[{index}]"))
+        return items
+    return {path: value}
+
+
+_MISSING = object()
+
+
+def _differences(old: dict, new: dict) -> list[tuple[str, object, object]]:
+    old_items, new_items = _flatten(old), _flatten(new)
+    return [
+        (path, old_items.get(path, _MISSING), new_items.get(path, _MISSING))
+        for path in sorted(old_items.keys() | new_items.keys())
+        if old_items.get(path, _MISSING) != new_items.get(path, _MISSING)
+    ]
+
+
+def _describe_change(old, new) -> str:
+    if old is _MISSING:
+        return f"added {_short(new)}"
+    if new is _MISSING:
+        return f"removed {_short(old)}"
+    if isinstance(old, dict) and isinstance(new, dict):
+        if (old["width"], old["height"]) == (new["width"], new["height"]):
+            return f"image pixels changed at {new['width']}x{new['height']}"
+        change = f"image {old['width']}x{old['height']} -> {new['width']}x{new['height']}"
+        if None not in (old["width"], new["width"]):
+            before = image_tokens(old["width"], old["height"])
+            after = image_tokens(new["width"], new["height"])
+            change += f", ~{before} -> ~{after} input tokens ({after - before:+d})"
+        return change
+    if isinstance(old, str) and isinstance(new, str) and "\n" in old + new:
+        diff = difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=0)
+        changed = [line for line in list(diff)[2:] if not line.startswith("@@")]
+        return "text changed:\n" + "\n".join(f"      {line}" for line in changed[:10])
+    return f"{_short(old)} -> {_short(new)}"
+
+
+def _short(value) -> str:
+    text = repr(value)
+    return text if len(text) <= 80 else text[:77] + "..."
+
+
+class _Messages:
+    def __init__(self, owner: "CassetteClient"):
+        self._owner = owner
+
+    def create(self, **request):
+        return self._owner._create(request)
+
+
+class CassetteClient:
+    """Stands in for anthropic.Anthropic: records calls through `client`
+    when one is given, otherwise replays them from `cassette`."""
+
+    def __init__(self, cassette: Cassette, client: anthropic.Anthropic | None = None):
+        self.cassette = cassette
+        self.client = client
+        self.messages = _Messages(self)
+
+    @property
+    def recording(self) -> bool:
+        return self.client is not None
+
+    def _create(self, request: dict):
+        normalized = normalize_request(request)
+        if not self.recording:
+            interaction = self.cassette.lookup(normalized)
+            return anthropic.types.Message.model_validate(interaction["response"])
+        started = time.monotonic()
+        message = self.client.messages.create(**request)
+        self.cassette.record(
+            normalized,
+            message.model_dump(mode="json", exclude_none=True),
+            int((time.monotonic() - started) * 1000),
+        )
+        return message
@@ -0,0 +1,234 @@
+"""Circuit breaker around Claude calls, with an optional fallback model.
+
+During an Anthropic incident every page would otherwise wait out the SDK's
+timeouts and retries before failing, running invocations up to the Lambda
+timeout. Each model gets a breaker that opens after CIRCUIT_FAILURE_THRESHOLD
+consecutive failed calls (default 5; 0 disables the breakers). A failure is
+a connection error, a timeout (CLAUDE_TIMEOUT_SECONDS per attempt) or a
+5xx/overloaded response, after the SDK's own retries (CLAUDE_MAX_RETRIES). Client errors (bad request, auth, rate limits) come from the
+caller's key or request, not from Anthropic being down, so they don't count.
+
+While a model's breaker is open its calls go to CLAUDE_FALLBACK_MODEL, if
+one is set and its own breaker is closed, or fail fast with
+CircuitOpenError. After CIRCUIT_RESET_SECONDS (default 30) one call is let
+through as a probe: a response closes the breaker, an outage error reopens
+it, and anything else (a client error, an interruption) leaves it half-open
+for the next probe.
+
+State changes are logged and emitted as a `CircuitState` metric per model
+(0 closed, 1 half-open, 2 open).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+
+import anthropic
+
+from metrics import emit
+from usage import model_rates
+
+logger = logging.getLogger()
+
+CIRCUIT_FAILURE_THRESHOLD_ENV = "CIRCUIT_FAILURE_THRESHOLD"
+CIRCUIT_RESET_SECONDS_ENV = "CIRCUIT_RESET_SECONDS"
+CLAUDE_FALLBACK_MODEL_ENV = "CLAUDE_FALLBACK_MODEL"
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 30.0
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_METRIC = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Claude calls are failing fast while the model's circuit is open."""
+
+
+def is_outage(error: BaseException) -> bool:
+    """Whether an error says Anthropic is unreachable or failing, as opposed
+    to rejecting this particular request."""
+    if isinstance(error, anthropic.APIConnectionError):  # includes timeouts
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one model."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_seconds: float = DEFAULT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may start now; in half-open state only the probe may."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def release(self):
+        """End a call that neither succeeded nor failed, freeing the probe
+        slot without changing state."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def _transition(self, state: str):
+        self._state = state
+        if state == OPEN:
+            logger.warning(
+                f"Circuit for {self.name} open after {self._failures} consecutive failures; "
+                f"probing again in {self.reset_seconds:g}s"
+            )
+        else:
+            logger.info(f"Circuit for {self.name} {state.replace('_', '-')}")
+        emit({"CircuitState": (_STATE_METRIC[state], "None")}, {"Model": self.name})
+
+
+class Breakers:
+    """One breaker per model, and the fallback used while a model's is open."""
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_seconds: float = DEFAULT_RESET_SECONDS,
+        fallback_model: str | None = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.fallback_model = fallback_model
+        self._lock = threading.Lock()
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(
+                    model, self.failure_threshold, self.reset_seconds
+                )
+            return self._breakers[model]
+
+    def call(self, model: str, send: Callable[[str], object]) -> tuple[str, object]:
+        """(model used, send(model)), on the fallback model if `model`'s
+        circuit is open.
+
+        Raises CircuitOpenError when neither circuit lets a call through.
+        """
+        breaker = self.breaker(model)
+        if not breaker.allow():
+            fallback = self.fallback_model
+            if fallback is None or fallback == model or not self.breaker(fallback).allow():
+                raise CircuitOpenError(f"Anthropic unavailable: circuit for {model} is open")
+            logger.info(f"Circuit for {model} open, using {fallback}")
+            model, breaker = fallback, self.breaker(fallback)
+        try:
+            result = send(model)
+        except Exception as e:
+            if is_outage(e):
+                breaker.record_failure()
+            else:
+                # Rejected or failed locally: no evidence either way
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()  # interrupted; says nothing about Anthropic
+            raise
+        breaker.record_success()
+        return model, result
+
+
+_breakers: Breakers | None = None
+_breakers_checked = False
+_breakers_lock = threading.Lock()
+
+
+def configure(breakers: Breakers | None):
+    """Use explicit breakers (tests); None to reset."""
+    global _breakers, _breakers_checked
+    with _breakers_lock:
+        _breakers = breakers
+        _breakers_checked = breakers is not None
+
+
+def get_breakers() -> Breakers | None:
+    """The container's breakers, built from the environment on first use.
+
+    Returns None when CIRCUIT_FAILURE_THRESHOLD is 0.
+    """
+    global _breakers, _breakers_checked
+    if _breakers_checked:
+        return _breakers
+    with _breakers_lock:
+        if not _breakers_checked:
+            _breakers = _breakers_from_env()
+            _breakers_checked = True
+    return _breakers
+
+
+def _number_env(name: str, default, parse):
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        return max(0, parse(value))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}")
+        return default
+
+
+def _breakers_from_env() -> Breakers | None:
+    threshold = _number_env(CIRCUIT_FAILURE_THRESHOLD_ENV, DEFAULT_FAILURE_THRESHOLD, int)
+    if not threshold:
+        return None
+    fallback_model = os.environ.get(CLAUDE_FALLBACK_MODEL_ENV) or None
+    if fallback_model is not None:
+        # Warn at startup rather than on the first call during an incident
+        model_rates(fallback_model)
+    return Breakers(
+        threshold,
+        _number_env(CIRCUIT_RESET_SECONDS_ENV, DEFAULT_RESET_SECONDS, float),
+        fallback_model,
+    )
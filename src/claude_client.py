@@ -7,14 +7,37 @@ traditional OCR services.
 
 import base64
 import logging
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
 
 import anthropic
+from PIL import Image
+
+import circuit_breaker
+import hedging
+from rm_renderer import RENDER_SCALE
+from usage import ModelCall, UsageMeter
 
 logger = logging.getLogger(__name__)
 
 # Claude model for vision tasks - Sonnet balances cost and quality
 MODEL = "claude-sonnet-4-20250514"
 
+# Pages go to the fast model first and escalate to MODEL only when its answer
+# looks unreliable (see _escalation_reason). Set to None to always use MODEL.
+FAST_MODEL = "claude-haiku-4-5-20251001"
+
+EXTRACTION_MAX_TOKENS = 4096
+
+# A transcription is "suspiciously short" when it has fewer than
+# MIN_CHARS_PER_INK_CHAR of the characters its ink suggests. Handwriting
+# rendered at RENDER_SCALE leaves ~60 dark pixels per character; at other
+# scales (adaptive render scale) roughly in proportion, since thin strokes
+# stay 1px wide and only get shorter or longer.
+INK_PIXELS_PER_CHAR = 60
+MIN_CHARS_PER_INK_CHAR = 0.2
+
 EXTRACTION_PROMPT = """Extract all handwritten and typed text from this image.
 
 Rules:
@@ -56,17 +79,180 @@ NO_TEXT_INDICATORS = [
 ]
 
 
-def extract_text_from_image(png_bytes: bytes, client: anthropic.Anthropic) -> tuple[str, float]:
+@dataclass
+class OcrTrace:
+    """Routing decisions and per-call stats for one page, returned to clients.
+
+    With a `meter`, every call is also charged to the request's UsageMeter and
+    no call starts once its budget is spent.
+    """
+
+    calls: list[ModelCall] = field(default_factory=list)
+    escalation: str | None = None
+    meter: UsageMeter | None = None
+
+    @property
+    def budget_exhausted(self) -> bool:
+        return self.meter is not None and self.meter.exhausted
+
+    def record(self, model: str, purpose: str, message, started: float):
+        call = _model_call(model, purpose, message, started)
+        self.calls.append(call)
+        if self.meter is not None:
+            self.meter.record(call)
+
+    def charge(self, model: str, purpose: str, message, started: float):
+        """Charge a call whose answer was discarded (a hedge's loser) to the
+        meter only; the page's own call list already has the winner."""
+        if self.meter is not None:
+            self.meter.record(_model_call(model, purpose, message, started))
+
+    def to_dict(self) -> dict:
+        extract_models = [c.model for c in self.calls if c.purpose == "extract"]
+        return {
+            "model": extract_models[-1] if extract_models else None,
+            "escalation": self.escalation,
+            "calls": [c.to_dict() for c in self.calls],
+        }
+
+
+def _model_call(model: str, purpose: str, message, started: float) -> ModelCall:
+    usage = getattr(message, "usage", None)
+    return ModelCall(
+        model=model,
+        purpose=purpose,
+        latency_ms=int((time.monotonic() - started) * 1000),
+        input_tokens=_token_count(usage, "input_tokens"),
+        output_tokens=_token_count(usage, "output_tokens"),
+        cache_creation_input_tokens=_token_count(usage, "cache_creation_input_tokens"),
+        cache_read_input_tokens=_token_count(usage, "cache_read_input_tokens"),
+    )
+
+
+def _token_count(usage, name: str) -> int:
+    value = getattr(usage, name, 0)
+    return value if isinstance(value, int) else 0
+
+
+def _image_request(
+    client: anthropic.Anthropic,
+    model: str,
+    max_tokens: int,
+    base64_image: str,
+    prompt: str,
+    purpose: str,
+    trace: OcrTrace | None,
+):
+    if trace is not None and trace.meter is not None:
+        trace.meter.check()
+    started = time.monotonic()
+    content = [
+        {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": "image/png",
+                "data": base64_image,
+            },
+        },
+        {
+            "type": "text",
+            "text": prompt,
+        },
+    ]
+
+    def send(model: str):
+        request = dict(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": content}],
+        )
+        hedger = hedging.get_hedger()
+        if hedger is None:
+            return client.messages.create(**request)
+        return hedger.call(
+            f"{model}:{purpose}",
+            lambda: client.messages.create(**request),
+            may_hedge=lambda: trace is None or not trace.budget_exhausted,
+            abandoned=(
+                None if trace is None
+                else lambda loser: trace.charge(model, purpose, loser, started)
+            ),
+        )
+
+    breakers = circuit_breaker.get_breakers()
+    if breakers is None:
+        message = send(model)
+    else:
+        model, message = breakers.call(model, send)
+    if trace is not None:
+        trace.record(model, purpose, message, started)
+    return message
+
+
+def _ink_pixels(png_bytes: bytes) -> int | None:
+    """Count dark pixels in a rendered page, or None if it can't be decoded."""
+    try:
+        with Image.open(BytesIO(png_bytes)) as img:
+            histogram = img.convert("L").histogram()
+    except Exception:
+        return None
+    return sum(histogram[:128])
+
+
+def _escalation_reason(
+    message,
+    raw_response: str,
+    text: str,
+    has_drawings: bool,
+    ink_pixels: int | None,
+    scale: float = RENDER_SCALE,
+) -> str | None:
+    """Why a fast-model transcription should be retried on MODEL, if at all."""
+    if getattr(message, "stop_reason", None) == "max_tokens":
+        return "max_tokens"
+    if not text:
+        sentinel = raw_response.replace(HAS_DRAWINGS_MARKER, "").strip()
+        # "NO_TEXT_FOUND" alongside a drawing is a clean answer; anything
+        # else means a page with ink came back empty or described.
+        if sentinel != "NO_TEXT_FOUND" or not has_drawings:
+            return "no_text"
+        return None
+    if ink_pixels:
+        expected_chars = ink_pixels / (INK_PIXELS_PER_CHAR * scale / RENDER_SCALE)
+        if len(text) < expected_chars * MIN_CHARS_PER_INK_CHAR:
+            return "short_for_ink"
+    return None
+
+
+def extract_text_from_image(
+    png_bytes: bytes,
+    client: anthropic.Anthropic,
+    trace: OcrTrace | None = None,
+    scale: float = RENDER_SCALE,
+    drawing_regions: bool | None = None,
+) -> tuple[str, float]:
     """Extract text from PNG using Claude Vision API.
 
     For pages with text: returns extracted markdown
     For pages with drawings: returns illustration marker [illustration: description]
     For mixed content: returns text followed by illustration marker
 
+    The page goes to FAST_MODEL first and is retried on MODEL when the
+    answer hits max_tokens, comes back empty or descriptive, or is short for
+    the amount of ink on the page. The fast model also flags drawings on
+    plain handwriting, so its flag is dropped when the stroke segmenter
+    found none (`drawing_regions=False`); a page it then leaves without
+    text is escalated as usual.
+
     Args:
         png_bytes: PNG image data as bytes
         client: Anthropic client (caller owns lifecycle; reuse across pages
             in one Lambda invocation amortizes TLS/connection setup)
+        trace: Optional OcrTrace that records routing and per-call stats
+        scale: The scale the page was rendered at, for the ink heuristic
+        drawing_regions: Whether rm_renderer's segmenter found drawing
+            regions in the image, or None if unknown
 
     Returns:
         tuple of (markdown_text, confidence)
@@ -76,43 +262,45 @@ def extract_text_from_image(png_bytes: bytes, client: anthropic.Anthropic) -> tu
 
     logger.info(f"Sending image to Claude ({len(png_bytes)} bytes)")
 
-    message = client.messages.create(
-        model=MODEL,
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/png",
-                            "data": base64_image,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": EXTRACTION_PROMPT,
-                    },
-                ],
-            }
-        ],
+    model = FAST_MODEL or MODEL
+    message = _image_request(
+        client, model, EXTRACTION_MAX_TOKENS, base64_image, EXTRACTION_PROMPT, "extract", trace
     )
-
     raw_response = message.content[0].text
 
     # Parse response to get text and detect drawings
     extracted_text, has_drawings = _parse_extraction_response(raw_response)
 
+    if model != MODEL and has_drawings and drawing_regions is False:
+        logger.info(f"Ignoring {HAS_DRAWINGS_MARKER} from {model}: no drawing strokes on the page")
+        has_drawings = False
+
+    if model != MODEL:
+        reason = _escalation_reason(
+            message, raw_response, extracted_text, has_drawings, _ink_pixels(png_bytes), scale
+        )
+        if reason is not None and trace is not None and trace.budget_exhausted:
+            # Keep the fast answer rather than lose the page to the budget.
+            logger.info(f"Not escalating ({reason}): token budget spent")
+            trace.escalation = f"{reason}:skipped_budget"
+        elif reason is not None:
+            logger.info(f"Escalating from {model} to {MODEL}: {reason}")
+            if trace is not None:
+                trace.escalation = reason
+            message = _image_request(
+                client, MODEL, EXTRACTION_MAX_TOKENS, base64_image, EXTRACTION_PROMPT,
+                "extract", trace,
+            )
+            raw_response = message.content[0].text
+            extracted_text, has_drawings = _parse_extraction_response(raw_response)
+
     logger.info(
         f"Extracted {len(extracted_text)} characters, has_drawings={has_drawings}"
     )
 
     # If drawings detected, add illustration marker
     if has_drawings:
-        description = describe_illustration(png_bytes, client)
-        marker = f"[illustration: {description}]"
+        marker = _illustration_marker(png_bytes, client, trace)
         if extracted_text:
             # Mixed content: text + illustration marker
             extracted_text = f"{extracted_text}\n\n{marker}"
@@ -123,6 +311,36 @@ def extract_text_from_image(png_bytes: bytes, client: anthropic.Anthropic) -> tu
     return extracted_text, 1.0
 
 
+def extract_text_from_segments(
+    segments,
+    client: anthropic.Anthropic,
+    trace: OcrTrace | None = None,
+    scale: float = RENDER_SCALE,
+) -> tuple[str, float]:
+    """Transcribe a segmented mixed page (see rm_renderer.segment_page).
+
+    Only the text crop goes through extraction; each drawing crop goes
+    straight to the short description prompt, so the drawing's pixels are
+    never sent at extraction size and the page needs no full-page image.
+    Illustration markers follow the text in top-to-bottom order.
+
+    Returns:
+        tuple of (markdown_text, confidence) as extract_text_from_image
+    """
+    text, confidence = extract_text_from_image(
+        segments.text_png, client, trace, scale, drawing_regions=False
+    )
+    markers = [_illustration_marker(png, client, trace) for png in segments.drawing_pngs]
+    return "\n\n".join(filter(None, [text, *markers])), confidence
+
+
+def _illustration_marker(png_bytes: bytes, client: anthropic.Anthropic, trace: OcrTrace | None) -> str:
+    """Describe a drawing, or leave an undescribed marker once the budget is spent."""
+    if trace is not None and trace.budget_exhausted:
+        return "[illustration]"
+    return f"[illustration: {describe_illustration(png_bytes, client, trace)}]"
+
+
 def _parse_extraction_response(text: str) -> tuple[str, bool]:
     """Parse extraction response to get text and drawing detection.
 
@@ -145,12 +363,20 @@ def _parse_extraction_response(text: str) -> tuple[str, bool]:
     return cleaned_text, has_drawings
 
 
-def describe_illustration(png_bytes: bytes, client: anthropic.Anthropic) -> str:
+def describe_illustration(
+    png_bytes: bytes,
+    client: anthropic.Anthropic,
+    trace: OcrTrace | None = None,
+) -> str:
     """Generate brief description of drawing.
 
+    A five-word label doesn't need the stronger model, so this always uses
+    FAST_MODEL when one is configured.
+
     Args:
         png_bytes: PNG image data as bytes
         client: Anthropic client (caller owns lifecycle)
+        trace: Optional OcrTrace that records the call
 
     Returns:
         Short description string (5 words or fewer)
@@ -159,28 +385,8 @@ def describe_illustration(png_bytes: bytes, client: anthropic.Anthropic) -> str:
 
     logger.info(f"Describing illustration from image ({len(png_bytes)} bytes)")
 
-    message = client.messages.create(
-        model=MODEL,
-        max_tokens=50,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/png",
-                            "data": base64_image,
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": ILLUSTRATION_PROMPT,
-                    },
-                ],
-            }
-        ],
+    message = _image_request(
+        client, FAST_MODEL or MODEL, 50, base64_image, ILLUSTRATION_PROMPT, "describe", trace
     )
 
     description = message.content[0].text.strip().lower()
@@ -0,0 +1,241 @@
+"""Weighted fair sharing of page slots between tenants.
+
+In server and job mode many requests share one process's render and Claude
+slots (pipeline.StagePipeline). With plain semaphores, a tenant backfilling
+hundreds of pages keeps every slot busy and a one-page interactive sync
+waits behind its whole backlog. FairScheduler hands each freed slot to the
+waiting tenant that has used the least of its share so far, so a small
+tenant waits for about one slot to free up, however deep the large tenant's
+backlog is.
+
+A tenant is derived from the caller's Anthropic key (or, without one, the
+deployment API key it authenticated with), hashed so the key itself is
+never held here; handlers set it with tenant() for the request's threads.
+Pages with no tenant share one anonymous queue.
+
+Per-tenant policy comes from the environment:
+- TENANT_WEIGHTS: "tenant=weight,..." shares (default 1 each), keyed by
+  tenant_id: the first 16 hex digits of the key's SHA-256, which the key's
+  owner can compute (`printf %s "$KEY" | sha256sum | cut -c1-16`) without
+  the id ever being logged
+- TENANT_RATE / TENANT_BURST: an optional token bucket per tenant, in
+  pages admitted per second and the burst allowed above that rate
+"""
+
+import contextvars
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+logger = logging.getLogger()
+
+TENANT_WEIGHTS_ENV = "TENANT_WEIGHTS"
+TENANT_RATE_ENV = "TENANT_RATE"
+TENANT_BURST_ENV = "TENANT_BURST"
+
+_tenant: contextvars.ContextVar[str | None] = contextvars.ContextVar("tenant", default=None)
+
+
+def tenant_id(key: str) -> str:
+    """A stable, non-reversible tenant id for an API key (the form
+    TENANT_WEIGHTS uses)."""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+@contextmanager
+def tenant(tenant: str | None):
+    """Attribute pages processed in this block (and in threads started in a
+    copy of its context) to `tenant`."""
+    token = _tenant.set(tenant)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def current_tenant() -> str | None:
+    return _tenant.get()
+
+
+@dataclass
+class TenantPolicy:
+    """Per-tenant weights and the optional token bucket (pages per second)."""
+
+    weights: dict[str, float] = field(default_factory=dict)
+    rate: float | None = None
+    burst: float = 1.0
+
+    def weight(self, tenant: str | None) -> float:
+        return self.weights.get(tenant, 1.0)
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is now)."""
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        self.wait_time(now)
+        return self._tokens >= self.burst
+
+    def take(self):
+        self._tokens -= 1
+
+
+class FairScheduler:
+    """A counting semaphore whose free slots go to tenants in weighted fair
+    order (start-time fair queuing over slot grants).
+
+    Each tenant has a virtual time that advances by 1/weight per slot it is
+    granted; the waiting tenant with the lowest virtual time goes next, and
+    waiters of one tenant are served in arrival order. A tenant that has
+    been idle rejoins at the current virtual time, so idling banks no
+    credit. With a rate limit, a tenant whose bucket is empty is skipped
+    until it refills, even if slots are free.
+    """
+
+    def __init__(self, slots: int, policy: TenantPolicy | None = None, rate_limited: bool = True):
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.slots = slots
+        self.policy = policy or TenantPolicy()
+        self._rate_limited = rate_limited and self.policy.rate is not None
+        self._cond = threading.Condition()
+        self._free = slots
+        self._queues: dict[str | None, deque[int]] = {}
+        self._vtime: dict[str | None, float] = {}
+        self._virtual = 0.0
+        self._buckets: dict[str | None, TokenBucket] = {}
+        self._seq = itertools.count()
+
+    def acquire(self, tenant: str | None = None):
+        with self._cond:
+            ticket = next(self._seq)
+            queue = self._queues.get(tenant)
+            if queue is None:
+                queue = self._queues[tenant] = deque()
+                self._vtime[tenant] = max(self._vtime.get(tenant, 0.0), self._virtual)
+            queue.append(ticket)
+            try:
+                while True:
+                    chosen, wait = self._next()
+                    if chosen is queue and queue[0] == ticket:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                self._leave(tenant, ticket)
+                raise
+            self._free -= 1
+            self._virtual = self._vtime[tenant]
+            self._vtime[tenant] += 1 / self.policy.weight(tenant)
+            if self._rate_limited:
+                self._buckets[tenant].take()
+            self._leave(tenant, ticket)
+            # An idle tenant rejoins at the current virtual time anyway
+            for idle in [t for t, v in self._vtime.items()
+                         if t not in self._queues and v <= self._virtual]:
+                del self._vtime[idle]
+            now = time.monotonic()
+            for idle in [t for t, b in self._buckets.items()
+                         if t not in self._queues and b.full(now)]:
+                del self._buckets[idle]
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._free += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tenant: str | None = None):
+        """Hold a slot for the block, queued as `tenant` (default: the
+        current tenant)."""
+        self.acquire(tenant if tenant is not None else current_tenant())
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _next(self) -> tuple[deque | None, float | None]:
+        """(queue of the tenant to serve next or None, seconds until a
+        bucket refills)."""
+        if not self._free:
+            return None, None
+        now = time.monotonic()
+        best, best_key, wait = None, None, None
+        for tenant, queue in self._queues.items():
+            if self._rate_limited:
+                bucket = self._buckets.get(tenant)
+                if bucket is None:
+                    bucket = self._buckets[tenant] = TokenBucket(
+                        self.policy.rate, self.policy.burst, now
+                    )
+                delay = bucket.wait_time(now)
+                if delay:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+            key = (self._vtime[tenant], queue[0])
+            if best_key is None or key < best_key:
+                best, best_key = queue, key
+        return best, wait if best is None else None
+
+    def _leave(self, tenant: str | None, ticket: int):
+        queue = self._queues[tenant]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[tenant]
+
+
+def _parse_weights(value: str) -> dict[str, float]:
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        try:
+            number = float(weight)
+        except ValueError:
+            number = 0
+        if not name.strip() or number <= 0:
+            logger.warning(f"Ignoring invalid {TENANT_WEIGHTS_ENV} entry {item!r}")
+            continue
+        weights[name.strip()] = number
+    return weights
+
+
+def _positive_env(name: str) -> float | None:
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        logger.warning(f"Ignoring invalid {name}={value!r}")
+        return None
+    return number
+
+
+def policy_from_env() -> TenantPolicy:
+    rate = _positive_env(TENANT_RATE_ENV)
+    burst = _positive_env(TENANT_BURST_ENV)
+    return TenantPolicy(
+        weights=_parse_weights(os.environ.get(TENANT_WEIGHTS_ENV, "")),
+        rate=rate,
+        burst=max(1.0, burst if burst is not None else (rate or 1.0)),
+    )
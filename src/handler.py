@@ -4,53 +4,240 @@ Receives .rm files as base64-encoded data, extracts text (typed or handwritten),
 and returns formatted markdown.
 """
 
-import base64
+import hashlib
 import json
 import logging
+import os
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from dataclasses import dataclass, field
 from hmac import compare_digest
 from typing import Any
+from urllib.parse import parse_qs
 
 import anthropic
 
 # Request limits to prevent DoS
 MAX_PAGES = 20
-MAX_PAGE_SIZE = 5 * 1024 * 1024  # 5MB per page
+MAX_PAGE_SIZE = 5 * 1024 * 1024  # 5MB per page, after base64 decoding
+# Bound on a decompressed request body: every page at the limit, base64'd,
+# plus room for ids and JSON framing. Compressed uploads let a batch fit the
+# 6MB Function URL payload limit but must not expand past what we'd accept
+# uncompressed.
+MAX_BODY_SIZE = MAX_PAGES * MAX_PAGE_SIZE * 4 // 3 + 64 * 1024
+# Parsing holds about two copies of the body at its peak (see
+# payload.load_json_body), next to the runtime, render workers and in-flight
+# PNGs, so a decompressed body is also held to this share of the function's
+# memory (AWS_LAMBDA_FUNCTION_MEMORY_SIZE). At the default 2048MB that is
+# 512MB and MAX_BODY_SIZE (~133MB, ~270MB while parsed) applies; a 512MB
+# function gets 128MB and a 128MB function 32MB.
+MAX_BODY_MEMORY_SHARE = 0.25
+LAMBDA_MEMORY_ENV = "AWS_LAMBDA_FUNCTION_MEMORY_SIZE"
+# Notebook archives aren't chunked by the client, so they get a higher page
+# cap. That is not what fits one invocation: at 5 concurrent Claude calls of
+# 5-15s, a 300s Lambda finishes roughly 100-250 handwriting pages (blank and
+# typed pages cost next to nothing). Handwriting pages not started by the
+# request's deadline (see _request_deadline) are returned as deferredPages;
+# a retry with the same Idempotency-Key picks them up, or use /jobs.
+MAX_NOTEBOOK_PAGES = 250
+# Kept free at the end of an invocation to build the response, on top of
+# the worst case for a Claude call started just before the deadline.
+DEADLINE_SLACK_SECONDS = 10
+
+# Async jobs aren't bound by the Lambda timeout, so they take many more
+# pages (and a larger decompressed body) than a synchronous batch.
+MAX_JOB_PAGES = 1000
+MAX_JOB_BODY_SIZE = 64 * 1024 * 1024
+# How long finalizing an upload session waits for its last pages by default
+# (`?wait=` overrides, up to the max), leaving the rest of the Lambda
+# timeout for collecting the results.
+SESSION_FINALIZE_WAIT_SECONDS = 20
+MAX_SESSION_FINALIZE_WAIT_SECONDS = 120
+
+# A delta sync manifest lists every page of a notebook, but only up to
+# MAX_PAGES of them may carry data; the body allows for the manifest entries.
+MAX_SYNC_PAGES = 2000
+MAX_SYNC_BODY_SIZE = MAX_BODY_SIZE + MAX_SYNC_PAGES * 256
+
+NOTEBOOK_PATH = "/notebook"
+
+# Stage limits for process_page. Rendering is CPU-bound, so it gets one slot
+# per render worker process. OCR slots are Claude calls in flight; 5 matches
+# Prose's batch size (ocr.ts:245). Up to OCR_QUEUE_DEPTH rendered pages wait
+# for an OCR slot, bounding the PNGs held in memory.
+OCR_WORKERS = 5
+OCR_QUEUE_DEPTH = 4
+
+# Optional cap on Claude tokens (input + output + cache) spent per request.
+TOKEN_BUDGET_HEADER = "x-token-budget"
 
 from secrets import get_api_keys
-from rm_renderer import extract_typed_text, render_rm_to_png, has_strokes
-from claude_client import extract_text_from_image
+from rm_renderer import (
+    RENDER_SCALE, PageSegments, ScaleChoice, extract_typed_text, has_drawing_regions, has_strokes,
+)
+import render_cache
+import render_pool
+from render_pool import choose_scale, render_rm_to_png, segment_page
+from claude_client import OcrTrace, extract_text_from_image, extract_text_from_segments
 from markdown_formatter import format_typed_text
+from metrics import emit_request_usage
+import idempotency
+from idempotency import Replay
+import jobs
+from jobs import JOBS_PATH, SESSIONS_PATH, JobClosed, JobNotFound
+import sync
+from sync import SYNC_PATH
+from notebook import ArchivePage, Notebook, NotebookError, spool_base64
+import fair_scheduler
+from pipeline import StagePipeline
+from payload import (
+    EncodedPage,
+    PayloadTooLarge,
+    UnsupportedEncoding,
+    b64decode,
+    compress_response,
+    get_header,
+    load_json_body,
+)
+from usage import BudgetExhausted, UsageMeter, summarize
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+STAGES = StagePipeline(
+    render_workers=max(1, render_pool.configured_processes()),
+    ocr_workers=OCR_WORKERS,
+    queue_depth=OCR_QUEUE_DEPTH,
+    policy=fair_scheduler.policy_from_env(),
+)
+
+
+# Connection pool shared by every request's Anthropic client. Unset on Lambda,
+# where each invocation's client makes its own; the HTTP server (server.py)
+# sets one so keep-alive connections to the API outlive a single request.
+_shared_http_client = None
+
+
+def use_shared_http_client(http_client):
+    """Build Anthropic clients on `http_client` (an httpx.Client), or None to stop."""
+    global _shared_http_client
+    _shared_http_client = http_client
+
+
+# Per-attempt timeout and retries for Claude calls. The SDK defaults (600s,
+# 2 retries) outlast the 300s Lambda timeout, so a hung call would be killed
+# with the invocation instead of failing and counting toward the model's
+# circuit breaker. Worst case per call: (retries + 1) * timeout.
+CLAUDE_TIMEOUT_SECONDS_ENV = "CLAUDE_TIMEOUT_SECONDS"
+CLAUDE_MAX_RETRIES_ENV = "CLAUDE_MAX_RETRIES"
+DEFAULT_CLAUDE_TIMEOUT_SECONDS = 60.0
+DEFAULT_CLAUDE_MAX_RETRIES = 1
+
+
+def _number_env(name: str, default, parse):
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        return max(0, parse(value))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}")
+        return default
+
+
+def _body_size_limit(max_size: int) -> int:
+    """`max_size`, lowered to MAX_BODY_MEMORY_SHARE of the Lambda's memory."""
+    memory_mb = _number_env(LAMBDA_MEMORY_ENV, 0, int)
+    if not memory_mb:
+        return max_size
+    return min(max_size, int(memory_mb * 1024 * 1024 * MAX_BODY_MEMORY_SHARE))
+
+
+def _claude_call_limits() -> tuple[float, int]:
+    """(per-attempt timeout, retries) for Claude calls."""
+    # A zero timeout would fail every call
+    timeout = _number_env(CLAUDE_TIMEOUT_SECONDS_ENV, DEFAULT_CLAUDE_TIMEOUT_SECONDS, float)
+    retries = _number_env(CLAUDE_MAX_RETRIES_ENV, DEFAULT_CLAUDE_MAX_RETRIES, int)
+    return timeout or DEFAULT_CLAUDE_TIMEOUT_SECONDS, retries
+
+
+def make_anthropic_client(api_key: str) -> anthropic.Anthropic:
+    """An Anthropic client for one request's key, on the shared pool if set."""
+    timeout, retries = _claude_call_limits()
+    options = {"timeout": timeout, "max_retries": retries}
+    if _shared_http_client is not None:
+        options["http_client"] = _shared_http_client
+    return anthropic.Anthropic(api_key=api_key, **options)
+
+
+def _request_deadline(context: Any) -> float | None:
+    """time.monotonic() after which the request starts no new Claude call.
+
+    Leaves room for a call started just before it to run to its timeout
+    (every retry included) and for the response to be built, so finished
+    pages are returned instead of lost with the invocation. None outside
+    Lambda (no context), where requests have no timeout.
+    """
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining_ms is None:
+        return None
+    timeout, retries = _claude_call_limits()
+    reserve = timeout * (retries + 1) + DEADLINE_SLACK_SECONDS
+    return time.monotonic() + remaining_ms() / 1000 - reserve
+
 
 def handler(event: dict, context: Any) -> dict:
     """Lambda entry point for OCR requests.
 
+    Routes on the request path:
+    - `POST /` or `POST /ocr`: a batch of up to MAX_PAGES pages (below)
+    - `POST /notebook`: a whole notebook archive (see handle_notebook)
+    - `POST /sync`: delta sync of one notebook against stored results
+      (see handle_sync)
+    - `/jobs` and `/sessions`: async jobs and chunked upload sessions
+      (see handle_jobs, handle_sessions)
+
     Expected request format:
     {
         "pages": [
             {"id": "page-uuid", "data": "<base64 .rm data>"},
+            {"id": "page-uuid", "data": "<base64 gzip'd .rm>", "encoding": "gzip"},
             ...
         ]
     }
 
+    The body itself may be sent with `Content-Encoding: gzip` or `zstd`, and
+    the response is compressed when the client sends `Accept-Encoding`.
+
     Response format:
     {
         "pages": [
             {"id": "page-uuid", "markdown": "...", "confidence": 0.92},
             ...
-        ]
+        ],
+        "failedPages": ["page-uuid"],    # only if any failed
+        "deferredPages": ["page-uuid"],  # only if the token budget ran out
+        "deduplicatedPages": 1,          # only if identical pages were merged
+        "replayedPages": 1,              # only if an Idempotency-Key retry reused results
+        "usage": {"inputTokens": ..., "outputTokens": ..., "costUsd": ...}
     }
+
+    Send `x-token-budget: <tokens>` to cap Claude usage for the request;
+    once it is spent no new Claude calls start and the remaining handwriting
+    pages are returned in `deferredPages` for the client to retry.
+
+    Send `Idempotency-Key: <key>` to make retries cheap: pages a previous
+    attempt with the same key finished are returned without being processed
+    again (see idempotency).
     """
+    # SQS event source mapping: this invocation is a job worker
+    if "Records" in event:
+        return handle_queue_event(event)
+
     try:
         # Validate API key against all valid keys (supports dual-key rotation)
-        provided_key = (
-            event.get("headers", {}).get("x-api-key")
-            or event.get("headers", {}).get("X-Api-Key")
-        )
+        provided_key = get_header(event, "x-api-key")
         valid_keys = get_api_keys()
 
         if not provided_key:
@@ -69,172 +256,940 @@ def handler(event: dict, context: Any) -> dict:
         # Extract user's Anthropic API key and instantiate one client per
         # Lambda invocation. Reusing the client across pages amortizes
         # TLS handshake and HTTP connection-pool setup over the request.
-        anthropic_key = (
-            event.get("headers", {}).get("x-anthropic-key")
-            or event.get("headers", {}).get("X-Anthropic-Key")
-        )
-        anthropic_client = (
-            anthropic.Anthropic(api_key=anthropic_key) if anthropic_key else None
-        )
+        anthropic_key = get_header(event, "x-anthropic-key")
+        anthropic_client = make_anthropic_client(anthropic_key) if anthropic_key else None
 
         # Check HTTP method
         method = event.get("requestContext", {}).get("http", {}).get("method", "GET")
+        path = (event.get("rawPath") or "/").rstrip("/")
+        # Concurrent requests share the process's page slots fairly per
+        # caller (server and job mode).
+        tenant = fair_scheduler.tenant_id(anthropic_key or provided_key)
+        with fair_scheduler.tenant(tenant):
+            if path == JOBS_PATH or path.startswith(JOBS_PATH + "/"):
+                response = handle_jobs(event, method, path, anthropic_key)
+            elif path == SESSIONS_PATH or path.startswith(SESSIONS_PATH + "/"):
+                response = handle_sessions(event, method, path, anthropic_key)
+            elif method != "POST":
+                return error_response(405, f"Method {method} not allowed. Use POST.")
+            elif path == NOTEBOOK_PATH:
+                response = handle_notebook(event, anthropic_client, context)
+            elif path == SYNC_PATH:
+                response = handle_sync(event, anthropic_client)
+            elif path in ("", "/ocr"):
+                response = handle_pages(event, anthropic_client)
+            else:
+                return error_response(404, f"Unknown path {event.get('rawPath')}")
+
+        if response["statusCode"] != 200:
+            return response
+        return compress_response(response, get_header(event, "accept-encoding"))
+
+    except Exception as e:
+        logger.error(f"Unhandled error: {e}")
+        return error_response(500, "Internal server error")
+
+
+def handle_pages(event: dict, anthropic_client: anthropic.Anthropic | None) -> dict:
+    """Process a JSON batch of base64 pages (the `/ocr` contract)."""
+    # Parse request body
+    try:
+        request_data = load_json_body(event, max_size=_body_size_limit(MAX_BODY_SIZE))
+    except json.JSONDecodeError as e:
+        return error_response(400, f"Invalid JSON: {e}")
+    except UnsupportedEncoding as e:
+        return error_response(415, str(e))
+    except PayloadTooLarge as e:
+        return error_response(413, str(e))
+    except ValueError as e:
+        return error_response(400, f"Invalid request body: {e}")
+
+    try:
+        meter = UsageMeter(parse_token_budget(event))
+        replay = idempotency.begin(event, "/ocr")
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    pages = request_data.get("pages", [])
+    if not pages:
+        return error_response(400, "No pages provided")
+
+    if len(pages) > MAX_PAGES:
+        return error_response(400, f"Too many pages (max {MAX_PAGES})")
+
+    logger.info(f"Processing {len(pages)} pages")
+
+    valid_pages, failed_pages = validate_pages(pages)
+
+    # Drop the parsed request so each page's base64 string is referenced
+    # only by its EncodedPage and is freed once a worker decodes it.
+    del request_data, pages
+    valid_count = len(valid_pages)
+
+    try:
+        batch = process_pages(valid_pages, anthropic_client, meter, replay)
+    except MissingAnthropicKeyError:
+        return missing_anthropic_key_response()
+    failed_pages.extend(batch.failed_pages)
+
+    response_body = {"pages": batch.results}
+    if failed_pages:
+        response_body["failedPages"] = failed_pages
+    if batch.deferred_pages:
+        response_body["deferredPages"] = batch.deferred_pages
+    if batch.deduplicated:
+        response_body["deduplicatedPages"] = batch.deduplicated
+    if batch.replayed:
+        response_body["replayedPages"] = batch.replayed
+    response_body["usage"] = meter.to_dict()
+
+    emit_request_usage("/ocr", meter, valid_count, len(batch.deferred_pages))
+    return json_response(response_body)
+
+
+def validate_pages(pages: list[dict]) -> tuple[list[tuple[str, EncodedPage]], list[str]]:
+    """Split request pages into (page_id, EncodedPage) to process and failed ids.
+
+    Pre-validates cheap checks (missing data, encoding, size) before any
+    worker is spent on a page; nothing is decoded here.
+    """
+    failed_pages = []
+    valid_pages = []
+    for page in pages:
+        page_id = page.get("id", "unknown")
+        page_data = page.get("data", "")
+
+        if not page_data:
+            failed_pages.append(page_id)
+            continue
+
+        # Size-check from the encoded length; the page is not decoded
+        # (or decompressed) until a worker picks it up.
+        try:
+            encoded_page = EncodedPage(
+                page_data, encoding=page.get("encoding"), max_size=MAX_PAGE_SIZE
+            )
+        except UnsupportedEncoding as e:
+            logger.warning(f"Page {page_id}: {e}")
+            failed_pages.append(page_id)
+            continue
+
+        if encoded_page.size > MAX_PAGE_SIZE:
+            logger.warning(f"Page {page_id} exceeds size limit")
+            failed_pages.append(page_id)
+            continue
+
+        valid_pages.append((page_id, encoded_page))
+    return valid_pages, failed_pages
+
+
+def handle_jobs(event: dict, method: str, path: str, anthropic_key: str | None) -> dict:
+    """Async job API.
+
+    - `POST /jobs`: submit pages (the /ocr JSON body, up to MAX_JOB_PAGES) or
+      a notebook archive (binary body, as for /notebook). Returns 202 with
+      the job's status; pages rejected up front are listed in rejectedPages.
+    - `GET /jobs/<id>`: status and page counts
+    - `GET /jobs/<id>/results?cursor=&limit=`: finished page results in
+      document order, with `nextCursor` while there may be more
+    """
+    backend = jobs.get_backend()
+    if backend is None:
+        return error_response(501, "Job mode is not configured", "JOBS_NOT_CONFIGURED")
+    store, queue = backend
+
+    parts = path[len(JOBS_PATH):].strip("/").split("/") if path != JOBS_PATH else []
+    if not parts:
         if method != "POST":
             return error_response(405, f"Method {method} not allowed. Use POST.")
+        return submit_job(event, store, queue, anthropic_key)
+
+    if method != "GET":
+        return error_response(405, f"Method {method} not allowed. Use GET.")
+    job_id = parts[0]
+    try:
+        if len(parts) == 1:
+            return json_response(jobs.get_status(store, job_id))
+        if len(parts) == 2 and parts[1] == "results":
+            query = parse_qs(event.get("rawQueryString") or "")
+            return json_response(jobs.get_results(
+                store, job_id,
+                (query.get("cursor") or [None])[0],
+                (query.get("limit") or [None])[0],
+            ))
+    except JobNotFound:
+        return error_response(404, f"Unknown job {job_id}")
+    except ValueError as e:
+        return error_response(400, str(e))
+    return error_response(404, f"Unknown path {event.get('rawPath')}")
 
-        # Parse request body
-        body = event.get("body", "")
-        if event.get("isBase64Encoded", False):
-            body = base64.b64decode(body).decode("utf-8")
 
+def handle_sessions(event: dict, method: str, path: str, anthropic_key: str | None) -> dict:
+    """Chunked upload sessions, built on async jobs.
+
+    - `POST /sessions`: open a session; returns 201 with its jobId
+    - `POST /sessions/<id>/pages`: append a chunk (the /ocr JSON body, up to
+      MAX_PAGES pages). The chunk is queued at once, so OCR runs while the
+      next chunk uploads. Returns 202 with the chunk's firstIndex.
+    - `POST /sessions/<id>/finalize?wait=<seconds>`: close the session and
+      wait for its pages. Returns 200 with every page in upload order and
+      the combined markdown, or 202 with the status if they're still
+      running (then page through `GET /jobs/<id>/results`).
+    """
+    backend = jobs.get_backend()
+    if backend is None:
+        return error_response(501, "Job mode is not configured", "JOBS_NOT_CONFIGURED")
+    store, queue = backend
+    if method != "POST":
+        return error_response(405, f"Method {method} not allowed. Use POST.")
+
+    parts = path[len(SESSIONS_PATH):].strip("/").split("/") if path != SESSIONS_PATH else []
+    if not parts:
+        return json_response(jobs.open_session(store), status_code=201)
+    if len(parts) != 2 or parts[1] not in ("pages", "finalize"):
+        return error_response(404, f"Unknown path {event.get('rawPath')}")
+
+    job_id = parts[0]
+    try:
+        if parts[1] == "pages":
+            return append_session_pages(event, store, queue, job_id, anthropic_key)
+        query = parse_qs(event.get("rawQueryString") or "")
         try:
-            request_data = json.loads(body) if body else {}
-        except json.JSONDecodeError as e:
-            return error_response(400, f"Invalid JSON: {e}")
+            wait = float((query.get("wait") or [SESSION_FINALIZE_WAIT_SECONDS])[0])
+        except ValueError:
+            return error_response(400, "wait must be a number of seconds")
+        wait = min(max(wait, 0.0), MAX_SESSION_FINALIZE_WAIT_SECONDS)
+        status = jobs.finalize_session(store, job_id, wait)
+        return json_response(status, status_code=200 if "pages" in status else 202)
+    except JobNotFound:
+        return error_response(404, f"Unknown session {job_id}")
+    except JobClosed:
+        return error_response(409, f"Session {job_id} is finalized", "SESSION_CLOSED")
 
-        pages = request_data.get("pages", [])
-        if not pages:
-            return error_response(400, "No pages provided")
 
-        if len(pages) > MAX_PAGES:
-            return error_response(400, f"Too many pages (max {MAX_PAGES})")
+def append_session_pages(event: dict, store, queue, job_id: str, anthropic_key: str | None) -> dict:
+    try:
+        request_data = load_json_body(event, max_size=_body_size_limit(MAX_BODY_SIZE))
+    except json.JSONDecodeError as e:
+        return error_response(400, f"Invalid JSON: {e}")
+    except UnsupportedEncoding as e:
+        return error_response(415, str(e))
+    except PayloadTooLarge as e:
+        return error_response(413, str(e))
+    except ValueError as e:
+        return error_response(400, f"Invalid request body: {e}")
 
-        logger.info(f"Processing {len(pages)} pages")
+    pages = request_data.get("pages", [])
+    if not pages:
+        return error_response(400, "No pages provided")
+    if len(pages) > MAX_PAGES:
+        return error_response(400, f"Too many pages (max {MAX_PAGES})")
 
-        results = []
-        failed_pages = []
+    valid_pages, failed_pages = validate_pages(pages)
+    del request_data, pages
+    chunk = []
+    for page_id, encoded_page in valid_pages:
+        try:
+            chunk.append((page_id, encoded_page.take()))
+        except (ValueError, PayloadTooLarge) as e:
+            logger.warning(f"Page {page_id}: {e}")
+            failed_pages.append(page_id)
 
-        # Pre-validate cheap checks (missing data, size) before spawning threads
-        # so we don't burn a worker just to short-circuit. Pages that pass
-        # validation get submitted to the pool.
-        valid_pages = []
-        for page in pages:
-            page_id = page.get("id", "unknown")
-            page_data = page.get("data", "")
+    if not chunk:
+        return error_response(400, "No valid pages provided")
 
-            if not page_data:
-                failed_pages.append(page_id)
-                continue
+    try:
+        start = jobs.append_pages(store, queue, job_id, chunk, MAX_JOB_PAGES, anthropic_key)
+    except ValueError as e:
+        return error_response(400, str(e))
+    body = {**jobs.get_status(store, job_id), "firstIndex": start}
+    if failed_pages:
+        body["rejectedPages"] = failed_pages
+    return json_response(body, status_code=202)
+
+
+def submit_job(event: dict, store, queue, anthropic_key: str | None) -> dict:
+    """Create a job from a pages body or notebook archive."""
+    content_type = (get_header(event, "content-type") or "").lower()
+    if event.get("isBase64Encoded", False) and "json" not in content_type:
+        return submit_notebook_job(event, store, queue, anthropic_key)
+
+    try:
+        request_data = load_json_body(event, max_size=_body_size_limit(MAX_JOB_BODY_SIZE))
+    except json.JSONDecodeError as e:
+        return error_response(400, f"Invalid JSON: {e}")
+    except UnsupportedEncoding as e:
+        return error_response(415, str(e))
+    except PayloadTooLarge as e:
+        return error_response(413, str(e))
+    except ValueError as e:
+        return error_response(400, f"Invalid request body: {e}")
+
+    pages = request_data.get("pages", [])
+    if not pages:
+        return error_response(400, "No pages provided")
+    if len(pages) > MAX_JOB_PAGES:
+        return error_response(400, f"Too many pages (max {MAX_JOB_PAGES})")
+
+    valid_pages, failed_pages = validate_pages(pages)
+    del request_data, pages
+    job_pages = []
+    for page_id, encoded_page in valid_pages:
+        try:
+            job_pages.append((page_id, encoded_page.take()))
+        except (ValueError, PayloadTooLarge) as e:
+            logger.warning(f"Page {page_id}: {e}")
+            failed_pages.append(page_id)
+    if not job_pages:
+        return error_response(400, "No valid pages provided")
 
-            if len(page_data) > MAX_PAGE_SIZE:
+    status = jobs.create_job(store, queue, job_pages, anthropic_key)
+    if failed_pages:
+        status["rejectedPages"] = failed_pages
+    return json_response(status, status_code=202)
+
+
+def submit_notebook_job(event: dict, store, queue, anthropic_key: str | None) -> dict:
+    body = event.get("body") or ""
+    if not body:
+        return error_response(400, "No notebook archive provided")
+    try:
+        notebook = Notebook(spool_base64(body))
+    except NotebookError as e:
+        return error_response(400, f"Invalid notebook archive: {e}")
+    except ValueError as e:
+        return error_response(400, f"Invalid request body: {e}")
+
+    try:
+        if len(notebook.page_ids) > MAX_JOB_PAGES:
+            return error_response(400, f"Too many pages in notebook (max {MAX_JOB_PAGES})")
+        job_pages = []
+        failed_pages = []
+        for page_id in notebook.page_ids:
+            page = notebook.page(page_id)
+            if page is not None and page.size > MAX_PAGE_SIZE:
                 logger.warning(f"Page {page_id} exceeds size limit")
                 failed_pages.append(page_id)
                 continue
+            job_pages.append((page_id, page.take() if page is not None else None))
+    finally:
+        notebook.close()
+
+    status = jobs.create_job(store, queue, job_pages, anthropic_key, notebook={
+        "id": notebook.id, "title": notebook.title, "pageCount": len(notebook.page_ids),
+    })
+    if failed_pages:
+        status["rejectedPages"] = failed_pages
+    return json_response(status, status_code=202)
+
 
-            valid_pages.append((page_id, page_data))
-
-        # Process pages in parallel. Prose batches at BATCH_SIZE=5 (ocr.ts:245)
-        # so 5 workers matches the wire contract; oversizing wastes RAM with no
-        # latency win since each worker is I/O-bound waiting on Claude.
-        #
-        # MISSING_ANTHROPIC_KEY policy: whole-batch abort with HTTP 400. Pages
-        # in a batch share the same client/user, so a missing key fails every
-        # handwriting page anyway. Cancelling pending futures avoids spending
-        # any further Anthropic-side cost for typed-only pages we'd discard.
-        missing_key_response: dict | None = None
-
-        if valid_pages:
-            with ThreadPoolExecutor(max_workers=min(5, len(valid_pages))) as executor:
-                future_to_id = {
-                    executor.submit(process_page, page_id, page_data, anthropic_client): page_id
-                    for page_id, page_data in valid_pages
-                }
-                for future in as_completed(future_to_id):
-                    page_id = future_to_id[future]
-                    try:
-                        results.append(future.result())
-                    except ValueError as e:
-                        if "Anthropic API key required" in str(e):
-                            # Cancel any not-yet-started futures. In-flight
-                            # Claude calls cannot be killed by concurrent.futures
-                            # but the `with` block's shutdown will wait for them
-                            # to drain.
-                            for f in future_to_id:
-                                f.cancel()
-                            missing_key_response = error_response(
-                                400,
-                                "Anthropic API key required for handwriting OCR. "
-                                "Provide x-anthropic-key header.",
-                                "MISSING_ANTHROPIC_KEY",
-                            )
-                            break
-                        logger.error(f"Error processing page {page_id}: {e}")
-                        failed_pages.append(page_id)
-                    except Exception as e:
-                        logger.error(f"Error processing page {page_id}: {e}")
-                        failed_pages.append(page_id)
-
-        if missing_key_response is not None:
-            return missing_key_response
-
-        response_body = {"pages": results}
-        if failed_pages:
-            response_body["failedPages"] = failed_pages
-
-        return {
-            "statusCode": 200,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(response_body),
+def handle_queue_event(event: dict) -> dict:
+    """Job worker: run the page tasks in an SQS batch.
+
+    Tasks run in parallel like a request's pages. Tasks that should be
+    retried are reported in batchItemFailures so SQS redelivers only those.
+    """
+    backend = jobs.get_backend()
+    if backend is None:
+        raise RuntimeError("Received job tasks but job mode is not configured")
+    store, _ = backend
+    records = event["Records"]
+
+    def run(record):
+        attempt = int(record.get("attributes", {}).get("ApproximateReceiveCount", 1))
+        jobs.run_task(json.loads(record["body"]), attempt, store, process_page,
+                      make_anthropic_client)
+
+    failures = []
+    render_pool.warm()
+    with render_cache.track() as cache_stats, \
+            ThreadPoolExecutor(max_workers=min(OCR_WORKERS, len(records)) or 1) as executor:
+        futures = {
+            executor.submit(copy_context().run, run, record): record["messageId"]
+            for record in records
         }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f"Task {futures[future]} will be retried: {e}")
+                failures.append({"itemIdentifier": futures[future]})
+    if cache_stats.lookups:
+        logger.info(f"Render cache: {cache_stats}")
+    return {"batchItemFailures": failures}
 
-    except Exception as e:
-        logger.error(f"Unhandled error: {e}")
-        return error_response(500, "Internal server error")
 
+def handle_notebook(
+    event: dict, anthropic_client: anthropic.Anthropic | None, context: Any = None
+) -> dict:
+    """Process a whole notebook archive (.rmdoc / zip) into one document.
 
-def process_page(
-    page_id: str,
-    base64_data: str,
+    The request body is the raw archive (sent with a binary content type, so
+    the Function URL delivers it base64-encoded). Pages are processed in
+    parallel but returned in document order, and the combined markdown has
+    an anchor per page so clients can link into it:
+
+    {
+        "notebook": {"id": "doc-uuid", "title": "Meeting notes", "pageCount": 3},
+        "markdown": "<a id=\"page-<uuid>\"></a>\n\n...",
+        "pages": [{"id": "page-uuid", "index": 0, "markdown": "...", "confidence": 1.0}, ...],
+        "failedPages": ["page-uuid"],
+        "deferredPages": ["page-uuid"],
+        "deduplicatedPages": 2,
+        "usage": {...}
+    }
+
+    Honors `x-token-budget` and `Idempotency-Key` as handle_pages does.
+    Handwriting pages that would start too close to the Lambda timeout
+    (`context`) are deferred the same way as past the token budget.
+    """
+    if not event.get("isBase64Encoded", False):
+        return error_response(400, "Notebook archive must be sent as a binary body")
+
+    body = event.get("body") or ""
+    if not body:
+        return error_response(400, "No notebook archive provided")
+
+    try:
+        meter = UsageMeter(parse_token_budget(event), deadline=_request_deadline(context))
+        replay = idempotency.begin(event, NOTEBOOK_PATH)
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    try:
+        notebook = Notebook(spool_base64(body))
+    except NotebookError as e:
+        return error_response(400, f"Invalid notebook archive: {e}")
+    except ValueError as e:
+        return error_response(400, f"Invalid request body: {e}")
+
+    try:
+        page_ids = notebook.page_ids
+        if len(page_ids) > MAX_NOTEBOOK_PAGES:
+            return error_response(
+                400, f"Too many pages in notebook (max {MAX_NOTEBOOK_PAGES})"
+            )
+
+        logger.info(f"Processing notebook {notebook.id} ({len(page_ids)} pages)")
+
+        failed_pages = []
+        by_id = {}
+        valid_pages = []
+        for page_id in page_ids:
+            page = notebook.page(page_id)
+            if page is None:
+                # Never drawn on: the device writes no .rm for blank pages.
+                by_id[page_id] = {"id": page_id, "markdown": "", "confidence": 1.0}
+            elif page.size > MAX_PAGE_SIZE:
+                logger.warning(f"Page {page_id} exceeds size limit")
+                failed_pages.append(page_id)
+            else:
+                valid_pages.append((page_id, page))
+
+        # Submitted in document order, so early pages finish first.
+        page_count = len(valid_pages)
+        try:
+            batch = process_pages(valid_pages, anthropic_client, meter, replay)
+        except MissingAnthropicKeyError:
+            return missing_anthropic_key_response()
+        failed_pages.extend(batch.failed_pages)
+    finally:
+        notebook.close()
+
+    by_id.update((r["id"], r) for r in batch.results)
+    ordered = []
+    sections = []
+    for index, page_id in enumerate(page_ids):
+        sections.append(f'<a id="page-{page_id}"></a>')
+        result = by_id.get(page_id)
+        if result is None:
+            continue
+        ordered.append({**result, "index": index})
+        if result["markdown"]:
+            sections.append(result["markdown"])
+
+    response_body = {
+        "notebook": {
+            "id": notebook.id,
+            "title": notebook.title,
+            "pageCount": len(page_ids),
+        },
+        "markdown": "\n\n".join(sections),
+        "pages": ordered,
+    }
+    failed_set = set(failed_pages)
+    if failed_pages:
+        response_body["failedPages"] = [p for p in page_ids if p in failed_set]
+    if batch.deferred_pages:
+        deferred_set = set(batch.deferred_pages)
+        response_body["deferredPages"] = [p for p in page_ids if p in deferred_set]
+    if batch.deduplicated:
+        response_body["deduplicatedPages"] = batch.deduplicated
+    if batch.replayed:
+        response_body["replayedPages"] = batch.replayed
+    response_body["usage"] = meter.to_dict()
+
+    emit_request_usage(NOTEBOOK_PATH, meter, page_count, len(batch.deferred_pages))
+    return json_response(response_body)
+
+
+def handle_sync(event: dict, anthropic_client: anthropic.Anthropic | None) -> dict:
+    """Delta sync one notebook against its stored page results.
+
+    Request: the notebook's full manifest, with data for pages the client
+    thinks changed (or that a previous sync listed in neededPages):
+
+    {
+        "notebookId": "doc-uuid",
+        "pages": [
+            {"id": "page-uuid", "hash": "<sha256 of the .rm>", "modified": 1700000000000},
+            {"id": "page-uuid", "hash": "...", "modified": ..., "data": "<base64 .rm>"},
+            ...
+        ]
+    }
+
+    Response: only pages whose markdown changed, plus tombstones:
+
+    {
+        "notebookId": "doc-uuid",
+        "pages": [{"id": "...", "hash": "...", "modified": ..., "markdown": "...", "confidence": 0.9}],
+        "unchangedPages": 118,
+        "neededPages": ["page-uuid"],    # changed but sent without data
+        "deletedPages": ["page-uuid"],   # stored but no longer in the manifest
+        "failedPages": [...], "deferredPages": [...], "usage": {...}
+    }
+
+    Pages that fail or are deferred keep their previous stored result and
+    are asked for again on the next sync.
+    """
+    store = sync.get_store()
+    if store is None:
+        return error_response(501, "Delta sync is not configured", "SYNC_NOT_CONFIGURED")
+
+    try:
+        request_data = load_json_body(event, max_size=_body_size_limit(MAX_SYNC_BODY_SIZE))
+    except json.JSONDecodeError as e:
+        return error_response(400, f"Invalid JSON: {e}")
+    except UnsupportedEncoding as e:
+        return error_response(415, str(e))
+    except PayloadTooLarge as e:
+        return error_response(413, str(e))
+    except ValueError as e:
+        return error_response(400, f"Invalid request body: {e}")
+
+    try:
+        meter = UsageMeter(parse_token_budget(event))
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    notebook_id = request_data.get("notebookId")
+    manifest = request_data.get("pages")
+    if not isinstance(notebook_id, str) or not notebook_id:
+        return error_response(400, "notebookId is required")
+    if not isinstance(manifest, list):
+        return error_response(400, "pages must be a list")
+    if len(manifest) > MAX_SYNC_PAGES:
+        return error_response(400, f"Too many pages (max {MAX_SYNC_PAGES})")
+    seen = set()
+    for page in manifest:
+        if not isinstance(page, dict) or not isinstance(page.get("id"), str) \
+                or not isinstance(page.get("hash"), str):
+            return error_response(400, "Each page needs a string id and hash")
+        modified = page.get("modified")
+        if modified is not None and (not isinstance(modified, int) or isinstance(modified, bool)):
+            return error_response(400, f"Page {page['id']}: modified must be epoch milliseconds")
+        if page["id"] in seen:
+            return error_response(400, f"Duplicate page id {page['id']}")
+        seen.add(page["id"])
+        page["hash"] = page["hash"].lower()
+    if sum(1 for page in manifest if page.get("data")) > MAX_PAGES:
+        return error_response(400, f"Too many pages with data (max {MAX_PAGES})")
+
+    store_key = sync.notebook_key(event, notebook_id)
+    stored = store.get_notebook(store_key)
+    plan = sync.plan_sync(stored, manifest)
+    logger.info(
+        f"Syncing notebook {notebook_id}: {len(plan.unchanged)} unchanged, "
+        f"{len(plan.process)} to process, {len(plan.reused)} reused, "
+        f"{len(plan.needed)} needed, {len(plan.deleted)} deleted"
+    )
+
+    # Decode now to check each page against its declared hash; a mismatch
+    # would store a result under the wrong content.
+    valid_pages, failed_pages = validate_pages(plan.process)
+    hashes = {page["id"]: page["hash"] for page in plan.process}
+    to_process = []
+    for page_id, encoded_page in valid_pages:
+        try:
+            rm_bytes = encoded_page.take()
+        except (ValueError, PayloadTooLarge) as e:
+            logger.warning(f"Page {page_id}: {e}")
+            failed_pages.append(page_id)
+            continue
+        if hashlib.sha256(rm_bytes).hexdigest() != hashes[page_id]:
+            logger.warning(f"Page {page_id}: data does not match its hash")
+            failed_pages.append(page_id)
+            continue
+        to_process.append((page_id, rm_bytes))
+    del request_data
+
+    try:
+        batch = process_pages(to_process, anthropic_client, meter)
+    except MissingAnthropicKeyError:
+        return missing_anthropic_key_response()
+    failed_pages.extend(batch.failed_pages)
+
+    changed, unchanged = sync.commit_sync(
+        store, store_key, stored, manifest, plan, {r["id"]: r for r in batch.results}
+    )
+    response_body = {"notebookId": notebook_id, "pages": changed, "unchangedPages": unchanged}
+    if plan.needed:
+        response_body["neededPages"] = plan.needed
+    if plan.deleted:
+        response_body["deletedPages"] = plan.deleted
+    if failed_pages:
+        response_body["failedPages"] = failed_pages
+    if batch.deferred_pages:
+        response_body["deferredPages"] = batch.deferred_pages
+    response_body["usage"] = meter.to_dict()
+
+    emit_request_usage(SYNC_PATH, meter, len(to_process), len(batch.deferred_pages))
+    return json_response(response_body)
+
+
+class MissingAnthropicKeyError(Exception):
+    """A handwriting page was found but no Anthropic key was provided."""
+
+
+@dataclass
+class BatchResult:
+    """Outcome of process_pages for one request."""
+
+    results: list[dict] = field(default_factory=list)
+    failed_pages: list[str] = field(default_factory=list)
+    # Handwriting pages not started because the token budget ran out
+    deferred_pages: list[str] = field(default_factory=list)
+    # Pages answered from another page's result instead of being processed
+    deduplicated: int = 0
+    # Pages answered from an earlier attempt with the same Idempotency-Key
+    replayed: int = 0
+
+
+def _reused(result: dict) -> dict:
+    """A result answered without new Claude calls: its `ocr` trace and
+    `usage` belong to the page that made the calls, so the copy drops them
+    and per-page usage still adds up to the request's."""
+    return {k: v for k, v in result.items() if k not in ("ocr", "usage")}
+
+
+def page_content_key(page_data: Any) -> str | None:
+    """Hash a page's payload without decoding it, or None if unhashable."""
+    if isinstance(page_data, str):
+        return "raw:" + hashlib.sha256(page_data.encode("ascii", "replace")).hexdigest()
+    if isinstance(page_data, bytes):
+        return "rm:" + hashlib.sha256(page_data).hexdigest()
+    digest = getattr(page_data, "digest", None)
+    return digest() if digest is not None else None
+
+
+def process_pages(
+    pages: list[tuple[str, Any]],
     anthropic_client: anthropic.Anthropic | None,
-) -> dict:
-    """Process a single page through the OCR pipeline.
+    meter: UsageMeter | None = None,
+    replay: Replay | None = None,
+) -> BatchResult:
+    """Run process_page over (page_id, page_data) pairs in parallel.
 
-    1. Decode base64 .rm data
-    2. Try to extract typed text directly
-    3. If handwriting present, render to PNG and OCR
-    4. Format as markdown
+    Pages with identical payloads (template pages, copies, resync retries)
+    are processed once and the result is fanned out to every page id that
+    shares it. Results are in completion order. Claude usage is charged to
+    `meter`; pages that can't start a Claude call because its budget is
+    spent are deferred rather than failed. Raises MissingAnthropicKeyError
+    if any page needs OCR and no client was given.
 
-    Args:
-        page_id: Unique identifier for the page
-        base64_data: Base64-encoded .rm file data
-        anthropic_client: Anthropic client for OCR (required for handwriting;
-            None is allowed for typed-only pages)
+    With a `replay` (the request's Idempotency-Key), pages already finished
+    by an earlier attempt are answered from it first, and each new result
+    is recorded to it as it completes.
+    """
+    batch = BatchResult()
+    if not pages:
+        return batch
+
+    # Group by content hash up front; the first page id in each group is
+    # the one actually processed.
+    groups: dict[str, list[str]] = {}
+    unique_pages = []
+    unhashable = set()
+    for page_id, page_data in pages:
+        key = page_content_key(page_data)
+        replayed = replay.lookup(page_id, key) if replay is not None else None
+        if replayed is not None:
+            batch.results.append({**_reused(replayed), "id": page_id, "replayed": True})
+            batch.replayed += 1
+            continue
+        if key is None:
+            key = f"id:{len(unique_pages)}:{page_id}"
+            unhashable.add(key)
+        if key in groups:
+            groups[key].append(page_id)
+            batch.deduplicated += 1
+            continue
+        groups[key] = [page_id]
+        unique_pages.append((key, page_id, page_data))
+
+    if batch.replayed:
+        logger.info(f"Replayed {batch.replayed} of {len(pages)} pages for a retried request")
+    if batch.deduplicated:
+        logger.info(f"Deduplicated {batch.deduplicated} of {len(pages)} pages")
+    if not unique_pages:
+        return batch
+
+    # Process pages in parallel. One thread per page that can make progress
+    # (rendering, queued for OCR, or in OCR); STAGES limits each stage, so
+    # rendering the next pages overlaps Claude's work on earlier ones.
+    #
+    # MISSING_ANTHROPIC_KEY policy: whole-batch abort with HTTP 400. Pages
+    # in a batch share the same client/user, so a missing key fails every
+    # handwriting page anyway. Cancelling pending futures avoids spending
+    # any further Anthropic-side cost for typed-only pages we'd discard.
+    missing_key = False
+
+    # Render workers must fork before the page threads start.
+    render_pool.warm()
+    workers = min(STAGES.max_in_flight, len(unique_pages))
+    with render_cache.track() as cache_stats, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Page threads run in a copy of this context to count into cache_stats
+        future_to_key = {
+            executor.submit(
+                copy_context().run, process_page, page_id, page_data, anthropic_client, meter=meter
+            ): key
+            for key, page_id, page_data in unique_pages
+        }
+        for future in as_completed(future_to_key):
+            key = future_to_key[future]
+            page_ids = groups[key]
+            try:
+                result = future.result()
+                batch.results.append(result)
+                batch.results.extend(
+                    {**_reused(result), "id": dup_id, "deduplicatedFrom": page_ids[0]}
+                    for dup_id in page_ids[1:]
+                )
+                if replay is not None and key not in unhashable:
+                    for page_id in page_ids:
+                        replay.record(page_id, key, {**result, "id": page_id})
+            except BudgetExhausted as e:
+                logger.info(f"Deferring page {page_ids[0]}: {e}")
+                batch.deferred_pages.extend(page_ids)
+            except ValueError as e:
+                if "Anthropic API key required" in str(e):
+                    # Cancel any not-yet-started futures. In-flight
+                    # Claude calls cannot be killed by concurrent.futures
+                    # but the `with` block's shutdown will wait for them
+                    # to drain.
+                    for f in future_to_key:
+                        f.cancel()
+                    missing_key = True
+                    break
+                logger.error(f"Error processing page {page_ids[0]}: {e}")
+                batch.failed_pages.extend(page_ids)
+            except Exception as e:
+                logger.error(f"Error processing page {page_ids[0]}: {e}")
+                batch.failed_pages.extend(page_ids)
+
+    if cache_stats.lookups:
+        logger.info(f"Render cache: {cache_stats}")
+    if missing_key:
+        raise MissingAnthropicKeyError()
+    return batch
+
+
+@dataclass
+class RenderedPage:
+    """Output of the render stage: typed text and what the OCR stage needs."""
+
+    page_id: str
+    typed_markdown: str | None = None
+    has_handwriting: bool = False
+    png: bytes | None = None
+    segments: PageSegments | None = None
+    # For unsegmented pages: whether the segmenter found any drawing strokes
+    drawing_regions: bool | None = None
+    scale_choice: ScaleChoice | None = None
+
+    @property
+    def scale(self) -> float:
+        return self.scale_choice.scale if self.scale_choice is not None else RENDER_SCALE
+
+
+def render_page(
+    page_id: str,
+    base64_data: str | bytes | EncodedPage | ArchivePage,
+    render_handwriting: bool = True,
+) -> RenderedPage:
+    """CPU stage: decode the page, extract typed text, render handwriting.
+
+    Mixed text/drawing pages are segmented so only text regions are
+    transcribed; other handwriting pages are rendered whole. With
+    render_handwriting=False, handwriting is detected but not rendered
+    (there is no client to OCR it with).
     """
     # Decode .rm data
-    rm_bytes = base64.b64decode(base64_data)
+    if isinstance(base64_data, str):
+        rm_bytes = b64decode(base64_data)
+    elif isinstance(base64_data, bytes):
+        rm_bytes = base64_data
+    else:
+        rm_bytes = base64_data.take()
 
     # Try typed text extraction first (no OCR needed)
     typed_text = extract_typed_text(rm_bytes)
-    has_handwriting = has_strokes(rm_bytes)
-
-    markdown_parts = []
-    confidence = 1.0  # Default confidence for typed text
+    page = RenderedPage(page_id, has_handwriting=has_strokes(rm_bytes))
 
     # Add typed text if present
     if typed_text:
-        markdown_parts.append(format_typed_text(typed_text))
+        page.typed_markdown = format_typed_text(typed_text)
         logger.info(f"Page {page_id}: Extracted typed text directly")
 
+    if page.has_handwriting and render_handwriting:
+        page.scale_choice = choose_scale(rm_bytes)
+        if page.scale_choice is not None:
+            logger.info(
+                f"Page {page_id}: Render scale {page.scale_choice.scale} "
+                f"(~{page.scale_choice.estimated_token_saving} image tokens saved)"
+            )
+        # Mixed pages send only the text strokes for transcription and each
+        # drawing to the cheap description prompt.
+        page.segments = segment_page(rm_bytes, page.scale)
+        if page.segments is not None:
+            logger.info(
+                f"Page {page_id}: Segmented into text and "
+                f"{len(page.segments.drawing_pngs)} drawing region(s)"
+            )
+        else:
+            logger.info(f"Page {page_id}: Rendering strokes for OCR")
+            page.drawing_regions = has_drawing_regions(rm_bytes)
+            page.png = render_rm_to_png(rm_bytes, page.scale)
+    return page
+
+
+def ocr_page(
+    page: RenderedPage,
+    anthropic_client: anthropic.Anthropic | None,
+    meter: UsageMeter | None = None,
+) -> dict:
+    """I/O stage: transcribe a rendered page with Claude and build its result."""
+    markdown_parts = [page.typed_markdown]
+    confidence = 1.0  # Default confidence for typed text
+    trace = OcrTrace(meter=meter)
+
     # Process handwriting if present
-    if has_handwriting:
+    if page.has_handwriting:
         if anthropic_client is None:
             raise ValueError("Anthropic API key required for handwriting OCR")
-
-        logger.info(f"Page {page_id}: Rendering strokes for OCR")
-        png_bytes = render_rm_to_png(rm_bytes)
-
-        handwriting_md, confidence = extract_text_from_image(png_bytes, anthropic_client)
+        if page.segments is not None:
+            handwriting_md, confidence = extract_text_from_segments(
+                page.segments, anthropic_client, trace=trace, scale=page.scale
+            )
+        else:
+            handwriting_md, confidence = extract_text_from_image(
+                page.png, anthropic_client, trace=trace, scale=page.scale,
+                drawing_regions=page.drawing_regions,
+            )
         if handwriting_md:
             markdown_parts.append(handwriting_md)
 
     # Combine results
     markdown = "\n\n".join(filter(None, markdown_parts))
 
-    return {
-        "id": page_id,
+    result = {
+        "id": page.page_id,
         "markdown": markdown,
         "confidence": round(confidence, 2),
     }
+    # Model routing and per-call latency/tokens, for tuning the cascade
+    if trace.calls:
+        result["ocr"] = trace.to_dict()
+        result["usage"] = summarize(trace.calls)
+    if page.scale_choice is not None:
+        result["render"] = page.scale_choice.to_dict()
+    return result
+
+
+def process_page(
+    page_id: str,
+    base64_data: str | bytes | EncodedPage | ArchivePage,
+    anthropic_client: anthropic.Anthropic | None,
+    meter: UsageMeter | None = None,
+) -> dict:
+    """Process a single page through the OCR pipeline.
+
+    1. Decode base64 .rm data
+    2. Try to extract typed text directly
+    3. If handwriting present, render to PNG and OCR (mixed text/drawing
+       pages are segmented so only text regions are transcribed)
+    4. Format as markdown
+
+    Steps 1-3's rendering run in the render stage (render_page) and the
+    Claude calls in the OCR stage (ocr_page), each under its own STAGES
+    limit. Pages without handwriting never enter the OCR queue. Pages are
+    admitted, and reach OCR, in fair order between tenants (the caller set
+    with fair_scheduler.tenant).
+
+    Args:
+        page_id: Unique identifier for the page
+        base64_data: Base64-encoded .rm file data as a str, the .rm bytes
+            themselves (job tasks), or a lazy page (EncodedPage,
+            ArchivePage) whose take() yields the .rm bytes
+        anthropic_client: Anthropic client for OCR (required for handwriting;
+            None is allowed for typed-only pages)
+        meter: Request-wide UsageMeter; raises BudgetExhausted if its token
+            budget is spent before this page's first Claude call
+    """
+    with STAGES.admit():
+        with STAGES.render() as enqueue:
+            page = render_page(
+                page_id, base64_data, render_handwriting=anthropic_client is not None
+            )
+            if not page.has_handwriting:
+                return ocr_page(page, anthropic_client, meter)
+            if anthropic_client is None:
+                raise ValueError("Anthropic API key required for handwriting OCR")
+            enqueue()
+        with STAGES.ocr():
+            return ocr_page(page, anthropic_client, meter)
+
+
+def parse_token_budget(event: dict) -> int | None:
+    """Read the optional per-request token budget header."""
+    value = get_header(event, TOKEN_BUDGET_HEADER)
+    if value is None or value.strip() == "":
+        return None
+    try:
+        budget = int(value)
+    except ValueError:
+        budget = 0
+    if budget <= 0:
+        raise ValueError(f"Invalid {TOKEN_BUDGET_HEADER} header: must be a positive integer")
+    return budget
+
+
+def json_response(body: dict, status_code: int = 200) -> dict:
+    """Create a JSON response (200 unless given)."""
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(body),
+    }
+
+
+def missing_anthropic_key_response() -> dict:
+    return error_response(
+        400,
+        "Anthropic API key required for handwriting OCR. "
+        "Provide x-anthropic-key header.",
+        "MISSING_ANTHROPIC_KEY",
+    )
 
 
 def error_response(status_code: int, message: str, code: str | None = None) -> dict:
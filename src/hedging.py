@@ -0,0 +1,211 @@
+"""Hedged Claude requests: a second call for a page stuck in the latency tail.
+
+A few Claude calls take many times the median, and one slow page holds up
+the whole batch response. With HEDGE_PERCENTILE set (e.g. 95), a call still
+running past that percentile of recent latencies for the same model and
+purpose gets a duplicate request, and whichever answer arrives first wins.
+
+The synchronous SDK can't abort a request in flight, so the losing call is
+abandoned rather than cancelled: its answer is discarded and its usage is
+still charged to the request's meter if it lands. To cap that extra spend,
+at most HEDGE_MAX_FRACTION of recent calls (default 5%) may be hedged, and
+no hedge starts once the request's token budget is spent.
+
+Hedging stays off for a model and purpose until MIN_SAMPLES calls have
+been timed, so a cold container sends no duplicates.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextvars import copy_context
+from dataclasses import dataclass
+
+logger = logging.getLogger()
+
+HEDGE_PERCENTILE_ENV = "HEDGE_PERCENTILE"
+HEDGE_MAX_FRACTION_ENV = "HEDGE_MAX_FRACTION"
+DEFAULT_MAX_FRACTION = 0.05
+
+# Latencies (per model and purpose) and hedge decisions kept for the
+# percentile and the spend cap.
+WINDOW = 200
+MIN_SAMPLES = 20
+
+
+@dataclass
+class HedgeStats:
+    """Calls seen, duplicates sent, and duplicates that answered first."""
+
+    calls: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+
+
+class Hedger:
+    """Sends a duplicate of calls that outlive a percentile of recent latencies."""
+
+    def __init__(
+        self,
+        percentile: float,
+        max_fraction: float = DEFAULT_MAX_FRACTION,
+        window: int = WINDOW,
+        min_samples: int = MIN_SAMPLES,
+    ):
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.stats = HedgeStats()
+        self._window = window
+        self._lock = threading.Lock()
+        self._latencies: dict[str, deque[float]] = {}
+        self._decisions: deque[bool] = deque(maxlen=window)
+
+    def threshold(self, kind: str) -> float | None:
+        """Seconds after which a `kind` call is hedged, or None while too few
+        calls have been timed."""
+        with self._lock:
+            samples = sorted(self._latencies.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile / 100))]
+
+    def observe(self, kind: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=self._window)).append(seconds)
+
+    def call(
+        self,
+        kind: str,
+        send: Callable[[], object],
+        may_hedge: Callable[[], bool] | None = None,
+        abandoned: Callable[[object], None] | None = None,
+    ):
+        """send(), duplicated if it runs past the threshold for `kind`.
+
+        Returns the first successful answer; raises the first attempt's error
+        only if every attempt fails. `may_hedge` is asked before a duplicate is sent, and
+        `abandoned` receives the losing answer if it arrives later.
+        """
+        delay = self.threshold(kind)
+        if delay is None:
+            self._decide(False)
+            started = time.monotonic()
+            result = send()
+            self.observe(kind, time.monotonic() - started)
+            return result
+
+        primary = self._start(kind, send)
+        wait([primary], timeout=delay)
+        if primary.done() or (may_hedge is not None and not may_hedge()):
+            self._decide(False)
+            return primary.result()
+        if not self._decide(True):
+            return primary.result()
+
+        logger.info(f"Hedging {kind} call still running after {delay * 1000:.0f} ms")
+        hedge = self._start(kind, send)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Prefer the primary when both land together
+            for future in sorted(done, key=lambda f: f is not primary):
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.stats.hedge_wins += 1
+                    for loser in pending:
+                        loser.add_done_callback(lambda f: _hand_off(f, abandoned))
+                    return future.result()
+        raise primary.exception()
+
+    def _decide(self, hedge: bool) -> bool:
+        """Count a call, and whether it may be hedged under the spend cap."""
+        with self._lock:
+            if hedge:
+                hedged = sum(self._decisions) + 1
+                hedge = hedged <= self.max_fraction * (len(self._decisions) + 1)
+            self._decisions.append(hedge)
+            self.stats.calls += 1
+            self.stats.hedges += hedge
+        return hedge
+
+    def _start(self, kind: str, send: Callable[[], object]) -> Future:
+        future = Future()
+        started = time.monotonic()
+
+        def run():
+            try:
+                result = send()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            self.observe(kind, time.monotonic() - started)
+            future.set_result(result)
+
+        context = copy_context()
+        threading.Thread(target=context.run, args=(run,), daemon=True).start()
+        return future
+
+
+def _hand_off(future: Future, abandoned: Callable[[object], None] | None):
+    if abandoned is None or future.exception() is not None:
+        return
+    try:
+        abandoned(future.result())
+    except Exception as e:
+        logger.warning(f"Couldn't account for an abandoned hedged call: {e}")
+
+
+_hedger: Hedger | None = None
+_hedger_checked = False
+_hedger_lock = threading.Lock()
+
+
+def configure(hedger: Hedger | None):
+    """Use an explicit hedger (tests); None to reset."""
+    global _hedger, _hedger_checked
+    with _hedger_lock:
+        _hedger = hedger
+        _hedger_checked = hedger is not None
+
+
+def get_hedger() -> Hedger | None:
+    """The container's hedger, built from the environment on first use.
+
+    Returns None (no hedging) unless HEDGE_PERCENTILE is set.
+    """
+    global _hedger, _hedger_checked
+    if _hedger_checked:
+        return _hedger
+    with _hedger_lock:
+        if not _hedger_checked:
+            _hedger = _hedger_from_env()
+            _hedger_checked = True
+    return _hedger
+
+
+def _float_env(name: str, default: float | None, low: float, high: float) -> float | None:
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not low < number < high:
+        logger.warning(f"Ignoring invalid {name}={value!r}")
+        return default
+    return number
+
+
+def _hedger_from_env() -> Hedger | None:
+    percentile = _float_env(HEDGE_PERCENTILE_ENV, None, 0, 100)
+    if percentile is None:
+        return None
+    max_fraction = _float_env(HEDGE_MAX_FRACTION_ENV, DEFAULT_MAX_FRACTION, 0, 1)
+    return Hedger(percentile, max_fraction)
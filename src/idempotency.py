@@ -0,0 +1,124 @@
+"""Idempotent OCR requests: replay finished pages to a retried request.
+
+A client that times out and retries would otherwise have the whole batch
+processed (and paid for) again, even if the first attempt finished a
+moment later. A request sent with an `Idempotency-Key` header records each
+page's result as it completes; a retry with the same key gets the finished
+pages back immediately and processes only the rest. A page is replayed
+only when its content matches what was recorded, so a retry that changes a
+page processes it again.
+
+Keys are scoped to the route and to the caller's Anthropic key, so two
+users picking the same key never see each other's results.
+
+IDEMPOTENCY_BACKEND selects the store: "aws" (the default when
+IDEMPOTENCY_TABLE is set) for DynamoDB, "sqlite" (IDEMPOTENCY_SQLITE_PATH)
+or "memory" (the default otherwise, which covers retries that reach the
+same warm container or server process).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from idempotency_store import (
+    DynamoIdempotencyStore,
+    IdempotencyStore,
+    MemoryIdempotencyStore,
+    SQLiteIdempotencyStore,
+)
+from payload import get_header
+
+logger = logging.getLogger()
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_BACKEND_ENV = "IDEMPOTENCY_BACKEND"
+DEFAULT_SQLITE_PATH = "/tmp/remarkable-idempotency.db"
+
+_store: IdempotencyStore | None = None
+_store_checked = False
+_store_lock = threading.Lock()
+
+
+def configure(store: IdempotencyStore | None):
+    """Use an explicit store (tests, server mode); None to reset."""
+    global _store, _store_checked
+    with _store_lock:
+        _store = store
+        _store_checked = store is not None
+
+
+def get_store() -> IdempotencyStore:
+    """The configured store, built from the environment on first use."""
+    global _store, _store_checked
+    if _store_checked:
+        return _store
+    with _store_lock:
+        if not _store_checked:
+            _store = _store_from_env()
+            _store_checked = True
+    return _store
+
+
+def _store_from_env() -> IdempotencyStore:
+    kind = os.environ.get(IDEMPOTENCY_BACKEND_ENV) or (
+        "aws" if os.environ.get("IDEMPOTENCY_TABLE") else "memory"
+    )
+    if kind == "aws":
+        return DynamoIdempotencyStore(os.environ["IDEMPOTENCY_TABLE"])
+    if kind == "sqlite":
+        return SQLiteIdempotencyStore(os.environ.get("IDEMPOTENCY_SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    if kind == "memory":
+        return MemoryIdempotencyStore()
+    raise ValueError(f"Unknown {IDEMPOTENCY_BACKEND_ENV}: {kind}")
+
+
+class Replay:
+    """One request's recorded results under its Idempotency-Key."""
+
+    def __init__(self, store: IdempotencyStore, scope: str):
+        self.store = store
+        self.scope = scope
+        self._recorded = store.get_results(scope)
+
+    def lookup(self, page_id: str, page_hash: str | None) -> dict | None:
+        """The recorded result for this page and content, if any."""
+        entry = self._recorded.get(page_id)
+        if entry is None or page_hash is None or entry["hash"] != page_hash:
+            return None
+        return entry["result"]
+
+    def record(self, page_id: str, page_hash: str | None, result: dict):
+        """Store a finished page's result; failures only cost the replay."""
+        if page_hash is None:
+            return
+        try:
+            self.store.put_result(self.scope, page_id, page_hash, result)
+        except Exception as e:
+            logger.warning(f"Couldn't record result of page {page_id} for replay: {e}")
+
+
+def begin(event: dict, route: str) -> Replay | None:
+    """The request's Replay, or None if it has no Idempotency-Key.
+
+    Raises ValueError for a malformed key. If the store can't be read, the
+    request runs without replay.
+    """
+    key = get_header(event, IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise ValueError(
+            f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} printable characters"
+        )
+    anthropic_key = get_header(event, "x-anthropic-key") or ""
+    scope = hashlib.sha256(f"{anthropic_key}\n{route}\n{key}".encode()).hexdigest()
+    try:
+        return Replay(get_store(), scope)
+    except Exception as e:
+        logger.warning(f"Idempotency store unavailable, processing without replay: {e}")
+        return None
@@ -0,0 +1,142 @@
+"""Per-page results recorded under a request's Idempotency-Key.
+
+A request sent with an Idempotency-Key has each page's result stored as it
+completes, together with the content hash of the page it came from. A
+retry with the same key gets those results back instead of paying for the
+pages again. Records expire after IDEMPOTENCY_TTL_SECONDS.
+
+IdempotencyStore is the interface the idempotency module codes against:
+- MemoryIdempotencyStore and SQLiteIdempotencyStore for tests, server mode
+  and offline runs
+- DynamoIdempotencyStore for Lambda (one item per page)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+# Clients retry within minutes; a day covers a device that was offline.
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+
+
+class IdempotencyStore:
+    """Interface for results recorded under an idempotency scope.
+
+    A scope identifies one caller's Idempotency-Key. Each entry is a dict
+    with "hash" (the page's content key) and "result" (its result dict).
+    """
+
+    def get_results(self, scope: str) -> dict[str, dict]:
+        """Unexpired entries for a scope, keyed by page id."""
+        raise NotImplementedError
+
+    def put_result(self, scope: str, page_id: str, page_hash: str, result: dict):
+        """Record (or replace) one page's result."""
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """In-process store; records live as long as the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scopes: dict[str, tuple[float, dict[str, dict]]] = {}
+
+    def get_results(self, scope):
+        now = time.time()
+        with self._lock:
+            for expired in [s for s, (expires, _) in self._scopes.items() if expires < now]:
+                del self._scopes[expired]
+            _, pages = self._scopes.get(scope, (0, {}))
+            return {page_id: dict(entry) for page_id, entry in pages.items()}
+
+    def put_result(self, scope, page_id, page_hash, result):
+        expires = time.time() + IDEMPOTENCY_TTL_SECONDS
+        with self._lock:
+            _, pages = self._scopes.get(scope, (expires, {}))
+            pages[page_id] = {"hash": page_hash, "result": result}
+            self._scopes[scope] = (expires, pages)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Single-file store for offline runs and single-host servers."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS idempotent_results (
+                scope TEXT NOT NULL, page_id TEXT NOT NULL, page_hash TEXT NOT NULL,
+                result TEXT NOT NULL, expires_at REAL NOT NULL,
+                PRIMARY KEY (scope, page_id)
+            );
+            """
+        )
+
+    def get_results(self, scope):
+        with self._lock:
+            self._db.execute("DELETE FROM idempotent_results WHERE expires_at < ?", (time.time(),))
+            rows = self._db.execute(
+                "SELECT page_id, page_hash, result FROM idempotent_results WHERE scope = ?",
+                (scope,),
+            ).fetchall()
+        return {page_id: {"hash": page_hash, "result": json.loads(result)}
+                for page_id, page_hash, result in rows}
+
+    def put_result(self, scope, page_id, page_hash, result):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO idempotent_results "
+                "(scope, page_id, page_hash, result, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (scope, page_id, page_hash, json.dumps(result),
+                 time.time() + IDEMPOTENCY_TTL_SECONDS),
+            )
+
+
+class DynamoIdempotencyStore(IdempotencyStore):
+    """DynamoDB table keyed (pk = scope, sk = page id), expiring via TTL on
+    `expiresAt`."""
+
+    def __init__(self, table_name: str, dynamodb=None):
+        import boto3
+
+        self._table = table_name
+        self._dynamodb = dynamodb or boto3.client("dynamodb")
+
+    def get_results(self, scope):
+        now = time.time()
+        pages = {}
+        kwargs = {
+            "TableName": self._table,
+            "KeyConditionExpression": "pk = :pk",
+            "ExpressionAttributeValues": {":pk": {"S": scope}},
+            "ConsistentRead": True,
+        }
+        while True:
+            response = self._dynamodb.query(**kwargs)
+            for item in response.get("Items", []):
+                # TTL deletion lags expiry by up to a couple of days.
+                if int(item["expiresAt"]["N"]) < now:
+                    continue
+                pages[item["sk"]["S"]] = {
+                    "hash": item["hash"]["S"],
+                    "result": json.loads(item["result"]["S"]),
+                }
+            if "LastEvaluatedKey" not in response:
+                return pages
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def put_result(self, scope, page_id, page_hash, result):
+        self._dynamodb.put_item(
+            TableName=self._table,
+            Item={
+                "pk": {"S": scope},
+                "sk": {"S": page_id},
+                "hash": {"S": page_hash},
+                "result": {"S": json.dumps(result)},
+                "expiresAt": {"N": str(int(time.time() + IDEMPOTENCY_TTL_SECONDS))},
+            },
+        )
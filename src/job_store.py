@@ -0,0 +1,447 @@
+"""Storage for asynchronous OCR jobs: job records, page data and results.
+
+A job is a list of pages in document order, addressed by index. Its record
+counts finished pages; each page's .rm bytes are stored until a worker has
+processed it, and its result is written once (redelivered tasks don't
+double-count). An open job (an upload session) takes more pages at the end
+until it is closed.
+
+JobStore is the interface the jobs module codes against:
+- MemoryJobStore and SQLiteJobStore run the whole flow in one process (tests,
+  server mode, offline runs)
+- DynamoJobStore keeps records and results in a DynamoDB table and page data
+  in S3, for Lambda workers
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+# Finished jobs (and their results) are dropped after this long.
+JOB_TTL_SECONDS = 7 * 24 * 3600
+
+
+class JobNotFound(KeyError):
+    """No job with that id (never created, or expired)."""
+
+
+class JobClosed(Exception):
+    """Pages were appended to a job that isn't open."""
+
+
+class JobStore:
+    """Interface for job persistence."""
+
+    def create_job(
+        self, job_id: str, meta: dict, pages: list[tuple[str, bytes | None]], open: bool = False
+    ):
+        """Store a new job. `pages` are (page_id, rm_bytes) in document order.
+
+        An open job accepts append_pages() until close_job().
+        """
+        raise NotImplementedError
+
+    def append_pages(self, job_id: str, pages: list[tuple[str, bytes | None]], max_pages: int) -> int:
+        """Add pages to the end of an open job and return the first new index.
+
+        Raises JobNotFound, JobClosed, or ValueError if the job would exceed
+        max_pages.
+        """
+        raise NotImplementedError
+
+    def close_job(self, job_id: str):
+        """Stop an open job taking pages (no-op if already closed). Raises JobNotFound."""
+        raise NotImplementedError
+
+    def get_job(self, job_id: str) -> dict | None:
+        """Job record: the creation meta plus pageCount, completedCount, failedCount, open."""
+        raise NotImplementedError
+
+    def get_page(self, job_id: str, index: int) -> tuple[str, bytes | None] | None:
+        """(page_id, rm_bytes) for a page, or None if the job is gone."""
+        raise NotImplementedError
+
+    def has_result(self, job_id: str, index: int) -> bool:
+        raise NotImplementedError
+
+    def put_result(self, job_id: str, index: int, result: dict) -> bool:
+        """Record a page's result (with "error" if it failed) and release its data.
+
+        Returns False, changing nothing, if the page already has a result.
+        """
+        raise NotImplementedError
+
+    def list_results(self, job_id: str, start: int, limit: int) -> list[dict]:
+        """Up to `limit` recorded results with index >= start, in index order."""
+        raise NotImplementedError
+
+
+def _new_record(meta: dict, page_count: int, open: bool) -> dict:
+    return {**meta, "pageCount": page_count, "completedCount": 0, "failedCount": 0,
+            "open": open}
+
+
+def _too_many(max_pages: int) -> ValueError:
+    return ValueError(f"Too many pages (max {max_pages})")
+
+
+class MemoryJobStore(JobStore):
+    """In-process store; jobs live as long as the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: dict[str, dict] = {}
+        self._pages: dict[tuple[str, int], tuple[str, bytes | None]] = {}
+        self._results: dict[str, dict[int, dict]] = {}
+
+    def create_job(self, job_id, meta, pages, open=False):
+        with self._lock:
+            self._jobs[job_id] = _new_record(meta, len(pages), open)
+            self._results[job_id] = {}
+            for index, page in enumerate(pages):
+                self._pages[(job_id, index)] = page
+
+    def append_pages(self, job_id, pages, max_pages):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise JobNotFound(job_id)
+            if not job["open"]:
+                raise JobClosed(job_id)
+            start = job["pageCount"]
+            if start + len(pages) > max_pages:
+                raise _too_many(max_pages)
+            job["pageCount"] += len(pages)
+            for index, page in enumerate(pages, start):
+                self._pages[(job_id, index)] = page
+            return start
+
+    def close_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise JobNotFound(job_id)
+            job["open"] = False
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def get_page(self, job_id, index):
+        with self._lock:
+            return self._pages.get((job_id, index))
+
+    def has_result(self, job_id, index):
+        with self._lock:
+            return index in self._results.get(job_id, {})
+
+    def put_result(self, job_id, index, result):
+        with self._lock:
+            results = self._results.get(job_id)
+            if results is None or index in results:
+                return False
+            results[index] = result
+            page = self._pages.get((job_id, index))
+            if page is not None:
+                self._pages[(job_id, index)] = (page[0], None)
+            self._jobs[job_id]["failedCount" if "error" in result else "completedCount"] += 1
+            return True
+
+    def list_results(self, job_id, start, limit):
+        with self._lock:
+            results = self._results.get(job_id, {})
+            return [results[i] for i in sorted(results) if i >= start][:limit]
+
+
+class SQLiteJobStore(JobStore):
+    """Single-file store for offline runs and single-host servers."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, meta TEXT NOT NULL, page_count INTEGER NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0,
+                expires_at REAL NOT NULL, open INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS job_pages (
+                job_id TEXT NOT NULL, idx INTEGER NOT NULL, page_id TEXT NOT NULL, data BLOB,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL, idx INTEGER NOT NULL, result TEXT NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+            """
+        )
+
+    def create_job(self, job_id, meta, pages, open=False):
+        with self._lock:
+            self._db.execute("BEGIN")
+            expired = "SELECT id FROM jobs WHERE expires_at < ?"
+            for table in ("job_pages", "job_results"):
+                self._db.execute(f"DELETE FROM {table} WHERE job_id IN ({expired})", (time.time(),))
+            self._db.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),))
+            self._db.execute(
+                "INSERT INTO jobs (id, meta, page_count, expires_at, open) VALUES (?, ?, ?, ?, ?)",
+                (job_id, json.dumps(meta), len(pages), time.time() + JOB_TTL_SECONDS, int(open)),
+            )
+            self._insert_pages(job_id, 0, pages)
+            self._db.execute("COMMIT")
+
+    def _insert_pages(self, job_id, start, pages):
+        self._db.executemany(
+            "INSERT INTO job_pages (job_id, idx, page_id, data) VALUES (?, ?, ?, ?)",
+            [(job_id, i, page_id, data) for i, (page_id, data) in enumerate(pages, start)],
+        )
+
+    def append_pages(self, job_id, pages, max_pages):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT page_count, open FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+                if row is None:
+                    raise JobNotFound(job_id)
+                start, is_open = row
+                if not is_open:
+                    raise JobClosed(job_id)
+                if start + len(pages) > max_pages:
+                    raise _too_many(max_pages)
+                self._db.execute(
+                    "UPDATE jobs SET page_count = page_count + ? WHERE id = ?", (len(pages), job_id)
+                )
+                self._insert_pages(job_id, start, pages)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return start
+
+    def close_job(self, job_id):
+        with self._lock:
+            updated = self._db.execute(
+                "UPDATE jobs SET open = 0 WHERE id = ?", (job_id,)
+            ).rowcount
+        if not updated:
+            raise JobNotFound(job_id)
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT meta, page_count, completed, failed, open FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[0]), "pageCount": row[1],
+                "completedCount": row[2], "failedCount": row[3], "open": bool(row[4])}
+
+    def get_page(self, job_id, index):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT page_id, data FROM job_pages WHERE job_id = ? AND idx = ?",
+                (job_id, index),
+            ).fetchone()
+        return (row[0], row[1]) if row is not None else None
+
+    def has_result(self, job_id, index):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM job_results WHERE job_id = ? AND idx = ?", (job_id, index)
+            ).fetchone() is not None
+
+    def put_result(self, job_id, index, result):
+        column = "failed" if "error" in result else "completed"
+        with self._lock:
+            self._db.execute("BEGIN")
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO job_results (job_id, idx, result) "
+                "SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM jobs WHERE id = ?)",
+                (job_id, index, json.dumps(result), job_id),
+            ).rowcount
+            if inserted:
+                self._db.execute(f"UPDATE jobs SET {column} = {column} + 1 WHERE id = ?", (job_id,))
+                self._db.execute(
+                    "UPDATE job_pages SET data = NULL WHERE job_id = ? AND idx = ?", (job_id, index)
+                )
+            self._db.execute("COMMIT")
+        return bool(inserted)
+
+    def list_results(self, job_id, start, limit):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT result FROM job_results WHERE job_id = ? AND idx >= ? "
+                "ORDER BY idx LIMIT ?",
+                (job_id, start, limit),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class DynamoJobStore(JobStore):
+    """DynamoDB table (pk, sk) for records and results, S3 for page data.
+
+    Items: the job record at sk "job", one "page#<index>" item per page (its
+    id), and one "result#<index>" item per finished page. Page bytes go to
+    S3 because a DynamoDB item is capped at 400KB. Every item carries an
+    `expiresAt` for DynamoDB TTL; the bucket should expire `jobs/` objects
+    on the same schedule.
+    """
+
+    def __init__(self, table_name: str, bucket: str, dynamodb=None, s3=None):
+        import boto3
+
+        self._table = table_name
+        self._bucket = bucket
+        self._dynamodb = dynamodb or boto3.client("dynamodb")
+        self._s3 = s3 or boto3.client("s3")
+
+    @staticmethod
+    def _sk(kind: str, index: int) -> str:
+        return f"{kind}#{index:06d}"
+
+    def _page_key(self, job_id: str, index: int) -> str:
+        return f"jobs/{job_id}/{index:06d}.rm"
+
+    def _put_pages(self, job_id, start, pages):
+        expires = str(int(time.time() + JOB_TTL_SECONDS))
+        for index, (page_id, data) in enumerate(pages, start):
+            if data is not None:
+                self._s3.put_object(Bucket=self._bucket, Key=self._page_key(job_id, index), Body=data)
+        items = [
+            {"pk": {"S": job_id}, "sk": {"S": self._sk("page", i)}, "pageId": {"S": page_id},
+             "hasData": {"BOOL": data is not None}, "expiresAt": {"N": expires}}
+            for i, (page_id, data) in enumerate(pages, start)
+        ]
+        for batch in range(0, len(items), 25):
+            request = {self._table: [{"PutRequest": {"Item": item}} for item in items[batch:batch + 25]]}
+            while request:
+                response = self._dynamodb.batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems") or None
+
+    def create_job(self, job_id, meta, pages, open=False):
+        self._put_pages(job_id, 0, pages)
+        # The record goes last so a visible job always has all its pages.
+        self._dynamodb.put_item(TableName=self._table, Item={
+            "pk": {"S": job_id}, "sk": {"S": "job"},
+            "meta": {"S": json.dumps(meta)}, "pageCount": {"N": str(len(pages))},
+            "completedCount": {"N": "0"}, "failedCount": {"N": "0"},
+            "open": {"BOOL": open}, "expiresAt": {"N": str(int(time.time() + JOB_TTL_SECONDS))},
+        })
+
+    def append_pages(self, job_id, pages, max_pages):
+        # Reserve the indexes first: the job can't complete while the new
+        # pages are counted but unfinished, and concurrent appends don't collide.
+        try:
+            response = self._dynamodb.update_item(
+                TableName=self._table,
+                Key={"pk": {"S": job_id}, "sk": {"S": "job"}},
+                UpdateExpression="ADD pageCount :n",
+                ConditionExpression="attribute_exists(sk) AND #open = :true AND pageCount <= :room",
+                ExpressionAttributeNames={"#open": "open"},
+                ExpressionAttributeValues={
+                    ":n": {"N": str(len(pages))},
+                    ":true": {"BOOL": True},
+                    ":room": {"N": str(max_pages - len(pages))},
+                },
+                ReturnValues="UPDATED_NEW",
+            )
+        except self._dynamodb.exceptions.ConditionalCheckFailedException:
+            job = self.get_job(job_id)
+            if job is None:
+                raise JobNotFound(job_id) from None
+            if not job["open"]:
+                raise JobClosed(job_id) from None
+            raise _too_many(max_pages) from None
+        start = int(response["Attributes"]["pageCount"]["N"]) - len(pages)
+        self._put_pages(job_id, start, pages)
+        return start
+
+    def close_job(self, job_id):
+        try:
+            self._dynamodb.update_item(
+                TableName=self._table,
+                Key={"pk": {"S": job_id}, "sk": {"S": "job"}},
+                UpdateExpression="SET #open = :false",
+                ConditionExpression="attribute_exists(sk)",
+                ExpressionAttributeNames={"#open": "open"},
+                ExpressionAttributeValues={":false": {"BOOL": False}},
+            )
+        except self._dynamodb.exceptions.ConditionalCheckFailedException:
+            raise JobNotFound(job_id) from None
+
+    def get_job(self, job_id):
+        item = self._dynamodb.get_item(
+            TableName=self._table, Key={"pk": {"S": job_id}, "sk": {"S": "job"}},
+            ConsistentRead=True,
+        ).get("Item")
+        if item is None:
+            return None
+        return {**json.loads(item["meta"]["S"]),
+                **{k: int(item[k]["N"]) for k in ("pageCount", "completedCount", "failedCount")},
+                "open": item.get("open", {}).get("BOOL", False)}
+
+    def get_page(self, job_id, index):
+        item = self._dynamodb.get_item(
+            TableName=self._table, Key={"pk": {"S": job_id}, "sk": {"S": self._sk("page", index)}},
+        ).get("Item")
+        if item is None:
+            return None
+        data = None
+        if item["hasData"]["BOOL"]:
+            try:
+                obj = self._s3.get_object(Bucket=self._bucket, Key=self._page_key(job_id, index))
+                data = obj["Body"].read()
+            except self._s3.exceptions.NoSuchKey:
+                pass
+        return item["pageId"]["S"], data
+
+    def has_result(self, job_id, index):
+        return "Item" in self._dynamodb.get_item(
+            TableName=self._table,
+            Key={"pk": {"S": job_id}, "sk": {"S": self._sk("result", index)}},
+            ProjectionExpression="sk",
+        )
+
+    def put_result(self, job_id, index, result):
+        counter = "failedCount" if "error" in result else "completedCount"
+        try:
+            self._dynamodb.transact_write_items(TransactItems=[
+                {"Put": {
+                    "TableName": self._table,
+                    "Item": {"pk": {"S": job_id}, "sk": {"S": self._sk("result", index)},
+                             "result": {"S": json.dumps(result)},
+                             "expiresAt": {"N": str(int(time.time() + JOB_TTL_SECONDS))}},
+                    "ConditionExpression": "attribute_not_exists(sk)",
+                }},
+                {"Update": {
+                    "TableName": self._table,
+                    "Key": {"pk": {"S": job_id}, "sk": {"S": "job"}},
+                    "UpdateExpression": f"ADD {counter} :one",
+                    "ConditionExpression": "attribute_exists(sk)",
+                    "ExpressionAttributeValues": {":one": {"N": "1"}},
+                }},
+            ])
+        except self._dynamodb.exceptions.TransactionCanceledException:
+            return False
+        self._s3.delete_object(Bucket=self._bucket, Key=self._page_key(job_id, index))
+        return True
+
+    def list_results(self, job_id, start, limit):
+        response = self._dynamodb.query(
+            TableName=self._table,
+            KeyConditionExpression="pk = :pk AND sk BETWEEN :lo AND :hi",
+            ExpressionAttributeValues={
+                ":pk": {"S": job_id},
+                ":lo": {"S": self._sk("result", start)},
+                ":hi": {"S": "result#999999"},
+            },
+            Limit=limit,
+            ConsistentRead=True,
+        )
+        return [json.loads(item["result"]["S"]) for item in response.get("Items", [])]
@@ -0,0 +1,403 @@
+"""Asynchronous OCR jobs for syncs too large for one request.
+
+A client submits pages (or a notebook archive) to `POST /jobs` and gets a
+job id back at once. Each page becomes a task on a queue; worker
+invocations take tasks, run the normal page pipeline and write the result
+to the job store. Clients poll `GET /jobs/<id>` for progress and page
+through `GET /jobs/<id>/results`.
+
+An upload session is a job opened empty: the client appends pages in
+chunks (`POST /sessions/<id>/pages`), each chunk is queued as it arrives so
+OCR overlaps the upload, and finalizing closes the job and returns the
+combined results once the last pages finish.
+
+The store and queue are pluggable (job_store, task_queue). JOB_BACKEND
+selects them:
+- "aws" (the default when JOBS_TABLE is set): DynamoDB + S3 + SQS, with
+  Lambda invoked by the SQS event source mapping as the worker
+- "sqlite": one file at JOB_SQLITE_PATH, worked by local threads
+- "memory": in-process, worked by local threads
+
+The user's Anthropic key is never stored in plaintext: tasks carry it
+sealed (task_keys), KMS-encrypted for the job on the "aws" backend and as a
+reference to process memory on the local ones.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable
+
+import anthropic
+
+import fair_scheduler
+from circuit_breaker import CircuitOpenError
+from job_store import (
+    DynamoJobStore,
+    JobClosed,
+    JobNotFound,
+    JobStore,
+    MemoryJobStore,
+    SQLiteJobStore,
+)
+from task_keys import KmsTaskKeys, LocalTaskKeys, TaskKeys
+from task_queue import MemoryTaskQueue, SQLiteTaskQueue, SqsTaskQueue, TaskQueue
+
+logger = logging.getLogger()
+
+JOBS_PATH = "/jobs"
+SESSIONS_PATH = "/sessions"
+
+JOB_BACKEND_ENV = "JOB_BACKEND"
+DEFAULT_SQLITE_PATH = "/tmp/remarkable-jobs.db"
+
+# A page whose task keeps failing transiently is recorded as failed on its
+# last attempt, so the job still completes.
+MAX_TASK_ATTEMPTS = 3
+
+RESULTS_PAGE_SIZE = 50
+MAX_RESULTS_PAGE_SIZE = 200
+
+# How often finalize_session checks whether the last pages have finished.
+FINALIZE_POLL_SECONDS = 0.5
+
+# Worth retrying from the queue rather than failing the page.
+TRANSIENT_ERRORS = (
+    anthropic.RateLimitError,
+    anthropic.APIConnectionError,
+    anthropic.InternalServerError,
+    CircuitOpenError,
+)
+
+_backend: tuple[JobStore, TaskQueue] | None = None
+_keys: TaskKeys | None = None
+_backend_checked = False
+_backend_lock = threading.Lock()
+
+
+def configure(
+    store: JobStore | None, queue: TaskQueue | None = None, keys: TaskKeys | None = None
+):
+    """Use an explicit store and queue (tests, server mode); None to reset.
+
+    Keys are held in process memory unless `keys` says otherwise.
+    """
+    global _backend, _keys, _backend_checked
+    with _backend_lock:
+        _backend = (store, queue) if store is not None else None
+        _keys = (keys or LocalTaskKeys()) if store is not None else None
+        _backend_checked = store is not None
+
+
+def get_backend() -> tuple[JobStore, TaskQueue] | None:
+    """The configured (store, queue), built from the environment on first use.
+
+    Returns None when job mode isn't configured.
+    """
+    global _backend, _keys, _backend_checked
+    if _backend_checked:
+        return _backend
+    with _backend_lock:
+        if not _backend_checked:
+            backend = _backend_from_env()
+            if backend is not None:
+                _backend, _keys = backend[:2], backend[2]
+            _backend_checked = True
+    return _backend
+
+
+def get_task_keys() -> TaskKeys | None:
+    """How the configured backend seals Anthropic keys into tasks."""
+    get_backend()
+    return _keys
+
+
+def _backend_from_env() -> tuple[JobStore, TaskQueue, TaskKeys] | None:
+    kind = os.environ.get(JOB_BACKEND_ENV) or ("aws" if os.environ.get("JOBS_TABLE") else "")
+    if kind == "aws":
+        return (
+            DynamoJobStore(os.environ["JOBS_TABLE"], os.environ["JOBS_BUCKET"]),
+            SqsTaskQueue(os.environ["JOBS_QUEUE_URL"]),
+            KmsTaskKeys(os.environ["JOBS_KMS_KEY_ID"]),
+        )
+    if kind == "sqlite":
+        path = os.environ.get("JOB_SQLITE_PATH", DEFAULT_SQLITE_PATH)
+        return SQLiteJobStore(path), SQLiteTaskQueue(path), LocalTaskKeys()
+    if kind == "memory":
+        return MemoryJobStore(), MemoryTaskQueue(), LocalTaskKeys()
+    if kind:
+        raise ValueError(f"Unknown {JOB_BACKEND_ENV}: {kind}")
+    return None
+
+
+def create_job(
+    store: JobStore,
+    queue: TaskQueue,
+    pages: list[tuple[str, bytes | None]],
+    anthropic_key: str | None = None,
+    notebook: dict | None = None,
+) -> dict:
+    """Store a job and enqueue one task per page; returns its status.
+
+    Pages with no data (blank notebook pages) are finished immediately.
+    """
+    job_id = uuid.uuid4().hex
+    meta = {"jobId": job_id, "createdAt": int(time.time())}
+    if notebook is not None:
+        meta["notebook"] = notebook
+    store.create_job(job_id, meta, pages)
+    tasks = _enqueue(store, queue, job_id, 0, pages, anthropic_key)
+    logger.info(f"Created job {job_id} ({len(pages)} pages, {tasks} tasks)")
+    return get_status(store, job_id)
+
+
+def _enqueue(
+    store: JobStore,
+    queue: TaskQueue,
+    job_id: str,
+    start: int,
+    pages: list[tuple[str, bytes | None]],
+    anthropic_key: str | None,
+) -> int:
+    """Queue a task for each stored page from `start`; returns the task count.
+
+    Pages with no data are finished here instead.
+    """
+    sealed = None
+    if anthropic_key and any(data is not None for _, data in pages):
+        sealed = get_task_keys().seal(job_id, anthropic_key)
+    tasks = []
+    for index, (page_id, data) in enumerate(pages, start):
+        if data is None:
+            store.put_result(job_id, index, {"id": page_id, "index": index,
+                                             "markdown": "", "confidence": 1.0})
+            continue
+        # pageId lets a task whose page can't be read still be reported
+        task = {"jobId": job_id, "index": index, "pageId": page_id}
+        if sealed:
+            task["sealedKey"] = sealed
+        tasks.append(task)
+    if tasks:
+        queue.send(tasks)
+    return len(tasks)
+
+
+def open_session(store: JobStore) -> dict:
+    """Create an empty, open job for chunked uploads; returns its status."""
+    job_id = uuid.uuid4().hex
+    store.create_job(job_id, {"jobId": job_id, "createdAt": int(time.time())}, [], open=True)
+    logger.info(f"Opened session {job_id}")
+    return get_status(store, job_id)
+
+
+def append_pages(
+    store: JobStore,
+    queue: TaskQueue,
+    job_id: str,
+    pages: list[tuple[str, bytes | None]],
+    max_pages: int,
+    anthropic_key: str | None = None,
+) -> int:
+    """Add a chunk of pages to an open session and queue them at once.
+
+    Returns the index of the chunk's first page. Raises JobNotFound,
+    JobClosed, or ValueError past max_pages.
+    """
+    start = store.append_pages(job_id, pages, max_pages)
+    tasks = _enqueue(store, queue, job_id, start, pages, anthropic_key)
+    logger.info(f"Session {job_id}: appended pages {start}-{start + len(pages) - 1} ({tasks} tasks)")
+    return start
+
+
+def finalize_session(store: JobStore, job_id: str, wait_seconds: float = 0) -> dict:
+    """Close a session and wait up to wait_seconds for its pages to finish.
+
+    Returns the status; once completed it also carries every result in
+    document order ("pages"), the combined markdown and any failedPages.
+    Raises JobNotFound.
+    """
+    store.close_job(job_id)
+    deadline = time.monotonic() + wait_seconds
+    status = get_status(store, job_id)
+    while status["status"] != "completed" and time.monotonic() < deadline:
+        time.sleep(min(FINALIZE_POLL_SECONDS, max(0.0, deadline - time.monotonic())))
+        status = get_status(store, job_id)
+    if status["status"] != "completed":
+        return status
+
+    pages = []
+    while len(pages) < status["pageCount"]:
+        chunk = store.list_results(job_id, len(pages), MAX_RESULTS_PAGE_SIZE)
+        if not chunk:
+            break
+        pages.extend(chunk)
+    status["markdown"] = "\n\n".join(p["markdown"] for p in pages if p.get("markdown"))
+    status["pages"] = pages
+    failed = [p["id"] for p in pages if "error" in p]
+    if failed:
+        status["failedPages"] = failed
+    return status
+
+
+def get_status(store: JobStore, job_id: str) -> dict:
+    """Progress of a job, as returned by `GET /jobs/<id>`. Raises JobNotFound.
+
+    A session reports "open" until it is finalized, however far its pages
+    have got.
+    """
+    job = store.get_job(job_id)
+    if job is None:
+        raise JobNotFound(job_id)
+    finished = job["completedCount"] + job["failedCount"]
+    if job.pop("open"):
+        job["status"] = "open"
+    elif finished >= job["pageCount"]:
+        job["status"] = "completed"
+    else:
+        job["status"] = "running" if finished else "queued"
+    return job
+
+
+def get_results(store: JobStore, job_id: str, cursor: str | None, limit: int | None) -> dict:
+    """A page of finished results in document order, from `cursor` on.
+
+    `nextCursor` is set when there may be more finished results; pages
+    that haven't finished yet are not listed, so poll until the job is
+    completed for the full set. Raises JobNotFound, or ValueError for a
+    bad cursor or limit.
+    """
+    status = get_status(store, job_id)
+    try:
+        start = int(cursor) if cursor else 0
+        limit = int(limit) if limit else RESULTS_PAGE_SIZE
+    except ValueError:
+        raise ValueError("cursor and limit must be integers") from None
+    if start < 0 or not 0 < limit <= MAX_RESULTS_PAGE_SIZE:
+        raise ValueError(f"limit must be 1-{MAX_RESULTS_PAGE_SIZE} and cursor non-negative")
+
+    pages = store.list_results(job_id, start, limit)
+    body = {"jobId": job_id, "status": status["status"], "pages": pages}
+    if len(pages) == limit:
+        body["nextCursor"] = str(pages[-1]["index"] + 1)
+    return body
+
+
+def run_task(
+    task: dict,
+    attempt: int,
+    store: JobStore,
+    process_page: Callable,
+    make_client: Callable[[str], anthropic.Anthropic],
+):
+    """Process one page task and record its result.
+
+    Transient Claude errors, and any error reading the task's page or
+    opening its key (S3, DynamoDB, KMS), are raised so the queue redelivers
+    the task, up to MAX_TASK_ATTEMPTS; any other error, or the last
+    attempt's, is recorded as a failed page.
+    """
+    job_id, index = task["jobId"], task["index"]
+    try:
+        loaded = _load_task(task, store)
+    except Exception as e:
+        if attempt < MAX_TASK_ATTEMPTS:
+            logger.warning(f"Job {job_id} page {index}: retrying after {e}")
+            raise
+        logger.error(f"Job {job_id} page {index}: giving up after {attempt} attempts: {e}")
+        store.put_result(job_id, index, {"id": task.get("pageId"), "index": index, "error": str(e)})
+        return
+    if loaded is None:
+        return
+    page_id, data, key = loaded
+
+    client = make_client(key) if key else None
+    try:
+        # Same tenant as the user's interactive requests (see handler)
+        with fair_scheduler.tenant(fair_scheduler.tenant_id(key) if key else None):
+            result = process_page(page_id, data, client)
+    except TRANSIENT_ERRORS as e:
+        if attempt < MAX_TASK_ATTEMPTS:
+            logger.warning(f"Job {job_id} page {page_id}: retrying after {e}")
+            raise
+        logger.error(f"Job {job_id} page {page_id}: giving up after {attempt} attempts: {e}")
+        result = {"id": page_id, "error": str(e)}
+    except Exception as e:
+        logger.error(f"Job {job_id} page {page_id}: {e}")
+        result = {"id": page_id, "error": str(e)}
+    store.put_result(job_id, index, {**result, "index": index})
+
+
+def _load_task(task: dict, store: JobStore) -> tuple[str, bytes, str | None] | None:
+    """(page id, data, Anthropic key) for a task, or None if it has nothing
+    left to do."""
+    job_id, index = task["jobId"], task["index"]
+    if store.has_result(job_id, index):
+        return None  # redelivered after its result was written
+    page = store.get_page(job_id, index)
+    if page is None:
+        logger.warning(f"Dropping task for unknown job {job_id} page {index}")
+        return None
+    page_id, data = page
+
+    sealed = task.get("sealedKey")
+    key = get_task_keys().open(job_id, sealed) if sealed else None
+    if sealed and key is None:
+        logger.warning(f"Job {job_id} page {page_id}: Anthropic key no longer available")
+    return page_id, data, key
+
+
+def work(
+    store: JobStore,
+    queue: TaskQueue,
+    process_page: Callable,
+    make_client: Callable[[str], anthropic.Anthropic],
+    stop: threading.Event | None = None,
+    wait_seconds: float = 1.0,
+    until_idle: bool = False,
+) -> int:
+    """Local worker loop: run tasks until `stop` is set (or the queue is empty).
+
+    Returns the number of tasks completed. A task whose run raises is left
+    on the queue for redelivery.
+    """
+    done = 0
+    while stop is None or not stop.is_set():
+        tasks = queue.receive(max_messages=1, wait_seconds=0 if until_idle else wait_seconds)
+        if not tasks:
+            if until_idle:
+                break
+            continue
+        for task in tasks:
+            try:
+                run_task(task.body, task.attempt, store, process_page, make_client)
+            except Exception:
+                continue
+            queue.delete(task.receipt)
+            done += 1
+    return done
+
+
+def start_workers(
+    count: int,
+    process_page: Callable,
+    make_client: Callable[[str], anthropic.Anthropic],
+) -> tuple[threading.Event, list[threading.Thread]]:
+    """Run `count` local worker threads on the configured backend.
+
+    Returns the stop event and the threads to join after setting it.
+    """
+    backend = get_backend()
+    if backend is None:
+        raise ValueError("Job mode is not configured")
+    store, queue = backend
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=work, args=(store, queue, process_page, make_client, stop),
+                         name=f"job-worker-{i}", daemon=True)
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return stop, threads
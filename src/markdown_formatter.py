@@ -83,20 +83,10 @@ def format_line(text: str, bbox: dict) -> str:
 def format_typed_text(text: str) -> str:
     """Format directly extracted typed text as markdown.
 
-    Typed text from rmscene may already have some structure,
-    so we do minimal processing.
+    Typed text is already markdown (see typed_text.py), so we only trim
+    trailing whitespace; leading indentation marks nested list items.
     """
     if not text:
         return ""
 
-    lines = text.split("\n")
-    formatted_lines = []
-
-    for line in lines:
-        stripped = line.strip()
-        if stripped:
-            formatted_lines.append(stripped)
-        else:
-            formatted_lines.append("")
-
-    return "\n".join(formatted_lines)
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip("\n")
@@ -0,0 +1,69 @@
+"""CloudWatch metrics via the Embedded Metric Format (EMF).
+
+Lambda ships each stdout line to CloudWatch Logs, which extracts metrics
+from lines that are EMF JSON documents, so no PutMetricData calls (or IAM
+permissions) are needed. Lines go through print(), not logging: the Lambda
+log formatter prefixes each record, and the line must be bare JSON.
+"""
+
+import json
+import time
+
+NAMESPACE = "RemarkableOCR"
+
+
+def emit(
+    metrics: dict[str, tuple[float | list[float], str]],
+    dimensions: dict[str, str] | None = None,
+):
+    """Write one EMF document. `metrics` maps name -> (value or values, unit)."""
+    dimensions = dimensions or {}
+    document = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()
+                    ],
+                }
+            ],
+        },
+        **dimensions,
+        **{name: value for name, (value, _) in metrics.items()},
+    }
+    print(json.dumps(document), flush=True)
+
+
+def emit_request_usage(route: str, meter, pages: int, deferred: int):
+    """Emit per-request totals and per-model token usage for one request."""
+    totals = meter.to_dict()
+    emit(
+        {
+            "Pages": (pages, "Count"),
+            "DeferredPages": (deferred, "Count"),
+            "InputTokens": (totals["inputTokens"], "Count"),
+            "OutputTokens": (totals["outputTokens"], "Count"),
+            "CacheCreationInputTokens": (totals["cacheCreationInputTokens"], "Count"),
+            "CacheReadInputTokens": (totals["cacheReadInputTokens"], "Count"),
+            "CostUsd": (totals["costUsd"], "None"),
+        },
+        {"Route": route},
+    )
+
+    by_model = {}
+    for call in meter.calls:
+        by_model.setdefault(call.model, []).append(call)
+    for model, calls in by_model.items():
+        emit(
+            {
+                "Calls": (len(calls), "Count"),
+                "InputTokens": (sum(c.input_tokens for c in calls), "Count"),
+                "OutputTokens": (sum(c.output_tokens for c in calls), "Count"),
+                "CostUsd": (round(sum(c.cost_usd for c in calls), 6), "None"),
+                "LatencyMs": ([c.latency_ms for c in calls], "Milliseconds"),
+            },
+            {"Model": model},
+        )
@@ -0,0 +1,215 @@
+"""Read reMarkable notebook archives (.rmdoc / zip) one page at a time.
+
+An .rmdoc is a zip holding `<doc>.content` (page order and metadata),
+`<doc>.metadata` (title), and one `<doc>/<page>.rm` file per page that has
+ever been drawn on. The archive body is spooled to a temporary file as it is
+base64-decoded, and each page's .rm member is only read when a worker asks
+for it, so a notebook is never held in memory as a whole.
+"""
+
+import binascii
+import hashlib
+import json
+import posixpath
+import tempfile
+import threading
+import zipfile
+import zlib
+from typing import BinaryIO
+
+# Archives above this size spill from memory to /tmp while being decoded.
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+# Base64 is decoded in slices of this many characters (a multiple of 4).
+_DECODE_CHUNK_CHARS = 256 * 1024
+
+# Members are hashed in reads of this many bytes.
+_HASH_CHUNK_BYTES = 256 * 1024
+
+# Limits on what an archive may expand to, checked against the sizes the
+# zip declares before anything is decompressed (zipfile never inflates a
+# member past its declared size). .content and .metadata are small JSON
+# files; pages are capped by the handlers' per-page limit.
+MAX_METADATA_SIZE = 1024 * 1024
+MAX_UNCOMPRESSED_SIZE = 512 * 1024 * 1024
+
+# What zipfile raises for corrupt, encrypted or unsupported members.
+_READ_ERRORS = (zipfile.BadZipFile, NotImplementedError, RuntimeError, zlib.error, EOFError)
+
+
+class NotebookError(ValueError):
+    """Archive is not a readable reMarkable notebook."""
+
+
+class ArchivePage:
+    """A page whose .rm bytes are read from the archive on first use.
+
+    Mirrors `payload.EncodedPage.take()` so the page pipeline can treat
+    request pages and archive pages alike.
+    """
+
+    __slots__ = ("_notebook", "_digest", "member", "size")
+
+    def __init__(self, notebook: "Notebook", member: zipfile.ZipInfo):
+        self._notebook = notebook
+        self._digest: str | None = None
+        self.member = member
+        self.size = member.file_size
+
+    def digest(self) -> str | None:
+        """SHA-256 of the page's .rm bytes, for deduplication and replay.
+
+        The member is streamed through the hash rather than held, so a
+        notebook's pages are still never in memory together; take() reads
+        it again later. None if the member can't be read, so the page is
+        processed on its own and fails there.
+        """
+        if self._digest is None:
+            if self._notebook is None:
+                raise RuntimeError("Page data already consumed")
+            try:
+                self._digest = "rm:" + self._notebook.hash_member(self.member)
+            except NotebookError:
+                return None
+        return self._digest
+
+    def take(self) -> bytes:
+        """Read the page's .rm member. May only be called once."""
+        notebook, self._notebook = self._notebook, None
+        if notebook is None:
+            raise RuntimeError("Page data already consumed")
+        return notebook.read_member(self.member)
+
+
+class Notebook:
+    """Page order and lazily-read pages of an open notebook archive."""
+
+    def __init__(self, fileobj: BinaryIO):
+        try:
+            self._zip = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise NotebookError(f"Not a zip archive: {e}") from e
+        # ZipFile shares one file handle between members; serialize reads
+        # from worker threads.
+        self._lock = threading.Lock()
+
+        total_size = sum(info.file_size for info in self._zip.infolist())
+        if total_size > MAX_UNCOMPRESSED_SIZE:
+            raise NotebookError(
+                f"Archive expands to {total_size} bytes (max {MAX_UNCOMPRESSED_SIZE})"
+            )
+
+        content_name = _find_member(self._zip, ".content")
+        if content_name is None:
+            raise NotebookError("Archive has no .content metadata")
+        self.id = posixpath.basename(content_name)[: -len(".content")]
+
+        try:
+            content = json.loads(self._read_metadata(content_name))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise NotebookError(f"Invalid .content metadata: {e}") from e
+        self.page_ids = _page_order(content)
+
+        self.title = self.id
+        metadata_name = _find_member(self._zip, ".metadata")
+        if metadata_name is not None:
+            try:
+                metadata = json.loads(self._read_metadata(metadata_name))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                metadata = None
+            if isinstance(metadata, dict) and isinstance(metadata.get("visibleName"), str):
+                self.title = metadata["visibleName"] or self.id
+
+        # Map page id → .rm member without reading any page data.
+        self._members = {}
+        for info in self._zip.infolist():
+            if info.filename.endswith(".rm"):
+                page_id = posixpath.basename(info.filename)[: -len(".rm")]
+                self._members[page_id] = info
+
+    def page(self, page_id: str) -> ArchivePage | None:
+        """Return a lazy handle on a page's .rm data, or None for a blank page."""
+        info = self._members.get(page_id)
+        return ArchivePage(self, info) if info is not None else None
+
+    def read_member(self, info: zipfile.ZipInfo) -> bytes:
+        with self._lock:
+            try:
+                return self._zip.read(info)
+            except _READ_ERRORS as e:
+                raise NotebookError(f"Unreadable member {info.filename}: {e}") from e
+
+    def hash_member(self, info: zipfile.ZipInfo) -> str:
+        """SHA-256 hex digest of a member's bytes, read in chunks."""
+        h = hashlib.sha256()
+        with self._lock:
+            try:
+                with self._zip.open(info) as f:
+                    while chunk := f.read(_HASH_CHUNK_BYTES):
+                        h.update(chunk)
+            except _READ_ERRORS as e:
+                raise NotebookError(f"Unreadable member {info.filename}: {e}") from e
+        return h.hexdigest()
+
+    def _read_metadata(self, name: str) -> bytes:
+        info = self._zip.getinfo(name)
+        if info.file_size > MAX_METADATA_SIZE:
+            raise NotebookError(
+                f"{name} expands to {info.file_size} bytes (max {MAX_METADATA_SIZE})"
+            )
+        return self.read_member(info)
+
+    def close(self):
+        self._zip.close()
+
+
+def _find_member(archive: zipfile.ZipFile, suffix: str) -> str | None:
+    """Return the shallowest member name with the given suffix."""
+    names = [n for n in archive.namelist() if n.endswith(suffix)]
+    return min(names, key=lambda n: n.count("/"), default=None)
+
+
+def _page_order(content) -> list[str]:
+    """Page ids in document order from a .content file.
+
+    Firmware 3.x writes `cPages.pages` entries with a fractional-index sort
+    key (`idx.value`) and tombstones deleted pages; older firmware writes a
+    plain `pages` list. Entries of the wrong shape are skipped.
+    """
+    if not isinstance(content, dict):
+        raise NotebookError(".content metadata is not a JSON object")
+    c_pages = content.get("cPages")
+    c_pages = c_pages.get("pages") if isinstance(c_pages, dict) else None
+    if isinstance(c_pages, list) and c_pages:
+        live = [
+            p for p in c_pages
+            if isinstance(p, dict) and isinstance(p.get("id"), str)
+            and not _field_value(p, "deleted")
+        ]
+        live.sort(key=lambda p: str(_field_value(p, "idx") or ""))
+        return [p["id"] for p in live]
+    pages = content.get("pages")
+    if isinstance(pages, list):
+        return [p for p in pages if isinstance(p, str)]
+    raise NotebookError(".content metadata lists no pages")
+
+
+def _field_value(entry: dict, name: str):
+    """`entry[name]["value"]`, or None when either level is missing or not
+    the expected shape."""
+    field = entry.get(name)
+    return field.get("value") if isinstance(field, dict) else None
+
+
+def spool_base64(encoded: str) -> BinaryIO:
+    """Decode a base64 str into a spooled temp file, one slice at a time.
+
+    Keeps at most one decoded slice in memory on top of the encoded str;
+    large archives spill to /tmp instead of doubling the invocation's RSS.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    # Whitespace would misalign slices; Function URL bodies never contain it.
+    for start in range(0, len(encoded), _DECODE_CHUNK_CHARS):
+        spool.write(binascii.a2b_base64(encoded[start : start + _DECODE_CHUNK_CHARS]))
+    spool.seek(0)
+    return spool
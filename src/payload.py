@@ -0,0 +1,259 @@
+"""Request payload decoding for the OCR handler.
+
+Function URL events carry the request body as a str, base64-encoded when the
+client sent a binary content type, and every page inside the JSON body is
+base64 again. Decoding it naively keeps several full copies of a batch alive
+at once (encoded body, decoded body, parsed JSON strings, decoded pages),
+which is what pushes a maximum-size request toward the Lambda memory limit.
+
+The helpers here keep at most two copies alive while parsing, size-check
+pages from their encoded length, and defer each page's decode to the worker
+that processes it.
+
+.rm stroke data compresses well, so bodies and individual pages may also be
+gzip- or zstd-compressed on the wire, and responses are compressed for
+clients that advertise Accept-Encoding. Decompression is always bounded so a
+small upload can't expand past the limits the handler enforces.
+"""
+
+import base64
+import binascii
+import gzip
+import hashlib
+import json
+import zlib
+from io import BytesIO
+
+try:
+    import zstandard
+except ImportError:  # zstd is an optional wire encoding; gzip always works
+    zstandard = None
+
+# Responses smaller than this aren't worth the CPU or the base64 envelope.
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+class PayloadTooLarge(ValueError):
+    """Decompressed data exceeds the allowed size."""
+
+
+class UnsupportedEncoding(ValueError):
+    """Content encoding is unknown or its codec isn't installed."""
+
+
+def supported_encodings() -> tuple[str, ...]:
+    """Encodings accepted on requests and offered on responses, preferred first."""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def get_header(event: dict, name: str) -> str | None:
+    """Case-insensitive header lookup on a Function URL event."""
+    headers = event.get("headers") or {}
+    if name in headers:
+        return headers[name]
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+def _normalize_encoding(encoding: str | None) -> str | None:
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding == "x-gzip":
+        return "gzip"
+    if encoding not in supported_encodings():
+        raise UnsupportedEncoding(f"Unsupported content encoding: {encoding}")
+    return encoding
+
+
+def decompress(data: bytes, encoding: str | None, max_size: int | None = None) -> bytes:
+    """Decompress gzip or zstd data, refusing to produce more than max_size bytes."""
+    encoding = _normalize_encoding(encoding)
+    if encoding is None:
+        result = data
+    elif encoding == "gzip":
+        result = _gunzip_bounded(data, max_size)
+    else:
+        reader = zstandard.ZstdDecompressor().stream_reader(BytesIO(data))
+        try:
+            result = reader.read(-1 if max_size is None else max_size + 1)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd data: {e}") from e
+    if max_size is not None and len(result) > max_size:
+        raise PayloadTooLarge(f"Decompressed size exceeds {max_size} bytes")
+    return result
+
+
+def _gunzip_bounded(data: bytes, max_size: int | None) -> bytes:
+    out = []
+    produced = 0
+    try:
+        # Loop to honor concatenated gzip members, as gzip.decompress does.
+        while data:
+            d = zlib.decompressobj(wbits=31)
+            # max_length=0 means unbounded.
+            budget = 0 if max_size is None else max_size + 1 - produced
+            chunk = d.decompress(data, budget)
+            out.append(chunk)
+            produced += len(chunk)
+            if max_size is not None and (produced > max_size or d.unconsumed_tail):
+                raise PayloadTooLarge(f"Decompressed size exceeds {max_size} bytes")
+            data = d.unused_data
+    except zlib.error as e:
+        raise ValueError(f"Invalid gzip data: {e}") from e
+    return b"".join(out)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress data with gzip or zstd."""
+    encoding = _normalize_encoding(encoding)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def choose_response_encoding(accept_encoding: str | None) -> str | None:
+    """Pick the preferred supported encoding from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add("gzip" if token == "x-gzip" else token)
+    for encoding in supported_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def compress_response(response: dict, accept_encoding: str | None) -> dict:
+    """Compress a Function URL response body if the client accepts it.
+
+    Function URLs pass binary bodies through as base64 with isBase64Encoded
+    set; the client sees raw compressed bytes with a Content-Encoding header.
+    """
+    body = response.get("body") or ""
+    encoding = choose_response_encoding(accept_encoding)
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return response
+    compressed = compress(body.encode("utf-8"), encoding)
+    headers = dict(response.get("headers") or {})
+    headers["Content-Encoding"] = encoding
+    headers["Vary"] = "Accept-Encoding"
+    return {
+        **response,
+        "headers": headers,
+        "body": base64.b64encode(compressed).decode("ascii"),
+        "isBase64Encoded": True,
+    }
+
+
+def decoded_length(encoded: str) -> int:
+    """Return the number of bytes a base64 string decodes to, without decoding.
+
+    Exact for canonical base64; an upper bound when the encoder inserted line
+    breaks, which is the safe direction for a size limit.
+    """
+    n = len(encoded)
+    if n == 0:
+        return 0
+    padding = 2 if encoded.endswith("==") else 1 if encoded.endswith("=") else 0
+    return max(0, (n * 3) // 4 - padding)
+
+
+class EncodedPage:
+    """A page's base64 payload that is decoded once, on first use.
+
+    The handler's request dict is dropped after validation, leaving this
+    object as the only reference to the page's base64 string. `take()` hands
+    the string to the decoder and forgets it, so the encoded copy is freed as
+    soon as a worker starts on the page instead of when the batch finishes.
+
+    Pages may declare an `encoding` ("gzip" or "zstd"); `size` is then the
+    compressed size and `take()` enforces `max_size` on the decompressed
+    bytes. Unsupported encodings raise UnsupportedEncoding up front so the
+    page can be rejected without spending a worker on it.
+    """
+
+    __slots__ = ("_encoded", "size", "encoding", "max_size")
+
+    def __init__(
+        self,
+        encoded: str,
+        encoding: str | None = None,
+        max_size: int | None = None,
+    ):
+        self._encoded: str | None = encoded
+        self.size = decoded_length(encoded)
+        self.encoding = _normalize_encoding(encoding)
+        self.max_size = max_size
+
+    def digest(self) -> str:
+        """Content hash of the payload as sent, for in-request deduplication.
+
+        Hashes the encoded form so no page is decoded up front; identical
+        bytes sent with the same encoding always produce identical strings.
+        """
+        if self._encoded is None:
+            raise RuntimeError("Page data already consumed")
+        h = hashlib.sha256(self._encoded.encode("ascii", "replace"))
+        return f"{self.encoding or 'raw'}:{h.hexdigest()}"
+
+    def take(self) -> bytes:
+        """Decode and release the payload. May only be called once."""
+        encoded, self._encoded = self._encoded, None
+        if encoded is None:
+            raise RuntimeError("Page data already consumed")
+        data = b64decode(encoded)
+        del encoded
+        if self.encoding is not None:
+            data = decompress(data, self.encoding, self.max_size)
+        return data
+
+
+def b64decode(encoded: str) -> bytes:
+    """Decode base64 without the intermediate ASCII copy.
+
+    `base64.b64decode` encodes a str argument to bytes before decoding it;
+    `binascii.a2b_base64` reads an ASCII str's buffer in place.
+    """
+    return binascii.a2b_base64(encoded)
+
+
+def load_json_body(event: dict, max_size: int | None = None) -> dict:
+    """Parse a Function URL event body as JSON.
+
+    Honors a gzip or zstd Content-Encoding; max_size bounds the decompressed
+    body. Raises json.JSONDecodeError for malformed JSON, UnsupportedEncoding
+    or PayloadTooLarge for a rejected body, and ValueError for a malformed
+    base64 envelope or compressed stream.
+
+    The body is removed from `event`, which would otherwise keep the whole
+    encoded request alive until the handler returns.
+    """
+    body = event.pop("body", None) or ""
+    encoding = _normalize_encoding(get_header(event, "content-encoding"))
+    if event.get("isBase64Encoded", False):
+        raw = b64decode(body)
+        del body
+        if encoding is not None:
+            raw = decompress(raw, encoding, max_size)
+        body = raw.decode("utf-8")
+        # Free the decoded bytes before json.loads materializes the page
+        # strings, so the peak is two copies of the body rather than three.
+        del raw
+    elif encoding is not None:
+        # Function URLs base64-encode any body sent with a Content-Encoding.
+        raise ValueError("Compressed request body must be base64-encoded")
+    return json.loads(body) if body else {}
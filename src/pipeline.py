@@ -0,0 +1,79 @@
+"""Concurrency limits for the render and OCR stages of page processing.
+
+A page is rendered (CPU: decode, parse, draw, PNG encode) and then OCR'd
+(I/O: waiting on Claude). Running both under one pool of page workers
+couples them: a slow Claude call holds a slot that could be rendering the
+next page. The two stages here have separate limits and are joined by a
+bounded hand-off, so rendering of page N+1 overlaps Claude's work on page
+N, while at most `queue_depth` rendered pages (and their PNGs) wait for an
+OCR slot.
+
+Each page keeps its own thread across both stages; the stages are
+semaphores rather than separate thread pools, so a page's rendered output
+never has to be passed between threads and errors surface from the page's
+own future, as before. The hand-off slot behaves like a bounded queue: a
+renderer that finishes while the queue is full keeps its render slot until
+a rendered page moves on to OCR.
+
+Pages are admitted to the pipeline, and rendered pages to OCR, in weighted
+fair order between tenants (fair_scheduler), so one tenant's backlog can't
+hold every slot while another tenant's page waits. A page holds its
+admission slot until it leaves the pipeline; there are max_in_flight of
+them, so an admitted page always has room to progress.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from fair_scheduler import FairScheduler, TenantPolicy
+
+
+class StagePipeline:
+    """Render and OCR concurrency limits joined by a bounded queue."""
+
+    def __init__(
+        self,
+        render_workers: int,
+        ocr_workers: int,
+        queue_depth: int,
+        policy: TenantPolicy | None = None,
+    ):
+        if min(render_workers, ocr_workers, queue_depth) < 1:
+            raise ValueError("stage limits must be at least 1")
+        self.render_workers = render_workers
+        self.ocr_workers = ocr_workers
+        self.queue_depth = queue_depth
+        # Per-tenant rate limits apply once per page, at admission.
+        self._admit = FairScheduler(self.max_in_flight, policy)
+        self._render = threading.BoundedSemaphore(render_workers)
+        self._queue = threading.BoundedSemaphore(queue_depth)
+        self._ocr = FairScheduler(ocr_workers, policy, rate_limited=False)
+
+    @property
+    def max_in_flight(self) -> int:
+        """Pages that can make progress at once: rendering, queued, or in OCR."""
+        return self.render_workers + self.queue_depth + self.ocr_workers
+
+    def admit(self):
+        """Hold one of max_in_flight page slots, granted fairly between
+        tenants, for the duration of the block."""
+        return self._admit.slot()
+
+    @contextmanager
+    def render(self):
+        """Hold a render slot for the duration of the block.
+
+        Yields an `enqueue` callable. A page that goes on to OCR calls it
+        at the end of the block: it waits for queue space while still
+        holding the render slot, and the queue slot is then held until
+        ocr() is entered.
+        """
+        with self._render:
+            yield self._queue.acquire
+
+    @contextmanager
+    def ocr(self):
+        """Move an enqueued page into an OCR slot for the duration of the block."""
+        with self._ocr.slot():
+            self._queue.release()
+            yield
@@ -0,0 +1,276 @@
+"""Cache of rendered pages, kept across invocations in a warm container.
+
+A client retrying a page after a failed Claude call, or sending a page the
+container rendered recently, would otherwise have it parsed, rendered and
+PNG-encoded again. Renders (PNG bytes, or a mixed page's PageSegments) are
+cached under the .rm content hash, the render task and the scale, in memory
+up to RENDER_CACHE_BYTES. Entries evicted from memory, least recently used
+first, spill to files under RENDER_CACHE_SPILL_DIR (if set) up to
+RENDER_CACHE_SPILL_BYTES, and are promoted back to memory when hit.
+
+Hits, misses and evictions are counted per invocation: callers wrap their
+work in track() and run page threads in a copy of the context.
+"""
+
+import contextvars
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger()
+
+RENDER_CACHE_BYTES_ENV = "RENDER_CACHE_BYTES"
+RENDER_CACHE_SPILL_DIR_ENV = "RENDER_CACHE_SPILL_DIR"
+RENDER_CACHE_SPILL_BYTES_ENV = "RENDER_CACHE_SPILL_BYTES"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SPILL_MAX_BYTES = 256 * 1024 * 1024
+
+# Charged for every entry, however small its render (a cached None is a
+# text-only page): the key, the index node and the object headers.
+MIN_ENTRY_BYTES = 256
+
+_SPILL_SUFFIX = ".render"
+_UNREADABLE = object()
+
+
+@dataclass
+class CacheStats:
+    """Lookup counts; `spill_hits` are hits served from the spill files."""
+
+    hits: int = 0
+    spill_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    def __str__(self):
+        return (f"{self.hits} hits ({self.spill_hits} from disk), "
+                f"{self.misses} misses, {self.evictions} evictions")
+
+
+_invocation_stats: contextvars.ContextVar[CacheStats | None] = contextvars.ContextVar(
+    "render_cache_stats", default=None
+)
+
+
+@contextmanager
+def track():
+    """Count the current invocation's cache lookups into a fresh CacheStats.
+
+    Threads started inside see the counter only if they run in a copy of
+    this context (contextvars.copy_context().run).
+    """
+    stats = CacheStats()
+    token = _invocation_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _invocation_stats.reset(token)
+
+
+def _entry_size(value) -> int:
+    """Approximate bytes held by a cached render, at least MIN_ENTRY_BYTES."""
+    if value is None:
+        size = 0
+    elif isinstance(value, bytes):
+        size = len(value)
+    else:
+        size = len(value.text_png) + sum(len(png) for png in value.drawing_pngs)
+    return max(size, MIN_ENTRY_BYTES)
+
+
+class RenderCache:
+    """Byte-bounded LRU of renders, with an optional LRU of spill files.
+
+    The lock only guards the indexes; spill files are pickled, written and
+    read outside it, so one thread's disk I/O doesn't stall other pages'
+    lookups. Each spill gets a file of its own, so a file being read or
+    removed is never one another thread is writing.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str | None = None, spill_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.spill_max_bytes = spill_max_bytes if spill_dir else 0
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self._bytes = 0
+        self._spilled: OrderedDict[str, tuple[Path, int]] = OrderedDict()
+        self._spill_bytes = 0
+        self._spill_dir = Path(spill_dir) if spill_dir else None
+        if self._spill_dir is not None:
+            self._spill_dir.mkdir(parents=True, exist_ok=True)
+            # Files left by an earlier process aren't in the index
+            for path in self._spill_dir.glob("*" + _SPILL_SUFFIX):
+                path.unlink(missing_ok=True)
+
+    @staticmethod
+    def key(task: str, rm_bytes: bytes, scale: float) -> str:
+        return f"{task}-{scale}-{hashlib.sha256(rm_bytes).hexdigest()}"
+
+    def get(self, key: str) -> tuple[bool, object]:
+        """(True, value) on a hit, (False, None) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._count(hits=1)
+                return True, entry[0]
+            spilled = self._spilled.pop(key, None)
+            if spilled is None:
+                self._count(misses=1)
+                return False, None
+            path, size = spilled
+            self._spill_bytes -= size
+
+        try:
+            value = pickle.loads(path.read_bytes())
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Dropping unreadable render cache file: {e}")
+            value = _UNREADABLE
+        path.unlink(missing_ok=True)
+        with self._lock:
+            if value is _UNREADABLE:
+                self._count(misses=1)
+                return False, None
+            self._count(hits=1, spill_hits=1)
+            evicted = self._store(key, value) if key not in self._entries else []
+        self._spill(evicted)
+        return True, value
+
+    def put(self, key: str, value):
+        with self._lock:
+            if key in self._entries:
+                return
+            evicted = self._store(key, value)
+        self._spill(evicted)
+
+    def _store(self, key: str, value) -> list[tuple[str, object]]:
+        """Add an entry to memory; returns the entries it pushed out, for
+        _spill. Called with the lock held."""
+        size = _entry_size(value)
+        if size > self.max_bytes:
+            return [(key, value)]
+        self._entries[key] = (value, size)
+        self._bytes += size
+        evicted = []
+        while self._bytes > self.max_bytes:
+            old_key, (old_value, old_size) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            evicted.append((old_key, old_value))
+        return evicted
+
+    def _spill(self, evicted: list[tuple[str, object]]):
+        """Move entries evicted from memory to disk, or drop them. Called
+        without the lock."""
+        for key, value in evicted:
+            data = pickle.dumps(value) if self.spill_max_bytes else None
+            if data is None or len(data) > self.spill_max_bytes:
+                with self._lock:
+                    self._count(evictions=1)
+                continue
+            path = self._spill_dir / f"{key}-{os.urandom(4).hex()}{_SPILL_SUFFIX}"
+            try:
+                path.write_bytes(data)
+            except OSError as e:
+                logger.warning(f"Couldn't spill render cache entry: {e}")
+                with self._lock:
+                    self._count(evictions=1)
+                continue
+            removed = []
+            with self._lock:
+                if key in self._entries or key in self._spilled:
+                    # Rendered and cached again while this was written
+                    removed.append(path)
+                else:
+                    self._spilled[key] = (path, len(data))
+                    self._spill_bytes += len(data)
+                    while self._spill_bytes > self.spill_max_bytes:
+                        _, (old_path, old_size) = self._spilled.popitem(last=False)
+                        self._spill_bytes -= old_size
+                        removed.append(old_path)
+                        self._count(evictions=1)
+            for old_path in removed:
+                old_path.unlink(missing_ok=True)
+
+    def _count(self, hits=0, spill_hits=0, misses=0, evictions=0):
+        for stats in (self.stats, _invocation_stats.get()):
+            if stats is not None:
+                stats.hits += hits
+                stats.spill_hits += spill_hits
+                stats.misses += misses
+                stats.evictions += evictions
+
+
+_cache: RenderCache | None = None
+_cache_checked = False
+_cache_lock = threading.Lock()
+
+
+def configure(cache: RenderCache | None):
+    """Use an explicit cache (tests); None to reset."""
+    global _cache, _cache_checked
+    with _cache_lock:
+        _cache = cache
+        _cache_checked = cache is not None
+
+
+def get_cache() -> RenderCache | None:
+    """The container's cache, built from the environment on first use.
+
+    Returns None when RENDER_CACHE_BYTES is 0.
+    """
+    global _cache, _cache_checked
+    if _cache_checked:
+        return _cache
+    with _cache_lock:
+        if not _cache_checked:
+            _cache = _cache_from_env()
+            _cache_checked = True
+    return _cache
+
+
+def _int_env(name: str, default: int) -> int:
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}")
+        return default
+
+
+def _cache_from_env() -> RenderCache | None:
+    max_bytes = _int_env(RENDER_CACHE_BYTES_ENV, DEFAULT_MAX_BYTES)
+    if not max_bytes:
+        return None
+    return RenderCache(
+        max_bytes,
+        spill_dir=os.environ.get(RENDER_CACHE_SPILL_DIR_ENV) or None,
+        spill_max_bytes=_int_env(RENDER_CACHE_SPILL_BYTES_ENV, DEFAULT_SPILL_MAX_BYTES),
+    )
+
+
+def cached(task: str, rm_bytes: bytes, scale: float, render: Callable):
+    """render(rm_bytes, scale), answered from the cache when possible."""
+    cache = get_cache()
+    if cache is None:
+        return render(rm_bytes, scale)
+    key = cache.key(task, rm_bytes, scale)
+    found, value = cache.get(key)
+    if found:
+        return value
+    value = render(rm_bytes, scale)
+    cache.put(key, value)
+    return value
@@ -0,0 +1,274 @@
+"""Process pool for the CPU-bound render stage.
+
+Stroke rendering and PNG encoding are pure Python and Pillow work, so page
+threads serialize on the GIL and the extra vCPUs that come with a larger
+`lambda_memory` sit idle. This module runs rendering in worker processes that
+take .rm bytes and return PNG bytes.
+
+Lambda has no /dev/shm, so multiprocessing.Pool, Queue and anything else
+built on POSIX semaphores fails there. Each worker is a plain Process with
+its own duplex Pipe (a socketpair), and page threads borrow idle workers
+from an in-process queue.Queue. Workers are forked once per container,
+inherit the already-imported renderer, and stay warm across invocations.
+
+`render_rm_to_png` and `segment_page` here are drop-in replacements for the
+rm_renderer functions that run in the pool when it is enabled, and are
+answered from the render cache (render_cache) when the page was rendered
+recently.
+
+With ADAPTIVE_RENDER_SCALE set, `choose_scale` picks each page's scale from
+its handwriting (rm_renderer.choose_scale) within RENDER_SCALE_MIN and
+RENDER_SCALE_MAX. It runs on the calling thread: with the fast scanner,
+reading a page's strokes costs about a millisecond, less than a round trip
+to a worker.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+import render_cache
+import rm_renderer
+from rm_renderer import RENDER_SCALE, PageSegments, ScaleChoice
+
+logger = logging.getLogger()
+
+# Adaptive render scale: off unless ADAPTIVE_RENDER_SCALE is set ("1",
+# "true"); every page then renders between the min and max scale.
+ADAPTIVE_RENDER_SCALE_ENV = "ADAPTIVE_RENDER_SCALE"
+RENDER_SCALE_MIN_ENV = "RENDER_SCALE_MIN"
+RENDER_SCALE_MAX_ENV = "RENDER_SCALE_MAX"
+DEFAULT_MIN_SCALE = 0.25
+DEFAULT_MAX_SCALE = 1.0
+
+# Worker process count. Unset or empty means one per vCPU; 0 or 1 renders on
+# the calling thread (a single worker on a single vCPU only adds IPC).
+RENDER_PROCESSES_ENV = "RENDER_PROCESSES"
+
+_TASKS = {
+    "render": rm_renderer.render_rm_to_png,
+    "segment": rm_renderer.segment_page,
+}
+
+
+class RenderWorkerError(RuntimeError):
+    """A render worker exited mid-task (e.g. killed for memory)."""
+
+
+def _warm():
+    """Load Pillow's PNG encoder, which Image.save imports on first use."""
+    Image.new("L", (1, 1), "white").save(BytesIO(), format="PNG")
+
+
+def _worker_main(conn):
+    """Serve (task, rm_bytes, scale) requests until the pipe closes."""
+    _warm()
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        task, rm_bytes, scale = request
+        try:
+            conn.send((True, _TASKS[task](rm_bytes, scale)))
+        except Exception as e:
+            # send() pickles before writing, so an unpicklable exception
+            # leaves the pipe clean for the fallback.
+            try:
+                conn.send((False, e))
+            except Exception:
+                conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class RenderPool:
+    """A fixed set of render worker processes shared by page threads."""
+
+    def __init__(self, processes: int, context=None):
+        if processes < 1:
+            raise ValueError("processes must be at least 1")
+        # fork: workers inherit the imported renderer instead of re-importing
+        # it, and spawn would re-run the Lambda bootstrap as __main__.
+        self._context = context or multiprocessing.get_context("fork")
+        self._idle = queue.Queue()
+        self._workers = [_Worker(self._context) for _ in range(processes)]
+        for worker in self._workers:
+            self._idle.put(worker)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def run(self, task: str, rm_bytes: bytes, scale: float = RENDER_SCALE):
+        """Run `task` ("render" or "segment") on an idle worker and return its result.
+
+        Blocks until a worker is free. Exceptions raised by the task are
+        re-raised here. If the worker dies, it is replaced and
+        RenderWorkerError is raised for this page.
+        """
+        if task not in _TASKS:
+            raise ValueError(f"Unknown render task: {task}")
+        worker = self._idle.get()
+        try:
+            worker.conn.send((task, rm_bytes, scale))
+            ok, value = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            self._replace(worker)
+            raise RenderWorkerError(f"Render worker exited: {e or type(e).__name__}") from e
+        self._idle.put(worker)
+        if not ok:
+            raise value
+        return value
+
+    def _replace(self, worker: _Worker):
+        worker.close()
+        with self._lock:
+            if self._closed:
+                return
+            replacement = _Worker(self._context)
+            self._workers[self._workers.index(worker)] = replacement
+        self._idle.put(replacement)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+
+_pool: RenderPool | None = None
+_pool_lock = threading.Lock()
+_pool_checked = False
+
+
+def configured_processes() -> int:
+    """Worker count from RENDER_PROCESSES, defaulting to os.cpu_count()."""
+    value = os.environ.get(RENDER_PROCESSES_ENV, "").strip()
+    if not value:
+        return os.cpu_count() or 1
+    try:
+        processes = int(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {RENDER_PROCESSES_ENV}={value!r}")
+        return os.cpu_count() or 1
+    return max(0, processes)
+
+
+def get_pool() -> RenderPool | None:
+    """The container's render pool, started on first use; None when disabled."""
+    global _pool, _pool_checked
+    if _pool_checked:
+        return _pool
+    with _pool_lock:
+        if not _pool_checked:
+            processes = configured_processes()
+            if processes > 1:
+                _pool = RenderPool(processes)
+                logger.info(f"Started {processes} render worker processes")
+            _pool_checked = True
+    return _pool
+
+
+def shutdown():
+    """Stop the container's render pool; the next render starts a new one."""
+    global _pool, _pool_checked
+    with _pool_lock:
+        pool, _pool, _pool_checked = _pool, None, False
+    if pool is not None:
+        pool.close()
+
+
+def warm():
+    """Start the pool before page threads exist, so workers fork single-threaded."""
+    get_pool()
+
+
+def _render(rm_bytes: bytes, scale: float) -> bytes:
+    pool = get_pool()
+    if pool is None:
+        return rm_renderer.render_rm_to_png(rm_bytes, scale)
+    return pool.run("render", rm_bytes, scale)
+
+
+def _segment(rm_bytes: bytes, scale: float) -> PageSegments | None:
+    pool = get_pool()
+    if pool is None:
+        return rm_renderer.segment_page(rm_bytes, scale)
+    return pool.run("segment", rm_bytes, scale)
+
+
+def render_rm_to_png(rm_bytes: bytes, scale: float = RENDER_SCALE) -> bytes:
+    """rm_renderer.render_rm_to_png, cached, run in the render pool when enabled."""
+    return render_cache.cached("render", rm_bytes, scale, _render)
+
+
+def segment_page(rm_bytes: bytes, scale: float = RENDER_SCALE) -> PageSegments | None:
+    """rm_renderer.segment_page, cached, run in the render pool when enabled."""
+    return render_cache.cached("segment", rm_bytes, scale, _segment)
+
+
+def _scale_env(name: str, default: float) -> float:
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        scale = float(value)
+    except ValueError:
+        scale = 0
+    if not 0 < scale <= 1:
+        logger.warning(f"Ignoring invalid {name}={value!r}")
+        return default
+    return scale
+
+
+def scale_bounds() -> tuple[float, float] | None:
+    """(min, max) adaptive render scale, or None when it's off."""
+    if os.environ.get(ADAPTIVE_RENDER_SCALE_ENV, "").strip().lower() not in ("1", "true", "yes"):
+        return None
+    low = _scale_env(RENDER_SCALE_MIN_ENV, DEFAULT_MIN_SCALE)
+    high = _scale_env(RENDER_SCALE_MAX_ENV, DEFAULT_MAX_SCALE)
+    if low > high:
+        logger.warning(f"{RENDER_SCALE_MIN_ENV} is above {RENDER_SCALE_MAX_ENV}; using {high} for both")
+        low = high
+    return low, high
+
+
+def choose_scale(rm_bytes: bytes) -> ScaleChoice | None:
+    """The page's adaptive render scale, or None to render at RENDER_SCALE
+    (adaptive scale off, or the page's strokes couldn't be read)."""
+    bounds = scale_bounds()
+    if bounds is None:
+        return None
+    try:
+        return rm_renderer.choose_scale(rm_renderer.read_strokes(rm_bytes), *bounds)
+    except Exception as e:
+        logger.warning(f"Couldn't choose a render scale, using {RENDER_SCALE}: {e}")
+        return None
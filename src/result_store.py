@@ -0,0 +1,199 @@
+"""Per-notebook page results kept between syncs, for delta sync.
+
+Each notebook maps page ids to the last result for that page: the content
+hash it was computed from, the client's last-modified time, and the
+markdown. A page deleted from the notebook stays as a tombstone for a while,
+so a page that comes back (undo, move between notebooks) is answered from
+its old result instead of being OCR'd again.
+
+ResultStore is the interface the sync module codes against:
+- MemoryResultStore and SQLiteResultStore for tests, server mode and
+  offline runs
+- DynamoResultStore for Lambda (one item per page)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+# Tombstones are dropped after this long; live pages are kept until deleted.
+TOMBSTONE_TTL_SECONDS = 30 * 24 * 3600
+
+
+class ResultStore:
+    """Interface for per-notebook page results.
+
+    An entry is a dict with "hash", "modified", "markdown", "confidence"
+    and "deleted" (True for tombstones).
+    """
+
+    def get_notebook(self, notebook_id: str) -> dict[str, dict]:
+        """All entries for a notebook (tombstones included), keyed by page id."""
+        raise NotImplementedError
+
+    def put_pages(self, notebook_id: str, entries: dict[str, dict]):
+        """Store or replace live entries for the given page ids."""
+        raise NotImplementedError
+
+    def delete_pages(self, notebook_id: str, page_ids: list[str]):
+        """Turn the given pages' entries into tombstones."""
+        raise NotImplementedError
+
+
+class MemoryResultStore(ResultStore):
+    """In-process store; results live as long as the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._notebooks: dict[str, dict[str, dict]] = {}
+        self._expires: dict[tuple[str, str], float] = {}
+
+    def get_notebook(self, notebook_id):
+        now = time.time()
+        with self._lock:
+            pages = self._notebooks.get(notebook_id, {})
+            for page_id in [p for p in pages if self._expires.get((notebook_id, p), now) < now]:
+                del pages[page_id]
+                del self._expires[(notebook_id, page_id)]
+            return {page_id: dict(entry) for page_id, entry in pages.items()}
+
+    def put_pages(self, notebook_id, entries):
+        with self._lock:
+            pages = self._notebooks.setdefault(notebook_id, {})
+            for page_id, entry in entries.items():
+                pages[page_id] = {**entry, "deleted": False}
+                self._expires.pop((notebook_id, page_id), None)
+
+    def delete_pages(self, notebook_id, page_ids):
+        expires = time.time() + TOMBSTONE_TTL_SECONDS
+        with self._lock:
+            pages = self._notebooks.get(notebook_id, {})
+            for page_id in page_ids:
+                if page_id in pages:
+                    pages[page_id]["deleted"] = True
+                    self._expires[(notebook_id, page_id)] = expires
+
+
+class SQLiteResultStore(ResultStore):
+    """Single-file store for offline runs and single-host servers."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS page_results (
+                notebook_id TEXT NOT NULL, page_id TEXT NOT NULL, entry TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0, expires_at REAL,
+                PRIMARY KEY (notebook_id, page_id)
+            );
+            """
+        )
+
+    def get_notebook(self, notebook_id):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM page_results WHERE notebook_id = ? AND expires_at < ?",
+                (notebook_id, time.time()),
+            )
+            rows = self._db.execute(
+                "SELECT page_id, entry, deleted FROM page_results WHERE notebook_id = ?",
+                (notebook_id,),
+            ).fetchall()
+        return {page_id: {**json.loads(entry), "deleted": bool(deleted)}
+                for page_id, entry, deleted in rows}
+
+    def put_pages(self, notebook_id, entries):
+        rows = [
+            (notebook_id, page_id, json.dumps({k: v for k, v in entry.items() if k != "deleted"}))
+            for page_id, entry in entries.items()
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO page_results (notebook_id, page_id, entry) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def delete_pages(self, notebook_id, page_ids):
+        expires = time.time() + TOMBSTONE_TTL_SECONDS
+        with self._lock:
+            self._db.executemany(
+                "UPDATE page_results SET deleted = 1, expires_at = ? "
+                "WHERE notebook_id = ? AND page_id = ?",
+                [(expires, notebook_id, page_id) for page_id in page_ids],
+            )
+
+
+class DynamoResultStore(ResultStore):
+    """DynamoDB table keyed (pk = notebook id, sk = page id).
+
+    Tombstones carry an `expiresAt` for DynamoDB TTL; live pages don't
+    expire.
+    """
+
+    def __init__(self, table_name: str, dynamodb=None):
+        import boto3
+
+        self._table = table_name
+        self._dynamodb = dynamodb or boto3.client("dynamodb")
+
+    def get_notebook(self, notebook_id):
+        now = time.time()
+        pages = {}
+        kwargs = {
+            "TableName": self._table,
+            "KeyConditionExpression": "pk = :pk",
+            "ExpressionAttributeValues": {":pk": {"S": notebook_id}},
+            "ConsistentRead": True,
+        }
+        while True:
+            response = self._dynamodb.query(**kwargs)
+            for item in response.get("Items", []):
+                # TTL deletion lags expiry by up to a couple of days.
+                if "expiresAt" in item and int(item["expiresAt"]["N"]) < now:
+                    continue
+                pages[item["sk"]["S"]] = {
+                    "hash": item["hash"]["S"],
+                    "modified": int(item["modified"]["N"]) if "modified" in item else None,
+                    "markdown": item["markdown"]["S"],
+                    "confidence": float(item["confidence"]["N"]),
+                    "deleted": item.get("deleted", {}).get("BOOL", False),
+                }
+            if "LastEvaluatedKey" not in response:
+                return pages
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def put_pages(self, notebook_id, entries):
+        items = []
+        for page_id, entry in entries.items():
+            item = {
+                "pk": {"S": notebook_id}, "sk": {"S": page_id},
+                "hash": {"S": entry["hash"]},
+                "markdown": {"S": entry["markdown"]},
+                "confidence": {"N": str(entry["confidence"])},
+                "deleted": {"BOOL": False},
+            }
+            if entry.get("modified") is not None:
+                item["modified"] = {"N": str(entry["modified"])}
+            items.append(item)
+        for start in range(0, len(items), 25):
+            request = {self._table: [{"PutRequest": {"Item": item}} for item in items[start:start + 25]]}
+            while request:
+                response = self._dynamodb.batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems") or None
+
+    def delete_pages(self, notebook_id, page_ids):
+        expires = str(int(time.time() + TOMBSTONE_TTL_SECONDS))
+        for page_id in page_ids:
+            try:
+                self._dynamodb.update_item(
+                    TableName=self._table,
+                    Key={"pk": {"S": notebook_id}, "sk": {"S": page_id}},
+                    UpdateExpression="SET deleted = :true, expiresAt = :expires",
+                    ConditionExpression="attribute_exists(sk)",
+                    ExpressionAttributeValues={":true": {"BOOL": True}, ":expires": {"N": expires}},
+                )
+            except self._dynamodb.exceptions.ConditionalCheckFailedException:
+                pass  # already gone
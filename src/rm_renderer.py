@@ -2,12 +2,25 @@
 
 This module parses .rm v6 files and renders strokes to PNG for OCR processing.
 It also extracts typed text directly when available (firmware v3.3+).
+
+Files are read with the fast scanner in rm_scan; rmscene parses any file
+the scanner doesn't fully understand.
 """
 
+import math
+import statistics
+from dataclasses import dataclass, field
+from functools import partial
 from io import BytesIO
+
 from PIL import Image, ImageDraw
 from rmscene import read_blocks
-from rmscene.scene_items import Line, Text
+from rmscene.scene_stream import RootTextBlock
+
+import rm_scan
+from rm_scan import ScanError
+from strokes import StrokeSet
+from typed_text import text_to_markdown
 
 # reMarkable native page dimensions in pixels (do not change — these reflect
 # the device coordinate system, not the rendered output size).
@@ -30,6 +43,39 @@ MAX_CANVAS_HEIGHT = 12000
 # Bottom/right padding around stroke extents so glyphs don't touch the edge.
 PADDING_PX = 20
 
+# Stroke segmentation (native pixels). Strokes closer than MERGE_GAP_PX join
+# one region, which groups handwritten words into lines and lines into
+# paragraphs (ruled templates space baselines ~80px apart).
+MERGE_GAP_PX = 60
+SEGMENT_CELL_PX = 128
+# Handwriting stays within a ruled line's height however wide a cursive word
+# gets; drawings have tall strokes or long straight ones. A region is
+# drawing-like when most of its ink (by path length) is in such strokes.
+TEXT_MAX_STROKE_HEIGHT_PX = 160
+LONG_STROKE_PX = 250
+STRAIGHT_PATH_RATIO = 1.3
+DRAWING_INK_FRACTION = 0.5
+# A mixed page gets at most this many drawing crops (one description call
+# each); past it, the smallest drawings share the last crop.
+MAX_DRAWING_CROPS = 4
+
+# Adaptive render scale (choose_scale). A page is rendered at the lowest
+# scale that keeps its typical handwriting stroke MIN_GLYPH_PX tall, more
+# when ink covers much of the writing area (glyphs crowd each other), and
+# keeps a loop's inside MIN_COUNTER_PX open under thick pens. Strokes shorter
+# than MIN_GLYPH_STROKE_PX (dots, ticks) don't count as glyphs. Scales are
+# rounded up to SCALE_STEP so renders share cache entries.
+MIN_GLYPH_PX = 20
+MIN_COUNTER_PX = 2
+MIN_GLYPH_STROKE_PX = 8
+SCALE_STEP = 0.05
+
+# Claude Vision downsizes images past these limits before counting tokens
+# (about width * height / 750 per image).
+MAX_IMAGE_EDGE_PX = 1568
+MAX_IMAGE_PIXELS = 1_150_000
+PIXELS_PER_IMAGE_TOKEN = 750
+
 # Brush colors (reMarkable uses 0=black, 1=gray, 2=white). Color names and
 # hex strings are accepted by PIL ImageDraw in both "RGB" and "L" modes.
 BRUSH_COLORS = {
@@ -40,7 +86,7 @@ BRUSH_COLORS = {
 
 
 def _iter_lines(blocks):
-    """Yield Line objects from rmscene blocks (v6 format + legacy fallback)."""
+    """Yield Lines from rmscene blocks (v6 format + legacy fallback)."""
     for block in blocks:
         if hasattr(block, "item") and block.item is not None:
             item = block.item
@@ -53,7 +99,250 @@ def _iter_lines(blocks):
             yield block.value
 
 
-def _compute_canvas_dims(blocks, scale):
+def _scan(rm_bytes: bytes) -> rm_scan.ScannedPage | None:
+    """The page via the fast scanner, or None to read it with rmscene."""
+    try:
+        return rm_scan.scan(rm_bytes)
+    except ScanError:
+        return None
+
+
+def read_strokes(rm_bytes: bytes) -> StrokeSet:
+    """Every stroke on a page, in file order."""
+    page = _scan(rm_bytes)
+    if page is not None:
+        return page.lines
+    return StrokeSet.from_lines(_iter_lines(read_blocks(BytesIO(rm_bytes))))
+
+
+@dataclass
+class Region:
+    """A spatial cluster of strokes, labelled "text" or "drawing".
+
+    `bbox` is (x0, y0, x1, y1) in native device coordinates (center-origin X).
+    """
+
+    kind: str
+    bbox: tuple[float, float, float, float]
+    lines: list = field(default_factory=list)
+
+
+@dataclass
+class PageSegments:
+    """Cropped renders of a mixed page: text strokes and each drawing."""
+
+    text_png: bytes
+    drawing_pngs: list[bytes]
+
+
+def _stroke_bbox(line):
+    xy = line.xy
+    xs, ys = xy[0::2], xy[1::2]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _path_length(line) -> float:
+    xy = line.xy
+    xs, ys = xy[0::2], xy[1::2]
+    return sum(
+        math.hypot(x1 - x0, y1 - y0) for x0, x1, y0, y1 in zip(xs, xs[1:], ys, ys[1:])
+    )
+
+
+def _boxes_near(a, b, gap):
+    return (a[0] - gap <= b[2] and b[0] - gap <= a[2]
+            and a[1] - gap <= b[3] and b[1] - gap <= a[3])
+
+
+def _union_box(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _is_drawing_stroke(box, path_length) -> bool:
+    width, height = box[2] - box[0], box[3] - box[1]
+    if height > TEXT_MAX_STROKE_HEIGHT_PX:
+        return True
+    extent = max(width, height)
+    return extent > LONG_STROKE_PX and path_length < STRAIGHT_PATH_RATIO * extent
+
+
+def _classify(boxes, lengths) -> str:
+    ink = sum(lengths) or 1.0
+    drawing_ink = sum(
+        length for box, length in zip(boxes, lengths) if _is_drawing_stroke(box, length)
+    )
+    return "drawing" if drawing_ink / ink > DRAWING_INK_FRACTION else "text"
+
+
+def _find(parent: list[int], i: int) -> int:
+    """Union-find root of `i`, halving the path on the way."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _merge_overlapping(groups: list[list]) -> list[list]:
+    """Merge [bbox, members] groups until no two bboxes intersect.
+
+    Each pass sweeps the boxes left to right, comparing a box only with
+    those still open at its left edge, and joins intersecting ones with
+    union-find. A merged box can reach a box none of its parts touched, so
+    passes repeat until one joins nothing (rarely more than two).
+    """
+    while True:
+        groups.sort(key=lambda group: group[0][0])
+        parent = list(range(len(groups)))
+        open_boxes = []
+        joined = False
+        for i, (box, _) in enumerate(groups):
+            open_boxes = [j for j in open_boxes if groups[j][0][2] >= box[0]]
+            for j in open_boxes:
+                other = groups[j][0]
+                if other[1] <= box[3] and box[1] <= other[3]:
+                    ri, rj = _find(parent, i), _find(parent, j)
+                    if ri != rj:
+                        parent[ri] = rj
+                        joined = True
+            open_boxes.append(i)
+        if not joined:
+            return groups
+        roots = {}
+        for i, (box, members) in enumerate(groups):
+            root = roots.setdefault(_find(parent, i), [box, []])
+            root[0] = _union_box(root[0], box)
+            root[1] += members
+        groups = list(roots.values())
+
+
+def segment_strokes(lines, gap: float = MERGE_GAP_PX) -> list[Region]:
+    """Group strokes into spatial regions and label each text- or drawing-like.
+
+    Strokes whose bounding boxes come within `gap` of each other are joined
+    (union-find over a uniform grid, so only nearby strokes are compared),
+    then regions whose boxes still overlap are merged so crops never share
+    ink. Regions are returned in reading order, top to bottom.
+    """
+    lines = [line for line in StrokeSet.from_lines(lines) if line.point_count > 0]
+    boxes = [_stroke_bbox(line) for line in lines]
+    lengths = [_path_length(line) for line in lines]
+    parent = list(range(len(lines)))
+    find = partial(_find, parent)
+
+    grid = {}
+    half = gap / 2
+    for i, box in enumerate(boxes):
+        cx0 = int((box[0] - half) // SEGMENT_CELL_PX)
+        cx1 = int((box[2] + half) // SEGMENT_CELL_PX)
+        cy0 = int((box[1] - half) // SEGMENT_CELL_PX)
+        cy1 = int((box[3] + half) // SEGMENT_CELL_PX)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = grid.setdefault((cx, cy), [])
+                for j in cell:
+                    if _boxes_near(box, boxes[j], gap):
+                        ri, rj = find(i), find(j)
+                        if ri != rj:
+                            parent[ri] = rj
+                cell.append(i)
+
+    clusters = {}
+    for i in range(len(lines)):
+        clusters.setdefault(find(i), []).append(i)
+    groups = []
+    for members in clusters.values():
+        bbox = boxes[members[0]]
+        for i in members[1:]:
+            bbox = _union_box(bbox, boxes[i])
+        groups.append([bbox, members])
+
+    # Stroke-level clustering can leave region boxes overlapping (a word
+    # inside a drawn frame); merge them so crops never share ink.
+    groups = _merge_overlapping(groups)
+
+    regions = []
+    for bbox, members in groups:
+        members.sort()
+        regions.append(Region(
+            kind=_classify([boxes[i] for i in members], [lengths[i] for i in members]),
+            bbox=bbox,
+            lines=[lines[i] for i in members],
+        ))
+    regions.sort(key=lambda r: (r.bbox[1], r.bbox[0]))
+    return regions
+
+
+def render_lines_to_png(lines, bbox, scale: float = RENDER_SCALE) -> bytes:
+    """Render strokes cropped to `bbox` (native coords) plus padding."""
+    x0, y0, x1, y1 = bbox
+    width = max(1, int((x1 - x0 + 2 * PADDING_PX) * scale))
+    height = max(1, int((min(y1 - y0, MAX_CANVAS_HEIGHT) + 2 * PADDING_PX) * scale))
+    img = Image.new("L", (width, height), "white")
+    _draw_lines(ImageDraw.Draw(img), lines, PADDING_PX - x0, PADDING_PX - y0, scale)
+    output = BytesIO()
+    img.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+
+def segment_page(rm_bytes: bytes, scale: float = RENDER_SCALE) -> PageSegments | None:
+    """Split a mixed page into a text-only crop and one crop per drawing.
+
+    Returns None unless the page has both text-like and drawing-like regions
+    (or can't be parsed); such pages are sent whole, so a misclassified
+    region still reaches transcription. For mixed pages, every text region
+    is rendered onto one canvas cropped to their union, leaving drawings
+    out of the transcription image, and each drawing gets its own crop (up
+    to MAX_DRAWING_CROPS).
+    """
+    try:
+        regions = segment_strokes(read_strokes(rm_bytes))
+    except Exception:
+        return None
+    text_regions = [r for r in regions if r.kind == "text"]
+    drawing_regions = [r for r in regions if r.kind == "drawing"]
+    if not text_regions or not drawing_regions:
+        return None
+
+    text_bbox = text_regions[0].bbox
+    for region in text_regions[1:]:
+        text_bbox = _union_box(text_bbox, region.bbox)
+    text_lines = [line for region in text_regions for line in region.lines]
+    drawing_regions = _cap_drawings(drawing_regions)
+    return PageSegments(
+        text_png=render_lines_to_png(text_lines, text_bbox, scale),
+        drawing_pngs=[render_lines_to_png(r.lines, r.bbox, scale) for r in drawing_regions],
+    )
+
+
+def has_drawing_regions(rm_bytes: bytes) -> bool | None:
+    """Whether segment_strokes finds any drawing-like region on the page.
+
+    None if the strokes can't be read. Pages segment_page returned None for
+    are either text-only or drawing-only; this tells the two apart.
+    """
+    try:
+        regions = segment_strokes(read_strokes(rm_bytes))
+    except Exception:
+        return None
+    return any(r.kind == "drawing" for r in regions)
+
+
+def _cap_drawings(regions: list[Region]) -> list[Region]:
+    """At most MAX_DRAWING_CROPS regions: the largest drawings (by ink) keep
+    their own crop and the rest share one, still in reading order."""
+    if len(regions) <= MAX_DRAWING_CROPS:
+        return regions
+    by_ink = sorted(regions, key=lambda r: sum(map(_path_length, r.lines)), reverse=True)
+    extras = by_ink[MAX_DRAWING_CROPS - 1:]
+    bbox = extras[0].bbox
+    for region in extras[1:]:
+        bbox = _union_box(bbox, region.bbox)
+    shared = Region(kind="drawing", bbox=bbox, lines=[line for r in extras for line in r.lines])
+    kept = [*by_ink[:MAX_DRAWING_CROPS - 1], shared]
+    return sorted(kept, key=lambda r: (r.bbox[1], r.bbox[0]))
+
+
+def _compute_canvas_dims(lines, scale):
     """Walk strokes once to derive a canvas that fits every point.
 
     Returns (width, height, x_offset_native) where width/height are the scaled
@@ -62,15 +351,11 @@ def _compute_canvas_dims(blocks, scale):
     the canvas. Floors at standard page dims so empty/short pages still render
     at the familiar size; ceilings at MAX_CANVAS_HEIGHT to bound payload.
     """
-    max_y_strokes = 0
-    max_x_extent = X_OFFSET  # half-width from center (RM_WIDTH / 2)
-    for line in _iter_lines(blocks):
-        for p in line.points:
-            if p.y > max_y_strokes:
-                max_y_strokes = p.y
-            ax = abs(p.x)
-            if ax > max_x_extent:
-                max_x_extent = ax
+    xy = memoryview(StrokeSet.from_lines(lines).points)
+    xs, ys = xy[0::2], xy[1::2]
+    max_y_strokes = max(0, max(ys, default=0))
+    # half-width from center (RM_WIDTH / 2)
+    max_x_extent = max(X_OFFSET, max(xs, default=0), -min(xs, default=0))
     # Only pad past the standard page when strokes actually overflow it —
     # short/empty pages keep their familiar RM_HEIGHT so existing call sites
     # and the Prose UI see no dimension change for typical content.
@@ -83,23 +368,103 @@ def _compute_canvas_dims(blocks, scale):
     return width, height, max_x_extent
 
 
+@dataclass
+class ScaleChoice:
+    """The render scale picked for a page and what it was picked from.
+
+    `glyph_height` is the median height (native px) of handwriting strokes,
+    None if the page has none; `ink_coverage` the share of the writing
+    area covered by ink. `estimated_token_saving` compares the page's image
+    tokens at the chosen scale with RENDER_SCALE (negative when the page
+    needed more resolution).
+    """
+
+    scale: float
+    glyph_height: float | None
+    ink_coverage: float
+    estimated_token_saving: int
+
+    def to_dict(self) -> dict:
+        return {
+            "scale": self.scale,
+            "glyphHeightPx": None if self.glyph_height is None else round(self.glyph_height, 1),
+            "inkCoverage": round(self.ink_coverage, 3),
+            "estimatedTokenSaving": self.estimated_token_saving,
+        }
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Approximate Claude Vision input tokens for an image of this size."""
+    shrink = min(
+        1.0,
+        MAX_IMAGE_EDGE_PX / max(width, height),
+        math.sqrt(MAX_IMAGE_PIXELS / (width * height)),
+    )
+    return math.ceil((width * shrink) * (height * shrink) / PIXELS_PER_IMAGE_TOKEN)
+
+
+def choose_scale(lines, min_scale: float, max_scale: float) -> ScaleChoice:
+    """The lowest scale in [min_scale, max_scale] that keeps the page's
+    handwriting legible (see MIN_GLYPH_PX).
+
+    Pages without handwriting-sized strokes keep RENDER_SCALE, clamped to
+    the range.
+    """
+    strokes = StrokeSet.from_lines(lines)
+    heights, widths = [], []
+    ink_area = 0.0
+    area_box = None
+    for line in strokes:
+        if line.point_count < 2:
+            continue
+        box = _stroke_bbox(line)
+        height = box[3] - box[1]
+        if not MIN_GLYPH_STROKE_PX <= height <= TEXT_MAX_STROKE_HEIGHT_PX:
+            continue
+        heights.append(height)
+        widths.append(line.thickness_scale)
+        ink_area += _path_length(line) * line.thickness_scale
+        area_box = box if area_box is None else _union_box(area_box, box)
+
+    if not heights:
+        scale = min(max(RENDER_SCALE, min_scale), max_scale)
+        return ScaleChoice(scale, None, 0.0, _token_saving(strokes, scale))
+
+    glyph_height = statistics.median(heights)
+    width = statistics.median(widths)
+    area = max(1.0, (area_box[2] - area_box[0]) * (area_box[3] - area_box[1]))
+    coverage = min(1.0, ink_area / area)
+
+    needed = MIN_GLYPH_PX * (1 + coverage) / glyph_height
+    counter = glyph_height / 2 - width
+    needed = max(needed, MIN_COUNTER_PX / counter if counter > 0 else max_scale)
+    scale = math.ceil(round(needed / SCALE_STEP, 6)) * SCALE_STEP
+    scale = round(min(max(scale, min_scale), max_scale), 4)
+    return ScaleChoice(scale, glyph_height, coverage, _token_saving(strokes, scale))
+
+
+def _token_saving(lines, scale: float) -> int:
+    """Whole-page image tokens at RENDER_SCALE minus those at `scale`."""
+    baseline = image_tokens(*_compute_canvas_dims(lines, RENDER_SCALE)[:2])
+    return baseline - image_tokens(*_compute_canvas_dims(lines, scale)[:2])
+
+
 def extract_typed_text(rm_bytes: bytes) -> str | None:
     """Extract typed text directly from .rm file (firmware v3.3+).
 
-    Returns the text content if the page contains typed text,
-    or None if it only contains handwritten strokes.
+    Returns the page's typed text as markdown, with paragraph styles mapped
+    to headings, bullets, and checkboxes, or None if it only contains
+    handwritten strokes.
     """
     try:
-        blocks = list(read_blocks(BytesIO(rm_bytes)))
-        text_parts = []
-
-        for block in blocks:
-            if isinstance(block, Text):
-                if hasattr(block, "text") and block.text:
-                    text_parts.append(block.text)
-
-        if text_parts:
-            return "\n".join(text_parts)
+        page = _scan(rm_bytes)
+        if page is not None:
+            if page.text is None:
+                return None
+            return text_to_markdown(page.text) or None
+        for block in read_blocks(BytesIO(rm_bytes)):
+            if isinstance(block, RootTextBlock):
+                return text_to_markdown(block.value) or None
         return None
     except Exception:
         return None
@@ -108,7 +473,7 @@ def extract_typed_text(rm_bytes: bytes) -> str | None:
 def render_rm_to_png(rm_bytes: bytes, scale: float = RENDER_SCALE) -> bytes:
     """Render .rm strokes to PNG image.
 
-    Parses the .rm binary format using rmscene and draws strokes
+    Reads the page's strokes (see read_strokes) and draws them
     using Pillow's ImageDraw. Handles stroke attributes like
     position, width, and color.
 
@@ -122,13 +487,13 @@ def render_rm_to_png(rm_bytes: bytes, scale: float = RENDER_SCALE) -> bytes:
         PNG image as bytes (8-bit grayscale)
     """
     # Parse .rm file
-    blocks = list(read_blocks(BytesIO(rm_bytes)))
+    lines = read_strokes(rm_bytes)
 
     # Size the canvas to the strokes' actual extent so infinite-scroll pages
     # aren't truncated. x_offset_native is the un-scaled X shift; using
     # max(X_OFFSET, ...) keeps the center-origin transform valid even when a
     # stroke pushes past the standard half-width.
-    out_w, out_h, x_offset_native = _compute_canvas_dims(blocks, scale)
+    out_w, out_h, x_offset_native = _compute_canvas_dims(lines, scale)
     x_offset_effective = max(X_OFFSET, x_offset_native)
 
     # Grayscale ("L") mode is one byte per pixel vs three for "RGB" — direct
@@ -136,23 +501,33 @@ def render_rm_to_png(rm_bytes: bytes, scale: float = RENDER_SCALE) -> bytes:
     img = Image.new("L", (out_w, out_h), "white")
     draw = ImageDraw.Draw(img)
 
-    # Draw each stroke
-    for line in _iter_lines(blocks):
-        if len(line.points) < 2:
+    # Apply X offset for center-origin coordinate system, then scale into
+    # the output canvas.
+    _draw_lines(draw, lines, x_offset_effective, 0, scale)
+
+    # Export to PNG bytes
+    output = BytesIO()
+    img.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+
+def _draw_lines(draw, lines, dx: float, dy: float, scale: float):
+    """Draw strokes, mapping each point to ((x + dx) * scale, (y + dy) * scale)."""
+    for line in lines:
+        if line.point_count < 2:
             continue
 
-        # Extract points: apply X offset for center-origin coordinate system,
-        # then scale into output canvas.
-        points = [((p.x + x_offset_effective) * scale, p.y * scale) for p in line.points]
+        # Only one stroke's points are ever materialized at a time.
+        xy = line.xy
+        points = [((x + dx) * scale, (y + dy) * scale) for x, y in zip(xy[0::2], xy[1::2])]
 
         # Determine stroke color
-        color_idx = getattr(line, "color", 0)
-        color = BRUSH_COLORS.get(color_idx, "black")
+        color = BRUSH_COLORS.get(line.color, "black")
 
         # Stroke width scales with canvas so visual line weight is preserved.
         # `thickness_scale` defaults to 2; `max(1, ...)` keeps hairlines visible
         # after scaling, especially at scale < 0.5.
-        width = max(1, int(getattr(line, "thickness_scale", 2) * scale))
+        width = max(1, int(line.thickness_scale * scale))
 
         # Draw the stroke
         if len(points) == 2:
@@ -161,18 +536,20 @@ def render_rm_to_png(rm_bytes: bytes, scale: float = RENDER_SCALE) -> bytes:
             # Draw as connected line segments
             draw.line(points, fill=color, width=width, joint="curve")
 
-    # Export to PNG bytes
-    output = BytesIO()
-    img.save(output, format="PNG", optimize=True)
-    return output.getvalue()
-
 
 def has_strokes(rm_bytes: bytes) -> bool:
     """Check if the .rm file contains any handwritten strokes.
 
     Used to determine if OCR is needed or if typed text extraction
-    is sufficient.
+    is sufficient. The scanner answers from block headers and stops at the
+    first line with points; rmscene parses the file only when it can't.
     """
+    try:
+        found = rm_scan.sniff_strokes(rm_bytes)
+    except ScanError:
+        found = None
+    if found is not None:
+        return found
     try:
         blocks = list(read_blocks(BytesIO(rm_bytes)))
         return any(len(line.points) > 0 for line in _iter_lines(blocks))
@@ -0,0 +1,303 @@
+"""Fast scanner for the parts of a .rm v6 file the renderer uses.
+
+rmscene parses every block into a full object graph, with a `Point`
+dataclass built from six separate field reads per sample, though rendering
+needs only each line's points, pen color and thickness, and OCR routing
+needs the typed text. This scanner walks the block headers over a
+memoryview, skips every block type but lines and root text, and unpacks a
+line's point records in one `struct.iter_unpack` pass straight into the
+page's StrokeSet arrays.
+`sniff_strokes` answers "any ink?" from the block headers and the first
+non-empty line, without unpacking points at all.
+
+It accepts only structures it fully understands. Anything else (another
+header version, a tag out of place, a truncated block) raises ScanError,
+and callers fall back to rmscene for the whole file, so a page renders the
+same either way.
+"""
+
+import struct
+from dataclasses import dataclass, field
+from itertools import chain
+
+from rmscene import scene_items as si
+from rmscene.crdt_sequence import CrdtSequence, CrdtSequenceItem
+from rmscene.tagged_block_common import HEADER_V6, CrdtId, LwwValue
+
+from strokes import StrokeSet
+
+LINE_BLOCK = 0x05
+ROOT_TEXT_BLOCK = 0x07
+LINE_ITEM_TYPE = 0x03
+
+# Tag types (low nibble of a tag)
+_ID = 0xF
+_LENGTH4 = 0xC
+_BYTE8 = 0x8
+_BYTE4 = 0x4
+
+# Point records by line version: x and y first, then pen dynamics we don't
+# render (speed, width, direction, pressure).
+_POINT_FORMATS = {
+    1: struct.Struct("<ff16x"),
+    2: struct.Struct("<ff6x"),
+}
+
+_BLOCK_HEADER = struct.Struct("<IBBBB")
+_U32 = struct.Struct("<I")
+_F32 = struct.Struct("<f")
+_F64 = struct.Struct("<d")
+
+
+class ScanError(ValueError):
+    """The file has a structure the scanner doesn't handle; use rmscene."""
+
+
+@dataclass
+class ScannedPage:
+    """The strokes (in file order) and the first root text of a page."""
+
+    lines: StrokeSet = field(default_factory=StrokeSet)
+    text: si.Text | None = None
+
+
+class _Reader:
+    """Tagged-value reads over a memoryview, bounded by `end`."""
+
+    __slots__ = ("view", "pos", "end")
+
+    def __init__(self, view: memoryview, pos: int, end: int):
+        self.view = view
+        self.pos = pos
+        self.end = end
+
+    def _need(self, n: int):
+        if self.pos + n > self.end:
+            raise ScanError(f"read past end of block at {self.pos}")
+
+    def varuint(self) -> int:
+        result = shift = 0
+        while True:
+            self._need(1)
+            byte = self.view[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return result
+
+    def peek_tag(self) -> int | None:
+        pos = self.pos
+        try:
+            return self.varuint()
+        except ScanError:
+            return None
+        finally:
+            self.pos = pos
+
+    def tag(self, index: int, tag_type: int):
+        value = self.varuint()
+        if value != (index << 4 | tag_type):
+            raise ScanError(f"expected tag {index}/{tag_type:#x}, got {value:#x} at {self.pos}")
+
+    def unpack(self, fmt: struct.Struct):
+        self._need(fmt.size)
+        value = fmt.unpack_from(self.view, self.pos)[0]
+        self.pos += fmt.size
+        return value
+
+    def u8(self) -> int:
+        self._need(1)
+        value = self.view[self.pos]
+        self.pos += 1
+        return value
+
+    def crdt_id(self) -> CrdtId:
+        return CrdtId(self.u8(), self.varuint())
+
+    def id(self, index: int) -> CrdtId:
+        self.tag(index, _ID)
+        return self.crdt_id()
+
+    def int(self, index: int) -> int:
+        self.tag(index, _BYTE4)
+        return self.unpack(_U32)
+
+    def subblock(self, index: int) -> int:
+        """Enter a length-prefixed subblock; returns its end offset."""
+        self.tag(index, _LENGTH4)
+        length = self.unpack(_U32)
+        end = self.pos + length
+        if end > self.end:
+            raise ScanError(f"subblock {index} overruns its block at {self.pos}")
+        return end
+
+
+def scan(rm_bytes: bytes) -> ScannedPage | None:
+    """Scan a .rm file for its strokes and typed text.
+
+    Returns None if it isn't a v6 file. Raises ScanError for anything the
+    scanner can't read exactly as rmscene would.
+    """
+    view = memoryview(rm_bytes)
+    if not _is_v6(view):
+        return None
+
+    page = ScannedPage()
+    for block_type, version, start, end in _blocks(view):
+        if block_type == LINE_BLOCK:
+            line = _read_line(_Reader(view, start, end), version)
+            if line is not None:
+                color, thickness_scale, point_format, data = line
+                page.lines.append(color, thickness_scale,
+                                  chain.from_iterable(point_format.iter_unpack(data)))
+        elif block_type == ROOT_TEXT_BLOCK and page.text is None:
+            page.text = _scan_root_text(_Reader(view, start, end))
+    return page
+
+
+def sniff_strokes(rm_bytes: bytes) -> bool | None:
+    """Whether a .rm file has a stroke with at least one point.
+
+    Reads line blocks only up to the first one with a non-empty point
+    payload, without unpacking any points; past that, only the block
+    headers are checked, so a file that rmscene would fail to read still
+    does. Returns None if it isn't a v6 file; raises ScanError as `scan`
+    does.
+    """
+    view = memoryview(rm_bytes)
+    if not _is_v6(view):
+        return None
+
+    found = False
+    for block_type, version, start, end in _blocks(view):
+        if not found and block_type == LINE_BLOCK:
+            line = _read_line(_Reader(view, start, end), version)
+            found = line is not None and len(line[3]) > 0
+    return found
+
+
+def _is_v6(view: memoryview) -> bool:
+    return bytes(view[:len(HEADER_V6)]) == HEADER_V6
+
+
+def _blocks(view: memoryview):
+    """(block type, version, content start, content end) for each block."""
+    size = len(view)
+    pos = len(HEADER_V6)
+    while pos < size:
+        if pos + _BLOCK_HEADER.size > size:
+            raise ScanError("truncated block header")
+        length, unknown, min_version, version, block_type = _BLOCK_HEADER.unpack_from(view, pos)
+        start = pos + _BLOCK_HEADER.size
+        end = start + length
+        if unknown != 0 or min_version > version or end > size:
+            raise ScanError(f"bad block header at {pos}")
+        yield block_type, version, start, end
+        pos = end
+
+
+def _read_line(
+    r: _Reader, version: int
+) -> tuple[int, float, struct.Struct, memoryview] | None:
+    """A line block's color, thickness, point format and point data.
+
+    None for a deleted line.
+    """
+    point_format = _POINT_FORMATS.get(version)
+    if point_format is None:
+        raise ScanError(f"unknown line version {version}")
+    for index in (1, 2, 3, 4):  # parent, item, left and right ids
+        r.id(index)
+    r.int(5)  # deleted length
+    if r.peek_tag() != (6 << 4 | _LENGTH4):
+        return None  # deleted line: no value
+    value_end = r.subblock(6)
+    if r.u8() != LINE_ITEM_TYPE:
+        raise ScanError("line block without a line item")
+
+    r.int(1)  # tool
+    color = r.int(2)
+    r.tag(3, _BYTE8)
+    thickness_scale = r.unpack(_F64)
+    r.tag(4, _BYTE4)
+    r.unpack(_F32)  # starting length
+    points_end = r.subblock(5)
+    data = r.view[r.pos:points_end]
+    if len(data) % point_format.size:
+        raise ScanError("point data is not a whole number of points")
+    r.pos = points_end
+    r.end = value_end
+    r.id(6)  # timestamp; rmscene requires it
+    return color, thickness_scale, point_format, data
+
+
+def _scan_root_text(r: _Reader) -> si.Text:
+    if r.id(1) != CrdtId(0, 0):
+        raise ScanError("root text block id is not (0, 0)")
+
+    content_end = r.subblock(2)
+    items_end = r.subblock(1)
+    inner_end = r.subblock(1)
+    items = [_scan_text_item(r) for _ in range(r.varuint())]
+    if r.pos > inner_end:
+        raise ScanError("text items overrun their subblock")
+    r.pos = items_end
+
+    formats_end = r.subblock(2)
+    inner_end = r.subblock(1)
+    styles = dict(_scan_text_format(r) for _ in range(r.varuint()))
+    if r.pos > inner_end:
+        raise ScanError("text formats overrun their subblock")
+    r.pos = formats_end
+    if formats_end > content_end:
+        raise ScanError("text formats overrun the text content")
+    r.pos = content_end
+
+    position_end = r.subblock(3)
+    pos_x = r.unpack(_F64)
+    pos_y = r.unpack(_F64)
+    r.pos = position_end
+    r.tag(4, _BYTE4)
+    width = r.unpack(_F32)
+    return si.Text(items=CrdtSequence(items), styles=styles, pos_x=pos_x, pos_y=pos_y, width=width)
+
+
+def _scan_text_item(r: _Reader) -> CrdtSequenceItem:
+    end = r.subblock(0)
+    item_id = r.id(2)
+    left_id = r.id(3)
+    right_id = r.id(4)
+    deleted_length = r.int(5)
+    value = ""
+    if r.pos < end and r.peek_tag() == (6 << 4 | _LENGTH4):
+        string_end = r.subblock(6)
+        length = r.varuint()
+        if r.u8() != 1:
+            raise ScanError("text string is not flagged as utf-8")
+        r._need(length)
+        text = bytes(r.view[r.pos:r.pos + length]).decode()
+        r.pos += length
+        value = text
+        if r.pos < string_end and r.peek_tag() == (2 << 4 | _BYTE4):
+            value = r.int(2)  # formatting code, stored on an empty string
+        r.pos = string_end
+    if r.pos > end:
+        raise ScanError("text item overruns its subblock")
+    r.pos = end
+    return CrdtSequenceItem(item_id, left_id, right_id, deleted_length, value)
+
+
+def _scan_text_format(r: _Reader) -> tuple[CrdtId, LwwValue]:
+    char_id = r.crdt_id()
+    timestamp = r.id(1)
+    end = r.subblock(2)
+    if r.u8() != 17:
+        raise ScanError("unknown text format record")
+    code = r.u8()
+    try:
+        style = si.ParagraphStyle(code)
+    except ValueError:
+        style = si.ParagraphStyle.PLAIN
+    r.pos = end
+    return char_id, LwwValue(timestamp, style)
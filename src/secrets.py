@@ -1,16 +1,41 @@
-"""AWS Secrets Manager helper with TTL-based caching for Lambda container reuse."""
+"""AWS Secrets Manager helper with TTL-based caching for Lambda container reuse.
+
+Keys are refreshed stale-while-revalidate: once the TTL passes, callers keep
+getting the cached keys while a single background fetch replaces them, so
+no request waits on Secrets Manager except the first in a container (or one
+arriving after the keys are too stale to trust). Concurrent refreshes
+collapse into one fetch, and a failed fetch keeps the last good keys.
+After a failure no request waits on another fetch for RETRY_AFTER_SECONDS:
+they get the last good keys however stale, or an error if there are none.
+"""
 
 import json
+import logging
 import os
+import threading
 import time
 import boto3
 
+logger = logging.getLogger()
+
 secrets_client = None
 
 # TTL cache state
 _cached_keys: list[str] | None = None
 _cache_time: float = 0
 CACHE_TTL_SECONDS = 300  # 5 minutes — short enough for rotation, low overhead for sporadic traffic
+# Past this age the caller waits for the fetch instead of getting stale keys,
+# so a rotated-out key can't outlive the cache by more than this on an idle
+# container.
+MAX_STALE_SECONDS = 900
+# After a failed fetch, wait this long before trying Secrets Manager again.
+RETRY_AFTER_SECONDS = 30
+
+# Single-flight: held by whichever caller or background thread is fetching.
+_fetch_lock = threading.Lock()
+_retry_time: float = 0
+_last_error: Exception | None = None
+_refresh_thread: threading.Thread | None = None
 
 
 def get_secrets_client():
@@ -31,16 +56,21 @@ def get_api_keys() -> list[str]:
     - A JSON array: ["newest-key", "old-key"]
     - A plain string: "single-key" (backward compatible)
 
+    Keys older than CACHE_TTL_SECONDS are still returned while a background
+    refresh runs; keys older than MAX_STALE_SECONDS (or no keys at all) are
+    fetched inline. If Secrets Manager errors, the last good keys are served;
+    with none cached, the error is raised. For RETRY_AFTER_SECONDS after an
+    error, callers get the same answer without another fetch.
+
     Falls back to API_KEY environment variable for local testing.
     """
-    global _cached_keys, _cache_time
-
     # Check environment variable first (local testing)
     if api_key := os.environ.get("API_KEY"):
         return [api_key]
 
     # Return cached keys if still valid
-    if _cached_keys is not None and (time.monotonic() - _cache_time) < CACHE_TTL_SECONDS:
+    now = time.monotonic()
+    if _cached_keys is not None and (now - _cache_time) < CACHE_TTL_SECONDS:
         return _cached_keys
 
     # Get from Secrets Manager
@@ -48,6 +78,60 @@ def get_api_keys() -> list[str]:
     if not secret_arn:
         raise ValueError("API_KEY_SECRET_ARN environment variable not set")
 
+    if _cached_keys is not None and (now - _cache_time) < MAX_STALE_SECONDS:
+        if now >= _retry_time:
+            _start_background_refresh(secret_arn)
+        return _cached_keys
+
+    # Nothing usable cached: wait for a fetch (ours, or one already running),
+    # unless one failed within RETRY_AFTER_SECONDS.
+    if now < _retry_time:
+        return _backing_off()
+    with _fetch_lock:
+        now = time.monotonic()
+        if _cached_keys is not None and (now - _cache_time) < CACHE_TTL_SECONDS:
+            return _cached_keys
+        if now < _retry_time:
+            # The fetch we waited on failed
+            return _backing_off()
+        try:
+            _fetch(secret_arn)
+        except Exception as e:
+            _fetch_failed(e)
+            if _cached_keys is None:
+                raise
+    return _cached_keys
+
+
+def _backing_off() -> list[str]:
+    """The cached keys, however stale, while fetches are backing off."""
+    if _cached_keys is None:
+        raise RuntimeError(f"Secrets Manager unavailable, retrying shortly: {_last_error}")
+    return _cached_keys
+
+
+def _start_background_refresh(secret_arn: str):
+    """Start a refresh thread unless a fetch is already in flight."""
+    global _refresh_thread
+    if not _fetch_lock.acquire(blocking=False):
+        return
+
+    def refresh():
+        try:
+            _fetch(secret_arn)
+        except Exception as e:
+            _fetch_failed(e)
+        finally:
+            _fetch_lock.release()
+
+    _refresh_thread = threading.Thread(target=refresh, name="api-key-refresh", daemon=True)
+    _refresh_thread.start()
+
+
+def _fetch(secret_arn: str):
+    """Fetch and cache the keys. Caller must hold _fetch_lock."""
+    global _cached_keys, _cache_time
+
     client = get_secrets_client()
     response = client.get_secret_value(SecretId=secret_arn)
     secret_string = response["SecretString"]
@@ -55,12 +139,17 @@ def get_api_keys() -> list[str]:
     # Parse as JSON array, fall back to plain string for backward compat
     try:
         parsed = json.loads(secret_string)
-        if isinstance(parsed, list):
-            _cached_keys = parsed
-        else:
-            _cached_keys = [parsed]
+        keys = parsed if isinstance(parsed, list) else [parsed]
     except (json.JSONDecodeError, TypeError):
-        _cached_keys = [secret_string]
+        keys = [secret_string]
 
+    _cached_keys = keys
     _cache_time = time.monotonic()
-    return _cached_keys
+
+
+def _fetch_failed(error: Exception):
+    global _retry_time, _last_error
+    _retry_time = time.monotonic() + RETRY_AFTER_SECONDS
+    _last_error = error
+    if _cached_keys is not None:
+        logger.warning(f"Secrets Manager fetch failed, serving cached API keys: {error}")
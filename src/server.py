@@ -0,0 +1,237 @@
+"""Standalone HTTP server for running the service as a long-lived container.
+
+Adapts each HTTP request to a Lambda Function URL (payload format 2.0)
+event, calls handler.handler, and writes its response back, so the API
+contract is the Function URL's: same paths, headers, status codes and
+bodies. Unlike Lambda, one process serves many requests concurrently,
+so the API key cache, render worker pool, stage limits and an Anthropic
+connection pool are shared across requests, and clients can hold
+keep-alive connections.
+
+    python src/server.py --port 8080
+
+SIGTERM or SIGINT stops accepting connections, lets in-flight requests
+finish, then exits. With `--job-workers N`, N threads also work the async
+job queue (JOB_BACKEND=memory or sqlite).
+"""
+
+import argparse
+import base64
+import logging
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import anthropic
+
+import handler as lambda_handler
+import jobs
+import render_pool
+
+logger = logging.getLogger()
+
+# Function URL invocation payload limit; larger bodies get a 413 as they
+# would on Lambda.
+MAX_REQUEST_BYTES = 6 * 1024 * 1024
+# Idle keep-alive connections are closed after this many seconds, which
+# also bounds how long shutdown waits on them.
+KEEP_ALIVE_TIMEOUT = 5
+
+# Content types a Function URL passes through as text; any other body (or
+# one with a Content-Encoding) arrives base64-encoded.
+_TEXT_TYPES = ("text/", "application/json", "application/xml", "application/javascript")
+
+
+def _is_text(content_type: str | None, content_encoding: str | None) -> bool:
+    if content_encoding:
+        return False
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return media_type.startswith(_TEXT_TYPES) or media_type.endswith(("+json", "+xml"))
+
+
+def build_event(method: str, target: str, headers, body: bytes, source_ip: str) -> dict:
+    """Build a Function URL (payload 2.0) event for one HTTP request.
+
+    Header names are lowercased and repeated headers joined with commas, and
+    cookies move to the `cookies` list, as Function URLs deliver them.
+    """
+    url = urlsplit(target)
+    event_headers: dict[str, str] = {}
+    cookies = []
+    for name, value in headers.items():
+        name = name.lower()
+        if name == "cookie":
+            cookies.extend(c.strip() for c in value.split(";") if c.strip())
+        elif name in event_headers:
+            event_headers[name] += "," + value
+        else:
+            event_headers[name] = value
+
+    event = {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": url.path or "/",
+        "rawQueryString": url.query,
+        "headers": event_headers,
+        "requestContext": {
+            "http": {
+                "method": method,
+                "path": url.path or "/",
+                "protocol": "HTTP/1.1",
+                "sourceIp": source_ip,
+                "userAgent": event_headers.get("user-agent", ""),
+            },
+            "timeEpoch": int(time.time() * 1000),
+        },
+        "isBase64Encoded": False,
+    }
+    if cookies:
+        event["cookies"] = cookies
+    if body:
+        text = None
+        if _is_text(event_headers.get("content-type"), event_headers.get("content-encoding")):
+            try:
+                text = body.decode("utf-8")
+            except UnicodeDecodeError:
+                pass
+        if text is None:
+            event["body"] = base64.b64encode(body).decode("ascii")
+            event["isBase64Encoded"] = True
+        else:
+            event["body"] = text
+    return event
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Serves every method and path through handler.handler."""
+
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT
+    server_version = "remarkable-ocr"
+
+    def do_GET(self):
+        self._dispatch()
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = do_GET
+
+    def _dispatch(self):
+        if self.server.draining:
+            self.close_connection = True
+        length = self.headers.get("Content-Length")
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            self._send(411, {"Content-Type": "application/json"},
+                       b'{"error": "Content-Length required"}')
+            self.close_connection = True
+            return
+        size = int(length) if length and length.isdigit() else 0
+        if size > MAX_REQUEST_BYTES:
+            self._send(413, {"Content-Type": "application/json"},
+                       b'{"error": "Request body too large"}')
+            self.close_connection = True
+            return
+        body = self.rfile.read(size) if size else b""
+
+        event = build_event(self.command, self.path, self.headers, body, self.client_address[0])
+        response = lambda_handler.handler(event, None)
+
+        payload = response.get("body") or ""
+        if response.get("isBase64Encoded"):
+            data = base64.b64decode(payload)
+        else:
+            data = payload.encode("utf-8") if isinstance(payload, str) else payload
+        headers = dict(response.get("headers") or {})
+        self._send(response.get("statusCode", 200), headers, data, response.get("cookies"))
+
+    def _send(self, status: int, headers: dict, data: bytes, cookies=None):
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() not in ("content-length", "connection"):
+                self.send_header(name, str(value))
+        for cookie in cookies or ():
+            self.send_header("Set-Cookie", cookie)
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+class OcrServer(ThreadingHTTPServer):
+    """Thread-per-connection server sharing pools across requests.
+
+    Starts the render worker pool and an Anthropic connection pool on
+    construction; run() serves until drain() and then waits for in-flight
+    requests before releasing them.
+    """
+
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, address, job_workers: int = 0):
+        # Fork render workers before any request threads exist.
+        render_pool.warm()
+        self.http_client = anthropic.DefaultHttpxClient()
+        lambda_handler.use_shared_http_client(self.http_client)
+        super().__init__(address, RequestHandler)
+        self.draining = False
+        # Local workers for the async job API (memory or sqlite backend).
+        self._job_stop, self._job_threads = None, []
+        if job_workers:
+            self._job_stop, self._job_threads = jobs.start_workers(
+                job_workers, lambda_handler.process_page, lambda_handler.make_anthropic_client
+            )
+
+    def run(self):
+        logger.info(f"Serving on http://{self.server_address[0]}:{self.server_address[1]}")
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()  # joins request threads
+            if self._job_stop is not None:
+                self._job_stop.set()
+                for thread in self._job_threads:
+                    thread.join()
+            lambda_handler.use_shared_http_client(None)
+            self.http_client.close()
+            render_pool.shutdown()
+            logger.info("Server stopped")
+
+    def drain(self):
+        """Stop accepting connections and make run() return once requests finish.
+
+        Blocks until the serve loop exits, so call it from a thread other
+        than the one in run().
+        """
+        self.draining = True
+        self.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8080")))
+    parser.add_argument("--job-workers", type=int, default=int(os.environ.get("JOB_WORKERS", "0")),
+                        help="threads working async jobs (JOB_BACKEND=memory or sqlite)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    server = OcrServer((args.host, args.port), job_workers=args.job_workers)
+
+    def stop(signum, frame):
+        logger.info(f"Received signal {signum}, draining")
+        threading.Thread(target=server.drain, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
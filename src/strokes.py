@@ -0,0 +1,119 @@
+"""Compact, array-backed storage for a page's strokes.
+
+A dense infinite-scroll page holds hundreds of thousands of points. Kept
+as one Python object per point (rmscene's `Point`) or per (x, y) tuple,
+that is ~100 bytes a point, and five pages rendered at once approach the
+function's memory size. StrokeSet keeps every point in one float32 array,
+8 bytes a point, with per-stroke offsets, colors and widths alongside, and
+hands out small Stroke views that read from it.
+"""
+
+from array import array
+from itertools import chain
+
+
+class StrokeSet:
+    """A page's strokes in contiguous typed arrays.
+
+    `points` holds every stroke's coordinates back to back as x0, y0, x1,
+    y1, ... in float32, the precision the file stores them with. Stroke i
+    spans points offsets[i] to offsets[i + 1]; colors[i] and widths[i] are
+    its pen color and thickness scale. Indexing or iterating gives Stroke
+    views in file order.
+    """
+
+    __slots__ = ("points", "offsets", "colors", "widths")
+
+    def __init__(self):
+        self.points = array("f")
+        self.offsets = array("I", [0])
+        self.colors = array("I")
+        self.widths = array("d")
+
+    def append(self, color: int, thickness_scale: float, xy):
+        """Add a stroke; `xy` is its coordinates, flattened x0, y0, x1, y1, ..."""
+        start = len(self.points)
+        try:
+            self.points.extend(xy)
+            if (len(self.points) - start) % 2:
+                raise ValueError("stroke coordinates must come in (x, y) pairs")
+        except Exception:
+            del self.points[start:]
+            raise
+        self.offsets.append(len(self.points) // 2)
+        self.colors.append(color)
+        self.widths.append(thickness_scale)
+
+    @classmethod
+    def from_lines(cls, lines) -> "StrokeSet":
+        """A StrokeSet holding the given Stroke views or rmscene Lines.
+
+        A Line is anything with `points` (objects with x and y) and,
+        optionally, color and thickness_scale.
+        """
+        if isinstance(lines, StrokeSet):
+            return lines
+        strokes = cls()
+        for line in lines:
+            if isinstance(line, Stroke):
+                strokes.append(line.color, line.thickness_scale, line.xy)
+            else:
+                strokes.append(
+                    getattr(line, "color", 0),
+                    getattr(line, "thickness_scale", 2),
+                    chain.from_iterable((p.x, p.y) for p in line.points),
+                )
+        return strokes
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays."""
+        arrays = (self.points, self.offsets, self.colors, self.widths)
+        return sum(len(a) * a.itemsize for a in arrays)
+
+    def __len__(self) -> int:
+        return len(self.colors)
+
+    def __getitem__(self, index: int) -> "Stroke":
+        return Stroke(self, range(len(self.colors))[index])
+
+    def __iter__(self):
+        return (Stroke(self, i) for i in range(len(self.colors)))
+
+
+class Stroke:
+    """One pen line of a StrokeSet."""
+
+    __slots__ = ("strokes", "index")
+
+    def __init__(self, strokes: StrokeSet, index: int):
+        self.strokes = strokes
+        self.index = index
+
+    @property
+    def color(self) -> int:
+        return self.strokes.colors[self.index]
+
+    @property
+    def thickness_scale(self) -> float:
+        return self.strokes.widths[self.index]
+
+    @property
+    def xy(self) -> memoryview:
+        """The stroke's coordinates, x0, y0, x1, y1, ..., without copying.
+
+        Don't hold on to it while the set is still being appended to.
+        """
+        start, end = self.strokes.offsets[self.index:self.index + 2]
+        return memoryview(self.strokes.points)[2 * start:2 * end]
+
+    @property
+    def point_count(self) -> int:
+        offsets = self.strokes.offsets
+        return offsets[self.index + 1] - offsets[self.index]
+
+    @property
+    def points(self) -> list[tuple[float, float]]:
+        """The points as (x, y) tuples, built on each access."""
+        xy = self.xy
+        return list(zip(xy[0::2], xy[1::2]))
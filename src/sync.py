@@ -0,0 +1,195 @@
+"""Delta sync: answer a notebook manifest with only what changed.
+
+The service keeps each notebook's last page results (result_store). A
+client sends the notebook's full manifest, one (page id, content hash,
+last-modified) entry per page, with .rm data for the pages it expects to
+have changed. Each page is then:
+- unchanged: same hash as the stored result; nothing is returned
+- reused: a new hash that some stored page (or tombstone) of the notebook
+  already has, e.g. a copied or restored page; answered from that result
+- processed: a new hash with data attached; OCR'd as usual
+- needed: a new hash without data; listed so the client sends it
+- newer on the server: the stored result is from a later modification
+  than the client's, so it is returned as it is
+
+Only pages whose markdown actually changed are returned, and stored pages
+missing from the manifest become tombstones, reported once as deleted.
+
+Notebooks are stored under a hash of the caller's Anthropic key and the
+client's notebook id (notebook_key), so a caller can't read or tombstone
+another caller's pages by sending the same notebook id.
+
+RESULTS_BACKEND selects the store: "aws" (the default when RESULTS_TABLE is
+set) for DynamoDB, "sqlite" (RESULTS_SQLITE_PATH) or "memory".
+"""
+
+import hashlib
+import os
+import threading
+from dataclasses import dataclass, field
+
+from payload import get_header
+from result_store import DynamoResultStore, MemoryResultStore, ResultStore, SQLiteResultStore
+
+SYNC_PATH = "/sync"
+
+RESULTS_BACKEND_ENV = "RESULTS_BACKEND"
+DEFAULT_SQLITE_PATH = "/tmp/remarkable-results.db"
+
+_store: ResultStore | None = None
+_store_checked = False
+_store_lock = threading.Lock()
+
+
+def configure(store: ResultStore | None):
+    """Use an explicit store (tests, server mode); None to reset."""
+    global _store, _store_checked
+    with _store_lock:
+        _store = store
+        _store_checked = store is not None
+
+
+def get_store() -> ResultStore | None:
+    """The configured store, built from the environment on first use.
+
+    Returns None when delta sync isn't configured.
+    """
+    global _store, _store_checked
+    if _store_checked:
+        return _store
+    with _store_lock:
+        if not _store_checked:
+            _store = _store_from_env()
+            _store_checked = True
+    return _store
+
+
+def _store_from_env() -> ResultStore | None:
+    kind = os.environ.get(RESULTS_BACKEND_ENV) or ("aws" if os.environ.get("RESULTS_TABLE") else "")
+    if kind == "aws":
+        return DynamoResultStore(os.environ["RESULTS_TABLE"])
+    if kind == "sqlite":
+        return SQLiteResultStore(os.environ.get("RESULTS_SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    if kind == "memory":
+        return MemoryResultStore()
+    if kind:
+        raise ValueError(f"Unknown {RESULTS_BACKEND_ENV}: {kind}")
+    return None
+
+
+def notebook_key(event: dict, notebook_id: str) -> str:
+    """The store key for the caller's notebook `notebook_id`."""
+    anthropic_key = get_header(event, "x-anthropic-key") or ""
+    return hashlib.sha256(f"{anthropic_key}\n{SYNC_PATH}\n{notebook_id}".encode()).hexdigest()
+
+
+@dataclass
+class SyncPlan:
+    """What to do with each manifest page, from plan_sync."""
+
+    unchanged: list[str] = field(default_factory=list)
+    # Manifest entries (with data) to OCR
+    process: list[dict] = field(default_factory=list)
+    # Page ids the client must send data for
+    needed: list[str] = field(default_factory=list)
+    # page id -> stored entry with the same hash
+    reused: dict[str, dict] = field(default_factory=dict)
+    # page id -> stored entry modified after the client's copy
+    newer: dict[str, dict] = field(default_factory=dict)
+    # Stored live pages missing from the manifest
+    deleted: list[str] = field(default_factory=list)
+
+
+def plan_sync(stored: dict[str, dict], manifest: list[dict]) -> SyncPlan:
+    """Sort manifest pages against a notebook's stored entries.
+
+    `manifest` entries have "id", "hash", optional "modified" (epoch ms)
+    and optional "data"; page ids are unique.
+    """
+    plan = SyncPlan()
+    by_hash = {}
+    for entry in stored.values():
+        # Prefer a live page's result over a tombstone's
+        if entry["hash"] not in by_hash or not entry["deleted"]:
+            by_hash[entry["hash"]] = entry
+
+    listed = set()
+    for page in manifest:
+        page_id, digest, modified = page["id"], page["hash"], page.get("modified")
+        listed.add(page_id)
+        current = stored.get(page_id)
+        live = current if current is not None and not current["deleted"] else None
+        if live is not None and live["hash"] == digest:
+            plan.unchanged.append(page_id)
+        elif (live is not None and modified is not None and live.get("modified") is not None
+              and modified < live["modified"]):
+            plan.newer[page_id] = live
+        elif digest in by_hash:
+            plan.reused[page_id] = by_hash[digest]
+        elif page.get("data"):
+            plan.process.append(page)
+        else:
+            plan.needed.append(page_id)
+
+    plan.deleted = [
+        page_id for page_id, entry in stored.items()
+        if not entry["deleted"] and page_id not in listed
+    ]
+    return plan
+
+
+def _changed_page(page_id: str, entry: dict) -> dict:
+    return {
+        "id": page_id,
+        "hash": entry["hash"],
+        "modified": entry.get("modified"),
+        "markdown": entry["markdown"],
+        "confidence": entry["confidence"],
+    }
+
+
+def commit_sync(
+    store: ResultStore,
+    store_key: str,
+    stored: dict[str, dict],
+    manifest: list[dict],
+    plan: SyncPlan,
+    results: dict[str, dict],
+) -> tuple[list[dict], int]:
+    """Store new results and tombstones for a planned sync.
+
+    `store_key` is the notebook's notebook_key. `results` are the processed
+    pages' results by page id; planned pages missing from it (failed,
+    deferred) are left as they were, so the next sync asks for them again.
+    Returns the pages whose markdown changed, in manifest order, and the
+    number of unchanged pages.
+    """
+    entries = {}
+    changed = []
+    unchanged = len(plan.unchanged)
+    for page in manifest:
+        page_id = page["id"]
+        if page_id in plan.newer:
+            changed.append(_changed_page(page_id, plan.newer[page_id]))
+            continue
+        source = plan.reused.get(page_id) or results.get(page_id)
+        if source is None:
+            continue
+        entry = {
+            "hash": page["hash"],
+            "modified": page.get("modified"),
+            "markdown": source["markdown"],
+            "confidence": source["confidence"],
+        }
+        entries[page_id] = entry
+        previous = stored.get(page_id)
+        if previous is not None and not previous["deleted"] and previous["markdown"] == entry["markdown"]:
+            unchanged += 1
+        else:
+            changed.append(_changed_page(page_id, entry))
+
+    if entries:
+        store.put_pages(store_key, entries)
+    if plan.deleted:
+        store.delete_pages(store_key, plan.deleted)
+    return changed, unchanged
@@ -0,0 +1,81 @@
+"""Sealing the caller's Anthropic key into job tasks.
+
+Job workers need the key that submitted a job, but task messages sit in
+the queue (and, after repeated failures, the dead-letter queue) long after
+the request that carried the key. Tasks therefore carry a sealed key that
+is only useful to this deployment's workers, and only for the job it was
+sealed for:
+
+- KmsTaskKeys encrypts the key with a KMS key, bound to the job id as
+  encryption context (the "aws" job backend; JOBS_KMS_KEY_ID)
+- LocalTaskKeys keeps the key in process memory for TASK_KEY_TTL_SECONDS
+  and puts only a reference in the task (the "sqlite" and "memory"
+  backends, whose workers are threads of the same process). Tasks still
+  queued when the process restarts run without a key.
+"""
+
+import base64
+import os
+import threading
+import time
+
+# How long a locally held key stays usable; matches the SQS queue's
+# message retention.
+TASK_KEY_TTL_SECONDS = 24 * 60 * 60
+
+
+class TaskKeys:
+    """Interface for sealing Anthropic keys into tasks."""
+
+    def seal(self, job_id: str, key: str) -> str:
+        raise NotImplementedError
+
+    def open(self, job_id: str, sealed: str) -> str | None:
+        """The key sealed for `job_id`, or None if it can't be recovered."""
+        raise NotImplementedError
+
+
+class LocalTaskKeys(TaskKeys):
+    def __init__(self, ttl_seconds: float = TASK_KEY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._keys: dict[str, tuple[str, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def seal(self, job_id, key):
+        ref = os.urandom(16).hex()
+        now = time.monotonic()
+        with self._lock:
+            for stale in [r for r, (_, _, expires) in self._keys.items() if expires <= now]:
+                del self._keys[stale]
+            self._keys[ref] = (job_id, key, now + self.ttl_seconds)
+        return ref
+
+    def open(self, job_id, sealed):
+        with self._lock:
+            entry = self._keys.get(sealed)
+        if entry is None or entry[0] != job_id or entry[2] <= time.monotonic():
+            return None
+        return entry[1]
+
+
+class KmsTaskKeys(TaskKeys):
+    def __init__(self, key_id: str, kms=None):
+        import boto3
+
+        self._key_id = key_id
+        self._kms = kms or boto3.client("kms")
+
+    def seal(self, job_id, key):
+        response = self._kms.encrypt(
+            KeyId=self._key_id,
+            Plaintext=key.encode(),
+            EncryptionContext={"jobId": job_id},
+        )
+        return base64.b64encode(response["CiphertextBlob"]).decode()
+
+    def open(self, job_id, sealed):
+        response = self._kms.decrypt(
+            CiphertextBlob=base64.b64decode(sealed),
+            EncryptionContext={"jobId": job_id},
+        )
+        return response["Plaintext"].decode()
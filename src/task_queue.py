@@ -0,0 +1,179 @@
+"""Task queues feeding async job workers.
+
+A task is a small JSON message (one page of one job). Queues deliver at
+least once: a received task stays invisible for a visibility timeout and
+comes back unless the worker deletes it, so a worker that dies mid-page
+doesn't lose the page.
+
+- MemoryTaskQueue and SQLiteTaskQueue back local workers (server mode,
+  tests, offline runs)
+- SqsTaskQueue sends to SQS; on Lambda, an SQS event source mapping
+  delivers the messages to the handler instead of receive()
+"""
+
+import collections
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+# How long a received task stays hidden before it is redelivered. Should
+# comfortably exceed the time to OCR one page.
+VISIBILITY_TIMEOUT_SECONDS = 600
+
+
+class Task:
+    """A received message: its body, receipt for delete(), and delivery count."""
+
+    __slots__ = ("receipt", "body", "attempt")
+
+    def __init__(self, receipt: str, body: dict, attempt: int):
+        self.receipt = receipt
+        self.body = body
+        self.attempt = attempt
+
+
+class TaskQueue:
+    """Interface for task queues."""
+
+    def send(self, messages: list[dict]):
+        raise NotImplementedError
+
+    def receive(self, max_messages: int = 10, wait_seconds: float = 0) -> list[Task]:
+        """Receive up to max_messages tasks, waiting up to wait_seconds for one."""
+        raise NotImplementedError
+
+    def delete(self, receipt: str):
+        """Acknowledge a task so it is not redelivered."""
+        raise NotImplementedError
+
+
+class MemoryTaskQueue(TaskQueue):
+    def __init__(self, visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS):
+        self.visibility_timeout = visibility_timeout
+        self._ready = collections.deque()
+        self._in_flight: dict[str, tuple[float, dict, int]] = {}
+        self._ids = itertools.count()
+        self._cond = threading.Condition()
+
+    def send(self, messages):
+        with self._cond:
+            self._ready.extend((message, 0) for message in messages)
+            self._cond.notify_all()
+
+    def _requeue_expired(self, now):
+        for receipt, (deadline, body, attempt) in list(self._in_flight.items()):
+            if deadline <= now:
+                del self._in_flight[receipt]
+                self._ready.append((body, attempt))
+
+    def receive(self, max_messages=10, wait_seconds=0):
+        deadline = time.monotonic() + wait_seconds
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._requeue_expired(now)
+                if self._ready or now >= deadline:
+                    break
+                self._cond.wait(min(deadline - now, 0.5))
+            tasks = []
+            while self._ready and len(tasks) < max_messages:
+                body, attempt = self._ready.popleft()
+                receipt = str(next(self._ids))
+                self._in_flight[receipt] = (now + self.visibility_timeout, body, attempt + 1)
+                tasks.append(Task(receipt, body, attempt + 1))
+            return tasks
+
+    def delete(self, receipt):
+        with self._cond:
+            self._in_flight.pop(receipt, None)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._ready) + len(self._in_flight)
+
+
+class SQLiteTaskQueue(TaskQueue):
+    def __init__(self, path: str, visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS):
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL,
+                visible_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+
+    def send(self, messages):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO tasks (body, visible_at) VALUES (?, ?)",
+                [(json.dumps(m), now) for m in messages],
+            )
+
+    def _claim(self, max_messages):
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            rows = self._db.execute(
+                "SELECT id, body, attempts FROM tasks WHERE visible_at <= ? ORDER BY id LIMIT ?",
+                (now, max_messages),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE tasks SET visible_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now + self.visibility_timeout, row[0]) for row in rows],
+            )
+            self._db.execute("COMMIT")
+        return [Task(str(row[0]), json.loads(row[1]), row[2] + 1) for row in rows]
+
+    def receive(self, max_messages=10, wait_seconds=0):
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            tasks = self._claim(max_messages)
+            if tasks or time.monotonic() >= deadline:
+                return tasks
+            time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+
+    def delete(self, receipt):
+        with self._lock:
+            self._db.execute("DELETE FROM tasks WHERE id = ?", (int(receipt),))
+
+
+class SqsTaskQueue(TaskQueue):
+    def __init__(self, queue_url: str, sqs=None):
+        import boto3
+
+        self._url = queue_url
+        self._sqs = sqs or boto3.client("sqs")
+
+    def send(self, messages):
+        for start in range(0, len(messages), 10):
+            entries = [
+                {"Id": str(i), "MessageBody": json.dumps(m)}
+                for i, m in enumerate(messages[start:start + 10])
+            ]
+            response = self._sqs.send_message_batch(QueueUrl=self._url, Entries=entries)
+            if response.get("Failed"):
+                raise RuntimeError(f"SQS rejected {len(response['Failed'])} task(s)")
+
+    def receive(self, max_messages=10, wait_seconds=0):
+        response = self._sqs.receive_message(
+            QueueUrl=self._url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            WaitTimeSeconds=int(min(wait_seconds, 20)),
+            AttributeNames=["ApproximateReceiveCount"],
+        )
+        return [
+            Task(m["ReceiptHandle"], json.loads(m["Body"]),
+                 int(m.get("Attributes", {}).get("ApproximateReceiveCount", 1)))
+            for m in response.get("Messages", [])
+        ]
+
+    def delete(self, receipt):
+        self._sqs.delete_message(QueueUrl=self._url, ReceiptHandle=receipt)
@@ -0,0 +1,149 @@
+"""Token and cost accounting for Claude calls.
+
+Every messages.create call is recorded as a ModelCall. Calls for one page
+are collected on its OcrTrace (claude_client) and every call in a request is
+also charged to the request's UsageMeter, which totals usage across page
+workers and enforces the optional per-request token budget.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger()
+
+# USD per million tokens: (input, output, cache write, cache read). Covers
+# the pipeline's models and those suited to CLAUDE_FALLBACK_MODEL; calls to
+# any other model are costed at 0, with a warning.
+PRICING = {
+    "claude-sonnet-4-20250514": (3.00, 15.00, 3.75, 0.30),
+    "claude-haiku-4-5-20251001": (1.00, 5.00, 1.25, 0.10),
+    "claude-sonnet-4-5-20250929": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-7-sonnet-20250219": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-5-haiku-20241022": (0.80, 4.00, 1.00, 0.08),
+    "claude-opus-4-1-20250805": (15.00, 75.00, 18.75, 1.50),
+    "claude-opus-4-20250514": (15.00, 75.00, 18.75, 1.50),
+}
+
+_unpriced: set[str] = set()
+
+
+def model_rates(model: str) -> tuple[float, float, float, float] | None:
+    """The model's PRICING rates, or None (warning once per model)."""
+    rates = PRICING.get(model)
+    if rates is None and model not in _unpriced:
+        _unpriced.add(model)
+        logger.warning(f"No pricing for model {model}; its calls are reported at $0")
+    return rates
+
+
+class BudgetExhausted(Exception):
+    """The request's token budget is spent; no new Claude calls may start."""
+
+
+@dataclass
+class ModelCall:
+    """One messages.create call: which model, why, how long, how many tokens."""
+
+    model: str
+    purpose: str
+    latency_ms: int
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return (self.input_tokens + self.output_tokens
+                + self.cache_creation_input_tokens + self.cache_read_input_tokens)
+
+    @property
+    def cost_usd(self) -> float:
+        rates = model_rates(self.model)
+        if rates is None:
+            return 0.0
+        counts = (self.input_tokens, self.output_tokens,
+                  self.cache_creation_input_tokens, self.cache_read_input_tokens)
+        return sum(n * rate for n, rate in zip(counts, rates)) / 1_000_000
+
+    def to_dict(self) -> dict:
+        return {
+            "model": self.model,
+            "purpose": self.purpose,
+            "latencyMs": self.latency_ms,
+            "inputTokens": self.input_tokens,
+            "outputTokens": self.output_tokens,
+            "cacheCreationInputTokens": self.cache_creation_input_tokens,
+            "cacheReadInputTokens": self.cache_read_input_tokens,
+        }
+
+
+def summarize(calls: list[ModelCall]) -> dict:
+    """Token totals and cost for a set of calls, as returned to clients."""
+    return {
+        "inputTokens": sum(c.input_tokens for c in calls),
+        "outputTokens": sum(c.output_tokens for c in calls),
+        "cacheCreationInputTokens": sum(c.cache_creation_input_tokens for c in calls),
+        "cacheReadInputTokens": sum(c.cache_read_input_tokens for c in calls),
+        "costUsd": round(sum(c.cost_usd for c in calls), 6),
+    }
+
+
+class UsageMeter:
+    """Thread-safe usage totals for one request, with an optional token budget.
+
+    The budget is checked before a call starts, not reserved, so calls
+    already in flight when it runs out may overshoot it by up to one call
+    per worker. An optional `deadline` (time.monotonic()) ends the budget
+    early: past it, no new call starts however many tokens are left.
+    """
+
+    def __init__(self, budget_tokens: int | None = None, deadline: float | None = None):
+        self.budget_tokens = budget_tokens
+        self.deadline = deadline
+        self._calls: list[ModelCall] = []
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def used_tokens(self) -> int:
+        return self._used
+
+    @property
+    def exhausted(self) -> bool:
+        return self._tokens_spent or self._out_of_time
+
+    @property
+    def _tokens_spent(self) -> bool:
+        return self.budget_tokens is not None and self._used >= self.budget_tokens
+
+    @property
+    def _out_of_time(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def check(self):
+        """Raise BudgetExhausted if no new call may start."""
+        if self._tokens_spent:
+            raise BudgetExhausted(
+                f"Token budget of {self.budget_tokens} spent ({self._used} used)"
+            )
+        if self._out_of_time:
+            raise BudgetExhausted("Out of time for this request")
+
+    def record(self, call: ModelCall):
+        with self._lock:
+            self._calls.append(call)
+            self._used += call.total_tokens
+
+    @property
+    def calls(self) -> list[ModelCall]:
+        with self._lock:
+            return list(self._calls)
+
+    def to_dict(self) -> dict:
+        summary = summarize(self.calls)
+        if self.budget_tokens is not None:
+            summary["budgetTokens"] = self.budget_tokens
+        return summary
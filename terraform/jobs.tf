@@ -0,0 +1,146 @@
+# jobs.tf - Storage and queue for async jobs (POST /jobs), delta sync (POST /sync)
+# and Idempotency-Key records
+
+# Job records and per-page results. Items expire via DynamoDB TTL.
+resource "aws_dynamodb_table" "jobs" {
+  name         = "${var.project_name}-jobs"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+  range_key    = "sk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  attribute {
+    name = "sk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+}
+
+# Uploaded page data (.rm bytes), deleted as each page finishes
+resource "aws_s3_bucket" "jobs" {
+  bucket_prefix = "${var.project_name}-jobs-"
+  force_destroy = true
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "jobs" {
+  bucket = aws_s3_bucket.jobs.id
+
+  rule {
+    id     = "expire-job-pages"
+    status = "Enabled"
+
+    filter {
+      prefix = "jobs/"
+    }
+
+    # Matches JOB_TTL_SECONDS in src/job_store.py
+    expiration {
+      days = 7
+    }
+  }
+}
+
+resource "aws_s3_bucket_public_access_block" "jobs" {
+  bucket = aws_s3_bucket.jobs.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+# Seals the caller's Anthropic key into job tasks (JOBS_KMS_KEY_ID) and
+# encrypts both task queues at rest
+resource "aws_kms_key" "jobs" {
+  description             = "${var.project_name} job tasks"
+  enable_key_rotation     = true
+  deletion_window_in_days = 7
+}
+
+# Tasks that keep failing end up here instead of looping forever. Kept
+# just long enough to investigate a failure.
+resource "aws_sqs_queue" "jobs_dlq" {
+  name                              = "${var.project_name}-jobs-dlq"
+  message_retention_seconds         = 259200 # 3 days
+  kms_master_key_id                 = aws_kms_key.jobs.arn
+  kms_data_key_reuse_period_seconds = 300
+}
+
+# One message per page. AWS recommends a visibility timeout of at least six
+# times the function timeout for an SQS event source.
+resource "aws_sqs_queue" "jobs" {
+  name                              = "${var.project_name}-jobs"
+  visibility_timeout_seconds        = var.lambda_timeout * 6
+  message_retention_seconds         = 86400 # 1 day
+  kms_master_key_id                 = aws_kms_key.jobs.arn
+  kms_data_key_reuse_period_seconds = 300
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.jobs_dlq.arn
+    maxReceiveCount     = 5
+  })
+}
+
+# Lambda polls the queue and invokes the handler with batches of tasks;
+# failed tasks are reported individually and redelivered.
+resource "aws_lambda_event_source_mapping" "jobs" {
+  event_source_arn        = aws_sqs_queue.jobs.arn
+  function_name           = aws_lambda_function.remarkable_sync.arn
+  batch_size              = 5
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
+# Per-notebook page results for delta sync (POST /sync). Only tombstones
+# (deleted pages) carry expiresAt; live pages stay until deleted.
+resource "aws_dynamodb_table" "results" {
+  name         = "${var.project_name}-results"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+  range_key    = "sk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  attribute {
+    name = "sk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+}
+
+# Page results recorded under a request's Idempotency-Key, expiring via TTL
+resource "aws_dynamodb_table" "idempotency" {
+  name         = "${var.project_name}-idempotency"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+  range_key    = "sk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  attribute {
+    name = "sk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+}
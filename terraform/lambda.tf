@@ -45,6 +45,61 @@ resource "aws_iam_role_policy" "remarkable_lambda" {
           aws_secretsmanager_secret.api_key.arn
         ]
       },
+      {
+        # Async job records and results; delta sync page results;
+        # Idempotency-Key records
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem",
+          "dynamodb:BatchWriteItem",
+          "dynamodb:Query"
+        ]
+        Resource = [
+          aws_dynamodb_table.jobs.arn,
+          aws_dynamodb_table.results.arn,
+          aws_dynamodb_table.idempotency.arn
+        ]
+      },
+      {
+        # Async job page data
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ]
+        Resource = [
+          "${aws_s3_bucket.jobs.arn}/jobs/*"
+        ]
+      },
+      {
+        # Enqueue job tasks, and receive them via the event source mapping
+        Effect = "Allow"
+        Action = [
+          "sqs:SendMessage",
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ]
+        Resource = [
+          aws_sqs_queue.jobs.arn
+        ]
+      },
+      {
+        # Seal and open Anthropic keys in job tasks; read and write the
+        # KMS-encrypted task queue
+        Effect = "Allow"
+        Action = [
+          "kms:Encrypt",
+          "kms:Decrypt",
+          "kms:GenerateDataKey"
+        ]
+        Resource = [
+          aws_kms_key.jobs.arn
+        ]
+      },
     ]
   })
 }
@@ -66,6 +121,17 @@ resource "aws_lambda_function" "remarkable_sync" {
   environment {
     variables = {
       API_KEY_SECRET_ARN = aws_secretsmanager_secret.api_key.arn
+      RENDER_PROCESSES   = var.render_processes
+      JOBS_TABLE         = aws_dynamodb_table.jobs.name
+      JOBS_BUCKET        = aws_s3_bucket.jobs.id
+      JOBS_QUEUE_URL     = aws_sqs_queue.jobs.url
+      JOBS_KMS_KEY_ID    = aws_kms_key.jobs.arn
+      RESULTS_TABLE      = aws_dynamodb_table.results.name
+      IDEMPOTENCY_TABLE  = aws_dynamodb_table.idempotency.name
+
+      # /tmp is 512 MB by default and also holds spooled notebook archives
+      RENDER_CACHE_SPILL_DIR   = "/tmp/render-cache"
+      RENDER_CACHE_SPILL_BYTES = 128 * 1024 * 1024
     }
   }
 }
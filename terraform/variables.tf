@@ -19,7 +19,13 @@ variable "lambda_timeout" {
 }
 
 variable "lambda_memory" {
-  description = "Lambda memory in MB (more memory = more CPU). 2048 MB roughly doubles vCPU vs 1024 MB, which speeds up Pillow stroke rendering. The pipeline is mostly I/O-bound waiting on Claude, so the win is modest but cheap."
+  description = "Lambda memory in MB (more memory = more CPU). Lambda gets a second vCPU above 1769 MB, and rendering runs in one worker process per vCPU, so 2048 MB renders two pages at a time. The pipeline is mostly I/O-bound waiting on Claude, so the win is modest but cheap."
   type        = number
   default     = 2048
 }
+
+variable "render_processes" {
+  description = "Render worker processes per container. Empty means one per vCPU; 0 or 1 renders on the page threads."
+  type        = string
+  default     = ""
+}
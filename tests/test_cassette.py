@@ -0,0 +1,196 @@
+"""Tests for cassette — recording and replaying Claude calls offline.
+
+The fixture test at the bottom replays each `tests/fixtures/<name>.rm` page
+against `tests/fixtures/cassettes/<name>.json` and prints its call, token
+and latency deltas (`-s` to see them, or set CASSETTE_REPORT to a file to
+append them as JSON lines). To record or refresh the cassettes:
+
+  CASSETTE_RECORD=1 ANTHROPIC_API_KEY=sk-... python -m pytest tests/test_cassette.py -k fixture -s
+"""
+
+import base64
+import json
+import os
+import sys
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, "src")
+
+import anthropic
+import hedging
+from cassette import Cassette, CassetteClient, CassetteMismatch, normalize_request
+from claude_client import EXTRACTION_PROMPT, FAST_MODEL, MODEL, OcrTrace, extract_text_from_image
+from handler import process_page
+from rm_renderer import has_drawing_regions
+from tests.test_ocr_accuracy import ACCURACY_THRESHOLD
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+CASSETTE_DIR = FIXTURE_DIR / "cassettes"
+
+
+def _png(size=(200, 100), ink=20, compress_level=6):
+    img = Image.new("L", size, 255)
+    ImageDraw.Draw(img).rectangle((10, 10, 10 + ink, 40), fill=0)
+    out = BytesIO()
+    img.save(out, format="PNG", compress_level=compress_level)
+    return out.getvalue()
+
+
+def _message(text, model=FAST_MODEL, input_tokens=1200, output_tokens=8):
+    return anthropic.types.Message.model_validate({
+        "id": "msg_test",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+    })
+
+
+def _request(png=None, prompt="Transcribe", model=FAST_MODEL, max_tokens=100):
+    data = base64.b64encode(png or _png()).decode()
+    return dict(model=model, max_tokens=max_tokens, messages=[{"role": "user", "content": [
+        {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": data}},
+        {"type": "text", "text": prompt},
+    ]}])
+
+
+def _recorded(tmp_path, responses, requests):
+    """A cassette at tmp_path recorded from `requests` answered by `responses`."""
+    live = MagicMock()
+    live.messages.create.side_effect = responses
+    cassette = Cassette(tmp_path / "page.json")
+    client = CassetteClient(cassette, live)
+    for request in requests:
+        client.messages.create(**request)
+    cassette.save()
+    return Cassette(tmp_path / "page.json")
+
+
+def test_record_then_replay_offline(tmp_path):
+    cassette = _recorded(tmp_path, [_message("Hello")], [_request()])
+    assert "base64" not in cassette.path.read_text()
+
+    message = CassetteClient(cassette).messages.create(**_request())
+    assert message.content[0].text == "Hello"
+    assert message.usage.input_tokens == 1200
+    assert cassette.report()["delta"] == {
+        "calls": 0, "inputTokens": 0, "outputTokens": 0, "latencyMs": 0,
+    }
+
+
+def test_fingerprint_covers_pixels_not_png_encoding():
+    same = normalize_request(_request(_png(compress_level=9)))
+    assert same == normalize_request(_request(_png(compress_level=1)))
+    assert same != normalize_request(_request(_png(ink=21)))
+
+
+def test_mismatch_reports_image_size_and_token_change(tmp_path):
+    cassette = _recorded(tmp_path, [_message("Hello")], [_request(_png((1000, 1000)))])
+    with pytest.raises(CassetteMismatch) as error:
+        CassetteClient(cassette).messages.create(**_request(_png((600, 600))))
+    message = str(error.value)
+    assert "messages[0].content[0]: image 1000x1000 -> 600x600" in message
+    assert "~1334 -> ~480 input tokens (-854)" in message
+    assert "Re-record" in message
+
+
+def test_mismatch_reports_prompt_and_model_changes(tmp_path):
+    cassette = _recorded(tmp_path, [_message("Hello")], [_request(prompt="Rules:\n- one\n- two")])
+    with pytest.raises(CassetteMismatch) as error:
+        CassetteClient(cassette).messages.create(
+            **_request(prompt="Rules:\n- one\n- three", model=MODEL)
+        )
+    message = str(error.value)
+    assert f"model: '{FAST_MODEL}' -> '{MODEL}'" in message
+    assert "-- two" in message and "+- three" in message
+
+
+def test_same_request_twice_replays_recordings_in_order(tmp_path):
+    cassette = _recorded(tmp_path, [_message("first"), _message("second")], [_request()] * 2)
+    client = CassetteClient(cassette)
+    texts = [client.messages.create(**_request()).content[0].text for _ in range(3)]
+    # A third send reuses the last recording and counts as an extra call
+    assert texts == ["first", "second", "second"]
+    assert cassette.report()["delta"]["calls"] == 1
+
+
+def test_report_shows_calls_the_pipeline_no_longer_makes(tmp_path):
+    """A page recorded with an escalation, replayed after a routing change
+    (here: the ink heuristic at another render scale) accepts the fast
+    answer, reports the escalation's tokens as saved."""
+    png = _png()
+    fast = _request(png, EXTRACTION_PROMPT, FAST_MODEL, 4096)
+    strong = _request(png, EXTRACTION_PROMPT, MODEL, 4096)
+    cassette = _recorded(tmp_path, [
+        _message("ok", FAST_MODEL, 1200, 2),
+        _message("ok then", MODEL, 1200, 4),
+    ], [fast, strong])
+
+    trace = OcrTrace()
+    text, _ = extract_text_from_image(png, CassetteClient(cassette), trace, scale=1.0)
+
+    assert text == "ok"
+    assert [call.model for call in trace.calls] == [FAST_MODEL]
+    assert cassette.report()["delta"] == {
+        "calls": -1, "inputTokens": -1200, "outputTokens": -4, "latencyMs": 0,
+    }
+    assert cassette.format_report().startswith("page: calls 2 -> 1 (-1), inputTokens 2400 -> 1200")
+
+
+def test_unsupported_cassette_version(tmp_path):
+    path = tmp_path / "old.json"
+    path.write_text(json.dumps({"version": 99, "interactions": []}))
+    with pytest.raises(ValueError, match="unsupported cassette version"):
+        Cassette(path)
+
+
+@pytest.fixture
+def plain_pipeline(monkeypatch):
+    """The pipeline as configured by default: fixed render scale, no hedging."""
+    for name in ("ADAPTIVE_RENDER_SCALE", "HEDGE_PERCENTILE"):
+        monkeypatch.delenv(name, raising=False)
+    hedging.configure(None)
+    yield
+    hedging.configure(None)
+
+
+@pytest.mark.parametrize("rm_path", sorted(FIXTURE_DIR.glob("*.rm")), ids=lambda path: path.stem)
+def test_fixture_replays(rm_path, plain_pipeline):
+    cassette = Cassette(CASSETTE_DIR / f"{rm_path.stem}.json")
+    live = None
+    if os.environ.get("CASSETTE_RECORD"):
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            pytest.skip("CASSETTE_RECORD needs ANTHROPIC_API_KEY")
+        live = anthropic.Anthropic(api_key=api_key)
+    elif not cassette.exists:
+        pytest.fail(f"No cassette for {rm_path.name}; record one with CASSETTE_RECORD=1")
+
+    data = base64.b64encode(rm_path.read_bytes()).decode()
+    result = process_page(rm_path.stem, data, CassetteClient(cassette, live))
+    if live is not None:
+        cassette.save()
+
+    print(cassette.format_report())
+    if os.environ.get("CASSETTE_REPORT"):
+        with open(os.environ["CASSETTE_REPORT"], "a") as f:
+            f.write(json.dumps({"fixture": rm_path.stem, **cassette.report()}) + "\n")
+
+    if has_drawing_regions(rm_path.read_bytes()) is False:
+        # A drawing flag from the fast model on pure handwriting is dropped
+        assert "[illustration" not in result["markdown"]
+    expected = rm_path.with_suffix(".txt")
+    if expected.exists():
+        lines = [line.strip() for line in expected.read_text().splitlines()]
+        tokens = [t for t in lines if t and not t.startswith("#")]
+        found = [t for t in tokens if t.lower() in result["markdown"].lower()]
+        assert len(found) >= max(1, int(len(tokens) * ACCURACY_THRESHOLD)), (
+            f"Replayed OCR matched only {len(found)}/{len(tokens)} tokens: {result['markdown']!r}"
+        )
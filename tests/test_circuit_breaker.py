@@ -0,0 +1,250 @@
+"""Tests for circuit_breaker — failing fast while Anthropic is down."""
+
+import json
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import anthropic
+import circuit_breaker
+import jobs
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, Breakers, CircuitBreaker, CircuitOpenError
+from claude_client import FAST_MODEL, MODEL, OcrTrace, extract_text_from_image
+
+
+def _status_error(cls, status):
+    return cls("error", response=MagicMock(status_code=status), body=None)
+
+
+def _outage():
+    return anthropic.APIConnectionError(request=MagicMock())
+
+
+def _failing(error):
+    def send(model):
+        raise error
+    return send
+
+
+@pytest.fixture
+def clock():
+    with patch("circuit_breaker.time.monotonic", return_value=1000.0) as monotonic:
+        yield monotonic
+
+
+@pytest.fixture
+def breakers(clock):
+    breakers = Breakers(failure_threshold=3, reset_seconds=30)
+    circuit_breaker.configure(breakers)
+    yield breakers
+    circuit_breaker.configure(None)
+
+
+def _trip(breakers, model="m"):
+    for _ in range(breakers.failure_threshold):
+        with pytest.raises(anthropic.APIConnectionError):
+            breakers.call(model, _failing(_outage()))
+
+
+def test_opens_after_consecutive_failures_then_fails_fast(breakers):
+    _trip(breakers)
+    assert breakers.breaker("m").state == OPEN
+    send = MagicMock()
+    with pytest.raises(CircuitOpenError):
+        breakers.call("m", send)
+    send.assert_not_called()
+
+
+def test_success_resets_the_failure_count(breakers):
+    for _ in range(2):
+        with pytest.raises(anthropic.APIConnectionError):
+            breakers.call("m", _failing(_outage()))
+    assert breakers.call("m", lambda model: "ok") == ("m", "ok")
+    for _ in range(2):
+        with pytest.raises(anthropic.APIConnectionError):
+            breakers.call("m", _failing(_outage()))
+    assert breakers.breaker("m").state == CLOSED
+
+
+@pytest.mark.parametrize("error,trips", [
+    (_outage(), True),
+    (anthropic.APITimeoutError(request=MagicMock()), True),
+    (_status_error(anthropic.InternalServerError, 500), True),
+    (_status_error(anthropic.APIStatusError, 529), True),
+    (_status_error(anthropic.AuthenticationError, 401), False),
+    (_status_error(anthropic.BadRequestError, 400), False),
+    (_status_error(anthropic.RateLimitError, 429), False),
+    (ValueError("bad image"), False),
+])
+def test_only_outages_trip_the_breaker(breakers, error, trips):
+    for _ in range(breakers.failure_threshold):
+        with pytest.raises(type(error)):
+            breakers.call("m", _failing(error))
+    assert breakers.breaker("m").state == (OPEN if trips else CLOSED)
+
+
+def test_half_open_probe_closes_on_success(breakers, clock):
+    _trip(breakers)
+    clock.return_value += 31
+    breaker = breakers.breaker("m")
+    assert breaker.allow() is True  # the probe
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is False  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breakers.call("m", lambda model: "ok") == ("m", "ok")
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(anthropic.BadRequestError, 400),
+    ValueError("bad image"),
+    KeyboardInterrupt(),
+])
+def test_probe_without_a_response_leaves_circuit_half_open(breakers, clock, error):
+    _trip(breakers)
+    clock.return_value += 31
+    with pytest.raises(type(error)):
+        breakers.call("m", _failing(error))
+    breaker = breakers.breaker("m")
+    assert breaker.state == HALF_OPEN
+    assert breakers.call("m", lambda model: "ok") == ("m", "ok")  # the next probe
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens(breakers, clock):
+    _trip(breakers)
+    clock.return_value += 31
+    with pytest.raises(anthropic.APIConnectionError):
+        breakers.call("m", _failing(_outage()))
+    assert breakers.breaker("m").state == OPEN
+    clock.return_value += 10
+    with pytest.raises(CircuitOpenError):
+        breakers.call("m", lambda model: "ok")
+
+
+def test_falls_back_to_alternate_model_while_open(breakers):
+    breakers.fallback_model = "backup"
+    _trip(breakers)
+    sent = []
+    assert breakers.call("m", lambda model: sent.append(model) or "ok") == ("backup", "ok")
+    assert sent == ["backup"]
+
+    _trip(breakers, "backup")
+    with pytest.raises(CircuitOpenError):
+        breakers.call("m", lambda model: "ok")
+
+
+def test_transitions_are_logged_and_emitted(clock, capsys, caplog):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.return_value += 31
+    breaker.allow()
+    breaker.record_success()
+    states = [json.loads(line)["CircuitState"] for line in capsys.readouterr().out.splitlines()]
+    assert states == [2, 1, 0]
+    assert "Circuit for m open after 1 consecutive failures" in caplog.text
+
+
+def _message(text):
+    message = MagicMock()
+    message.content = [MagicMock(text=text)]
+    message.stop_reason = "end_turn"
+    return message
+
+
+def test_extraction_fails_fast_once_open(breakers):
+    client = MagicMock()
+    client.messages.create.side_effect = _outage()
+    for _ in range(breakers.failure_threshold):
+        with pytest.raises(anthropic.APIConnectionError):
+            extract_text_from_image(b"png", client)
+    client.messages.create.reset_mock()
+    with pytest.raises(CircuitOpenError):
+        extract_text_from_image(b"png", client)
+    client.messages.create.assert_not_called()
+
+
+def test_extraction_records_the_fallback_model(breakers):
+    breakers.fallback_model = MODEL
+    _trip(breakers, FAST_MODEL)
+    client = MagicMock()
+    client.messages.create.return_value = _message("Hello")
+    trace = OcrTrace()
+    extract_text_from_image(b"png", client, trace)
+    assert client.messages.create.call_args.kwargs["model"] == MODEL
+    assert [c.model for c in trace.calls] == [MODEL]
+
+
+def test_open_circuit_is_retried_by_job_workers():
+    assert issubclass(CircuitOpenError, jobs.TRANSIENT_ERRORS)
+
+
+@pytest.mark.parametrize("env,expected", [
+    ({}, (circuit_breaker.DEFAULT_FAILURE_THRESHOLD, circuit_breaker.DEFAULT_RESET_SECONDS, None)),
+    ({"CIRCUIT_FAILURE_THRESHOLD": "0"}, None),
+    ({"CIRCUIT_FAILURE_THRESHOLD": "10", "CIRCUIT_RESET_SECONDS": "5",
+      "CLAUDE_FALLBACK_MODEL": "claude-x"}, (10, 5.0, "claude-x")),
+    ({"CIRCUIT_FAILURE_THRESHOLD": "many"},
+     (circuit_breaker.DEFAULT_FAILURE_THRESHOLD, circuit_breaker.DEFAULT_RESET_SECONDS, None)),
+])
+def test_breakers_from_env(monkeypatch, env, expected):
+    for name in ("CIRCUIT_FAILURE_THRESHOLD", "CIRCUIT_RESET_SECONDS", "CLAUDE_FALLBACK_MODEL"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    circuit_breaker.configure(None)
+    try:
+        breakers = circuit_breaker.get_breakers()
+        assert (breakers and (breakers.failure_threshold, breakers.reset_seconds,
+                              breakers.fallback_model)) == expected
+    finally:
+        circuit_breaker.configure(None)
+
+
+@pytest.mark.parametrize("model,warns", [("claude-unpriced-fallback", True), ("claude-3-5-haiku-20241022", False)])
+def test_unpriced_fallback_model_warns_at_startup(monkeypatch, caplog, model, warns):
+    monkeypatch.setenv("CLAUDE_FALLBACK_MODEL", model)
+    monkeypatch.delenv("CIRCUIT_FAILURE_THRESHOLD", raising=False)
+    circuit_breaker.configure(None)
+    try:
+        circuit_breaker.get_breakers()
+    finally:
+        circuit_breaker.configure(None)
+    assert (f"No pricing for model {model}" in caplog.text) is warns
+
+
+def test_claude_timeouts_trip_the_breaker(monkeypatch):
+    """Clients time out within the Lambda budget, so a hung API opens the circuit."""
+    import socket
+    import handler
+
+    # Accepts connections (the backlog) but never answers
+    hung = socket.socket()
+    hung.bind(("127.0.0.1", 0))
+    hung.listen(8)
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", f"http://127.0.0.1:{hung.getsockname()[1]}")
+    monkeypatch.setenv("CLAUDE_TIMEOUT_SECONDS", "0.2")
+    monkeypatch.setenv("CLAUDE_MAX_RETRIES", "0")
+    circuit_breaker.configure(Breakers(failure_threshold=2, reset_seconds=30))
+    try:
+        client = handler.make_anthropic_client("sk-test")
+        assert (client.timeout, client.max_retries) == (0.2, 0)
+        for _ in range(2):
+            with pytest.raises(anthropic.APITimeoutError):
+                extract_text_from_image(b"png", client, OcrTrace())
+        assert circuit_breaker.get_breakers().breaker(FAST_MODEL).state == OPEN
+    finally:
+        circuit_breaker.configure(None)
+        hung.close()
+
+
+def test_claude_client_defaults_fit_the_lambda_timeout(monkeypatch):
+    import handler
+
+    for name in ("CLAUDE_TIMEOUT_SECONDS", "CLAUDE_MAX_RETRIES"):
+        monkeypatch.delenv(name, raising=False)
+    client = handler.make_anthropic_client("sk-test")
+    assert client.timeout * (client.max_retries + 1) < 300
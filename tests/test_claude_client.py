@@ -6,6 +6,9 @@ from unittest.mock import patch, MagicMock
 sys.path.insert(0, "src")
 
 from claude_client import (
+    FAST_MODEL,
+    MODEL,
+    OcrTrace,
     extract_text_from_image,
     describe_illustration,
     _parse_extraction_response,
@@ -42,7 +45,8 @@ def test_extract_text_sends_image():
 
     # Check the call arguments
     call_args = mock_client.messages.create.call_args
-    assert call_args.kwargs["model"] == "claude-sonnet-4-20250514"
+    # A clean first answer is kept from the fast model, no escalation.
+    assert call_args.kwargs["model"] == FAST_MODEL
     assert call_args.kwargs["max_tokens"] == 4096
 
     # Check message content includes image
@@ -182,3 +186,175 @@ def test_extract_text_mixed_content():
     assert "# My Notes" in text
     assert "[illustration: flowchart diagram]" in text
     assert confidence == 1.0
+
+
+def test_extract_text_from_segments_describes_each_drawing():
+    """Text crop is transcribed once; each drawing crop goes to the short prompt."""
+    from claude_client import extract_text_from_segments
+    from rm_renderer import PageSegments
+
+    responses = [MagicMock(content=[MagicMock(text="Meeting notes")]),
+                 MagicMock(content=[MagicMock(text="bar chart")]),
+                 MagicMock(content=[MagicMock(text="org chart")])]
+    mock_client = MagicMock()
+    mock_client.messages.create.side_effect = responses
+
+    segments = PageSegments(text_png=b"text-png", drawing_pngs=[b"d1", b"d2"])
+    text, confidence = extract_text_from_segments(segments, mock_client)
+
+    assert text == "Meeting notes\n\n[illustration: bar chart]\n\n[illustration: org chart]"
+    assert confidence == 1.0
+    calls = mock_client.messages.create.call_args_list
+    assert [c.kwargs["max_tokens"] for c in calls] == [4096, 50, 50]
+
+
+# --- Model cascade ---
+
+
+def _response(text, stop_reason="end_turn", input_tokens=1000, output_tokens=20):
+    message = MagicMock()
+    message.content = [MagicMock(text=text)]
+    message.stop_reason = stop_reason
+    message.usage = MagicMock(input_tokens=input_tokens, output_tokens=output_tokens)
+    return message
+
+
+def _png_with_ink(dark_pixels):
+    """A white grayscale PNG with `dark_pixels` black pixels."""
+    from io import BytesIO
+    from PIL import Image
+
+    img = Image.new("L", (200, 200), "white")
+    for i in range(dark_pixels):
+        img.putpixel((i % 200, i // 200), 0)
+    out = BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_cascade_keeps_fast_answer():
+    mock_client = MagicMock()
+    mock_client.messages.create.return_value = _response("Buy milk and eggs")
+    trace = OcrTrace()
+
+    text, _ = extract_text_from_image(_png_with_ink(300), mock_client, trace)
+
+    assert text == "Buy milk and eggs"
+    assert mock_client.messages.create.call_count == 1
+    assert trace.escalation is None
+    assert trace.to_dict()["model"] == FAST_MODEL
+    assert trace.calls[0].input_tokens == 1000
+
+
+def test_cascade_escalates_on_max_tokens():
+    mock_client = MagicMock()
+    mock_client.messages.create.side_effect = [
+        _response("truncated...", stop_reason="max_tokens"),
+        _response("Full transcription"),
+    ]
+    trace = OcrTrace()
+
+    text, _ = extract_text_from_image(b"png", mock_client, trace)
+
+    assert text == "Full transcription"
+    models = [c.kwargs["model"] for c in mock_client.messages.create.call_args_list]
+    assert models == [FAST_MODEL, MODEL]
+    assert trace.escalation == "max_tokens"
+    assert trace.to_dict()["model"] == MODEL
+
+
+def test_cascade_escalates_on_description_instead_of_text():
+    mock_client = MagicMock()
+    mock_client.messages.create.side_effect = [
+        _response("I can see some scribbles"),
+        _response("Call Sam"),
+    ]
+    trace = OcrTrace()
+
+    text, _ = extract_text_from_image(b"png", mock_client, trace)
+
+    assert text == "Call Sam"
+    assert trace.escalation == "no_text"
+
+
+def test_cascade_escalates_when_short_for_ink():
+    """Two characters for a page full of ink is suspicious."""
+    mock_client = MagicMock()
+    mock_client.messages.create.side_effect = [
+        _response("ok"),
+        _response("A much longer transcription of the whole page"),
+    ]
+    trace = OcrTrace()
+
+    text, _ = extract_text_from_image(_png_with_ink(6000), mock_client, trace)
+
+    assert text.startswith("A much longer")
+    assert trace.escalation == "short_for_ink"
+
+
+def test_short_for_ink_accounts_for_render_scale():
+    """The same ink is fewer characters on a page rendered at a larger scale."""
+    escalations = []
+    for scale in (0.5, 1.0):
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = [_response("ok"), _response("ok then")]
+        trace = OcrTrace()
+        extract_text_from_image(_png_with_ink(1200), mock_client, trace, scale=scale)
+        escalations.append(trace.escalation)
+
+    assert escalations == ["short_for_ink", None]
+
+
+def test_cascade_accepts_clean_drawing_only_answer():
+    """NO_TEXT_FOUND with a drawing flag is trusted; the description uses the fast model."""
+    mock_client = MagicMock()
+    mock_client.messages.create.side_effect = [
+        _response(f"NO_TEXT_FOUND\n{HAS_DRAWINGS_MARKER}"),
+        _response("house with tree"),
+    ]
+    trace = OcrTrace()
+
+    text, _ = extract_text_from_image(b"png", mock_client, trace)
+
+    assert text == "[illustration: house with tree]"
+    assert trace.escalation is None
+    assert [(c.model, c.purpose) for c in trace.calls] == [
+        (FAST_MODEL, "extract"), (FAST_MODEL, "describe"),
+    ]
+
+
+def test_fast_drawing_flag_dropped_without_drawing_strokes():
+    """A flag on a page the segmenter found only text on adds no illustration."""
+    mock_client = MagicMock()
+    mock_client.messages.create.side_effect = [_response(f"Buy milk\n{HAS_DRAWINGS_MARKER}")]
+    trace = OcrTrace()
+
+    text, _ = extract_text_from_image(b"png", mock_client, trace, drawing_regions=False)
+
+    assert text == "Buy milk"
+    assert [(c.model, c.purpose) for c in trace.calls] == [(FAST_MODEL, "extract")]
+
+
+def test_fast_drawing_only_answer_escalates_without_drawing_strokes():
+    mock_client = MagicMock()
+    mock_client.messages.create.side_effect = [
+        _response(f"NO_TEXT_FOUND\n{HAS_DRAWINGS_MARKER}"),
+        _response("Call Sam"),
+    ]
+    trace = OcrTrace()
+
+    text, _ = extract_text_from_image(b"png", mock_client, trace, drawing_regions=False)
+
+    assert text == "Call Sam"
+    assert trace.escalation == "no_text"
+
+
+def test_cascade_disabled_uses_model_only():
+    mock_client = MagicMock()
+    mock_client.messages.create.return_value = _response("")
+
+    with patch("claude_client.FAST_MODEL", None):
+        extract_text_from_image(b"png", mock_client)
+
+    assert mock_client.messages.create.call_count == 1
+    assert mock_client.messages.create.call_args.kwargs["model"] == MODEL
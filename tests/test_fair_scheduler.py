@@ -0,0 +1,217 @@
+"""Tests for fair_scheduler — sharing page slots fairly between tenants."""
+
+import json
+import statistics
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import fair_scheduler
+from fair_scheduler import FairScheduler, TenantPolicy, policy_from_env
+from handler import handler
+from pipeline import StagePipeline
+
+
+def _start(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiters(scheduler, count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while sum(len(q) for q in scheduler._queues.values()) < count:
+        assert time.monotonic() < deadline, f"timed out waiting for {count} waiters"
+        time.sleep(0.002)
+
+
+def _grant_order(scheduler, arrivals):
+    """Queue `arrivals` (tenant names, in order) behind a held slot, then
+    release one slot at a time and return the order they were granted."""
+    order = []
+    scheduler.acquire("holder")
+    threads = []
+    for i, tenant in enumerate(arrivals):
+        def take(tenant=tenant):
+            scheduler.acquire(tenant)
+            order.append(tenant)
+        threads.append(_start(take))
+        _wait_for_waiters(scheduler, i + 1)
+    for i in range(len(arrivals)):
+        scheduler.release()
+        deadline = time.monotonic() + 2
+        while len(order) <= i:
+            assert time.monotonic() < deadline
+            time.sleep(0.002)
+    for thread in threads:
+        thread.join(2)
+    return order
+
+
+def test_slots_limit_concurrency():
+    scheduler = FairScheduler(2)
+    lock = threading.Lock()
+    active = peak = 0
+
+    def work(tenant):
+        nonlocal active, peak
+        with scheduler.slot(tenant):
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with lock:
+                active -= 1
+
+    threads = [_start(work, f"t{i % 3}") for i in range(9)]
+    for thread in threads:
+        thread.join(2)
+    assert peak == 2
+
+
+def test_small_tenant_goes_ahead_of_a_backlog():
+    order = _grant_order(FairScheduler(1), ["big"] * 5 + ["small"])
+    assert order == ["big", "small", "big", "big", "big", "big"]
+
+
+def test_one_tenant_is_served_in_arrival_order():
+    scheduler = FairScheduler(1)
+    order = []
+    scheduler.acquire()
+    threads = []
+    for i in range(4):
+        def take(i=i):
+            scheduler.acquire()
+            order.append(i)
+            scheduler.release()
+        threads.append(_start(take))
+        _wait_for_waiters(scheduler, i + 1)
+    scheduler.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == [0, 1, 2, 3]
+
+
+def test_weights_share_slots_proportionally():
+    scheduler = FairScheduler(1, TenantPolicy(weights={"gold": 2}))
+    order = _grant_order(scheduler, ["gold"] * 6 + ["basic"] * 6)
+    assert order[:9].count("gold") == 6
+    assert order[:9].count("basic") == 3
+
+
+def test_idle_tenant_banks_no_credit():
+    scheduler = FairScheduler(1)
+    for _ in range(10):
+        with scheduler.slot("busy"):
+            pass
+    # "late" joins at the current virtual time rather than 10 grants behind
+    order = _grant_order(scheduler, ["busy"] * 3 + ["late"] * 3)
+    assert order == ["late", "busy"] * 3
+
+
+def test_token_bucket_limits_a_tenant_not_others():
+    scheduler = FairScheduler(4, TenantPolicy(rate=20, burst=1))
+    started = time.monotonic()
+    for _ in range(3):
+        with scheduler.slot("limited"):
+            pass
+    assert time.monotonic() - started >= 0.09  # 2 refills at 20/s
+
+    started = time.monotonic()
+    with scheduler.slot("other"):
+        pass
+    assert time.monotonic() - started < 0.05
+
+
+def _simulate(tenant_of, big_pages=60, small_pages=6, render_s=0.001, ocr_s=0.02):
+    """Run a large tenant's backlog and a few single-page syncs from other
+    tenants through a StagePipeline; return the small pages' latencies."""
+    stages = StagePipeline(render_workers=2, ocr_workers=3, queue_depth=2)
+    small_latencies = []
+    lock = threading.Lock()
+
+    def page(tenant, record):
+        started = time.monotonic()
+        with fair_scheduler.tenant(tenant), stages.admit():
+            with stages.render() as enqueue:
+                time.sleep(render_s)
+                enqueue()
+            with stages.ocr():
+                time.sleep(ocr_s)
+        if record:
+            with lock:
+                small_latencies.append(time.monotonic() - started)
+
+    threads = [_start(page, tenant_of("big"), False) for _ in range(big_pages)]
+    time.sleep(5 * ocr_s)  # the backlog saturates every slot
+    for i in range(small_pages):
+        threads.append(_start(page, tenant_of(f"small-{i}"), True))
+        time.sleep(ocr_s)
+    for thread in threads:
+        thread.join(10)
+    return small_latencies
+
+
+def test_simulation_small_tenants_have_bounded_latency():
+    """While one tenant's backlog saturates the pipeline, another tenant's
+    single page waits about one OCR call, not for the backlog to drain."""
+    ocr_s = 0.02
+    fair = _simulate(lambda name: name, ocr_s=ocr_s)
+    shared = _simulate(lambda name: None, ocr_s=ocr_s)  # one queue for everyone
+
+    # A fair page needs a slot to free up plus its own OCR; allow slack for CI
+    assert max(fair) < 6 * ocr_s
+    # Without tenants the same page waits behind most of the 60-page backlog
+    assert statistics.median(shared) > 3 * max(fair)
+
+
+def _ocr_event(anthropic_key):
+    return {
+        "rawPath": "/ocr",
+        "headers": {"x-api-key": "test-key", "x-anthropic-key": anthropic_key},
+        "requestContext": {"http": {"method": "POST"}},
+        "body": json.dumps({"pages": [{"id": "p", "data": "cm0="}]}),
+    }
+
+
+def test_requests_run_as_the_callers_tenant():
+    seen = []
+
+    def capture(page_id, page_data, anthropic_client, meter=None):
+        seen.append(fair_scheduler.current_tenant())
+        return {"id": page_id, "markdown": "", "confidence": 1.0}
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+            patch("handler.process_page", side_effect=capture):
+        for key in ("sk-alice", "sk-bob", "sk-alice"):
+            handler(_ocr_event(key), None)
+    assert seen[0] == seen[2] == fair_scheduler.tenant_id("sk-alice")
+    assert seen[1] == fair_scheduler.tenant_id("sk-bob")
+    assert "sk-alice" not in seen[0]
+
+
+@pytest.mark.parametrize("env,expected", [
+    ({}, ({}, None, 1.0)),
+    ({"TENANT_WEIGHTS": "abc=3, def=0.5"}, ({"abc": 3.0, "def": 0.5}, None, 1.0)),
+    ({"TENANT_WEIGHTS": "abc=x,=2,def=2"}, ({"def": 2.0}, None, 1.0)),
+    ({"TENANT_RATE": "2"}, ({}, 2.0, 2.0)),
+    ({"TENANT_RATE": "0.5", "TENANT_BURST": "10"}, ({}, 0.5, 10.0)),
+    ({"TENANT_RATE": "fast"}, ({}, None, 1.0)),
+])
+def test_policy_from_env(monkeypatch, env, expected):
+    for name in ("TENANT_WEIGHTS", "TENANT_RATE", "TENANT_BURST"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    policy = policy_from_env()
+    assert (policy.weights, policy.rate, policy.burst) == expected
+
+
+def test_tenant_id_matches_the_documented_shell_recipe():
+    """`printf %s sk-alice | sha256sum | cut -c1-16`, as in the README."""
+    assert fair_scheduler.tenant_id("sk-alice") == "099295a3784e1bd3"
@@ -1,13 +1,26 @@
 """Tests for Lambda handler."""
 
 import base64
+import gzip
+import io
 import json
 import sys
+import zipfile
 from unittest.mock import patch, MagicMock
 
+import pytest
+
 sys.path.insert(0, "src")
 
-from handler import handler, process_page, error_response
+from handler import (
+    DEFAULT_CLAUDE_MAX_RETRIES,
+    DEFAULT_CLAUDE_TIMEOUT_SECONDS,
+    error_response,
+    handler,
+    process_page,
+    validate_pages,
+)
+from tests.test_notebook import make_rmdoc
 
 
 def test_error_response():
@@ -189,6 +202,17 @@ def test_page_exceeds_size_limit():
         assert "big-page" in body.get("failedPages", [])
 
 
+def test_page_size_limit_applies_to_decoded_bytes():
+    """MAX_PAGE_SIZE bounds the decoded .rm data, not its base64 length."""
+    with patch("handler.MAX_PAGE_SIZE", 12):
+        valid, failed = validate_pages([
+            {"id": "at-limit", "data": base64.b64encode(b"x" * 12).decode()},  # 16 chars
+            {"id": "over", "data": base64.b64encode(b"x" * 13).decode()},
+        ])
+    assert [page_id for page_id, _ in valid] == ["at-limit"]
+    assert failed == ["over"]
+
+
 def test_empty_page_data():
     """Page with empty data is added to failedPages."""
     with patch("handler.get_api_keys", return_value=["test-key"]):
@@ -250,7 +274,7 @@ def test_pages_processed_in_parallel():
 
     barrier = threading.Barrier(3)
 
-    def slow_page(page_id, page_data, anthropic_client):
+    def slow_page(page_id, page_data, anthropic_client, meter=None):
         # All 3 workers must hit the barrier before any can proceed.
         # If processing were sequential, this would deadlock since only
         # the first worker would ever reach the barrier.
@@ -261,7 +285,7 @@ def test_pages_processed_in_parallel():
          patch("handler.process_page", side_effect=slow_page):
 
         pages = [
-            {"id": f"page-{i}", "data": base64.b64encode(b"x").decode()}
+            {"id": f"page-{i}", "data": base64.b64encode(f"x{i}".encode()).decode()}
             for i in range(3)
         ]
         event = {
@@ -283,7 +307,7 @@ def test_anthropic_client_reused_across_pages():
     """One Anthropic client is created per request and shared across pages."""
     captured_clients = []
 
-    def capture_client(page_id, page_data, anthropic_client):
+    def capture_client(page_id, page_data, anthropic_client, meter=None):
         captured_clients.append(anthropic_client)
         return {"id": page_id, "markdown": "", "confidence": 1.0}
 
@@ -295,7 +319,7 @@ def test_anthropic_client_reused_across_pages():
         mock_anthropic_ctor.return_value = sentinel_client
 
         pages = [
-            {"id": f"page-{i}", "data": base64.b64encode(b"x").decode()}
+            {"id": f"page-{i}", "data": base64.b64encode(f"x{i}".encode()).decode()}
             for i in range(4)
         ]
         event = {
@@ -309,7 +333,11 @@ def test_anthropic_client_reused_across_pages():
         handler(event, None)
 
         # Constructor called exactly once, with the user's key.
-        mock_anthropic_ctor.assert_called_once_with(api_key="sk-user-key")
+        mock_anthropic_ctor.assert_called_once_with(
+            api_key="sk-user-key",
+            timeout=DEFAULT_CLAUDE_TIMEOUT_SECONDS,
+            max_retries=DEFAULT_CLAUDE_MAX_RETRIES,
+        )
         # Every page received the same client instance.
         assert len(captured_clients) == 4
         assert all(c is sentinel_client for c in captured_clients)
@@ -317,7 +345,7 @@ def test_anthropic_client_reused_across_pages():
 
 def test_missing_anthropic_key_aborts_under_parallelism():
     """One page raising MISSING_ANTHROPIC_KEY aborts the whole batch with 400."""
-    def selective_raise(page_id, page_data, anthropic_client):
+    def selective_raise(page_id, page_data, anthropic_client, meter=None):
         if page_id == "hw-1":
             raise ValueError("Anthropic API key required for handwriting OCR")
         return {"id": page_id, "markdown": "typed", "confidence": 1.0}
@@ -339,3 +367,454 @@ def test_missing_anthropic_key_aborts_under_parallelism():
         assert result["statusCode"] == 400
         body = json.loads(result["body"])
         assert body["code"] == "MISSING_ANTHROPIC_KEY"
+
+
+# --- Deduplication ---
+
+def test_duplicate_pages_processed_once():
+    """Identical page payloads are processed once and fanned out by id."""
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=lambda pid, data, client, meter=None: {
+             "id": pid, "markdown": "same", "confidence": 0.9}) as mock_page:
+
+        same = base64.b64encode(b"template").decode()
+        pages = [
+            {"id": "a", "data": same},
+            {"id": "b", "data": base64.b64encode(b"other").decode()},
+            {"id": "c", "data": same},
+        ]
+        event = {
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"pages": pages}),
+        }
+        result = handler(event, None)
+
+    assert mock_page.call_count == 2
+    body = json.loads(result["body"])
+    assert body["deduplicatedPages"] == 1
+    by_id = {p["id"]: p for p in body["pages"]}
+    assert set(by_id) == {"a", "b", "c"}
+    assert by_id["c"] == {"id": "c", "markdown": "same", "confidence": 0.9, "deduplicatedFrom": "a"}
+
+
+def test_duplicate_pages_charge_usage_once():
+    """Only the processed page carries the Claude calls' trace and usage."""
+    usage = {"inputTokens": 1200, "outputTokens": 40, "costUsd": 0.001}
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=lambda pid, data, client, meter=None: {
+             "id": pid, "markdown": "same", "confidence": 0.9,
+             "ocr": {"model": "m", "calls": []}, "usage": usage}):
+
+        same = base64.b64encode(b"template").decode()
+        event = {
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"pages": [{"id": "a", "data": same}, {"id": "b", "data": same}]}),
+        }
+        body = json.loads(handler(event, None)["body"])
+
+    by_id = {p["id"]: p for p in body["pages"]}
+    assert by_id["a"]["usage"] == usage and "deduplicatedFrom" not in by_id["a"]
+    assert "usage" not in by_id["b"] and "ocr" not in by_id["b"]
+    assert by_id["b"]["deduplicatedFrom"] == "a"
+
+
+def test_duplicate_page_failure_fans_out():
+    """If the shared payload fails, every page that sent it is failed."""
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=RuntimeError("bad page")):
+
+        same = base64.b64encode(b"broken").decode()
+        event = {
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"pages": [{"id": "a", "data": same}, {"id": "b", "data": same}]}),
+        }
+        body = json.loads(handler(event, None)["body"])
+
+    assert sorted(body["failedPages"]) == ["a", "b"]
+
+
+def test_same_bytes_different_encoding_not_merged():
+    """Dedup keys on the payload as sent, including its per-page encoding."""
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=lambda pid, data, client, meter=None: {
+             "id": pid, "markdown": "", "confidence": 1.0}) as mock_page:
+
+        same = base64.b64encode(gzip.compress(b"rm")).decode()
+        pages = [
+            {"id": "a", "data": same, "encoding": "gzip"},
+            {"id": "b", "data": same},
+        ]
+        event = {
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"pages": pages}),
+        }
+        body = json.loads(handler(event, None)["body"])
+
+    assert mock_page.call_count == 2
+    assert "deduplicatedPages" not in body
+
+
+# --- Token budget ---
+
+def _pages_event(page_ids, headers=None):
+    return {
+        "headers": {"x-api-key": "test-key", **(headers or {})},
+        "requestContext": {"http": {"method": "POST"}},
+        "body": json.dumps({"pages": [
+            {"id": pid, "data": base64.b64encode(pid.encode()).decode()} for pid in page_ids
+        ]}),
+    }
+
+
+def test_invalid_token_budget_rejected():
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        result = handler(_pages_event(["a"], {"x-token-budget": "lots"}), None)
+    assert result["statusCode"] == 400
+    assert "x-token-budget" in json.loads(result["body"])["error"]
+
+
+def test_token_budget_defers_remaining_pages():
+    """Once the budget is spent, pages that still need Claude are deferred."""
+    import threading
+    from usage import ModelCall
+
+    first_done = threading.Event()
+
+    def spend(page_id, page_data, anthropic_client, meter=None):
+        if page_id != "a":
+            first_done.wait(timeout=2.0)
+        meter.check()
+        meter.record(ModelCall("claude-haiku-4-5-20251001", "extract", 10, input_tokens=1000))
+        first_done.set()
+        return {"id": page_id, "markdown": "ok", "confidence": 1.0}
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=spend):
+        result = handler(_pages_event(["a", "b", "c"], {"x-token-budget": "500"}), None)
+
+    body = json.loads(result["body"])
+    assert [p["id"] for p in body["pages"]] == ["a"]
+    assert sorted(body["deferredPages"]) == ["b", "c"]
+    assert "failedPages" not in body
+    assert body["usage"]["inputTokens"] == 1000
+    assert body["usage"]["budgetTokens"] == 500
+
+
+def test_usage_reported_without_budget(capsys):
+    from usage import ModelCall
+
+    def spend(page_id, page_data, anthropic_client, meter=None):
+        meter.record(ModelCall("claude-haiku-4-5-20251001", "extract", 10,
+                               input_tokens=1000, output_tokens=100))
+        return {"id": page_id, "markdown": "ok", "confidence": 1.0}
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=spend):
+        result = handler(_pages_event(["a", "b"]), None)
+
+    usage = json.loads(result["body"])["usage"]
+    assert usage["inputTokens"] == 2000
+    assert usage["outputTokens"] == 200
+    assert usage["costUsd"] == 0.003
+    # Request totals are also emitted as CloudWatch EMF metrics
+    emitted = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert emitted[0]["InputTokens"] == 2000
+
+
+# --- Compressed payloads ---
+
+def test_gzip_request_body():
+    """Handler accepts a gzip Content-Encoding request body."""
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", return_value={"id": "test", "markdown": "Hi", "confidence": 1.0}):
+
+        body = gzip.compress(json.dumps({
+            "pages": [{"id": "test", "data": base64.b64encode(b"test").decode()}]
+        }).encode())
+        event = {
+            "headers": {"x-api-key": "test-key", "content-encoding": "gzip"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": base64.b64encode(body).decode(),
+            "isBase64Encoded": True,
+        }
+        result = handler(event, None)
+        assert result["statusCode"] == 200
+        assert json.loads(result["body"])["pages"][0]["id"] == "test"
+
+
+def test_unsupported_content_encoding_returns_415():
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        event = {
+            "headers": {"x-api-key": "test-key", "content-encoding": "br"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": base64.b64encode(b"whatever").decode(),
+            "isBase64Encoded": True,
+        }
+        result = handler(event, None)
+        assert result["statusCode"] == 415
+
+
+def test_compressed_body_expansion_returns_413():
+    """A compressed body that expands past MAX_BODY_SIZE is rejected."""
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.MAX_BODY_SIZE", 1024):
+        body = gzip.compress(b" " * 100_000)
+        event = {
+            "headers": {"x-api-key": "test-key", "content-encoding": "gzip"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": base64.b64encode(body).decode(),
+            "isBase64Encoded": True,
+        }
+        result = handler(event, None)
+        assert result["statusCode"] == 413
+
+
+def test_compressed_body_bounded_by_lambda_memory(monkeypatch):
+    """A body within MAX_BODY_SIZE is still refused past a share of memory."""
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "1")
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        body = gzip.compress(json.dumps({"pages": [], "pad": " " * 300_000}).encode())
+        event = {
+            "headers": {"x-api-key": "test-key", "content-encoding": "gzip"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": base64.b64encode(body).decode(),
+            "isBase64Encoded": True,
+        }
+        result = handler(event, None)
+    assert result["statusCode"] == 413
+    assert str(1024 * 1024 // 4) in json.loads(result["body"])["error"]
+
+
+def test_per_page_gzip_encoding_decompressed_for_worker():
+    """A page with a declared encoding reaches the pipeline decompressed."""
+    seen = []
+
+    def fake_typed_text(rm_bytes):
+        seen.append(rm_bytes)
+        return "typed"
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.extract_typed_text", side_effect=fake_typed_text), \
+         patch("handler.has_strokes", return_value=False):
+
+        data = base64.b64encode(gzip.compress(b"raw rm bytes")).decode()
+        event = {
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"pages": [{"id": "p", "data": data, "encoding": "gzip"}]}),
+        }
+        result = handler(event, None)
+        assert result["statusCode"] == 200
+        assert seen == [b"raw rm bytes"]
+
+
+def test_unknown_page_encoding_fails_page():
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        event = {
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"pages": [{"id": "p", "data": "AAAA", "encoding": "lzma"}]}),
+        }
+        result = handler(event, None)
+        assert result["statusCode"] == 200
+        assert json.loads(result["body"])["failedPages"] == ["p"]
+
+
+def test_response_compressed_when_accepted():
+    """Response is gzip'd when the client sends Accept-Encoding: gzip."""
+    markdown = "word " * 1000
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", return_value={"id": "t", "markdown": markdown, "confidence": 1.0}):
+
+        event = {
+            "headers": {"x-api-key": "test-key", "accept-encoding": "gzip"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": json.dumps({"pages": [{"id": "t", "data": base64.b64encode(b"x").decode()}]}),
+        }
+        result = handler(event, None)
+        assert result["statusCode"] == 200
+        assert result["isBase64Encoded"] is True
+        assert result["headers"]["Content-Encoding"] == "gzip"
+        body = json.loads(gzip.decompress(base64.b64decode(result["body"])))
+        assert body["pages"][0]["markdown"] == markdown
+
+
+# --- Notebook endpoint ---
+
+def _notebook_event(archive_bytes, headers=None):
+    return {
+        "headers": {"x-api-key": "test-key", **(headers or {})},
+        "requestContext": {"http": {"method": "POST"}},
+        "rawPath": "/notebook",
+        "body": base64.b64encode(archive_bytes).decode(),
+        "isBase64Encoded": True,
+    }
+
+
+def test_notebook_returns_pages_in_document_order():
+    """Pages finish out of order but come back in document order with anchors."""
+    import time
+    def fake_page(page_id, page_data, anthropic_client, meter=None):
+        rm_bytes = page_data.take()
+        # Earlier pages take longer, so completion order is reversed.
+        time.sleep(0.05 * (3 - int(page_id[-1])))
+        return {"id": page_id, "markdown": rm_bytes.decode(), "confidence": 1.0}
+
+    archive = make_rmdoc(["p1", "p2", "p3"], title="Trip")
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=fake_page):
+        result = handler(_notebook_event(archive), None)
+
+    assert result["statusCode"] == 200
+    body = json.loads(result["body"])
+    assert body["notebook"]["title"] == "Trip"
+    assert [p["id"] for p in body["pages"]] == ["p1", "p2", "p3"]
+    assert [p["index"] for p in body["pages"]] == [0, 1, 2]
+    md = body["markdown"]
+    assert md.index('<a id="page-p1"></a>') < md.index("rm:p1") < md.index('<a id="page-p2"></a>')
+    assert md.index("rm:p2") < md.index("rm:p3")
+
+
+def test_notebook_exceeds_max_pages_per_request():
+    """Notebooks aren't bound by the per-batch MAX_PAGES limit."""
+    page_ids = [f"p{i}" for i in range(45)]
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=lambda pid, data, client, meter=None: {
+             "id": pid, "markdown": "", "confidence": 1.0}):
+        result = handler(_notebook_event(make_rmdoc(page_ids)), None)
+
+    assert result["statusCode"] == 200
+    assert len(json.loads(result["body"])["pages"]) == 45
+
+
+def test_notebook_blank_pages_skip_processing():
+    archive = make_rmdoc(["drawn", "blank"], drawn=["drawn"])
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", return_value={"id": "drawn", "markdown": "ink", "confidence": 1.0}) as mock_page:
+        result = handler(_notebook_event(archive), None)
+
+    assert mock_page.call_count == 1
+    body = json.loads(result["body"])
+    assert [p["id"] for p in body["pages"]] == ["drawn", "blank"]
+    assert '<a id="page-blank"></a>' in body["markdown"]
+
+
+def test_notebook_too_many_pages():
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.MAX_NOTEBOOK_PAGES", 2):
+        result = handler(_notebook_event(make_rmdoc(["a", "b", "c"])), None)
+    assert result["statusCode"] == 400
+
+
+def test_notebook_invalid_archive():
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        result = handler(_notebook_event(b"not a zip"), None)
+    assert result["statusCode"] == 400
+    assert "Invalid notebook archive" in json.loads(result["body"])["error"]
+
+
+@pytest.mark.parametrize("members", [
+    {"doc.content": b" " * (2 * 1024 * 1024)},  # inflates past the .content cap
+    {"doc.content": b"[]"},
+    {"doc.content": json.dumps({"cPages": ["not", "a", "dict"]}).encode()},
+])
+def test_notebook_hostile_archive_is_rejected(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        result = handler(_notebook_event(buf.getvalue()), None)
+    assert result["statusCode"] == 400
+    assert "Invalid notebook archive" in json.loads(result["body"])["error"]
+
+
+def test_notebook_failed_page_listed():
+    def flaky(page_id, page_data, anthropic_client, meter=None):
+        if page_id == "bad":
+            raise RuntimeError("render failed")
+        return {"id": page_id, "markdown": "ok", "confidence": 1.0}
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=flaky):
+        result = handler(_notebook_event(make_rmdoc(["good", "bad"])), None)
+
+    body = json.loads(result["body"])
+    assert body["failedPages"] == ["bad"]
+    assert [p["id"] for p in body["pages"]] == ["good"]
+
+
+def test_notebook_pages_past_the_deadline_are_deferred():
+    """Near the Lambda timeout, pages still needing Claude come back deferred."""
+    from types import SimpleNamespace
+
+    def spend(page_id, page_data, anthropic_client, meter=None):
+        meter.check()
+        return {"id": page_id, "markdown": "ok", "confidence": 1.0}
+
+    # Less time left than one Claude call may take
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 30_000)
+    archive = make_rmdoc(["a", "b", "blank"], drawn=["a", "b"])
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=spend):
+        result = handler(_notebook_event(archive), context)
+
+    assert result["statusCode"] == 200
+    body = json.loads(result["body"])
+    assert sorted(body["deferredPages"]) == ["a", "b"]
+    assert [p["id"] for p in body["pages"]] == ["blank"]
+
+
+def test_notebook_with_time_left_processes_every_page():
+    from types import SimpleNamespace
+
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 300_000)
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=lambda pid, data, client, meter=None: (
+             meter.check() or {"id": pid, "markdown": "ok", "confidence": 1.0})):
+        result = handler(_notebook_event(make_rmdoc(["a", "b"])), context)
+
+    body = json.loads(result["body"])
+    assert "deferredPages" not in body
+    assert [p["id"] for p in body["pages"]] == ["a", "b"]
+
+
+def test_notebook_duplicate_pages_processed_once():
+    """Byte-identical archive members are deduplicated by content hash."""
+    import io
+    import zipfile
+
+    src = make_rmdoc(["p1", "p2", "p3"])
+    buf = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(src)) as zin, zipfile.ZipFile(buf, "w") as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename.endswith("p3.rm"):
+                data = b"rm:p1"
+            zout.writestr(info.filename, data)
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=lambda pid, data, client, meter=None: {
+             "id": pid, "markdown": data.take().decode(), "confidence": 1.0}) as mock_page:
+        result = handler(_notebook_event(buf.getvalue()), None)
+
+    assert mock_page.call_count == 2
+    body = json.loads(result["body"])
+    assert body["deduplicatedPages"] == 1
+    assert [p["id"] for p in body["pages"]] == ["p1", "p2", "p3"]
+    assert body["pages"][2]["markdown"] == "rm:p1"
+
+
+def test_unknown_path_returns_404():
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        event = {
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "rawPath": "/nope",
+            "body": "{}",
+        }
+        assert handler(event, None)["statusCode"] == 404
@@ -0,0 +1,162 @@
+"""Tests for hedging — duplicate Claude calls for pages in the latency tail."""
+
+import sys
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import hedging
+from claude_client import FAST_MODEL, MODEL, OcrTrace, extract_text_from_image
+from hedging import Hedger
+from usage import UsageMeter
+
+
+def _warm(hedger, kind="m:extract", seconds=0.01, count=20):
+    for _ in range(count):
+        hedger.observe(kind, seconds)
+
+
+def _sender(*steps):
+    """A send() whose n-th call sleeps steps[n][0], then returns or raises steps[n][1]."""
+    calls = iter(steps)
+    lock = threading.Lock()
+
+    def send(**request):
+        with lock:
+            delay, outcome = next(calls)
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return send
+
+
+@pytest.fixture
+def hedger():
+    hedger = Hedger(percentile=90, max_fraction=1.0, min_samples=20)
+    _warm(hedger)
+    return hedger
+
+
+def test_no_hedging_until_enough_samples():
+    hedger = Hedger(percentile=90)
+    _warm(hedger, count=19)
+    assert hedger.threshold("m:extract") is None
+    assert hedger.call("m:extract", _sender((0.05, "slow"), (0, "hedge"))) == "slow"
+    assert hedger.stats.hedges == 0
+
+
+def test_threshold_is_percentile_per_kind():
+    hedger = Hedger(percentile=90, min_samples=10)
+    for ms in range(1, 101):
+        hedger.observe("m:extract", ms / 1000)
+    assert hedger.threshold("m:extract") == pytest.approx(0.091)
+    assert hedger.threshold("m:describe") is None
+
+
+def test_fast_call_is_not_hedged(hedger):
+    assert hedger.call("m:extract", _sender((0, "fast"), (0, "hedge"))) == "fast"
+    assert (hedger.stats.calls, hedger.stats.hedges) == (1, 0)
+
+
+def test_slow_call_is_hedged_and_first_answer_wins(hedger):
+    abandoned = []
+    send = _sender((0.3, "slow"), (0, "hedge"))
+    started = time.monotonic()
+    assert hedger.call("m:extract", send, abandoned=abandoned.append) == "hedge"
+    assert time.monotonic() - started < 0.2
+    assert (hedger.stats.hedges, hedger.stats.hedge_wins) == (1, 1)
+
+    time.sleep(0.4)
+    assert abandoned == ["slow"]
+
+
+def test_primary_can_still_win(hedger):
+    assert hedger.call("m:extract", _sender((0.05, "primary"), (0.5, "hedge"))) == "primary"
+    assert (hedger.stats.hedges, hedger.stats.hedge_wins) == (1, 0)
+
+
+def test_failed_attempt_falls_back_to_the_other(hedger):
+    send = _sender((0.05, RuntimeError("overloaded")), (0.1, "hedge"))
+    assert hedger.call("m:extract", send) == "hedge"
+
+
+def test_raises_when_every_attempt_fails(hedger):
+    send = _sender((0.05, RuntimeError("first")), (0, RuntimeError("second")))
+    with pytest.raises(RuntimeError, match="first"):
+        hedger.call("m:extract", send)
+
+
+def test_fast_failure_is_not_hedged(hedger):
+    with pytest.raises(RuntimeError):
+        hedger.call("m:extract", _sender((0, RuntimeError("bad request"))))
+    assert hedger.stats.hedges == 0
+
+
+def test_spend_cap_limits_hedged_share():
+    hedger = Hedger(percentile=50, max_fraction=0.25, min_samples=1)
+    _warm(hedger, seconds=0.001, count=100)
+    for _ in range(8):
+        hedger.call("m:extract", _sender((0.05, "slow"), (0.05, "hedge")))
+    assert hedger.stats.calls == 8
+    assert hedger.stats.hedges == 2
+
+
+def test_may_hedge_can_veto(hedger):
+    assert hedger.call("m:extract", _sender((0.05, "slow")), may_hedge=lambda: False) == "slow"
+    assert hedger.stats.hedges == 0
+
+
+def _message(text, input_tokens):
+    message = MagicMock()
+    message.content = [MagicMock(text=text)]
+    message.stop_reason = "end_turn"
+    message.usage = MagicMock(
+        input_tokens=input_tokens, output_tokens=10,
+        cache_creation_input_tokens=0, cache_read_input_tokens=0,
+    )
+    return message
+
+
+def test_extraction_charges_the_abandoned_call(hedger):
+    hedging.configure(hedger)
+    _warm(hedger, kind=f"{FAST_MODEL or MODEL}:extract")
+    try:
+        client = MagicMock()
+        client.messages.create.side_effect = _sender(
+            (0.3, _message("Slow answer", 1000)), (0, _message("Hedged answer", 1000))
+        )
+        meter = UsageMeter()
+        trace = OcrTrace(meter=meter)
+        text, _ = extract_text_from_image(b"png", client, trace)
+        assert text == "Hedged answer"
+        assert len(trace.calls) == 1
+        time.sleep(0.4)
+        assert meter.used_tokens == 2 * 1010
+    finally:
+        hedging.configure(None)
+
+
+@pytest.mark.parametrize("env,expected", [
+    ({}, None),
+    ({"HEDGE_PERCENTILE": "95"}, (95.0, hedging.DEFAULT_MAX_FRACTION)),
+    ({"HEDGE_PERCENTILE": "99", "HEDGE_MAX_FRACTION": "0.1"}, (99.0, 0.1)),
+    ({"HEDGE_PERCENTILE": "150"}, None),
+    ({"HEDGE_PERCENTILE": "95", "HEDGE_MAX_FRACTION": "lots"}, (95.0, hedging.DEFAULT_MAX_FRACTION)),
+])
+def test_hedger_from_env(monkeypatch, env, expected):
+    for name in ("HEDGE_PERCENTILE", "HEDGE_MAX_FRACTION"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    hedging.configure(None)
+    try:
+        hedger = hedging.get_hedger()
+        assert (hedger and (hedger.percentile, hedger.max_fraction)) == expected
+    finally:
+        hedging.configure(None)
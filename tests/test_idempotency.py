@@ -0,0 +1,172 @@
+"""Tests for idempotent requests — replaying finished pages to retries."""
+
+import base64
+import json
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import idempotency
+from handler import handler
+from idempotency_store import MemoryIdempotencyStore, SQLiteIdempotencyStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryIdempotencyStore()
+    else:
+        store = SQLiteIdempotencyStore(str(tmp_path / "idempotency.db"))
+    idempotency.configure(store)
+    yield store
+    idempotency.configure(None)
+
+
+def _page(page_id, content=None):
+    content = content or f"rm:{page_id}"
+    return {"id": page_id, "data": base64.b64encode(content.encode()).decode()}
+
+
+def _fake_page(page_id, page_data, anthropic_client, meter=None):
+    return {"id": page_id, "markdown": f"text of {page_data.take().decode()}", "confidence": 0.9}
+
+
+def _ocr(pages, key="retry-1", process=_fake_page, anthropic_key="sk-user"):
+    headers = {"x-api-key": "test-key", "x-anthropic-key": anthropic_key}
+    if key is not None:
+        headers["Idempotency-Key"] = key
+    event = {
+        "rawPath": "/ocr",
+        "headers": headers,
+        "requestContext": {"http": {"method": "POST"}},
+        "body": json.dumps({"pages": pages}),
+    }
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+            patch("handler.process_page", side_effect=process) as mock_process:
+        response = handler(event, None)
+    return response["statusCode"], json.loads(response["body"]), mock_process
+
+
+def _markdown(body):
+    return {p["id"]: p["markdown"] for p in body["pages"]}
+
+
+def test_retry_replays_finished_pages(store):
+    _, first, process = _ocr([_page("a"), _page("b")])
+    assert process.call_count == 2
+    assert "replayedPages" not in first
+
+    status, retry, process = _ocr([_page("a"), _page("b")])
+    assert status == 200
+    process.assert_not_called()
+    assert retry["replayedPages"] == 2
+    assert _markdown(retry) == _markdown(first)
+
+
+def test_replayed_pages_are_marked_and_carry_no_usage(store):
+    def with_usage(page_id, page_data, anthropic_client, meter=None):
+        return {**_fake_page(page_id, page_data, anthropic_client),
+                "ocr": {"model": "m", "calls": []}, "usage": {"inputTokens": 1200}}
+
+    _, first, _ = _ocr([_page("a")], process=with_usage)
+    assert "replayed" not in first["pages"][0]
+
+    _, retry, _ = _ocr([_page("a")])
+    page = retry["pages"][0]
+    assert page["replayed"] is True
+    assert "usage" not in page and "ocr" not in page
+
+
+def test_retry_processes_only_unfinished_pages(store):
+    def fail_b(page_id, page_data, anthropic_client, meter=None):
+        if page_id == "b":
+            raise RuntimeError("Claude timed out")
+        return _fake_page(page_id, page_data, anthropic_client)
+
+    _, first, _ = _ocr([_page("a"), _page("b")], process=fail_b)
+    assert first["failedPages"] == ["b"]
+
+    _, retry, process = _ocr([_page("a"), _page("b")])
+    assert [call.args[0] for call in process.call_args_list] == ["b"]
+    assert retry["replayedPages"] == 1
+    assert _markdown(retry) == {"a": "text of rm:a", "b": "text of rm:b"}
+    assert "failedPages" not in retry
+
+
+def test_changed_page_is_processed_again(store):
+    _ocr([_page("a"), _page("b")])
+    _, retry, process = _ocr([_page("a"), _page("b", "rm:b-edited")])
+    assert [call.args[0] for call in process.call_args_list] == ["b"]
+    assert _markdown(retry)["b"] == "text of rm:b-edited"
+
+
+def test_duplicate_pages_are_recorded_under_each_id(store):
+    _ocr([_page("a", "same"), _page("b", "same")])
+    _, retry, process = _ocr([_page("a", "same"), _page("b", "same")])
+    process.assert_not_called()
+    assert _markdown(retry) == {"a": "text of same", "b": "text of same"}
+
+
+@pytest.mark.parametrize("retry", [
+    {"key": "retry-2"},
+    {"key": None},
+    {"anthropic_key": "sk-someone-else"},
+])
+def test_replay_is_scoped_to_key_and_caller(store, retry):
+    _ocr([_page("a")])
+    _, body, process = _ocr([_page("a")], **retry)
+    assert process.call_count == 1
+    assert "replayedPages" not in body
+
+
+def test_scope_includes_the_route(store):
+    event = {"headers": {"Idempotency-Key": "k"}}
+    assert idempotency.begin(event, "/ocr").scope != idempotency.begin(event, "/notebook").scope
+
+
+@pytest.mark.parametrize("key", ["", " ", "x" * 256, "bad\nkey"])
+def test_malformed_key_is_rejected(store, key):
+    status, body, process = _ocr([_page("a")], key=key)
+    assert status == 400
+    assert "Idempotency-Key" in body["error"]
+    process.assert_not_called()
+
+
+def test_store_failures_do_not_fail_the_request(store):
+    with patch.object(store, "put_result", side_effect=OSError("disk full")):
+        status, body, _ = _ocr([_page("a")])
+    assert status == 200
+    assert _markdown(body) == {"a": "text of rm:a"}
+
+    with patch.object(store, "get_results", side_effect=OSError("unavailable")):
+        status, body, process = _ocr([_page("a")])
+    assert status == 200
+    assert process.call_count == 1
+
+
+def test_records_expire(store):
+    _ocr([_page("a")])
+    with patch("idempotency_store.time.time", return_value=time.time() + 25 * 3600):
+        _, _, process = _ocr([_page("a")])
+    assert process.call_count == 1
+
+
+@pytest.mark.parametrize("env,expected", [
+    ({}, MemoryIdempotencyStore),
+    ({"IDEMPOTENCY_BACKEND": "sqlite"}, SQLiteIdempotencyStore),
+])
+def test_store_from_env(monkeypatch, tmp_path, env, expected):
+    monkeypatch.delenv("IDEMPOTENCY_TABLE", raising=False)
+    monkeypatch.delenv("IDEMPOTENCY_BACKEND", raising=False)
+    monkeypatch.setenv("IDEMPOTENCY_SQLITE_PATH", str(tmp_path / "idem.db"))
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    idempotency.configure(None)
+    try:
+        assert isinstance(idempotency.get_store(), expected)
+    finally:
+        idempotency.configure(None)
@@ -0,0 +1,416 @@
+"""Tests for async jobs — job API, workers, stores and queues run offline."""
+
+import base64
+import json
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import anthropic
+import jobs
+from handler import (
+    DEFAULT_CLAUDE_MAX_RETRIES,
+    DEFAULT_CLAUDE_TIMEOUT_SECONDS,
+    handler,
+    make_anthropic_client,
+    process_page,
+)
+from job_store import MemoryJobStore, SQLiteJobStore
+from task_queue import MemoryTaskQueue, SQLiteTaskQueue
+from tests.test_notebook import make_rmdoc
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        store, queue = MemoryJobStore(), MemoryTaskQueue()
+    else:
+        path = str(tmp_path / "jobs.db")
+        store, queue = SQLiteJobStore(path), SQLiteTaskQueue(path)
+    jobs.configure(store, queue)
+    yield store, queue
+    jobs.configure(None)
+
+
+def _event(method, path, body=None, headers=None, query="", binary=False):
+    event = {
+        "rawPath": path,
+        "rawQueryString": query,
+        "headers": {"x-api-key": "test-key", **(headers or {})},
+        "requestContext": {"http": {"method": method}},
+    }
+    if body is not None:
+        event["body"] = body
+        event["isBase64Encoded"] = binary
+    return event
+
+
+def _call(event):
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        response = handler(event, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def _pages_body(page_ids):
+    return json.dumps({"pages": [
+        {"id": pid, "data": base64.b64encode(f"rm:{pid}".encode()).decode()} for pid in page_ids
+    ]})
+
+
+def _fake_page(page_id, page_data, anthropic_client, meter=None):
+    assert page_data == f"rm:{page_id}".encode()
+    return {"id": page_id, "markdown": f"text of {page_id}", "confidence": 1.0}
+
+
+def _drain(store, queue, process=_fake_page):
+    return jobs.work(store, queue, process, make_anthropic_client, until_idle=True)
+
+
+def test_jobs_not_configured():
+    jobs.configure(None)
+    with patch.dict("os.environ", {}, clear=False) as env:
+        env.pop("JOB_BACKEND", None)
+        env.pop("JOBS_TABLE", None)
+        status, body = _call(_event("POST", "/jobs", _pages_body(["a"])))
+    assert status == 501
+    assert body["code"] == "JOBS_NOT_CONFIGURED"
+
+
+def test_submit_work_and_fetch_results(backend):
+    store, queue = backend
+    status, body = _call(_event("POST", "/jobs", _pages_body(["a", "b", "c"])))
+    assert status == 202
+    assert body["status"] == "queued"
+    assert body["pageCount"] == 3
+    job_id = body["jobId"]
+
+    assert _drain(store, queue) == 3
+
+    status, body = _call(_event("GET", f"/jobs/{job_id}"))
+    assert status == 200
+    assert body["status"] == "completed"
+    assert body["completedCount"] == 3 and body["failedCount"] == 0
+
+    status, body = _call(_event("GET", f"/jobs/{job_id}/results"))
+    assert [p["id"] for p in body["pages"]] == ["a", "b", "c"]
+    assert [p["index"] for p in body["pages"]] == [0, 1, 2]
+    assert body["pages"][1]["markdown"] == "text of b"
+    assert "nextCursor" not in body
+
+
+def test_results_paginate(backend):
+    store, queue = backend
+    _, body = _call(_event("POST", "/jobs", _pages_body([f"p{i}" for i in range(5)])))
+    job_id = body["jobId"]
+    _drain(store, queue)
+
+    seen = []
+    cursor = None
+    while True:
+        query = "limit=2" + (f"&cursor={cursor}" if cursor else "")
+        _, body = _call(_event("GET", f"/jobs/{job_id}/results", query=query))
+        seen.extend(p["id"] for p in body["pages"])
+        cursor = body.get("nextCursor")
+        if cursor is None:
+            break
+    assert seen == ["p0", "p1", "p2", "p3", "p4"]
+
+
+def test_status_while_running(backend):
+    store, queue = backend
+    _, body = _call(_event("POST", "/jobs", _pages_body(["a", "b"])))
+    job_id = body["jobId"]
+    task = queue.receive(max_messages=1)[0]
+    jobs.run_task(task.body, task.attempt, store, _fake_page, make_anthropic_client)
+    queue.delete(task.receipt)
+
+    _, body = _call(_event("GET", f"/jobs/{job_id}"))
+    assert body["status"] == "running"
+    _, body = _call(_event("GET", f"/jobs/{job_id}/results"))
+    assert [p["id"] for p in body["pages"]] == ["a"]
+
+
+def test_notebook_job_keeps_document_order(backend):
+    store, queue = backend
+    archive = make_rmdoc(["p1", "p2", "p3"], drawn=["p1", "p3"], title="Trip")
+    status, body = _call(_event(
+        "POST", "/jobs", base64.b64encode(archive).decode(),
+        headers={"content-type": "application/zip"}, binary=True,
+    ))
+    assert status == 202
+    assert body["notebook"]["title"] == "Trip"
+    job_id = body["jobId"]
+
+    # The blank page is finished at submission; only drawn pages are tasks
+    assert _drain(store, queue) == 2
+    _, body = _call(_event("GET", f"/jobs/{job_id}/results"))
+    assert [(p["id"], p["markdown"]) for p in body["pages"]] == [
+        ("p1", "text of p1"), ("p2", ""), ("p3", "text of p3"),
+    ]
+
+
+def test_failed_page_recorded_and_job_completes(backend):
+    store, queue = backend
+    _, body = _call(_event("POST", "/jobs", _pages_body(["good", "bad"])))
+
+    def flaky(page_id, page_data, anthropic_client, meter=None):
+        if page_id == "bad":
+            raise RuntimeError("corrupt page")
+        return _fake_page(page_id, page_data, anthropic_client)
+
+    _drain(store, queue, flaky)
+    _, status = _call(_event("GET", f"/jobs/{body['jobId']}"))
+    assert status["status"] == "completed"
+    assert status["failedCount"] == 1
+    _, results = _call(_event("GET", f"/jobs/{body['jobId']}/results"))
+    assert results["pages"][1] == {"id": "bad", "error": "corrupt page", "index": 1}
+
+
+def test_transient_error_retried_then_recorded(backend):
+    store, queue = backend
+    queue.visibility_timeout = 0  # redeliver failed tasks immediately
+    _, body = _call(_event("POST", "/jobs", _pages_body(["a"])))
+    calls = []
+
+    def rate_limited(page_id, page_data, anthropic_client, meter=None):
+        calls.append(page_id)
+        raise anthropic.RateLimitError("slow down", response=MagicMock(status_code=429), body=None)
+
+    for _ in range(jobs.MAX_TASK_ATTEMPTS):
+        _drain(store, queue, rate_limited)
+    assert len(calls) == jobs.MAX_TASK_ATTEMPTS
+    _, status = _call(_event("GET", f"/jobs/{body['jobId']}"))
+    assert status["status"] == "completed" and status["failedCount"] == 1
+
+
+@pytest.mark.parametrize("broken", ["get_page", "open"])
+def test_storage_or_key_errors_retried_then_recorded(backend, broken):
+    """An S3/DynamoDB/KMS error on every delivery still finishes the job."""
+    store, queue = backend
+    queue.visibility_timeout = 0
+    headers = {"x-anthropic-key": "sk-user"}
+    _, body = _call(_event("POST", "/jobs", _pages_body(["a"]), headers=headers))
+    error = RuntimeError("AccessDenied")
+    target = store if broken == "get_page" else jobs.get_task_keys()
+
+    with patch.object(target, broken, side_effect=error) as failing:
+        for _ in range(jobs.MAX_TASK_ATTEMPTS):
+            _drain(store, queue, _fake_page)
+    assert failing.call_count == jobs.MAX_TASK_ATTEMPTS
+    _, status = _call(_event("GET", f"/jobs/{body['jobId']}"))
+    assert status["status"] == "completed" and status["failedCount"] == 1
+    _, results = _call(_event("GET", f"/jobs/{body['jobId']}/results"))
+    assert results["pages"] == [{"id": "a", "index": 0, "error": "AccessDenied"}]
+    assert queue.receive(wait_seconds=0) == []
+
+
+def test_anthropic_key_travels_with_tasks_not_store(backend):
+    store, queue = backend
+    _call(_event("POST", "/jobs", _pages_body(["a"]), headers={"x-anthropic-key": "sk-user"}))
+    seen = []
+
+    def capture(page_id, page_data, anthropic_client, meter=None):
+        seen.append(anthropic_client)
+        return _fake_page(page_id, page_data, anthropic_client)
+
+    with patch("handler.anthropic.Anthropic", return_value="client") as ctor:
+        _drain(store, queue, capture)
+    ctor.assert_called_once_with(
+        api_key="sk-user", timeout=DEFAULT_CLAUDE_TIMEOUT_SECONDS, max_retries=DEFAULT_CLAUDE_MAX_RETRIES
+    )
+    assert seen == ["client"]
+
+
+def test_anthropic_key_is_sealed_in_tasks(backend):
+    store, queue = backend
+    _call(_event("POST", "/jobs", _pages_body(["a", "b"]), headers={"x-anthropic-key": "sk-user"}))
+    tasks = queue.receive()
+    assert all("sk-user" not in json.dumps(task.body) for task in tasks)
+    assert len({task.body["sealedKey"] for task in tasks}) == 1  # sealed once per submission
+
+    # A sealed key only opens for the job it was sealed for
+    keys = jobs.get_task_keys()
+    job_id = tasks[0].body["jobId"]
+    assert keys.open(job_id, tasks[0].body["sealedKey"]) == "sk-user"
+    assert keys.open("other-job", tasks[0].body["sealedKey"]) is None
+
+
+def test_expired_local_key_runs_without_client():
+    from task_keys import LocalTaskKeys
+
+    keys = LocalTaskKeys(ttl_seconds=0)
+    assert keys.open("job", keys.seal("job", "sk-user")) is None
+
+
+def test_kms_keys_bind_the_job_id():
+    from task_keys import KmsTaskKeys
+
+    kms = MagicMock()
+    kms.encrypt.return_value = {"CiphertextBlob": b"cipher"}
+    kms.decrypt.return_value = {"Plaintext": b"sk-user"}
+    keys = KmsTaskKeys("alias/jobs", kms)
+
+    sealed = keys.seal("job-1", "sk-user")
+    assert "sk-user" not in sealed
+    kms.encrypt.assert_called_once_with(
+        KeyId="alias/jobs", Plaintext=b"sk-user", EncryptionContext={"jobId": "job-1"}
+    )
+    assert keys.open("job-1", sealed) == "sk-user"
+    kms.decrypt.assert_called_once_with(
+        CiphertextBlob=b"cipher", EncryptionContext={"jobId": "job-1"}
+    )
+
+
+def test_redelivered_task_not_double_counted(backend):
+    store, queue = backend
+    _, body = _call(_event("POST", "/jobs", _pages_body(["a"])))
+    task = queue.receive()[0]
+    jobs.run_task(task.body, 1, store, _fake_page, make_anthropic_client)
+    jobs.run_task(task.body, 2, store, _fake_page, make_anthropic_client)
+    assert store.put_result(body["jobId"], 0, {"id": "a", "index": 0}) is False
+    assert store.get_job(body["jobId"])["completedCount"] == 1
+
+
+def test_unknown_job_and_bad_cursor(backend):
+    status, _ = _call(_event("GET", "/jobs/nope"))
+    assert status == 404
+    _, body = _call(_event("POST", "/jobs", _pages_body(["a"])))
+    status, _ = _call(_event("GET", f"/jobs/{body['jobId']}/results", query="cursor=x"))
+    assert status == 400
+    status, _ = _call(_event("DELETE", f"/jobs/{body['jobId']}"))
+    assert status == 405
+
+
+def test_rejected_pages_listed_on_submit(backend):
+    body = json.dumps({"pages": [
+        {"id": "ok", "data": base64.b64encode(b"rm:ok").decode()},
+        {"id": "empty", "data": ""},
+    ]})
+    status, body = _call(_event("POST", "/jobs", body))
+    assert status == 202
+    assert body["pageCount"] == 1
+    assert body["rejectedPages"] == ["empty"]
+
+
+def test_queue_event_runs_tasks_and_reports_retries(backend):
+    """Lambda worker invocations from the SQS event source mapping."""
+    store, queue = backend
+    _, body = _call(_event("POST", "/jobs", _pages_body(["a", "b"])))
+    tasks = queue.receive()
+    records = [
+        {"messageId": f"m{i}", "body": json.dumps(t.body),
+         "attributes": {"ApproximateReceiveCount": "1"}}
+        for i, t in enumerate(tasks)
+    ]
+
+    def page(page_id, page_data, anthropic_client, meter=None):
+        if page_id == "b":
+            raise anthropic.APIConnectionError(request=MagicMock())
+        return _fake_page(page_id, page_data, anthropic_client)
+
+    with patch("handler.process_page", side_effect=page):
+        result = handler({"Records": records}, None)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    assert store.get_job(body["jobId"])["completedCount"] == 1
+
+
+def test_real_pipeline_offline(backend):
+    """The whole flow with the real page pipeline on a typed-text page."""
+    from io import BytesIO
+    from rmscene import simple_text_document, write_blocks
+
+    store, queue = backend
+    buf = BytesIO()
+    write_blocks(buf, list(simple_text_document("Hello jobs")))
+    body = json.dumps({"pages": [{"id": "t", "data": base64.b64encode(buf.getvalue()).decode()}]})
+    _, submitted = _call(_event("POST", "/jobs", body))
+    jobs.work(store, queue, process_page, make_anthropic_client, until_idle=True)
+    _, results = _call(_event("GET", f"/jobs/{submitted['jobId']}/results"))
+    assert results["pages"][0]["markdown"] == "Hello jobs"
+
+
+def test_session_chunks_processed_as_they_arrive(backend):
+    store, queue = backend
+    status, body = _call(_event("POST", "/sessions"))
+    assert status == 201
+    assert body["status"] == "open" and body["pageCount"] == 0
+    session = body["jobId"]
+
+    status, body = _call(_event("POST", f"/sessions/{session}/pages", _pages_body(["a", "b"])))
+    assert status == 202
+    assert body["firstIndex"] == 0
+
+    # The first chunk is worked before the second one is uploaded
+    assert _drain(store, queue) == 2
+    _, body = _call(_event("GET", f"/jobs/{session}"))
+    assert body["status"] == "open" and body["completedCount"] == 2
+
+    _, body = _call(_event("POST", f"/sessions/{session}/pages", _pages_body(["c"])))
+    assert body["firstIndex"] == 2
+    _drain(store, queue)
+
+    status, body = _call(_event("POST", f"/sessions/{session}/finalize", query="wait=0"))
+    assert status == 200
+    assert body["status"] == "completed"
+    assert [(p["id"], p["index"]) for p in body["pages"]] == [("a", 0), ("b", 1), ("c", 2)]
+    assert body["markdown"] == "text of a\n\ntext of b\n\ntext of c"
+
+
+def test_session_finalize_before_pages_finish(backend):
+    store, queue = backend
+    _, body = _call(_event("POST", "/sessions"))
+    session = body["jobId"]
+    _call(_event("POST", f"/sessions/{session}/pages", _pages_body(["a"])))
+
+    status, body = _call(_event("POST", f"/sessions/{session}/finalize", query="wait=0"))
+    assert status == 202
+    assert body["status"] == "queued" and "pages" not in body
+
+    status, _ = _call(_event("POST", f"/sessions/{session}/pages", _pages_body(["late"])))
+    assert status == 409
+
+    _drain(store, queue)
+    status, body = _call(_event("POST", f"/sessions/{session}/finalize", query="wait=0"))
+    assert status == 200
+    assert [p["id"] for p in body["pages"]] == ["a"]
+
+
+def test_session_finalize_waits_for_workers(backend):
+    store, queue = backend
+    _, body = _call(_event("POST", "/sessions"))
+    session = body["jobId"]
+    _call(_event("POST", f"/sessions/{session}/pages", _pages_body(["a", "b"])))
+
+    stop, threads = jobs.start_workers(2, _fake_page, make_anthropic_client)
+    try:
+        status, body = _call(_event("POST", f"/sessions/{session}/finalize", query="wait=10"))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert status == 200
+    assert [p["id"] for p in body["pages"]] == ["a", "b"]
+
+
+def test_session_page_limit_and_errors(backend):
+    _, body = _call(_event("POST", "/sessions"))
+    session = body["jobId"]
+    with patch("handler.MAX_JOB_PAGES", 3):
+        status, _ = _call(_event("POST", f"/sessions/{session}/pages", _pages_body(["a", "b"])))
+        assert status == 202
+        status, body = _call(_event("POST", f"/sessions/{session}/pages", _pages_body(["c", "d"])))
+        assert status == 400
+        assert "max 3" in body["error"]
+
+    status, _ = _call(_event("POST", "/sessions/nope/pages", _pages_body(["a"])))
+    assert status == 404
+    status, _ = _call(_event("POST", "/sessions/nope/finalize"))
+    assert status == 404
+    status, _ = _call(_event("GET", f"/sessions/{session}"))
+    assert status == 405
+    status, _ = _call(_event("POST", f"/sessions/{session}/finalize", query="wait=soon"))
+    assert status == 400
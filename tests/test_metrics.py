@@ -0,0 +1,38 @@
+"""Tests for metrics module — CloudWatch EMF output."""
+
+import json
+import sys
+
+sys.path.insert(0, "src")
+
+from metrics import NAMESPACE, emit, emit_request_usage
+from usage import ModelCall, UsageMeter
+
+
+def test_emit_writes_emf_document(capsys):
+    emit({"Pages": (3, "Count")}, {"Route": "/ocr"})
+    doc = json.loads(capsys.readouterr().out)
+
+    directive = doc["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == NAMESPACE
+    assert directive["Dimensions"] == [["Route"]]
+    assert directive["Metrics"] == [{"Name": "Pages", "Unit": "Count"}]
+    assert doc["Route"] == "/ocr"
+    assert doc["Pages"] == 3
+
+
+def test_emit_request_usage_per_model(capsys):
+    meter = UsageMeter()
+    meter.record(ModelCall("claude-haiku-4-5-20251001", "extract", 800, input_tokens=1000))
+    meter.record(ModelCall("claude-sonnet-4-20250514", "extract", 3000, input_tokens=1000))
+    meter.record(ModelCall("claude-haiku-4-5-20251001", "describe", 300, input_tokens=500))
+
+    emit_request_usage("/ocr", meter, pages=2, deferred=0)
+    docs = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert docs[0]["Route"] == "/ocr"
+    assert docs[0]["InputTokens"] == 2500
+    by_model = {d["Model"]: d for d in docs[1:]}
+    assert by_model["claude-haiku-4-5-20251001"]["Calls"] == 2
+    assert by_model["claude-haiku-4-5-20251001"]["LatencyMs"] == [800, 300]
+    assert by_model["claude-sonnet-4-20250514"]["InputTokens"] == 1000
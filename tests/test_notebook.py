@@ -0,0 +1,187 @@
+"""Tests for notebook module — archive parsing, page order, lazy page reads."""
+
+import base64
+import hashlib
+import io
+import json
+import sys
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+from notebook import Notebook, NotebookError, spool_base64
+
+
+def make_rmdoc(page_ids, content=None, drawn=None, title="Notes", doc_id="doc-1"):
+    """Build an in-memory .rmdoc with one .rm member per drawn page."""
+    if content is None:
+        content = {
+            "cPages": {
+                "pages": [
+                    {"id": pid, "idx": {"timestamp": "1:2", "value": f"b{i:03d}"}}
+                    for i, pid in enumerate(page_ids)
+                ]
+            }
+        }
+    if drawn is None:
+        drawn = page_ids
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{doc_id}.content", json.dumps(content))
+        zf.writestr(f"{doc_id}.metadata", json.dumps({"visibleName": title}))
+        for pid in drawn:
+            zf.writestr(f"{doc_id}/{pid}.rm", f"rm:{pid}".encode())
+    return buf.getvalue()
+
+
+def test_page_order_from_cpages_index():
+    """cPages entries are ordered by their fractional index, not file order."""
+    content = {
+        "cPages": {
+            "pages": [
+                {"id": "c", "idx": {"value": "bc"}},
+                {"id": "a", "idx": {"value": "ba"}},
+                {"id": "b", "idx": {"value": "bb"}},
+            ]
+        }
+    }
+    nb = Notebook(io.BytesIO(make_rmdoc(["a", "b", "c"], content=content)))
+    assert nb.page_ids == ["a", "b", "c"]
+
+
+def test_deleted_pages_skipped():
+    content = {
+        "cPages": {
+            "pages": [
+                {"id": "a", "idx": {"value": "ba"}},
+                {"id": "gone", "idx": {"value": "bb"}, "deleted": {"value": 1}},
+            ]
+        }
+    }
+    nb = Notebook(io.BytesIO(make_rmdoc(["a"], content=content)))
+    assert nb.page_ids == ["a"]
+
+
+def test_legacy_pages_list():
+    nb = Notebook(io.BytesIO(make_rmdoc(["x", "y"], content={"pages": ["x", "y"]})))
+    assert nb.page_ids == ["x", "y"]
+
+
+def test_title_and_id_from_metadata():
+    nb = Notebook(io.BytesIO(make_rmdoc(["a"], title="Meeting", doc_id="abc")))
+    assert nb.id == "abc"
+    assert nb.title == "Meeting"
+
+
+def test_blank_page_has_no_member():
+    nb = Notebook(io.BytesIO(make_rmdoc(["a", "blank"], drawn=["a"])))
+    assert nb.page("blank") is None
+    assert nb.page("a") is not None
+
+
+def test_archive_page_reads_member_lazily():
+    """Opening a notebook doesn't read page data; take() does, once."""
+    nb = Notebook(io.BytesIO(make_rmdoc(["a"])))
+    page = nb.page("a")
+    with patch.object(nb, "read_member", wraps=nb.read_member) as spy:
+        spy.assert_not_called()
+        assert page.take() == b"rm:a"
+        spy.assert_called_once()
+    with pytest.raises(RuntimeError):
+        page.take()
+
+
+def test_archive_page_digest_hashes_member_bytes():
+    """Pages are keyed on their bytes, not the zip's CRC-32, and stay readable."""
+    nb = Notebook(io.BytesIO(make_rmdoc(["a", "b"])))
+    a, b = nb.page("a"), nb.page("b")
+    assert a.digest() == "rm:" + hashlib.sha256(b"rm:a").hexdigest()
+    assert a.digest() != b.digest()
+    assert a.take() == b"rm:a"
+    assert a.digest() == "rm:" + hashlib.sha256(b"rm:a").hexdigest()
+
+
+def test_unreadable_archive_page_has_no_digest():
+    nb = Notebook(io.BytesIO(make_rmdoc(["a"])))
+    with patch("zipfile.ZipFile.open", side_effect=zipfile.BadZipFile("Bad CRC-32")):
+        assert nb.page("a").digest() is None
+
+
+def test_not_a_zip_raises():
+    with pytest.raises(NotebookError):
+        Notebook(io.BytesIO(b"definitely not a zip"))
+
+
+def test_missing_content_raises():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("doc/page.rm", b"x")
+    with pytest.raises(NotebookError, match=".content"):
+        Notebook(io.BytesIO(buf.getvalue()))
+
+
+def _archive(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return io.BytesIO(buf.getvalue())
+
+
+def test_oversized_content_rejected_before_reading():
+    """A .content that inflates past the cap is refused, not decompressed."""
+    from notebook import MAX_METADATA_SIZE
+
+    bomb = _archive({"doc.content": b" " * (MAX_METADATA_SIZE + 1)})
+    with patch("zipfile.ZipFile.read") as mock_read:
+        with pytest.raises(NotebookError, match="doc.content expands to"):
+            Notebook(bomb)
+    mock_read.assert_not_called()
+
+
+def test_archive_total_uncompressed_size_capped():
+    archive = io.BytesIO(make_rmdoc(["a", "b"]))
+    with patch("notebook.MAX_UNCOMPRESSED_SIZE", 10):
+        with pytest.raises(NotebookError, match="Archive expands to"):
+            Notebook(archive)
+
+
+@pytest.mark.parametrize("content", [
+    ["not", "an", "object"],
+    "pages",
+    {"pages": "abc"},
+])
+def test_malformed_content_raises_notebook_error(content):
+    with pytest.raises(NotebookError):
+        Notebook(_archive({"doc.content": json.dumps(content)}))
+
+
+def test_malformed_cpages_entries_are_skipped():
+    content = {"cPages": {"pages": [
+        "a", None, {"id": 7}, {"id": "b", "idx": "x", "deleted": True},
+        {"id": "c", "idx": {"value": "ba"}}, {"id": "d", "deleted": {"value": True}},
+    ]}}
+    nb = Notebook(_archive({"doc.content": json.dumps(content), "doc.metadata": "[1]"}))
+    assert nb.page_ids == ["b", "c"]  # "b" has no usable index, so sorts first
+    assert nb.title == "doc"
+
+
+@pytest.mark.parametrize("error", [
+    zipfile.BadZipFile("Bad CRC-32 for file 'doc.content'"),
+    NotImplementedError("That compression method is not supported"),
+])
+def test_unreadable_members_raise_notebook_error(error):
+    archive = io.BytesIO(make_rmdoc(["a"]))
+    with patch("zipfile.ZipFile.read", side_effect=error):
+        with pytest.raises(NotebookError, match="Unreadable member"):
+            Notebook(archive)
+
+
+def test_spool_base64_round_trip_across_chunks():
+    """Chunked decoding reassembles archives larger than one slice."""
+    data = bytes(range(256)) * 5000  # ~1.2MB, several decode slices
+    spool = spool_base64(base64.b64encode(data).decode())
+    assert spool.read() == data
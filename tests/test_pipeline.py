@@ -0,0 +1,111 @@
+"""Tests for pipeline module — render/OCR stage limits and the bounded queue."""
+
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, "src")
+
+from pipeline import StagePipeline
+
+
+def _start(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_for(order, entry, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while entry not in order:
+        assert time.monotonic() < deadline, f"timed out waiting for {entry}"
+        time.sleep(0.005)
+
+
+def test_limits_must_be_positive():
+    with pytest.raises(ValueError):
+        StagePipeline(render_workers=1, ocr_workers=0, queue_depth=1)
+
+
+def test_max_in_flight():
+    assert StagePipeline(2, 5, 4).max_in_flight == 11
+
+
+def test_slow_ocr_does_not_block_rendering():
+    """While page 1 sits in OCR, page 2 renders and waits in the queue."""
+    stages = StagePipeline(render_workers=1, ocr_workers=1, queue_depth=1)
+    in_ocr = threading.Event()
+    release_ocr = threading.Event()
+    rendered = threading.Event()
+
+    def page(on_render, on_ocr):
+        with stages.render() as enqueue:
+            on_render()
+            enqueue()
+        with stages.ocr():
+            on_ocr()
+
+    first = _start(lambda: page(lambda: None, lambda: (in_ocr.set(), release_ocr.wait(2))))
+    assert in_ocr.wait(2)
+    second = _start(lambda: page(rendered.set, lambda: None))
+    assert rendered.wait(2)
+
+    release_ocr.set()
+    first.join(2)
+    second.join(2)
+    assert not first.is_alive() and not second.is_alive()
+
+
+def test_full_queue_holds_render_slot():
+    """With the queue full, a finished render keeps its slot (backpressure)."""
+    stages = StagePipeline(render_workers=1, ocr_workers=1, queue_depth=1)
+    release_ocr = threading.Event()
+    order = []
+
+    def page(name):
+        with stages.render() as enqueue:
+            order.append(f"render {name}")
+            enqueue()
+        with stages.ocr():
+            release_ocr.wait(2)
+            order.append(f"ocr {name}")
+
+    threads = [_start(lambda: page("a"))]
+    _wait_for(order, "render a")
+    threads.append(_start(lambda: page("b")))  # queued behind a's OCR
+    _wait_for(order, "render b")
+    threads.append(_start(lambda: page("c")))  # renders, blocks on enqueue
+    _wait_for(order, "render c")
+    threads.append(_start(lambda: page("d")))  # no render slot free
+    time.sleep(0.2)
+    assert "render d" not in order
+
+    release_ocr.set()
+    for t in threads:
+        t.join(2)
+    assert sorted(o for o in order if o.startswith("ocr")) == ["ocr a", "ocr b", "ocr c", "ocr d"]
+
+
+def test_ocr_slots_limit_concurrency():
+    stages = StagePipeline(render_workers=4, ocr_workers=2, queue_depth=4)
+    lock = threading.Lock()
+    active = peak = 0
+
+    def page():
+        nonlocal active, peak
+        with stages.render() as enqueue:
+            enqueue()
+        with stages.ocr():
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+    threads = [_start(page) for _ in range(8)]
+    for t in threads:
+        t.join(2)
+    assert peak == 2
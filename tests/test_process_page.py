@@ -9,13 +9,14 @@ Tests the core OCR pipeline that:
 
 import base64
 import sys
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 
 import pytest
 
 sys.path.insert(0, "src")
 
-from handler import process_page
+from handler import RenderedPage, ocr_page, process_page, render_page
+from rm_renderer import RENDER_SCALE, ScaleChoice
 
 
 class TestProcessPageTypedTextOnly:
@@ -66,12 +67,44 @@ class TestProcessPageHandwriting:
             result = process_page("page-1", rm_data, anthropic_client=mock_client)
 
             mock_render.assert_called_once()
-            mock_claude.assert_called_once_with(mock_png, mock_client)
+            mock_claude.assert_called_once_with(
+                mock_png, mock_client, trace=ANY, scale=RENDER_SCALE, drawing_regions=None
+            )
 
             assert result["id"] == "page-1"
             assert result["markdown"] == "Handwritten text"
             assert result["confidence"] == 0.92
 
+    def test_handwriting_result_includes_routing(self):
+        """The page result reports which models ran and their token counts."""
+        from claude_client import ModelCall
+
+        rm_data = base64.b64encode(b"fake rm data").decode()
+
+        def fake_ocr(png_bytes, client, trace=None, scale=None, drawing_regions=None):
+            trace.calls.append(ModelCall("fast", "extract", 120, 1500, 12))
+            trace.calls.append(ModelCall("strong", "extract", 900, 1500, 40))
+            trace.escalation = "short_for_ink"
+            return "text", 1.0
+
+        with patch("handler.extract_typed_text", return_value=None), \
+             patch("handler.has_strokes", return_value=True), \
+             patch("handler.segment_page", return_value=None), \
+             patch("handler.render_rm_to_png", return_value=b"png"), \
+             patch("handler.extract_text_from_image", side_effect=fake_ocr):
+
+            result = process_page("page-1", rm_data, anthropic_client=MagicMock())
+
+        assert result["ocr"]["model"] == "strong"
+        assert result["ocr"]["escalation"] == "short_for_ink"
+        assert result["ocr"]["calls"][0] == {
+            "model": "fast", "purpose": "extract", "latencyMs": 120,
+            "inputTokens": 1500, "outputTokens": 12,
+            "cacheCreationInputTokens": 0, "cacheReadInputTokens": 0,
+        }
+        assert result["usage"]["inputTokens"] == 3000
+        assert result["usage"]["outputTokens"] == 52
+
     def test_handwriting_without_client_raises_error(self):
         """Handwriting pages require an Anthropic client."""
         rm_data = base64.b64encode(b"fake rm data").decode()
@@ -98,6 +131,31 @@ class TestProcessPageHandwriting:
             assert result["confidence"] == 0.5
 
 
+class TestProcessPageSegmented:
+    """Tests for pages with both handwriting and drawing regions."""
+
+    def test_mixed_regions_use_segmented_ocr(self):
+        """Segmented pages skip the whole-page render and transcribe crops."""
+        rm_data = base64.b64encode(b"fake rm data").decode()
+        mock_client = MagicMock()
+        segments = MagicMock(drawing_pngs=[b"d1"])
+
+        with patch("handler.extract_typed_text", return_value=None), \
+             patch("handler.has_strokes", return_value=True), \
+             patch("handler.segment_page", return_value=segments), \
+             patch("handler.render_rm_to_png") as mock_render, \
+             patch("handler.extract_text_from_image") as mock_full, \
+             patch("handler.extract_text_from_segments",
+                   return_value=("notes\n\n[illustration: chart]", 1.0)) as mock_segmented:
+
+            result = process_page("page-1", rm_data, anthropic_client=mock_client)
+
+            mock_render.assert_not_called()
+            mock_full.assert_not_called()
+            mock_segmented.assert_called_once_with(segments, mock_client, trace=ANY, scale=RENDER_SCALE)
+            assert result["markdown"] == "notes\n\n[illustration: chart]"
+
+
 class TestProcessPageMixedContent:
     """Tests for pages with both typed text and handwriting."""
 
@@ -167,3 +225,97 @@ class TestProcessPageEmptyPage:
             assert result["id"] == "page-1"
             assert result["markdown"] == ""
             assert result["confidence"] == 1.0
+
+
+class TestPipelineStages:
+    """render_page and ocr_page run separately; process_page composes them."""
+
+    def test_render_page_renders_without_claude(self):
+        rm_data = base64.b64encode(b"fake rm data").decode()
+
+        with patch("handler.extract_typed_text", return_value="Typed"), \
+             patch("handler.has_strokes", return_value=True), \
+             patch("handler.segment_page", return_value=None), \
+             patch("handler.render_rm_to_png", return_value=b"png"), \
+             patch("handler.extract_text_from_image") as mock_claude:
+
+            page = render_page("page-1", rm_data)
+
+        assert page == RenderedPage("page-1", typed_markdown="Typed", has_handwriting=True,
+                                    png=b"png")
+        mock_claude.assert_not_called()
+
+    def test_render_page_skips_render_without_client(self):
+        rm_data = base64.b64encode(b"fake rm data").decode()
+
+        with patch("handler.extract_typed_text", return_value=None), \
+             patch("handler.has_strokes", return_value=True), \
+             patch("handler.render_rm_to_png") as mock_render:
+
+            page = render_page("page-1", rm_data, render_handwriting=False)
+
+        assert page.has_handwriting and page.png is None
+        mock_render.assert_not_called()
+
+    def test_ocr_page_uses_rendered_png(self):
+        page = RenderedPage("page-1", typed_markdown="Typed", has_handwriting=True, png=b"png")
+        mock_client = MagicMock()
+
+        with patch("handler.extract_text_from_image", return_value=("Ink", 0.9)) as mock_ocr:
+            result = ocr_page(page, mock_client)
+
+        mock_ocr.assert_called_once_with(b"png", mock_client, trace=ANY, scale=RENDER_SCALE, drawing_regions=None)
+        assert result == {"id": "page-1", "markdown": "Typed\n\nInk", "confidence": 0.9}
+
+    def test_adaptive_scale_is_used_and_recorded(self):
+        rm_data = base64.b64encode(b"fake rm data").decode()
+        choice = ScaleChoice(0.3, 75.0, 0.03, 597)
+
+        with patch("handler.extract_typed_text", return_value=None), \
+             patch("handler.has_strokes", return_value=True), \
+             patch("handler.choose_scale", return_value=choice), \
+             patch("handler.segment_page", return_value=None) as mock_segment, \
+             patch("handler.render_rm_to_png", return_value=b"png") as mock_render, \
+             patch("handler.extract_text_from_image", return_value=("Ink", 1.0)) as mock_ocr:
+
+            result = process_page("page-1", rm_data, anthropic_client=MagicMock())
+
+        assert mock_segment.call_args.args[1] == 0.3
+        assert mock_render.call_args.args[1] == 0.3
+        assert mock_ocr.call_args.kwargs["scale"] == 0.3
+        assert result["render"] == {
+            "scale": 0.3, "glyphHeightPx": 75.0, "inkCoverage": 0.03, "estimatedTokenSaving": 597,
+        }
+
+    def test_typed_pages_bypass_ocr_queue(self):
+        """Pages with no handwriting finish even while every OCR slot is busy."""
+        import threading
+        from pipeline import StagePipeline
+
+        stages = StagePipeline(render_workers=1, ocr_workers=1, queue_depth=1)
+        rm_data = base64.b64encode(b"fake rm data").decode()
+        in_ocr = threading.Event()
+        release = threading.Event()
+
+        def slow_ocr(png, client, trace=None, scale=None, drawing_regions=None):
+            in_ocr.set()
+            release.wait(2)
+            return "Ink", 0.9
+
+        def run_handwriting():
+            process_page("hw", rm_data, anthropic_client=MagicMock())
+
+        with patch("handler.STAGES", stages), \
+             patch("handler.extract_typed_text", return_value="Typed"), \
+             patch("handler.segment_page", return_value=None), \
+             patch("handler.render_rm_to_png", return_value=b"png"), \
+             patch("handler.extract_text_from_image", side_effect=slow_ocr):
+            with patch("handler.has_strokes", return_value=True):
+                worker = threading.Thread(target=run_handwriting)
+                worker.start()
+                assert in_ocr.wait(2)
+            with patch("handler.has_strokes", return_value=False):
+                for i in range(3):
+                    assert process_page(f"typed-{i}", rm_data, None)["markdown"] == "Typed"
+            release.set()
+            worker.join(2)
@@ -0,0 +1,208 @@
+"""Tests for render_cache — rendered pages reused across invocations."""
+
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import render_cache
+import render_pool
+from handler import process_pages
+from render_cache import MIN_ENTRY_BYTES, CacheStats, RenderCache, track
+from rm_renderer import PageSegments
+
+
+@pytest.fixture
+def no_pool(monkeypatch):
+    monkeypatch.setenv("RENDER_PROCESSES", "1")
+    monkeypatch.setattr(render_pool, "_pool", None)
+    monkeypatch.setattr(render_pool, "_pool_checked", False)
+
+
+@pytest.fixture
+def cache():
+    cache = RenderCache(max_bytes=1000)
+    render_cache.configure(cache)
+    yield cache
+    render_cache.configure(None)
+
+
+def _stats(cache):
+    return (cache.stats.hits, cache.stats.spill_hits, cache.stats.misses, cache.stats.evictions)
+
+
+def test_hit_miss_and_key_includes_task_and_scale(cache):
+    key = RenderCache.key("render", b"page", 0.5)
+    assert cache.get(key) == (False, None)
+    cache.put(key, b"png")
+    assert cache.get(key) == (True, b"png")
+    assert RenderCache.key("render", b"page", 1.0) != key
+    assert RenderCache.key("segment", b"page", 0.5) != key
+    assert RenderCache.key("render", b"other", 0.5) != key
+    assert _stats(cache) == (1, 0, 1, 0)
+
+
+def test_evicts_least_recently_used_by_bytes(cache):
+    for name in "abc":
+        cache.put(name, bytes(400))
+    # a and b fit (800 bytes); c pushes out the least recently used
+    assert cache.get("a")[0] is False
+    assert cache.get("b")[0] is True
+    cache.put("d", bytes(400))  # evicts c, since b was just used
+    assert cache.get("c")[0] is False
+    assert cache.get("b")[0] is True
+    assert cache.stats.evictions == 2
+
+
+def test_none_and_segments_are_cached(cache):
+    segments = PageSegments(text_png=bytes(100), drawing_pngs=[bytes(200)])
+    cache.put("mixed", segments)
+    cache.put("plain", None)
+    assert cache.get("mixed") == (True, segments)
+    assert cache.get("plain") == (True, None)
+
+
+def test_every_entry_is_charged_a_minimum_size():
+    cache = RenderCache(max_bytes=2 * MIN_ENTRY_BYTES)
+    for name in "abc":
+        cache.put(name, None)
+    assert cache.get("a") == (False, None)
+    assert cache.stats.evictions == 1
+
+
+def test_evicted_entries_spill_to_disk_and_come_back(tmp_path):
+    cache = RenderCache(max_bytes=1000, spill_dir=str(tmp_path), spill_max_bytes=10_000)
+    cache.put("a", b"a" * 600)
+    cache.put("b", b"b" * 600)  # a spills
+    assert cache.stats.evictions == 0
+    assert len(list(tmp_path.iterdir())) == 1
+
+    assert cache.get("a") == (True, b"a" * 600)  # promoted; b spills
+    assert _stats(cache) == (1, 1, 0, 0)
+    assert cache.get("b") == (True, b"b" * 600)
+    assert cache.stats.spill_hits == 2
+
+
+def test_spill_is_bounded(tmp_path):
+    cache = RenderCache(max_bytes=100, spill_dir=str(tmp_path), spill_max_bytes=1500)
+    for name in "abcd":
+        cache.put(name, name.encode() * 600)
+    # Each entry goes straight to disk (too big for memory); two fit there
+    assert len(list(tmp_path.iterdir())) == 2
+    assert cache.stats.evictions == 2
+    assert cache.get("a")[0] is False
+    assert cache.get("d")[0] is True
+
+
+def test_spill_io_runs_outside_the_lock(tmp_path):
+    cache = RenderCache(max_bytes=1000, spill_dir=str(tmp_path), spill_max_bytes=10_000)
+    held = []
+    write_bytes, read_bytes = Path.write_bytes, Path.read_bytes
+
+    def checked_write(path, data):
+        held.append(cache._lock.locked())
+        return write_bytes(path, data)
+
+    def checked_read(path):
+        held.append(cache._lock.locked())
+        return read_bytes(path)
+
+    with patch.object(Path, "write_bytes", checked_write), \
+            patch.object(Path, "read_bytes", checked_read):
+        cache.put("a", b"a" * 600)
+        cache.put("b", b"b" * 600)  # a spills
+        assert cache.get("a") == (True, b"a" * 600)  # read back; b spills
+    assert held == [False, False, False]
+
+
+def test_leftover_spill_files_are_removed(tmp_path):
+    (tmp_path / "stale.render").write_bytes(b"x")
+    (tmp_path / "unrelated.txt").write_bytes(b"x")
+    RenderCache(max_bytes=100, spill_dir=str(tmp_path), spill_max_bytes=1000)
+    assert [p.name for p in tmp_path.iterdir()] == ["unrelated.txt"]
+
+
+def test_unreadable_spill_file_is_a_miss(tmp_path):
+    cache = RenderCache(max_bytes=100, spill_dir=str(tmp_path), spill_max_bytes=10_000)
+    cache.put("a", bytes(600))
+    next(tmp_path.iterdir()).write_bytes(b"garbage")
+    assert cache.get("a") == (False, None)
+
+
+def test_track_counts_per_invocation_across_threads(cache):
+    cache.put("a", b"png")
+    cache.get("a")  # outside any invocation: container-wide totals only
+    with track() as stats, ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(copy_context().run, cache.get, key) for key in ["a", "b", "a"]]
+        [f.result() for f in futures]
+    assert (stats.hits, stats.misses) == (2, 1)
+    assert (cache.stats.hits, cache.stats.misses) == (3, 1)
+
+
+def test_render_functions_use_the_cache(cache, no_pool):
+    with patch("rm_renderer.render_rm_to_png", return_value=b"png") as render, \
+            patch("rm_renderer.segment_page", return_value=None) as segment:
+        for _ in range(2):
+            assert render_pool.render_rm_to_png(b"page") == b"png"
+            assert render_pool.segment_page(b"page") is None
+        render_pool.render_rm_to_png(b"page", scale=1.0)
+    assert render.call_count == 2
+    assert segment.call_count == 1
+
+
+def test_process_pages_logs_cache_counts(cache, no_pool, caplog):
+    def fake_page(page_id, page_data, anthropic_client, meter=None):
+        render_pool.render_rm_to_png(page_data)
+        return {"id": page_id, "markdown": "", "confidence": 1.0}
+
+    caplog.set_level(logging.INFO)
+    with patch("rm_renderer.render_rm_to_png", return_value=b"png"), \
+            patch("handler.process_page", side_effect=fake_page):
+        process_pages([("p1", b"one"), ("p2", b"two")], None)
+        process_pages([("p1", b"one")], None)  # a retry
+    logs = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Render cache")]
+    assert logs == [
+        "Render cache: 0 hits (0 from disk), 2 misses, 0 evictions",
+        "Render cache: 1 hits (0 from disk), 0 misses, 0 evictions",
+    ]
+
+
+@pytest.mark.parametrize("env,expected", [
+    ({}, (render_cache.DEFAULT_MAX_BYTES, 0)),
+    ({"RENDER_CACHE_BYTES": "0"}, None),
+    ({"RENDER_CACHE_BYTES": "5000", "RENDER_CACHE_SPILL_BYTES": "9000"}, (5000, 0)),
+    ({"RENDER_CACHE_BYTES": "nope"}, (render_cache.DEFAULT_MAX_BYTES, 0)),
+])
+def test_cache_from_env(monkeypatch, env, expected):
+    for name in ("RENDER_CACHE_BYTES", "RENDER_CACHE_SPILL_DIR", "RENDER_CACHE_SPILL_BYTES"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    render_cache.configure(None)
+    try:
+        cache = render_cache.get_cache()
+        assert (cache and (cache.max_bytes, cache.spill_max_bytes)) == expected
+    finally:
+        render_cache.configure(None)
+
+
+def test_spill_dir_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("RENDER_CACHE_SPILL_DIR", str(tmp_path / "spill"))
+    monkeypatch.delenv("RENDER_CACHE_SPILL_BYTES", raising=False)
+    render_cache.configure(None)
+    try:
+        cache = render_cache.get_cache()
+        assert cache.spill_max_bytes == render_cache.DEFAULT_SPILL_MAX_BYTES
+        assert (tmp_path / "spill").is_dir()
+    finally:
+        render_cache.configure(None)
+
+
+def test_stats_summary():
+    assert str(CacheStats(3, 1, 2, 0)) == "3 hits (1 from disk), 2 misses, 0 evictions"
@@ -0,0 +1,123 @@
+"""Tests for render_pool module — rendering in worker processes."""
+
+import sys
+import threading
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import render_pool
+from render_pool import RenderPool, RenderWorkerError, configured_processes
+from rm_renderer import render_rm_to_png, segment_page
+
+
+@pytest.fixture
+def sample_rm():
+    with open("tests/fixtures/sample.rm", "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def pool():
+    pool = RenderPool(2)
+    yield pool
+    pool.close()
+
+
+def test_pool_render_matches_in_process(pool, sample_rm):
+    assert pool.run("render", sample_rm) == render_rm_to_png(sample_rm)
+
+
+def test_pool_segment_matches_in_process(pool, sample_rm):
+    assert pool.run("segment", sample_rm) == segment_page(sample_rm)
+
+
+def test_pool_passes_scale(pool, sample_rm):
+    assert pool.run("render", sample_rm, 0.25) == render_rm_to_png(sample_rm, 0.25)
+
+
+def test_task_errors_are_reraised_and_worker_survives(pool, sample_rm):
+    with pytest.raises(EOFError):
+        pool.run("render", b"not an rm file")
+    assert pool.run("render", sample_rm) == render_rm_to_png(sample_rm)
+
+
+def test_dead_worker_is_replaced(sample_rm):
+    pool = RenderPool(1)
+    try:
+        pool._workers[0].process.kill()
+        pool._workers[0].process.join()
+        with pytest.raises(RenderWorkerError):
+            pool.run("render", sample_rm)
+        assert pool.size == 1
+        assert pool.run("render", sample_rm) == render_rm_to_png(sample_rm)
+    finally:
+        pool.close()
+
+
+def test_concurrent_callers_share_workers(pool, sample_rm):
+    expected = render_rm_to_png(sample_rm)
+    results = []
+
+    def render():
+        results.append(pool.run("render", sample_rm))
+
+    threads = [threading.Thread(target=render) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [expected] * 6
+
+
+def test_unknown_task_rejected(pool):
+    with pytest.raises(ValueError):
+        pool.run("rm -rf", b"")
+
+
+@pytest.mark.parametrize("value,expected", [("4", 4), ("0", 0), ("-2", 0)])
+def test_configured_processes_from_env(monkeypatch, value, expected):
+    monkeypatch.setenv("RENDER_PROCESSES", value)
+    assert configured_processes() == expected
+
+
+def test_configured_processes_defaults_to_cpu_count(monkeypatch):
+    monkeypatch.delenv("RENDER_PROCESSES", raising=False)
+    with patch("render_pool.os.cpu_count", return_value=6):
+        assert configured_processes() == 6
+
+
+def test_disabled_pool_renders_in_process(monkeypatch, sample_rm):
+    monkeypatch.setenv("RENDER_PROCESSES", "1")
+    monkeypatch.setattr(render_pool, "_pool", None)
+    monkeypatch.setattr(render_pool, "_pool_checked", False)
+    assert render_pool.get_pool() is None
+    assert render_pool.render_rm_to_png(sample_rm) == render_rm_to_png(sample_rm)
+
+
+@pytest.mark.parametrize("env,expected", [
+    ({}, None),
+    ({"ADAPTIVE_RENDER_SCALE": "0"}, None),
+    ({"ADAPTIVE_RENDER_SCALE": "1"}, (0.25, 1.0)),
+    ({"ADAPTIVE_RENDER_SCALE": "true", "RENDER_SCALE_MIN": "0.3", "RENDER_SCALE_MAX": "0.8"}, (0.3, 0.8)),
+    ({"ADAPTIVE_RENDER_SCALE": "1", "RENDER_SCALE_MIN": "2", "RENDER_SCALE_MAX": "tiny"}, (0.25, 1.0)),
+    ({"ADAPTIVE_RENDER_SCALE": "1", "RENDER_SCALE_MIN": "0.9", "RENDER_SCALE_MAX": "0.6"}, (0.6, 0.6)),
+])
+def test_scale_bounds_from_env(monkeypatch, env, expected):
+    for name in ("ADAPTIVE_RENDER_SCALE", "RENDER_SCALE_MIN", "RENDER_SCALE_MAX"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert render_pool.scale_bounds() == expected
+
+
+def test_choose_scale_only_when_enabled(monkeypatch, sample_rm):
+    monkeypatch.delenv("ADAPTIVE_RENDER_SCALE", raising=False)
+    assert render_pool.choose_scale(sample_rm) is None
+
+    monkeypatch.setenv("ADAPTIVE_RENDER_SCALE", "1")
+    monkeypatch.setenv("RENDER_SCALE_MIN", "0.4")
+    assert render_pool.choose_scale(sample_rm).scale == 0.4
+    assert render_pool.choose_scale(b"not an rm file") is None
@@ -456,3 +456,227 @@ def test_canvas_caps_at_max_canvas_height():
 
     img = Image.open(_BytesIO(png_bytes))
     assert img.size[1] == int(MAX_CANVAS_HEIGHT * RENDER_SCALE)
+
+
+# --- Stroke segmentation ---
+
+
+def _handwriting_line(x0, y0, width=240, height=60):
+    """A cursive-word-like stroke: wide, short, and wiggly."""
+    points = []
+    for i in range(41):
+        x = x0 + width * i / 40
+        y = y0 + (height if i % 2 else 0)
+        points.append((x, y))
+    return points
+
+
+def _rectangle(x0, y0, w, h):
+    return [(x0, y0), (x0 + w, y0), (x0 + w, y0 + h), (x0, y0 + h), (x0, y0)]
+
+
+def _lines(blocks):
+    return [b.item.value for b in blocks]
+
+
+def test_segment_strokes_separates_text_and_drawing():
+    """Handwriting and a distant box become separate, correctly labelled regions."""
+    from rm_renderer import segment_strokes
+
+    blocks = [
+        _mock_block_with_stroke(_handwriting_line(-400, 200)),
+        _mock_block_with_stroke(_handwriting_line(-100, 210)),
+        _mock_block_with_stroke(_handwriting_line(-400, 300)),
+        _mock_block_with_stroke(_rectangle(-300, 900, 500, 400)),
+    ]
+    regions = segment_strokes(_lines(blocks))
+
+    assert [r.kind for r in regions] == ["text", "drawing"]
+    assert len(regions[0].lines) == 3
+    assert regions[1].bbox == (-300, 900, 200, 1300)
+
+
+def test_segment_strokes_long_straight_strokes_are_drawing():
+    """Short but long straight strokes (arrows, axes) read as drawing."""
+    from rm_renderer import segment_strokes
+
+    blocks = [
+        _mock_block_with_stroke([(-400, 500), (300, 520)]),
+        _mock_block_with_stroke([(-400, 560), (300, 580)]),
+    ]
+    assert [r.kind for r in segment_strokes(_lines(blocks))] == ["drawing"]
+
+
+def test_segment_strokes_merges_nearby_strokes():
+    from rm_renderer import MERGE_GAP_PX, segment_strokes
+
+    near = [
+        _mock_block_with_stroke(_handwriting_line(0, 100)),
+        _mock_block_with_stroke(_handwriting_line(0, 160 + MERGE_GAP_PX - 1)),
+    ]
+    far = [
+        _mock_block_with_stroke(_handwriting_line(0, 100)),
+        _mock_block_with_stroke(_handwriting_line(0, 160 + MERGE_GAP_PX + 1)),
+    ]
+    assert len(segment_strokes(_lines(near))) == 1
+    assert len(segment_strokes(_lines(far))) == 2
+
+
+def test_merge_overlapping_follows_grown_boxes():
+    """A merged box that reaches a box neither part touched absorbs it too."""
+    from rm_renderer import _merge_overlapping
+
+    groups = [
+        [(0, 0, 10, 10), [0]],
+        [(5, 20, 30, 30), [1]],
+        [(8, 5, 12, 25), [2]],  # bridges 0 and 1
+        [(20, 12, 25, 18), [3]],  # only inside the bridged box
+        [(100, 100, 110, 110), [4]],
+    ]
+    merged = _merge_overlapping(groups)
+    assert sorted((box, sorted(members)) for box, members in merged) == [
+        ((0, 0, 30, 30), [0, 1, 2, 3]),
+        ((100, 100, 110, 110), [4]),
+    ]
+
+
+def test_segment_page_caps_drawing_crops():
+    """Past MAX_DRAWING_CROPS, the smallest drawings share one crop."""
+    from rm_renderer import MAX_DRAWING_CROPS, segment_page
+
+    blocks = [_mock_block_with_stroke(_handwriting_line(-400, 200))]
+    for i in range(MAX_DRAWING_CROPS + 3):
+        size = 300 + 20 * i
+        blocks.append(_mock_block_with_stroke(_rectangle(-600 + 450 * (i % 3), 600 + 500 * i, size, size)))
+    with patch("rm_renderer.read_blocks", return_value=blocks):
+        segments = segment_page(b"fake rm data")
+
+    assert len(segments.drawing_pngs) == MAX_DRAWING_CROPS
+
+
+def test_segment_page_crops_text_and_drawings():
+    """A mixed page yields one text crop and one crop per drawing, all smaller than the page."""
+    from PIL import Image
+    from io import BytesIO as _BytesIO
+    from rm_renderer import segment_page
+
+    blocks = [
+        _mock_block_with_stroke(_handwriting_line(-400, 200)),
+        _mock_block_with_stroke(_rectangle(-300, 900, 500, 400)),
+    ]
+    with patch("rm_renderer.read_blocks", return_value=blocks):
+        segments = segment_page(b"fake rm data")
+
+    assert segments is not None
+    assert len(segments.drawing_pngs) == 1
+    text_img = Image.open(_BytesIO(segments.text_png))
+    assert text_img.mode == "L"
+    assert text_img.size == (
+        int((240 + 2 * PADDING_PX) * RENDER_SCALE),
+        int((60 + 2 * PADDING_PX) * RENDER_SCALE),
+    )
+    drawing_img = Image.open(_BytesIO(segments.drawing_pngs[0]))
+    assert drawing_img.size[0] * drawing_img.size[1] < (RM_WIDTH * RM_HEIGHT * RENDER_SCALE ** 2) / 2
+
+
+def test_segment_page_none_for_text_only_page():
+    """Pages without both kinds of region keep the whole-page path."""
+    from rm_renderer import segment_page
+
+    with open("tests/fixtures/sample.rm", "rb") as f:
+        assert segment_page(f.read()) is None
+
+
+def test_segment_page_none_on_parse_error():
+    from rm_renderer import segment_page
+
+    with patch("rm_renderer.read_blocks", side_effect=Exception("parse error")):
+        assert segment_page(b"invalid data") is None
+
+
+def test_has_drawing_regions():
+    from rm_renderer import has_drawing_regions
+
+    with open("tests/fixtures/sample.rm", "rb") as f:
+        assert has_drawing_regions(f.read()) is False
+    with patch("rm_renderer.read_blocks", side_effect=Exception("parse error")):
+        assert has_drawing_regions(b"invalid data") is None
+
+
+# --- Adaptive render scale ---
+
+
+def _written_page(glyph_height, thickness=2, rows=4, words=3):
+    """Rows of handwriting-like strokes `glyph_height` tall, spaced apart."""
+    blocks = []
+    for row in range(rows):
+        for word in range(words):
+            block = _mock_block_with_stroke(_handwriting_line(
+                -600 + word * glyph_height * 5, 100 + row * glyph_height * 3,
+                width=glyph_height * 4, height=glyph_height,
+            ))
+            block.item.value.thickness_scale = thickness
+            blocks.append(block)
+    return _lines(blocks)
+
+
+def test_choose_scale_small_writing_needs_more_resolution():
+    from rm_renderer import MIN_GLYPH_PX, choose_scale
+
+    small = choose_scale(_written_page(40), 0.1, 1.0)
+    large = choose_scale(_written_page(120), 0.1, 1.0)
+
+    assert small.scale > RENDER_SCALE > large.scale
+    assert small.glyph_height == 40 and large.glyph_height == 120
+    assert large.glyph_height * large.scale >= MIN_GLYPH_PX
+    assert small.estimated_token_saving < 0 < large.estimated_token_saving
+
+
+def test_choose_scale_clamps_to_range():
+    from rm_renderer import choose_scale
+
+    assert choose_scale(_written_page(30), 0.1, 0.6).scale == 0.6
+    assert choose_scale(_written_page(120), 0.4, 1.0).scale == 0.4
+
+
+def test_choose_scale_thick_pen_needs_more_resolution():
+    """Heavy ink fills a glyph's loops sooner as the image shrinks."""
+    from rm_renderer import choose_scale
+
+    thin = choose_scale(_written_page(60, thickness=2), 0.1, 1.0)
+    thick = choose_scale(_written_page(60, thickness=20), 0.1, 1.0)
+
+    assert thick.ink_coverage > thin.ink_coverage
+    assert thick.scale > thin.scale
+
+
+def test_choose_scale_without_handwriting_keeps_render_scale():
+    from rm_renderer import choose_scale
+
+    lines = _lines([
+        _mock_block_with_stroke([(0, 0), (2, 2)]),  # a dot
+        _mock_block_with_stroke(_rectangle(0, 500, 600, 600)),  # a drawing
+    ])
+    choice = choose_scale(lines, 0.25, 1.0)
+    assert (choice.scale, choice.glyph_height, choice.estimated_token_saving) == (
+        RENDER_SCALE, None, 0
+    )
+    assert choose_scale(lines, 0.6, 1.0).scale == 0.6
+
+
+def test_choose_scale_sample_page():
+    from rm_renderer import choose_scale, read_strokes
+
+    with open("tests/fixtures/sample.rm", "rb") as f:
+        choice = choose_scale(read_strokes(f.read()), 0.25, 1.0)
+    assert 0.25 <= choice.scale < RENDER_SCALE
+    assert choice.estimated_token_saving > 0
+    assert set(choice.to_dict()) == {"scale", "glyphHeightPx", "inkCoverage", "estimatedTokenSaving"}
+
+
+def test_image_tokens_follow_vision_resize():
+    from rm_renderer import MAX_IMAGE_EDGE_PX, image_tokens
+
+    assert image_tokens(750, 100) == 100
+    # Images past the edge limit are downsized before counting
+    assert image_tokens(MAX_IMAGE_EDGE_PX * 2, 100) == image_tokens(MAX_IMAGE_EDGE_PX, 50)
@@ -0,0 +1,240 @@
+"""Tests for rm_scan — the fast .rm v6 scanner must read pages as rmscene does."""
+
+import logging
+import struct
+import sys
+from io import BytesIO
+from unittest.mock import Mock, patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+from rmscene import read_blocks, scene_items as si, simple_text_document, write_blocks
+from rmscene.crdt_sequence import CrdtSequence, CrdtSequenceItem
+from rmscene.scene_stream import (
+    RootTextBlock,
+    SceneLineItemBlock,
+    SceneTombstoneItemBlock,
+    UnreadableBlock,
+)
+from rmscene.tagged_block_common import HEADER_V6, CrdtId, LwwValue
+
+import rm_renderer
+import rm_scan
+from rm_scan import ScanError, scan, sniff_strokes
+from typed_text import text_to_markdown
+
+logging.getLogger("rmscene").setLevel(logging.ERROR)
+
+SAMPLE = "tests/fixtures/sample.rm"
+
+
+def _line_block(index, points, color=si.PenColor.BLACK, thickness=2.0, deleted=False):
+    line = si.Line(
+        color=color,
+        tool=si.Pen.BALLPOINT_2,
+        points=[si.Point(x, y, 10, 20, 30, 40) for x, y in points],
+        thickness_scale=thickness,
+        starting_length=0.0,
+    )
+    return SceneLineItemBlock(
+        parent_id=CrdtId(0, 11),
+        item=CrdtSequenceItem(
+            item_id=CrdtId(1, 100 + index),
+            left_id=CrdtId(0, 0),
+            right_id=CrdtId(0, 0),
+            deleted_length=1 if deleted else 0,
+            value=None if deleted else line,
+        ),
+    )
+
+
+def _styled_text_block():
+    items = [
+        CrdtSequenceItem(CrdtId(1, 20), CrdtId(0, 0), CrdtId(0, 0), 0, "Title\n"),
+        CrdtSequenceItem(CrdtId(1, 26), CrdtId(1, 25), CrdtId(0, 0), 0, 1),
+        CrdtSequenceItem(CrdtId(1, 27), CrdtId(1, 26), CrdtId(0, 0), 0, "bold é"),
+        CrdtSequenceItem(CrdtId(1, 33), CrdtId(1, 32), CrdtId(0, 0), 0, 2),
+        CrdtSequenceItem(CrdtId(1, 34), CrdtId(1, 33), CrdtId(0, 0), 3, ""),
+    ]
+    styles = {
+        CrdtId(0, 0): LwwValue(CrdtId(1, 15), si.ParagraphStyle.HEADING),
+        CrdtId(1, 25): LwwValue(CrdtId(1, 16), si.ParagraphStyle.BULLET),
+    }
+    text = si.Text(items=CrdtSequence(items), styles=styles, pos_x=-468.0, pos_y=234.0, width=936.0)
+    return RootTextBlock(block_id=CrdtId(0, 0), value=text)
+
+
+def _write(blocks, version=None) -> bytes:
+    buf = BytesIO()
+    write_blocks(buf, list(blocks), options={"version": version} if version else None)
+    return buf.getvalue()
+
+
+def _mixed_page(version=None) -> bytes:
+    blocks = list(simple_text_document("Hello\nworld"))
+    blocks.insert(4, _line_block(0, [(-100.5, 200.25), (50.0, 260.0), (80.0, 300.0)]))
+    blocks.insert(5, _line_block(1, [(10.0, 10.0)], color=si.PenColor.GRAY, thickness=3.5))
+    blocks.insert(6, _line_block(2, [], deleted=True))
+    return _write(blocks, version)
+
+
+def _rmscene_strokes(data: bytes):
+    return [
+        (int(line.color), line.thickness_scale, [(p.x, p.y) for p in line.points])
+        for line in (b.item.value for b in read_blocks(BytesIO(data))
+                     if isinstance(b, SceneLineItemBlock) and b.item.value is not None)
+    ]
+
+
+def _scanned_strokes(data: bytes):
+    return [(line.color, line.thickness_scale, line.points) for line in scan(data).lines]
+
+
+def _rmscene_text(data: bytes):
+    for block in read_blocks(BytesIO(data)):
+        if isinstance(block, RootTextBlock):
+            return block.value
+    return None
+
+
+def _fixtures():
+    with open(SAMPLE, "rb") as f:
+        sample = f.read()
+    return {
+        "sample": sample,
+        "mixed": _mixed_page(),
+        "mixed-v1-lines": _mixed_page(version="3.0"),
+        "styled-text": _write([*list(simple_text_document("x"))[:4], _styled_text_block()]),
+    }
+
+
+@pytest.mark.parametrize("name", list(_fixtures()))
+def test_strokes_match_rmscene(name):
+    data = _fixtures()[name]
+    assert _scanned_strokes(data) == _rmscene_strokes(data)
+
+
+@pytest.mark.parametrize("name", list(_fixtures()))
+def test_text_matches_rmscene(name):
+    data = _fixtures()[name]
+    expected = _rmscene_text(data)
+    text = scan(data).text
+    if expected is None:
+        assert text is None
+        return
+    assert text.items.sequence_items() == expected.items.sequence_items()
+    assert text.styles == expected.styles
+    assert (text.pos_x, text.pos_y, text.width) == (expected.pos_x, expected.pos_y, expected.width)
+    assert text_to_markdown(text) == text_to_markdown(expected)
+
+
+@pytest.mark.parametrize("name", list(_fixtures()))
+def test_renderer_output_unchanged_by_scanner(name):
+    """Rendering, segmentation and routing give identical results on either path."""
+    data = _fixtures()[name]
+    fast = (rm_renderer.render_rm_to_png(data), rm_renderer.extract_typed_text(data),
+            rm_renderer.has_strokes(data), rm_renderer.segment_page(data))
+    with patch("rm_renderer.rm_scan.scan", side_effect=ScanError("forced")), \
+            patch("rm_renderer.rm_scan.sniff_strokes", side_effect=ScanError("forced")):
+        slow = (rm_renderer.render_rm_to_png(data), rm_renderer.extract_typed_text(data),
+                rm_renderer.has_strokes(data), rm_renderer.segment_page(data))
+    assert fast == slow
+
+
+def test_sample_has_strokes():
+    data = _fixtures()["sample"]
+    lines = scan(data).lines
+    assert len(lines) == 30
+    assert all(isinstance(p, tuple) and len(p) == 2 for p in lines[0].points)
+
+
+def test_not_v6_returns_none():
+    assert scan(b"fake rm data") is None
+    assert scan(b"reMarkable .lines file, version=5          ") is None
+
+
+def test_deleted_and_unknown_blocks_are_skipped():
+    data = _write([_line_block(0, [(1.0, 2.0), (3.0, 4.0)]), _line_block(1, [], deleted=True),
+                   SceneTombstoneItemBlock(CrdtId(0, 11), CrdtSequenceItem(
+                       CrdtId(1, 9), CrdtId(0, 0), CrdtId(0, 0), 1, None))])
+    # An unknown block type 0x7f with arbitrary content
+    data += struct.pack("<IBBBB", 3, 0, 1, 1, 0x7F) + b"\x01\x02\x03"
+    assert [line.points for line in scan(data).lines] == [[(1.0, 2.0), (3.0, 4.0)]]
+    assert _scanned_strokes(data) == _rmscene_strokes(data)
+
+
+def test_truncated_file_raises_and_renderer_falls_back():
+    data = _fixtures()["mixed"][:-5]
+    with pytest.raises(ScanError):
+        scan(data)
+    # rmscene's own handling decides the result
+    with patch("rm_renderer.read_blocks", wraps=read_blocks) as fallback:
+        with pytest.raises(EOFError):
+            rm_renderer.read_strokes(data)
+    fallback.assert_called_once()
+
+
+def test_unexpected_line_layout_falls_back():
+    """A line block whose value isn't laid out as expected is left to rmscene."""
+    data = bytearray(_write([_line_block(0, [(1.0, 2.0), (3.0, 4.0)])]))
+    # Corrupt the tool tag that follows the line item type: tag 1 / Byte4
+    # becomes tag 2 / ID
+    index = data.index(b"\x03\x14", len(HEADER_V6))
+    data[index + 1] = 0x2F
+    with pytest.raises(ScanError):
+        scan(bytes(data))
+    blocks = list(read_blocks(BytesIO(bytes(data))))
+    assert isinstance(blocks[0], UnreadableBlock)
+    assert rm_renderer.has_strokes(bytes(data)) is False
+
+
+def test_point_data_not_multiple_of_record_size():
+    data = bytearray(_write([_line_block(0, [(1.0, 2.0)])]))
+    with patch.dict(rm_scan._POINT_FORMATS, {2: struct.Struct("<ff7x")}):
+        with pytest.raises(ScanError):
+            scan(bytes(data))
+
+
+@pytest.mark.parametrize("name", list(_fixtures()))
+def test_sniff_matches_full_parse(name):
+    data = _fixtures()[name]
+    assert sniff_strokes(data) == any(points for _, _, points in _rmscene_strokes(data))
+
+
+def test_sniff_ignores_deleted_and_empty_lines():
+    data = _write([_line_block(0, [], deleted=True), _line_block(1, [])])
+    assert _rmscene_strokes(data) == [(0, 2.0, [])]
+    assert sniff_strokes(data) is False
+    assert sniff_strokes(data + _write([_line_block(2, [(1.0, 1.0)])])[len(HEADER_V6):]) is True
+
+
+def test_sniff_stops_reading_lines_at_first_stroke():
+    first = _write([_line_block(0, [(1.0, 2.0)])])
+    bad = bytearray(_write([_line_block(1, [(3.0, 4.0)])]))
+    bad[bad.index(b"\x03\x14", len(HEADER_V6)) + 1] = 0x2F  # unreadable line value
+    data = first + bytes(bad[len(HEADER_V6):])
+    with pytest.raises(ScanError):
+        scan(data)
+    assert sniff_strokes(data) is True
+
+
+def test_sniff_checks_framing_of_the_whole_file():
+    data = _fixtures()["mixed"][:-5]
+    with pytest.raises(ScanError):
+        sniff_strokes(data)
+    # rmscene can't read it, so the page is routed as it was before
+    with patch("rm_renderer.read_blocks", wraps=read_blocks) as fallback:
+        assert rm_renderer.has_strokes(data) is False
+    fallback.assert_called_once()
+
+
+def test_has_strokes_skips_the_full_parse():
+    data = _fixtures()["sample"]
+    point_format = Mock(size=rm_scan._POINT_FORMATS[2].size)
+    with patch("rm_renderer.read_blocks") as fallback, \
+            patch.dict(rm_scan._POINT_FORMATS, {2: point_format}):
+        assert rm_renderer.has_strokes(data) is True
+    fallback.assert_not_called()
+    point_format.iter_unpack.assert_not_called()
@@ -2,19 +2,29 @@
 
 import json
 import sys
+import threading
 import time
 from unittest.mock import patch, MagicMock
 
 sys.path.insert(0, "src")
 
 import secrets as secrets_module
-from secrets import get_api_keys, CACHE_TTL_SECONDS
+from secrets import get_api_keys, CACHE_TTL_SECONDS, MAX_STALE_SECONDS
 
 
 def _reset_cache():
     """Reset module-level cache state between tests."""
+    _wait_for_refresh()
     secrets_module._cached_keys = None
     secrets_module._cache_time = 0
+    secrets_module._retry_time = 0
+    secrets_module._refresh_thread = None
+
+
+def _wait_for_refresh():
+    thread = secrets_module._refresh_thread
+    if thread is not None:
+        thread.join(timeout=2.0)
 
 
 # --- Environment variable fallback ---
@@ -111,7 +121,7 @@ def test_cache_returns_without_fetch():
 
 
 def test_cache_expires_after_ttl():
-    """Cache expires after TTL and re-fetches from Secrets Manager."""
+    """Expired keys are served while a background refresh replaces them."""
     _reset_cache()
     mock_client = MagicMock()
     mock_client.get_secret_value.return_value = {
@@ -129,11 +139,184 @@ def test_cache_expires_after_ttl():
         mock_client.get_secret_value.return_value = {
             "SecretString": json.dumps(["key-v2"])
         }
+        get_api_keys()
+        _wait_for_refresh()
         result = get_api_keys()
         assert result == ["key-v2"]
         assert mock_client.get_secret_value.call_count == 2
 
 
+def _slow_client(keys, release):
+    """A Secrets Manager stand-in whose fetch blocks until `release` is set."""
+    client = MagicMock()
+
+    def get_secret_value(SecretId):
+        release.wait(timeout=2.0)
+        return {"SecretString": json.dumps(keys)}
+
+    client.get_secret_value.side_effect = get_secret_value
+    return client
+
+
+def _expire(age=CACHE_TTL_SECONDS + 1):
+    secrets_module._cache_time = time.monotonic() - age
+
+
+def test_stale_keys_served_without_waiting_for_refresh():
+    """Callers after expiry get the old keys immediately, not after the fetch."""
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    secrets_module._cached_keys = ["key-v1"]
+    _expire()
+    release = threading.Event()
+    client = _slow_client(["key-v2"], release)
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        start = time.monotonic()
+        assert get_api_keys() == ["key-v1"]
+        assert time.monotonic() - start < 0.5
+        release.set()
+        _wait_for_refresh()
+        assert get_api_keys() == ["key-v2"]
+
+
+def test_concurrent_refreshes_collapse_into_one_fetch():
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    secrets_module._cached_keys = ["key-v1"]
+    _expire()
+    release = threading.Event()
+    client = _slow_client(["key-v2"], release)
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        results = [get_api_keys() for _ in range(10)]
+        release.set()
+        _wait_for_refresh()
+    assert results == [["key-v1"]] * 10
+    assert client.get_secret_value.call_count == 1
+
+
+def test_cold_callers_share_one_fetch():
+    """With nothing cached, concurrent callers wait on a single fetch."""
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    release = threading.Event()
+    client = _slow_client(["key-v1"], release)
+    results = []
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        threads = [threading.Thread(target=lambda: results.append(get_api_keys()))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join(timeout=2.0)
+    assert results == [["key-v1"]] * 5
+    assert client.get_secret_value.call_count == 1
+
+
+def test_failed_refresh_keeps_last_good_keys():
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    secrets_module._cached_keys = ["key-v1"]
+    _expire()
+    client = MagicMock()
+    client.get_secret_value.side_effect = RuntimeError("throttled")
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        assert get_api_keys() == ["key-v1"]
+        _wait_for_refresh()
+        # Still served, and the retry backoff stops a fetch per request
+        assert get_api_keys() == ["key-v1"]
+        _wait_for_refresh()
+    assert client.get_secret_value.call_count == 1
+
+
+def test_too_stale_keys_fetched_inline():
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    secrets_module._cached_keys = ["key-v1"]
+    _expire(MAX_STALE_SECONDS + 1)
+    client = MagicMock()
+    client.get_secret_value.return_value = {"SecretString": json.dumps(["key-v2"])}
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        assert get_api_keys() == ["key-v2"]
+
+
+def test_too_stale_keys_served_if_fetch_fails():
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    secrets_module._cached_keys = ["key-v1"]
+    _expire(MAX_STALE_SECONDS + 1)
+    client = MagicMock()
+    client.get_secret_value.side_effect = RuntimeError("unavailable")
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        assert get_api_keys() == ["key-v1"]
+
+
+def test_too_stale_keys_back_off_after_failed_fetch():
+    """A failing Secrets Manager isn't called inline again until the back-off ends."""
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    secrets_module._cached_keys = ["key-v1"]
+    _expire(MAX_STALE_SECONDS + 1)
+    client = MagicMock()
+    client.get_secret_value.side_effect = RuntimeError("unavailable")
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        assert get_api_keys() == ["key-v1"]
+        assert get_api_keys() == ["key-v1"]
+        assert client.get_secret_value.call_count == 1
+
+        secrets_module._retry_time = 0  # back-off over
+        client.get_secret_value.side_effect = None
+        client.get_secret_value.return_value = {"SecretString": json.dumps(["key-v2"])}
+        assert get_api_keys() == ["key-v2"]
+
+
+def test_cold_fetch_error_fails_fast_during_back_off():
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    client = MagicMock()
+    client.get_secret_value.side_effect = RuntimeError("unavailable")
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        for _ in range(2):
+            try:
+                get_api_keys()
+                assert False, "Should have raised"
+            except RuntimeError as e:
+                assert "unavailable" in str(e)
+    assert client.get_secret_value.call_count == 1
+
+
+def test_cold_fetch_error_raises():
+    _reset_cache()
+    import os
+    os.environ.pop("API_KEY", None)
+    client = MagicMock()
+    client.get_secret_value.side_effect = RuntimeError("unavailable")
+    with patch.dict("os.environ", {"API_KEY_SECRET_ARN": "arn:test"}), \
+         patch.object(secrets_module, "get_secrets_client", return_value=client):
+        try:
+            get_api_keys()
+            assert False, "Should have raised"
+        except RuntimeError as e:
+            assert "unavailable" in str(e)
+
+
 def test_empty_list_is_cached():
     """Empty list from Secrets Manager is still cached (no repeated fetches)."""
     _reset_cache()
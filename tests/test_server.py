@@ -0,0 +1,210 @@
+"""Tests for server module — HTTP requests adapted to Function URL events."""
+
+import base64
+import gzip
+import http.client
+import json
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+from handler import handler as lambda_handler
+from server import OcrServer, build_event
+
+
+@pytest.fixture
+def server():
+    server = OcrServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    yield server
+    server.drain()
+    thread.join(timeout=10)
+
+
+def _connect(server):
+    return http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+
+
+def _pages_body(*page_ids):
+    return json.dumps({"pages": [
+        {"id": pid, "data": base64.b64encode(pid.encode()).decode()} for pid in page_ids
+    ]})
+
+
+def _fake_page(page_id, page_data, anthropic_client, meter=None):
+    return {"id": page_id, "markdown": f"text of {page_id}", "confidence": 1.0}
+
+
+# --- Event construction ---
+
+def test_build_event_matches_function_url_shape():
+    headers = http.client.HTTPMessage()
+    headers["X-Api-Key"] = "k"
+    headers["Accept-Encoding"] = "gzip"
+    headers["Accept-Encoding"] = "zstd"
+    headers["Content-Type"] = "application/json"
+    headers["Cookie"] = "a=1; b=2"
+    event = build_event("POST", "/ocr?x=1", headers, b'{"pages": []}', "10.0.0.1")
+
+    assert event["version"] == "2.0"
+    assert event["rawPath"] == "/ocr"
+    assert event["rawQueryString"] == "x=1"
+    assert event["headers"]["x-api-key"] == "k"
+    assert event["headers"]["accept-encoding"] == "gzip,zstd"
+    assert event["cookies"] == ["a=1", "b=2"]
+    assert event["requestContext"]["http"]["method"] == "POST"
+    assert event["requestContext"]["http"]["sourceIp"] == "10.0.0.1"
+    assert event["body"] == '{"pages": []}'
+    assert event["isBase64Encoded"] is False
+
+
+def test_build_event_base64_encodes_binary_and_compressed_bodies():
+    headers = http.client.HTTPMessage()
+    headers["Content-Type"] = "application/zip"
+    event = build_event("POST", "/notebook", headers, b"PK\x03\x04", "10.0.0.1")
+    assert event["isBase64Encoded"] is True
+    assert base64.b64decode(event["body"]) == b"PK\x03\x04"
+
+    headers = http.client.HTTPMessage()
+    headers["Content-Type"] = "application/json"
+    headers["Content-Encoding"] = "gzip"
+    event = build_event("POST", "/ocr", headers, gzip.compress(b"{}"), "10.0.0.1")
+    assert event["isBase64Encoded"] is True
+
+
+# --- End to end ---
+
+def test_ocr_request_matches_handler_response(server):
+    body = _pages_body("a", "b")
+    headers = {"x-api-key": "test-key", "Content-Type": "application/json"}
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=_fake_page):
+        conn = _connect(server)
+        conn.request("POST", "/ocr", body=body, headers=headers)
+        response = conn.getresponse()
+        served = json.loads(response.read())
+
+        expected = lambda_handler({
+            "rawPath": "/ocr",
+            "headers": {"x-api-key": "test-key"},
+            "requestContext": {"http": {"method": "POST"}},
+            "body": body,
+        }, None)
+
+    assert response.status == expected["statusCode"] == 200
+    assert response.getheader("Content-Type") == "application/json"
+    assert served == json.loads(expected["body"])
+
+
+def test_errors_pass_through(server):
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        conn = _connect(server)
+        conn.request("POST", "/ocr", body="{}", headers={"x-api-key": "wrong"})
+        response = conn.getresponse()
+        assert response.status == 401
+        assert json.loads(response.read()) == {"error": "Invalid or missing API key"}
+
+        conn.request("GET", "/ocr", headers={"x-api-key": "test-key"})
+        response = conn.getresponse()
+        assert response.status == 405
+        response.read()
+
+
+def test_keep_alive_reuses_connection(server):
+    headers = {"x-api-key": "test-key", "Content-Type": "application/json"}
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=_fake_page):
+        conn = _connect(server)
+        conn.request("POST", "/ocr", body=_pages_body("a"), headers=headers)
+        conn.getresponse().read()
+        sock = conn.sock
+        conn.request("POST", "/ocr", body=_pages_body("b"), headers=headers)
+        response = conn.getresponse()
+        assert json.loads(response.read())["pages"][0]["id"] == "b"
+        assert conn.sock is sock
+
+
+def test_compressed_response_is_sent_as_bytes(server):
+    headers = {"x-api-key": "test-key", "Content-Type": "application/json",
+               "Accept-Encoding": "gzip"}
+    long_page = {"id": "a", "markdown": "word " * 500, "confidence": 1.0}
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", return_value=long_page):
+        conn = _connect(server)
+        conn.request("POST", "/ocr", body=_pages_body("a"), headers=headers)
+        response = conn.getresponse()
+        assert response.getheader("Content-Encoding") == "gzip"
+        assert json.loads(gzip.decompress(response.read()))["pages"][0] == long_page
+
+
+def test_oversized_body_rejected(server):
+    conn = _connect(server)
+    conn.putrequest("POST", "/ocr")
+    conn.putheader("Content-Length", str(7 * 1024 * 1024))
+    conn.endheaders()
+    response = conn.getresponse()
+    assert response.status == 413
+
+
+def test_concurrent_requests_served_in_parallel(server):
+    barrier = threading.Barrier(3)
+
+    def slow_page(page_id, page_data, anthropic_client, meter=None):
+        barrier.wait(timeout=2.0)
+        return _fake_page(page_id, page_data, anthropic_client)
+
+    statuses = []
+
+    def request(page_id):
+        conn = _connect(server)
+        conn.request("POST", "/ocr", body=_pages_body(page_id),
+                     headers={"x-api-key": "test-key", "Content-Type": "application/json"})
+        statuses.append(conn.getresponse().status)
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=slow_page):
+        threads = [threading.Thread(target=request, args=(f"p{i}",)) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+    assert statuses == [200, 200, 200]
+
+
+def test_drain_waits_for_in_flight_requests():
+    server = OcrServer(("127.0.0.1", 0))
+    runner = threading.Thread(target=server.run)
+    runner.start()
+    started = threading.Event()
+    result = {}
+
+    def slow_page(page_id, page_data, anthropic_client, meter=None):
+        started.set()
+        time.sleep(0.3)
+        return _fake_page(page_id, page_data, anthropic_client)
+
+    def request():
+        conn = _connect(server)
+        conn.request("POST", "/ocr", body=_pages_body("a"),
+                     headers={"x-api-key": "test-key", "Content-Type": "application/json"})
+        response = conn.getresponse()
+        result["status"] = response.status
+        response.read()
+
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+         patch("handler.process_page", side_effect=slow_page):
+        client = threading.Thread(target=request)
+        client.start()
+        assert started.wait(2)
+        server.drain()
+        client.join(timeout=5)
+        runner.join(timeout=10)
+
+    assert result["status"] == 200
+    assert not runner.is_alive()
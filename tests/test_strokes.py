@@ -0,0 +1,70 @@
+"""Tests for strokes — array-backed stroke storage."""
+
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, "src")
+
+from rm_renderer import read_strokes
+from strokes import Stroke, StrokeSet
+
+
+def _set():
+    strokes = StrokeSet()
+    strokes.append(0, 2.0, [1.0, 2.0, 3.0, 4.0])
+    strokes.append(1, 3.5, [])
+    strokes.append(2, 1.0, (5.5, -6.25))
+    return strokes
+
+
+def test_strokes_are_views_over_shared_arrays():
+    strokes = _set()
+    assert len(strokes) == 3
+    assert [s.color for s in strokes] == [0, 1, 2]
+    assert [s.thickness_scale for s in strokes] == [2.0, 3.5, 1.0]
+    assert [s.point_count for s in strokes] == [2, 0, 1]
+    assert strokes[0].points == [(1.0, 2.0), (3.0, 4.0)]
+    assert strokes[-1].points == [(5.5, -6.25)]
+    assert list(strokes[2].xy) == [5.5, -6.25]
+    assert list(strokes.offsets) == [0, 2, 2, 3]
+    assert strokes.points.typecode == "f"
+    assert strokes.nbytes == 6 * 4 + 4 * 4 + 3 * 4 + 3 * 8
+    with pytest.raises(IndexError):
+        strokes[3]
+
+
+def test_views_have_no_instance_dict():
+    strokes = _set()
+    assert not hasattr(strokes, "__dict__")
+    assert not hasattr(strokes[0], "__dict__")
+
+
+def test_unpaired_coordinates_are_rejected_without_side_effects():
+    strokes = _set()
+    with pytest.raises(ValueError):
+        strokes.append(0, 2.0, [1.0, 2.0, 3.0])
+    assert len(strokes) == 3
+    assert len(strokes.points) == 6
+
+
+def test_from_lines_copies_rmscene_lines_and_views():
+    line = MagicMock(color=1, thickness_scale=4, points=[MagicMock(x=1, y=2), MagicMock(x=3, y=4)])
+    strokes = StrokeSet.from_lines([line])
+    assert strokes[0].points == [(1.0, 2.0), (3.0, 4.0)]
+    assert (strokes[0].color, strokes[0].thickness_scale) == (1, 4.0)
+
+    original = _set()
+    assert StrokeSet.from_lines(original) is original
+    copied = StrokeSet.from_lines([original[2], original[0]])
+    assert [s.points for s in copied] == [[(5.5, -6.25)], [(1.0, 2.0), (3.0, 4.0)]]
+
+
+def test_read_strokes_returns_a_stroke_set():
+    with open("tests/fixtures/sample.rm", "rb") as f:
+        strokes = read_strokes(f.read())
+    assert isinstance(strokes, StrokeSet)
+    assert len(strokes) == 30
+    assert all(isinstance(s, Stroke) for s in strokes)
+    assert strokes.offsets[-1] * 2 == len(strokes.points)
@@ -0,0 +1,219 @@
+"""Tests for delta sync — manifest planning, result stores and the /sync route."""
+
+import base64
+import hashlib
+import json
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, "src")
+
+import sync
+from handler import handler
+from result_store import MemoryResultStore, SQLiteResultStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryResultStore()
+    else:
+        store = SQLiteResultStore(str(tmp_path / "results.db"))
+    sync.configure(store)
+    yield store
+    sync.configure(None)
+
+
+def _content(page_id, version=1):
+    return f"rm:{page_id}:v{version}".encode()
+
+
+def _entry(page_id, version=1, modified=1000, data=True):
+    content = _content(page_id, version)
+    entry = {"id": page_id, "hash": hashlib.sha256(content).hexdigest(), "modified": modified}
+    if data:
+        entry["data"] = base64.b64encode(content).decode()
+    return entry
+
+
+def _fake_page(page_id, page_data, anthropic_client, meter=None):
+    return {"id": page_id, "markdown": f"text of {page_data.decode()}", "confidence": 0.9}
+
+
+def _stored(store, notebook_id="nb-1", anthropic_key=None):
+    """The store's entries for a caller's notebook."""
+    headers = {"x-anthropic-key": anthropic_key} if anthropic_key else {}
+    return store.get_notebook(sync.notebook_key({"headers": headers}, notebook_id))
+
+
+def _sync(pages, notebook_id="nb-1", process=_fake_page, anthropic_key=None):
+    headers = {"x-api-key": "test-key"}
+    if anthropic_key:
+        headers["x-anthropic-key"] = anthropic_key
+    event = {
+        "rawPath": "/sync",
+        "headers": headers,
+        "requestContext": {"http": {"method": "POST"}},
+        "body": json.dumps({"notebookId": notebook_id, "pages": pages}),
+    }
+    with patch("handler.get_api_keys", return_value=["test-key"]), \
+            patch("handler.process_page", side_effect=process) as mock_process:
+        response = handler(event, None)
+    return response["statusCode"], json.loads(response["body"]), mock_process
+
+
+def test_first_sync_processes_every_page(store):
+    status, body, process = _sync([_entry("a"), _entry("b")])
+    assert status == 200
+    assert [p["id"] for p in body["pages"]] == ["a", "b"]
+    assert body["pages"][0]["markdown"] == "text of rm:a:v1"
+    assert body["pages"][0]["hash"] == _entry("a")["hash"]
+    assert body["unchangedPages"] == 0
+    assert process.call_count == 2
+    assert set(_stored(store)) == {"a", "b"}
+
+
+def test_unchanged_notebook_costs_nothing(store):
+    _sync([_entry("a"), _entry("b")])
+    status, body, process = _sync([_entry("a", data=False), _entry("b", data=False)])
+    assert status == 200
+    assert body["pages"] == []
+    assert body["unchangedPages"] == 2
+    assert "neededPages" not in body and "deletedPages" not in body
+    process.assert_not_called()
+
+
+def test_changed_page_without_data_is_needed(store):
+    _sync([_entry("a"), _entry("b")])
+    _, body, process = _sync([_entry("a", data=False), _entry("b", version=2, data=False)])
+    assert body["neededPages"] == ["b"]
+    assert body["pages"] == []
+    process.assert_not_called()
+
+    _, body, process = _sync([_entry("a", data=False), _entry("b", version=2)])
+    assert [p["id"] for p in body["pages"]] == ["b"]
+    assert body["pages"][0]["markdown"] == "text of rm:b:v2"
+    assert process.call_count == 1
+
+
+def test_new_hash_with_same_markdown_is_not_returned(store):
+    _sync([_entry("a")])
+
+    def same_text(page_id, page_data, anthropic_client, meter=None):
+        return {"id": page_id, "markdown": "text of rm:a:v1", "confidence": 0.9}
+
+    _, body, _ = _sync([_entry("a", version=2)], process=same_text)
+    assert body["pages"] == []
+    assert body["unchangedPages"] == 1
+    # The new hash is stored, so the next sync doesn't ask for the page
+    assert _stored(store)["a"]["hash"] == _entry("a", version=2)["hash"]
+
+
+def test_deleted_pages_become_tombstones_reported_once(store):
+    _sync([_entry("a"), _entry("b")])
+    _, body, _ = _sync([_entry("a", data=False)])
+    assert body["deletedPages"] == ["b"]
+    assert _stored(store)["b"]["deleted"] is True
+
+    _, body, _ = _sync([_entry("a", data=False)])
+    assert "deletedPages" not in body
+
+
+def test_restored_or_copied_page_reuses_stored_result(store):
+    _sync([_entry("a"), _entry("b")])
+    _sync([_entry("a", data=False)])  # b deleted
+
+    # b comes back under a new id, and a is duplicated: no OCR for either
+    copy = {**_entry("a", data=False), "id": "a-copy"}
+    restored = {**_entry("b", data=False), "id": "b-restored"}
+    _, body, process = _sync([_entry("a", data=False), copy, restored])
+    process.assert_not_called()
+    assert {p["id"]: p["markdown"] for p in body["pages"]} == {
+        "a-copy": "text of rm:a:v1", "b-restored": "text of rm:b:v1",
+    }
+
+
+def test_newer_server_result_wins_over_stale_client(store):
+    _sync([_entry("a", version=2, modified=2000)])
+    _, body, process = _sync([_entry("a", version=1, modified=1000)])
+    process.assert_not_called()
+    assert body["pages"][0]["hash"] == _entry("a", version=2)["hash"]
+    assert body["pages"][0]["modified"] == 2000
+
+
+def test_failed_pages_are_asked_for_again(store):
+    def broken(page_id, page_data, anthropic_client, meter=None):
+        raise RuntimeError("corrupt")
+
+    _, body, _ = _sync([_entry("a")], process=broken)
+    assert body["failedPages"] == ["a"]
+    assert _stored(store) == {}
+    _, body, _ = _sync([_entry("a", data=False)])
+    assert body["neededPages"] == ["a"]
+
+
+def test_data_must_match_hash(store):
+    page = {**_entry("a"), "data": base64.b64encode(b"something else").decode()}
+    _, body, process = _sync([page])
+    assert body["failedPages"] == ["a"]
+    process.assert_not_called()
+
+
+def test_notebooks_are_independent(store):
+    _sync([_entry("a")], notebook_id="nb-1")
+    _, body, _ = _sync([_entry("a", data=False)], notebook_id="nb-2")
+    assert body["neededPages"] == ["a"]
+
+
+def test_callers_cant_see_or_delete_each_others_notebooks(store):
+    with patch("handler.make_anthropic_client"):
+        _sync([_entry("a", version=2, modified=2000)], anthropic_key="sk-alice")
+        # Same notebook id from another caller: nothing stored is returned
+        # as newer, and an empty manifest tombstones nothing of Alice's
+        _, body, _ = _sync([_entry("a", data=False)], anthropic_key="sk-mallory")
+        assert body["pages"] == [] and body["neededPages"] == ["a"]
+        _, body, _ = _sync([], anthropic_key="sk-mallory")
+        assert "deletedPages" not in body
+
+    assert _stored(store, anthropic_key="sk-alice")["a"]["deleted"] is False
+    assert _stored(store, anthropic_key="sk-mallory") == {}
+
+
+@pytest.mark.parametrize("body,message", [
+    ({"pages": []}, "notebookId"),
+    ({"notebookId": "nb", "pages": "x"}, "list"),
+    ({"notebookId": "nb", "pages": [{"id": "a"}]}, "hash"),
+    ({"notebookId": "nb", "pages": [{"id": "a", "hash": "h"}, {"id": "a", "hash": "h"}]}, "Duplicate"),
+    ({"notebookId": "nb", "pages": [{"id": "a", "hash": "h", "modified": "yesterday"}]}, "modified"),
+])
+def test_invalid_manifests(store, body, message):
+    event = {
+        "rawPath": "/sync",
+        "headers": {"x-api-key": "test-key"},
+        "requestContext": {"http": {"method": "POST"}},
+        "body": json.dumps(body),
+    }
+    with patch("handler.get_api_keys", return_value=["test-key"]):
+        response = handler(event, None)
+    assert response["statusCode"] == 400
+    assert message in json.loads(response["body"])["error"]
+
+
+def test_sync_not_configured():
+    sync.configure(None)
+    with patch.dict("os.environ", {}, clear=False) as env:
+        env.pop("RESULTS_BACKEND", None)
+        env.pop("RESULTS_TABLE", None)
+        status, body, _ = _sync([_entry("a")])
+    assert status == 501
+    assert body["code"] == "SYNC_NOT_CONFIGURED"
+
+
+def test_expired_tombstones_are_dropped(store):
+    store.put_pages("nb", {"a": {"hash": "h", "modified": 1, "markdown": "m", "confidence": 1.0}})
+    store.delete_pages("nb", ["a"])
+    with patch("result_store.time.time", return_value=time.time() + 31 * 24 * 3600):
+        assert store.get_notebook("nb") == {}
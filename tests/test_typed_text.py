@@ -0,0 +1,164 @@
+"""Tests for typed_text module — CRDT reconstruction and markdown mapping."""
+
+import random
+import sys
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, "src")
+
+from rmscene import scene_items as si
+from rmscene import simple_text_document, write_blocks
+from rmscene.crdt_sequence import CrdtSequence, CrdtSequenceItem
+from rmscene.tagged_block_common import CrdtId, LwwValue
+from rmscene.text import TextDocument
+
+from typed_text import reconstruct_paragraphs, text_to_markdown
+
+
+def make_text(items, styles=None):
+    """Build an rmscene Text from (id, left, right, value[, deleted]) tuples."""
+    seq = []
+    for entry in items:
+        item_id, left, right, value, *rest = entry
+        seq.append(CrdtSequenceItem(
+            CrdtId(*item_id), CrdtId(*left), CrdtId(*right), rest[0] if rest else 0, value,
+        ))
+    return si.Text(
+        items=CrdtSequence(seq),
+        styles={CrdtId(*k): LwwValue(CrdtId(1, 1), si.ParagraphStyle(v))
+                for k, v in (styles or {}).items()},
+        pos_x=0.0, pos_y=0.0, width=900.0,
+    )
+
+
+def rmscene_paragraphs(text):
+    """Reference result from rmscene's own (quadratic) reconstruction."""
+    doc = TextDocument.from_scene_item(text)
+    return [(str(p), int(p.style.value)) for p in doc.contents]
+
+
+def ours(text):
+    return [(p.text, p.style) for p in reconstruct_paragraphs(text)]
+
+
+def test_single_run_plain_text():
+    text = make_text([((1, 10), (0, 0), (0, 0), "Hello\nWorld")])
+    assert text_to_markdown(text) == "Hello\n\nWorld"
+
+
+def test_styles_map_to_markdown():
+    # "Title\nitem one\nitem two\ndone\nBody" with styles keyed by each "\n"
+    body = "Title\nitem one\nitem two\ndone\nBody"
+    newlines = [i for i, c in enumerate(body) if c == "\n"]
+    styles = {
+        (0, 0): si.ParagraphStyle.HEADING,
+        (1, 10 + newlines[0]): si.ParagraphStyle.BULLET,
+        (1, 10 + newlines[1]): si.ParagraphStyle.BULLET2,
+        (1, 10 + newlines[2]): si.ParagraphStyle.CHECKBOX_CHECKED,
+        (1, 10 + newlines[3]): si.ParagraphStyle.PLAIN,
+    }
+    text = make_text([((1, 10), (0, 0), (0, 0), body)], styles)
+    assert text_to_markdown(text) == (
+        "# Title\n\n- item one\n  - item two\n- [x] done\n\nBody"
+    )
+
+
+def test_inline_bold_and_italic():
+    text = make_text([
+        ((1, 10), (0, 0), (1, 14), "say "),
+        ((1, 14), (1, 13), (1, 15), 1),
+        ((1, 15), (1, 14), (1, 19), "this"),
+        ((1, 19), (1, 18), (1, 20), 2),
+        ((1, 20), (1, 19), (1, 25), " and "),
+        ((1, 25), (1, 24), (1, 26), 3),
+        ((1, 26), (1, 25), (0, 0), "that "),
+    ])
+    assert text_to_markdown(text) == "say **this** and *that*"
+
+
+def test_insert_into_middle_of_run_and_delete():
+    """Edits that point inside another run split it at the right place."""
+    text = make_text([
+        ((1, 10), (0, 0), (0, 0), "Helo wrld"),
+        # Insert "l" after "Hel" (char id 12), before "o" (13)
+        ((1, 30), (1, 12), (1, 13), "l"),
+        # Insert "o" after "w" (15), before "r" (16)
+        ((1, 31), (1, 15), (1, 16), "o"),
+        # A deleted run between the two words
+        ((1, 40), (1, 14), (1, 15), "", 3),
+    ])
+    assert text_to_markdown(text) == "Hello world"
+    assert ours(text) == rmscene_paragraphs(text)
+
+
+def test_concurrent_inserts_order_by_author():
+    """Concurrent inserts at one position put the higher author first, like rmscene."""
+    text = make_text([
+        ((1, 10), (0, 0), (0, 0), "ac"),
+        ((1, 20), (1, 10), (1, 11), "x"),
+        ((2, 5), (1, 10), (1, 11), "y"),
+    ])
+    assert ours(text) == rmscene_paragraphs(text)
+    assert reconstruct_paragraphs(text)[0].text == "ayxc"
+
+
+def _random_edit_text(seed, edits=200):
+    """Simulate typing, mid-run inserts and deletes; return an rmscene Text."""
+    rng = random.Random(seed)
+    chars = []  # ((author, id), char) in document order
+    items = []
+    next_id = {1: 10, 2: 10}
+    for _ in range(edits):
+        author = rng.choice((1, 2))
+        pos = rng.randint(0, len(chars))
+        left = chars[pos - 1][0] if pos > 0 else (0, 0)
+        right = chars[pos][0] if pos < len(chars) else (0, 0)
+        if rng.random() < 0.2 and chars:
+            n = rng.randint(1, 3)
+            items.append(((author, next_id[author]), left, right, "", n))
+            new = [((author, next_id[author] + k), "") for k in range(n)]
+        else:
+            word = rng.choice(["alpha", "beta\n", "gamma ", "\n", "de"])
+            items.append(((author, next_id[author]), left, right, word))
+            new = [((author, next_id[author] + k), c) for k, c in enumerate(word)]
+        next_id[author] += len(new)
+        chars[pos:pos] = new
+    styles = {cid: rng.choice(list(si.ParagraphStyle))
+              for cid, c in chars if c == "\n"}
+    styles[(0, 0)] = si.ParagraphStyle.HEADING
+    return make_text(items, styles), "".join(c for _, c in chars)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_rmscene_on_random_edits(seed):
+    text, expected = _random_edit_text(seed)
+    paragraphs = reconstruct_paragraphs(text)
+    assert "\n".join(p.text for p in paragraphs) == expected
+    assert [p for p in ours(text) if p[0]] == [p for p in rmscene_paragraphs(text) if p[0]]
+
+
+def test_cycle_raises():
+    text = make_text([
+        ((1, 10), (1, 11), (0, 0), "a"),
+        ((1, 11), (1, 10), (0, 0), "b"),
+    ])
+    with pytest.raises(ValueError, match="cyclic"):
+        reconstruct_paragraphs(text)
+
+
+def test_extract_typed_text_from_rm_file():
+    """extract_typed_text reads the RootTextBlock of a real .rm stream."""
+    from rm_renderer import extract_typed_text
+
+    buf = BytesIO()
+    write_blocks(buf, list(simple_text_document("Shopping\nmilk\neggs")))
+    assert extract_typed_text(buf.getvalue()) == "Shopping\n\nmilk\n\neggs"
+
+
+def test_extract_typed_text_ignores_stroke_only_pages():
+    from rm_renderer import extract_typed_text
+
+    with open("tests/fixtures/sample.rm", "rb") as f:
+        assert extract_typed_text(f.read()) is None
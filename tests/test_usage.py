@@ -0,0 +1,73 @@
+"""Tests for usage module — token totals, cost, and request budgets."""
+
+import sys
+
+import pytest
+
+sys.path.insert(0, "src")
+
+from usage import BudgetExhausted, ModelCall, UsageMeter, summarize
+
+
+def test_cost_uses_model_pricing():
+    call = ModelCall("claude-sonnet-4-20250514", "extract", 100,
+                     input_tokens=1_000_000, output_tokens=100_000)
+    assert call.cost_usd == pytest.approx(3.00 + 1.50)
+
+
+def test_cost_includes_cache_tokens():
+    call = ModelCall("claude-haiku-4-5-20251001", "extract", 100,
+                     cache_creation_input_tokens=1_000_000, cache_read_input_tokens=1_000_000)
+    assert call.cost_usd == pytest.approx(1.25 + 0.10)
+
+
+def test_unknown_model_costs_nothing():
+    assert ModelCall("some-future-model", "extract", 1, input_tokens=10).cost_usd == 0.0
+
+
+def test_unknown_model_warns_once(caplog):
+    for _ in range(2):
+        ModelCall("unpriced-model", "extract", 1, input_tokens=10).cost_usd
+    assert caplog.text.count("No pricing for model unpriced-model") == 1
+
+
+def test_summarize_totals():
+    calls = [
+        ModelCall("claude-haiku-4-5-20251001", "extract", 1, input_tokens=100, output_tokens=10),
+        ModelCall("claude-haiku-4-5-20251001", "describe", 1, input_tokens=50, output_tokens=5,
+                  cache_read_input_tokens=7),
+    ]
+    summary = summarize(calls)
+    assert summary["inputTokens"] == 150
+    assert summary["outputTokens"] == 15
+    assert summary["cacheReadInputTokens"] == 7
+    assert summary["costUsd"] > 0
+
+
+def test_meter_without_budget_never_exhausts():
+    meter = UsageMeter()
+    meter.record(ModelCall("m", "extract", 1, input_tokens=10**9))
+    meter.check()
+    assert "budgetTokens" not in meter.to_dict()
+
+
+def test_meter_budget_blocks_new_calls_once_spent():
+    meter = UsageMeter(budget_tokens=1000)
+    meter.check()
+    meter.record(ModelCall("m", "extract", 1, input_tokens=900, output_tokens=50))
+    meter.check()  # 950 < 1000, still allowed
+    meter.record(ModelCall("m", "extract", 1, input_tokens=100))
+    assert meter.exhausted
+    with pytest.raises(BudgetExhausted):
+        meter.check()
+    assert meter.to_dict()["budgetTokens"] == 1000
+
+
+def test_meter_deadline_blocks_new_calls_once_passed():
+    import time
+
+    assert not UsageMeter(deadline=time.monotonic() + 60).exhausted
+    meter = UsageMeter(budget_tokens=1000, deadline=time.monotonic() - 1)
+    assert meter.exhausted
+    with pytest.raises(BudgetExhausted, match="Out of time"):
+        meter.check()